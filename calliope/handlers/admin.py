@@ -2,9 +2,11 @@
 
 Gli utenti non autorizzati vengono ignorati senza risposta. Espone:
 - ``/admin stats``   → statistiche globali dal DB
-- ``/admin status``  → uptime, modello e device in uso
+- ``/admin status``  → uptime, device, coda e richieste servite per modello
 - ``/admin broadcast <messaggio>`` → invio a tutti gli utenti/gruppi con
   conferma, throttling e report finale
+- ``/admin model [nome]`` → modello di default attuale, o cambio a caldo (il
+  nuovo modello è caricato in background, i job in corso non si fermano)
 - un error handler globale che notifica l'owner e risponde in modo generico.
 """
 
@@ -25,8 +27,9 @@ BROADCAST_THROTTLE_S = 0.05
 ADMIN_HELP = (
     "🛠 Admin commands:\n"
     "/admin stats — global usage statistics\n"
-    "/admin status — uptime, model, device\n"
-    "/admin broadcast <message> — send a message to all users and groups"
+    "/admin status — uptime, device, queue, models\n"
+    "/admin broadcast <message> — send a message to all users and groups\n"
+    "/admin model [name] — show or hot-swap the default model"
 )
 
 
@@ -48,6 +51,8 @@ async def admin(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await _admin_status(update, context)
     elif subcommand == "broadcast":
         await _admin_broadcast(update, context)
+    elif subcommand == "model":
+        await _admin_model(update, context)
     else:
         await update.message.reply_text(ADMIN_HELP)
 
@@ -74,11 +79,63 @@ async def _admin_status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     uptime = format_timedelta(datetime.now() - start_time) if start_time else "unknown"
 
     transcriber = context.bot_data["transcriber"]
+    stats = await transcriber.stats()
+    waiting, running = stats["queue"]
+    # Una riga per modello caricato: richieste servite e real-time factor.
+    models = "\n".join(
+        f"• {name}: {served} served, RTF {rtf:.2f}"
+        for name, served, rtf in stats["models"]
+    )
+    # Coda persistente (se attiva): lavori di tutte le istanze.
+    jobs = ""
+    job_queue = context.bot_data.get("job_queue")
+    if job_queue is not None:
+        try:
+            counts = job_queue.counts()
+            jobs = (
+                f"Jobs: {counts['queued']} queued, {counts['running']} running, "
+                f"{counts['dead']} dead\n"
+            )
+        except Exception as e:
+            logger.error(f"Could not read job queue counts: {e}")
     await update.message.reply_text(
         "🩺 Status\n\n"
         f"Uptime: {uptime}\n"
-        f"Model: {transcriber.model_name}\n"
-        f"Device: {transcriber.device}"
+        f"Device: {transcriber.device}\n"
+        f"Queue: {waiting} waiting, {running} running\n"
+        f"{jobs}"
+        f"Models{'' if transcriber.loaded else ' (unloaded while idle)'}:\n{models}"
+    )
+
+
+async def _admin_model(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Mostra il modello di default o lo sostituisce a caldo.
+
+    Il caricamento può durare minuti: l'handler resta in attesa (gli update
+    sono concorrenti) mentre il bot continua a trascrivere con il vecchio
+    modello, poi riporta l'esito.
+    """
+    transcriber = context.bot_data["transcriber"]
+    args = context.args or []
+    if len(args) < 2:
+        await update.message.reply_text(
+            f"🧠 Current model: {transcriber.model_name}\nUsage: /admin model <name>"
+        )
+        return
+
+    name = args[1]
+    old = transcriber.model_name
+    await update.message.reply_text(f"⏳ Loading {name}…")
+    try:
+        load_s = await transcriber.swap_model(name)
+    except Exception as e:
+        # Nome errato, download fallito, memoria esaurita...: il vecchio
+        # modello resta in servizio.
+        logger.warning(f"Model swap to {name} failed: {e}")
+        await update.message.reply_text(f"❌ Could not switch to {name}: {e}")
+        return
+    await update.message.reply_text(
+        f"✅ Switched from {old} to {name} (loaded in {load_s:.1f}s)."
     )
 
 
@@ -0,0 +1,88 @@
+"""Pulsante "Stop" per interrompere una trascrizione in corso.
+
+Ogni trascrizione in streaming viene registrata in ``bot_data["running_jobs"]``
+con il task che la esegue. Il pulsante inline sul placeholder porta la chiave
+del job nella ``callback_data``: :func:`stop_callback` annulla quel task, lo
+stream chiude il generatore del transcriber e l'inferenza si ferma al segmento
+successivo liberando subito la replica.
+
+Solo chi ha inviato il messaggio (o l'owner del bot) può fermarlo.
+
+Il registro è in memoria, per processo: con la coda persistente il pulsante
+ferma solo i lavori eseguiti dall'istanza che riceve la callback (quella che
+fa polling). Un lavoro in corso su un'istanza ``JOB_WORKER_ONLY`` non è
+fermabile e arriva in fondo.
+"""
+
+import asyncio
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from loguru import logger
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Message, Update
+from telegram.ext import ContextTypes
+
+from calliope.notifier import is_admin
+
+RUNNING_JOBS = "running_jobs"
+
+
+@dataclass
+class RunningJob:
+    """Una trascrizione in corso che può essere fermata dal pulsante."""
+
+    user_id: int | None
+    task: asyncio.Task
+    stopped: bool = False
+
+    def stop(self) -> None:
+        """Segna il job come fermato dall'utente e ne annulla il task."""
+        self.stopped = True
+        self.task.cancel()
+
+
+def job_key(message: Message) -> str:
+    """Chiave del job: identifica il messaggio originale nella chat."""
+    return f"{message.chat_id}:{message.message_id}"
+
+
+def stop_keyboard(key: str) -> InlineKeyboardMarkup:
+    """Tastiera con il solo pulsante "Stop" per il job ``key``."""
+    return InlineKeyboardMarkup(
+        [[InlineKeyboardButton("⏹ Stop", callback_data=f"stop:{key}")]]
+    )
+
+
+@contextmanager
+def track_job(
+    bot_data: dict, key: str, user_id: int | None, task: asyncio.Task
+) -> Iterator[RunningJob]:
+    """Registra ``task`` come job fermabile per la durata del blocco."""
+    jobs = bot_data.setdefault(RUNNING_JOBS, {})
+    job = RunningJob(user_id=user_id, task=task)
+    jobs[key] = job
+    try:
+        yield job
+    finally:
+        if jobs.get(key) is job:
+            del jobs[key]
+
+
+async def stop_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Gestisce la pressione del pulsante "Stop"."""
+    query = update.callback_query
+    key = query.data.split(":", 1)[1]
+    job = context.bot_data.get(RUNNING_JOBS, {}).get(key)
+    if job is None or job.task.done():
+        await query.answer("This transcription has already finished.")
+        return
+
+    user_id = query.from_user.id
+    if user_id != job.user_id and not is_admin(user_id):
+        await query.answer("Only the sender can stop this transcription.")
+        return
+
+    logger.info(f"Transcription {key} stopped by user {user_id}")
+    job.stop()
+    await query.answer("Stopping…")
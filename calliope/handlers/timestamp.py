@@ -1,23 +1,43 @@
 import asyncio
 import io
+import time
+from contextlib import AbstractContextManager, aclosing, nullcontext
 
 from loguru import logger
-from telegram import Update
+from telegram import Message, Update
 from telegram.constants import ChatAction
-from telegram.error import BadRequest
+from telegram.error import NetworkError, TelegramError
 from telegram.ext import ContextTypes
 
-from calliope.media.extract import MediaTooLongError, download_audio
+from calliope.handlers.transcribe import (
+    enqueue_job,
+    learned_language,
+    rejection_text,
+    resolve_language,
+)
+from calliope.media.extract import (
+    MediaTooLongError,
+    declared_duration,
+    download_audio,
+)
 from calliope.media.silence import detect_silence
 from calliope.settings import settings
+from calliope.transcription.intervals import Interval, format_clock, render_intervals
+from calliope.transcription.scheduler import (
+    AdmissionRejectedError,
+    ChatQueueFullError,
+    OverloadedError,
+    Priority,
+)
+from calliope.transcription.streaming import Delivery, reload_note
+
+# Intervallo minimo tra due aggiornamenti del messaggio di avanzamento.
+PROGRESS_INTERVAL_S = 5.0
 
 
 async def timestamp(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     logger.info(f"Request from: {update.message.from_user.username}")
 
-    storage = context.bot_data["storage"]
-    transcriber = context.bot_data["transcriber"]
-
     message = update.effective_message
     if message is None:
         return
@@ -28,19 +48,87 @@ async def timestamp(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await message.reply_text("🔒 This Calliope instance is private.")
         return
 
+    language = resolve_language(context, update, message.chat_id)
+    # Con la coda persistente il video è solo accodato (vedi JobRunner).
+    if await enqueue_job(context, update, "timestamp", language, Priority.BATCH):
+        return
+    await transcribe_video(update, context, language)
+
+
+async def transcribe_video(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    language: str | None,
+    *,
+    admit: bool = True,
+    delivery: Delivery | None = None,
+) -> None:
+    """Admission e trascrizione con timestamp di un video (``admit`` e
+    ``delivery`` come in :func:`~calliope.handlers.transcribe.transcribe_voice`)."""
+    transcriber = context.bot_data["transcriber"]
+    message = update.effective_message
+    if message is None:
+        return
+
+    # Admission control: posto in coda per la chat e SLA sull'attesa stimata
+    # (sul modello scelto dal router), verificati prima del download.
+    model_name = transcriber.route(declared_duration(message), language)
+    profile = transcriber.decoding_profile("video", declared_duration(message))
+    admission: AbstractContextManager = nullcontext()
+    if admit:
+        try:
+            admission = await transcriber.admit(
+                message.chat_id,
+                duration=declared_duration(message),
+                priority=Priority.BATCH,
+                model_name=model_name,
+            )
+        except ChatQueueFullError as e:
+            logger.info(f"Chat {message.chat_id}: queue full, rejecting video")
+            await message.reply_text(rejection_text(e))
+            return
+        except OverloadedError as e:
+            logger.info(f"Overloaded (eta {e.eta_s:.0f}s), rejecting video")
+            await message.reply_text(rejection_text(e))
+            return
+    with admission:
+        await _transcribe_video(
+            update, context, message, language, model_name, profile, delivery
+        )
+
+
+async def _transcribe_video(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    message: Message,
+    language: str | None,
+    model_name: str,
+    profile: str,
+    delivery: Delivery | None = None,
+) -> None:
+    """Download, pre-filtro di silenzio e trascrizione con timestamp del video."""
+    transcriber = context.bot_data["transcriber"]
+
     # Download + estrazione audio (video via ffmpeg). Limite di durata verificato
     # prima del download; niente str(e) esposto all'utente.
     try:
         audio_data = await download_audio(
-            context.bot, message, max_duration_s=settings.max_media_duration_s
+            context.bot,
+            message,
+            max_duration_s=settings.max_media_duration_s,
+            proxy=settings.telegram_proxy,
+            timeout_s=settings.telegram_timeout_s,
         )
     except MediaTooLongError as e:
         await message.reply_text(
             f"⏱ This video is too long ({e.duration}s). The limit is {e.limit}s."
         )
         return
-    except BadRequest:
-        logger.warning(f"Could not download video from chat {message.chat_id}")
+    except NetworkError as e:
+        # BadRequest (es. file troppo grande) o download interrotto a metà.
+        logger.warning(
+            f"Could not download video from chat {message.chat_id}: {type(e).__name__}"
+        )
         await message.reply_text("Couldn't download this video (is it too large?).")
         return
 
@@ -55,18 +143,82 @@ async def timestamp(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         )
         await update.message.set_reaction("🔇")
         return
+    # Lingua imparata: solo ora che l'audio va davvero al modello, dopo il
+    # router (vedi learned_language).
+    if language is None:
+        language = learned_language(context, message.chat_id)
 
     # Trascrizione con timestamp direttamente dall'array audio (fuori dall'event
-    # loop). Azione "typing" come feedback durante l'elaborazione.
+    # loop). Gli intervalli arrivano man mano: un messaggio di stato mostra fin
+    # dove è arrivato il decoder, aggiornato al massimo ogni PROGRESS_INTERVAL_S.
     await context.bot.send_chat_action(message.chat_id, ChatAction.TYPING)
-    language = storage.get_language(update) or settings.default_language
-    result_str = await transcriber.transcribe_with_timestamps(
-        audio_data.samples, language=language
-    )
+    total = audio_data.samples.size / audio_data.sample_rate
+    # Lavoro della coda ripetuto: il messaggio di stato è quello del tentativo
+    # precedente, non uno nuovo.
+    if delivery is not None:
+        status = await delivery.reply(message, _progress_text(0, total))
+    else:
+        status = await message.reply_text(
+            _progress_text(0, total), disable_notification=True
+        )
+    intervals: list[Interval] = []
+    notes: list[str] = []  # tempo di ricarica dei modelli, se scaricati
+    last_update = time.monotonic()
+    try:
+        async with aclosing(
+            transcriber.stream_intervals(
+                audio_data.samples,
+                language,
+                duration=audio_data.duration,
+                priority=Priority.BATCH,
+                chat_id=message.chat_id,
+                model_name=model_name,
+                profile=profile,
+                on_reload=lambda seconds: notes.append(reload_note(seconds)),
+            )
+        ) as stream:
+            async for interval in stream:
+                intervals.append(interval)
+                if time.monotonic() - last_update >= PROGRESS_INTERVAL_S:
+                    last_update = time.monotonic()
+                    await _show_progress(status, interval.end, total, notes)
+    except AdmissionRejectedError as e:
+        # Worker remoto: l'ammissione ripetuta alla ricezione dell'audio può
+        # fallire se la coda si è riempita durante il download.
+        logger.info(f"Chat {message.chat_id}: video rejected by the worker ({e})")
+        await status.edit_text(rejection_text(e))
+        return
 
     # Inviamo il risultato come file .txt costruito in memoria (nessun file
     # temporaneo su disco).
-    document = io.BytesIO(result_str.encode("utf-8"))
+    document = io.BytesIO(render_intervals(intervals).encode("utf-8"))
     document.name = "trascrizione.txt"
     await update.message.reply_document(document=document, filename="trascrizione.txt")
-    logger.success("Trascrizione completata")
+    await _show_progress(status, total, total, notes)
+    logger.success(
+        f"{update.message.from_user.username}: transcribed {audio_data.duration}s "
+        f"video in {len(intervals)} intervals "
+        f"[lang={language or 'auto'}, model={model_name}, profile={profile}]"
+    )
+
+
+def _progress_text(
+    done_s: float, total_s: float, notes: list[str] | None = None
+) -> str:
+    if done_s >= total_s:
+        text = f"✅ Transcribed {format_clock(total_s)}"
+    else:
+        text = f"⏳ Transcribing… {format_clock(done_s)} / {format_clock(total_s)}"
+    return "\n".join([text, *(notes or [])])
+
+
+async def _show_progress(
+    status: Message, done_s: float, total_s: float, notes: list[str] | None = None
+) -> None:
+    """Aggiorna il messaggio di stato (con le eventuali ``notes`` sotto); un
+    errore (es. flood control) non interrompe la trascrizione: l'avanzamento è
+    solo informativo."""
+    try:
+        await status.edit_text(_progress_text(done_s, total_s, notes))
+    except TelegramError as e:
+        logger.debug(f"Could not update progress: {e}")
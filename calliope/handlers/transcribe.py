@@ -1,25 +1,47 @@
 import asyncio
 import time
+from contextlib import AbstractContextManager, aclosing, nullcontext
+from datetime import timedelta
+from functools import partial
 
 from loguru import logger
-from telegram import Update
+from telegram import Message, Update
 from telegram.constants import ChatAction, ReactionEmoji
-from telegram.error import BadRequest
+from telegram.error import BadRequest, NetworkError
 from telegram.ext import ContextTypes
 
-from calliope.media.extract import MediaTooLongError, download_audio
+from calliope.handlers.stop import job_key, stop_keyboard, track_job
+from calliope.media.extract import (
+    MediaTooLongError,
+    attachment_file_id,
+    attachment_unique_id,
+    declared_duration,
+    download_audio,
+)
 from calliope.media.silence import detect_silence
 from calliope.notifier import notify_registration
 from calliope.settings import settings
-from calliope.transcription.streaming import TranscriptionStreamer
+from calliope.storage.jobs import JobKind
+from calliope.transcription.cache import cache_key
+from calliope.transcription.formatting import format_timedelta
+from calliope.transcription.scheduler import (
+    AdmissionRejectedError,
+    ChatQueueFullError,
+    OverloadedError,
+    Priority,
+)
+from calliope.transcription.singleflight import Flight, FlightOutcome
+from calliope.transcription.streaming import (
+    WAKING_UP_STATUS,
+    Delivery,
+    TranscriptionStreamer,
+    reload_note,
+)
 
 
 async def stt(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     logger.info(f"Request from: {update.message.from_user.username}")
 
-    storage = context.bot_data["storage"]
-    transcriber = context.bot_data["transcriber"]
-
     message = update.effective_message
     if message is None:
         return
@@ -30,21 +52,294 @@ async def stt(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         await message.reply_text("🔒 This Calliope instance is private.")
         return
 
+    language = resolve_language(context, update, message.chat_id)
+    # Con la coda persistente l'handler si limita ad accodare: trascrive
+    # l'istanza che prende in carico il lavoro (JobRunner).
+    if await enqueue_job(context, update, "stt", language, Priority.INTERACTIVE):
+        return
+    await transcribe_voice(update, context, language)
+
+
+async def transcribe_voice(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    language: str | None,
+    *,
+    admit: bool = True,
+    delivery: Delivery | None = None,
+) -> None:
+    """Cache, single-flight, admission e trascrizione di un vocale.
+
+    ``admit=False`` salta l'admission control: i lavori della coda persistente
+    sono già stati accettati (l'attesa è nella coda, non nello scheduler).
+    ``delivery`` (lavori della coda) riusa i messaggi di un tentativo fallito.
+    """
+    transcriber = context.bot_data["transcriber"]
+    cache = context.bot_data["transcript_cache"]
+    flights = context.bot_data["flights"]
+    message = update.effective_message
+    if message is None:
+        return
+
+    # Il modello è scelto dal router (durata dichiarata e lingua della chat), il
+    # profilo di decodifica dalle regole del percorso vocale.
+    # Cache: lo stesso file (es. un vocale inoltrato in più gruppi) già
+    # trascritto con la stessa lingua, lo stesso modello e lo stesso profilo
+    # viene rimandato subito, senza download, coda né inferenza.
+    model_name = transcriber.route(declared_duration(message), language)
+    profile = transcriber.decoding_profile("voice", declared_duration(message))
+    transcript_key = cache_key(
+        attachment_unique_id(message), language, model_name, profile
+    )
+    cached = cache.get(transcript_key)
+    if cached is not None:
+        await _reply_cached(update, context, message, cached)
+        return
+
+    # Single-flight: se lo stesso file è già in trascrizione (es. inoltrato in
+    # più gruppi nello stesso momento) ci si aggancia a quel job invece di
+    # accodarne un altro. Se il job fallisce si prosegue con una richiesta propria.
+    flight = flights.get(transcript_key)
+    if flight is not None and await _follow(update, context, message, flight):
+        return
+
+    # Admission control: ogni chat ha un numero massimo di richieste pendenti
+    # e l'attesa stimata (dalla durata dichiarata) non deve superare lo SLA. Il
+    # posto è prenotato PRIMA del download (nessun download per richieste che
+    # non verrebbero servite) e rilasciato a fine trascrizione.
+    admission: AbstractContextManager = nullcontext()
+    if admit:
+        try:
+            admission = await transcriber.admit(
+                message.chat_id,
+                duration=declared_duration(message),
+                priority=Priority.INTERACTIVE,
+                model_name=model_name,
+            )
+        except ChatQueueFullError as e:
+            logger.info(f"Chat {message.chat_id}: queue full, rejecting request")
+            await message.reply_text(rejection_text(e))
+            return
+        except OverloadedError as e:
+            logger.info(f"Overloaded (eta {e.eta_s:.0f}s), rejecting request")
+            await message.reply_text(rejection_text(e))
+            return
+    with admission, flights.lead(transcript_key) as flight:
+        await _transcribe(
+            update,
+            context,
+            message,
+            language,
+            model_name,
+            profile,
+            transcript_key,
+            flight,
+            delivery,
+        )
+
+
+def resolve_language(
+    context: ContextTypes.DEFAULT_TYPE, update: Update, chat_id: int
+) -> str | None:
+    """Lingua esplicita della chat: /lang o DEFAULT_LANGUAGE (None = auto).
+
+    È la lingua usata da router e cache. La lingua imparata
+    (:func:`learned_language`) si applica dopo, solo alla decodifica.
+    """
+    storage = context.bot_data["storage"]
+    return storage.get_language(update) or settings.default_language
+
+
+def learned_language(context: ContextTypes.DEFAULT_TYPE, chat_id: int) -> str | None:
+    """Lingua imparata della chat per una richiesta in auto che arriva
+    all'inferenza (None = rileva, anche al re-check).
+
+    Va chiamata solo quando la decodifica parte davvero: ogni chiamata conta
+    come richiesta servita con la lingua fissata. Non entra nel routing: le
+    regole per lingua del router sono pensate per una scelta esplicita.
+    """
+    return context.bot_data["language_pinner"].language_for(chat_id)
+
+
+async def enqueue_job(
+    context: ContextTypes.DEFAULT_TYPE,
+    update: Update,
+    kind: JobKind,
+    language: str | None,
+    priority: Priority,
+) -> bool:
+    """Accoda il messaggio sulla coda persistente, se attiva.
+
+    Ritorna False se la coda non è configurata o MongoDB non risponde: il
+    chiamante trascrive allora subito, come senza coda.
+    """
+    queue = context.bot_data.get("job_queue")
+    if queue is None:
+        return False
+    message = update.effective_message
+    if message is None:
+        return False
+    try:
+        added = await asyncio.to_thread(
+            queue.enqueue,
+            kind,
+            chat_id=message.chat_id,
+            message_id=message.message_id,
+            file_id=attachment_file_id(message),
+            language=language,
+            priority=int(priority),
+            update=update.to_dict(),
+        )
+    except Exception as e:
+        logger.error(f"Could not enqueue job, transcribing inline: {e}")
+        return False
+    if added:
+        logger.info(f"Chat {message.chat_id}: {kind} job queued")
+        # Feedback immediato: la reaction ✍ dice che il messaggio è in coda.
+        try:
+            await message.set_reaction(ReactionEmoji.WRITING_HAND)
+        except BadRequest as e:
+            logger.warning(f"Could not set queued reaction: {e}")
+    return True
+
+
+def overloaded_text(error: OverloadedError) -> str:
+    """Risposta all'utente quando la richiesta è rifiutata per sovraccarico."""
+    wait = format_timedelta(timedelta(seconds=round(error.eta_s)))
+    return (
+        f"🚦 Calliope is very busy right now (estimated wait {wait}). "
+        "Please try again later."
+    )
+
+
+def rejection_text(error: AdmissionRejectedError) -> str:
+    """Risposta all'utente per una richiesta rifiutata dall'admission control."""
+    if isinstance(error, OverloadedError):
+        return overloaded_text(error)
+    return (
+        "⏳ Too many messages from this chat are already waiting. "
+        "Please try again in a moment."
+    )
+
+
+async def _reply_cached(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, message: Message, text: str
+) -> None:
+    """Invia una trascrizione presa dalla cache (l'uso conta nelle statistiche)."""
+    storage = context.bot_data["storage"]
+    duration = declared_duration(message)
+    registration = storage.update(update, duration)
+    if registration:
+        await notify_registration(context.bot, registration, update)
+
+    streamer = TranscriptionStreamer(message)
+    await streamer.start()
+    await streamer.add(text)
+    await streamer.finish()
+    logger.success(
+        f"{update.message.from_user.username}: served {duration}s audio "
+        f"({len(text)} chars) from cache"
+    )
+
+
+async def _follow(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, message: Message, flight: Flight
+) -> bool:
+    """Mostra in questa chat i segmenti di un job identico già in corso.
+
+    Il placeholder compare con il primo segmento ricevuto (l'audio potrebbe
+    rivelarsi silenzioso). Ritorna False se il job condiviso è fallito prima
+    di produrre testo: il chiamante trascrive allora per conto proprio.
+    """
+    logger.info(f"Chat {message.chat_id}: joining an identical running transcription")
+    streamer = TranscriptionStreamer(message)
+    started = False
+    async for text in flight.follow():
+        if not started:
+            await streamer.start()
+            started = True
+        await streamer.add(text)
+
+    if flight.outcome is FlightOutcome.SILENT:
+        await _react_silent(message)
+        return True
+    if flight.outcome is FlightOutcome.FAILED:
+        if not started:
+            return False
+        raise RuntimeError("Shared transcription failed after producing text")
+
+    duration = declared_duration(message)
+    registration = context.bot_data["storage"].update(update, duration)
+    if registration:
+        await notify_registration(context.bot, registration, update)
+    if not started:
+        await streamer.start()
+    if flight.outcome is FlightOutcome.STOPPED:
+        await streamer.stop()
+    else:
+        await streamer.finish()
+    logger.success(
+        f"{update.message.from_user.username}: shared {duration}s audio "
+        f"({len(streamer.text)} chars) with {flight.followers} identical request(s)"
+    )
+    return True
+
+
+async def _react_silent(message: Message) -> None:
+    """Reaction 🙊 su un audio senza parlato."""
+    # Solo le emoji dell'enum ReactionEmoji sono accettate da Telegram come
+    # reaction standard (🔇 non lo è → BadRequest). La reaction è puramente
+    # cosmetica: se non è possibile impostarla (permessi, ecc.) si degrada
+    # a un semplice log senza propagare all'error handler globale.
+    try:
+        await message.set_reaction(ReactionEmoji.SPEAK_NO_EVIL_MONKEY)
+    except BadRequest as e:
+        logger.warning(f"Could not set silence reaction: {e}")
+
+
+async def _transcribe(
+    update: Update,
+    context: ContextTypes.DEFAULT_TYPE,
+    message: Message,
+    language: str | None,
+    model_name: str,
+    profile: str,
+    transcript_key: str,
+    flight: Flight,
+    delivery: Delivery | None = None,
+) -> None:
+    """Download, pre-filtro di silenzio e trascrizione in streaming di ``message``.
+
+    I segmenti sono pubblicati anche su ``flight`` per le richieste identiche
+    agganciate a questo job.
+    """
+    storage = context.bot_data["storage"]
+    transcriber = context.bot_data["transcriber"]
+    cache = context.bot_data["transcript_cache"]
+    pinner = context.bot_data["language_pinner"]
+
     # Download + estrazione audio (voice/video_note via ffmpeg). Il limite di
     # durata è verificato PRIMA del download: media troppo lunghi sono rifiutati
     # senza scaricare nulla.
     start_time = time.time()
     try:
         audio_data = await download_audio(
-            context.bot, message, max_duration_s=settings.max_media_duration_s
+            context.bot,
+            message,
+            max_duration_s=settings.max_media_duration_s,
+            proxy=settings.telegram_proxy,
+            timeout_s=settings.telegram_timeout_s,
         )
     except MediaTooLongError as e:
         await message.reply_text(
             f"⏱ This message is too long ({e.duration}s). The limit is {e.limit}s."
         )
         return
-    except BadRequest:
-        logger.warning(f"Could not download media from chat {message.chat_id}")
+    except NetworkError as e:
+        # BadRequest (es. file troppo grande) o download interrotto a metà.
+        logger.warning(
+            f"Could not download media from chat {message.chat_id}: {type(e).__name__}"
+        )
         await message.reply_text("Couldn't download this message (is it too large?).")
         return
     duration = audio_data.duration
@@ -59,15 +354,13 @@ async def stt(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         logger.info(
             f"{message.from_user.username}: silent audio, skipping transcription"
         )
-        # Solo le emoji dell'enum ReactionEmoji sono accettate da Telegram come
-        # reaction standard (🔇 non lo è → BadRequest). La reaction è puramente
-        # cosmetica: se non è possibile impostarla (permessi, ecc.) si degrada
-        # a un semplice log senza propagare all'error handler globale.
-        try:
-            await message.set_reaction(ReactionEmoji.SPEAK_NO_EVIL_MONKEY)
-        except BadRequest as e:
-            logger.warning(f"Could not set silence reaction: {e}")
+        flight.close(FlightOutcome.SILENT)
+        await _react_silent(message)
         return
+    # Lingua imparata: solo ora che l'audio va davvero al modello, dopo router
+    # e cache (vedi learned_language).
+    if language is None:
+        language = learned_language(context, message.chat_id)
 
     # Solo l'uso reale (audio con parlato) viene conteggiato nelle statistiche.
     registration = storage.update(update, duration)
@@ -79,20 +372,131 @@ async def stt(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # Gli errori imprevisti dell'inferenza propagano all'error handler globale
     # (messaggio generico all'utente + notifica all'owner).
     start_time = time.time()
-    language = storage.get_language(update) or settings.default_language
     await context.bot.send_chat_action(message.chat_id, ChatAction.TYPING)
-    streamer = TranscriptionStreamer(message)
-    await streamer.start()
-    async for text in transcriber.stream_segments(
-        audio_data.samples, language=language
-    ):
-        await streamer.add(text)
-    await streamer.finish()
+    key = job_key(message)
+    streamer = TranscriptionStreamer(message, delivery=delivery)
+    await streamer.start(reply_markup=stop_keyboard(key))
+    # Modelli scaricati per inattività: questo job li ricarica, l'utente vede
+    # perché attende e, in fondo al testo, quanto è durata la ricarica.
+    if not transcriber.loaded:
+        streamer.show_status(WAKING_UP_STATUS)
+
+    # Due passate per i vocali lunghi (se configurato): il modello di anteprima
+    # riempie subito il placeholder, il testo definitivo lo sostituisce a fine
+    # trascrizione. Senza anteprima il testo definitivo è mostrato man mano.
+    preview = transcriber.wants_preview(duration)
+    refined: list[str] = []
+    # In auto-detect la lingua rilevata alimenta la lingua imparata della chat.
+    on_info = partial(pinner.observe, message.chat_id) if language is None else None
+
+    async def _refine() -> None:
+        # aclosing: se il task viene annullato il generatore si chiude subito
+        # e l'inferenza si ferma al segmento successivo.
+        async with aclosing(
+            transcriber.stream_segments(
+                audio_data.samples,
+                language=language,
+                duration=duration,
+                priority=Priority.INTERACTIVE,
+                chat_id=message.chat_id,
+                on_queue=streamer.show_queue_status,
+                model_name=model_name,
+                on_info=on_info,
+                profile=profile,
+                on_reload=lambda seconds: streamer.add_note(reload_note(seconds)),
+            )
+        ) as segments:
+            async for text in segments:
+                flight.publish(text)
+                refined.append(text)
+                if not preview:
+                    await streamer.add(text)
+
+    async def _stream() -> None:
+        if not preview:
+            await _refine()
+            return
+        # Il lock impedisce di annullare l'anteprima a metà di un edit.
+        lock = asyncio.Lock()
+        preview_task = asyncio.ensure_future(
+            _stream_preview(transcriber, streamer, lock, audio_data.samples, language)
+        )
+        try:
+            await _refine()
+        finally:
+            async with lock:
+                preview_task.cancel()
+            await asyncio.gather(preview_task, return_exceptions=True)
+        await streamer.replace("".join(refined) or "🔇")
+
+    # Lo streaming gira in un task a sé: il pulsante "Stop" annulla solo
+    # quello, l'handler prosegue e chiude il messaggio con il testo parziale.
+    task = asyncio.ensure_future(_stream())
+    rejected: AdmissionRejectedError | None = None
+    with track_job(context.bot_data, key, message.from_user.id, task) as job:
+        try:
+            await task
+        except asyncio.CancelledError:
+            if not job.stopped:
+                raise  # annullamento dell'handler (es. shutdown): propaga
+        except AdmissionRejectedError as e:
+            # Con il worker remoto l'ammissione è ripetuta quando riceve
+            # l'audio: la coda può essersi riempita durante il download.
+            rejected = e
+    if rejected is not None:
+        logger.info(
+            f"Chat {message.chat_id}: request rejected by the worker ({rejected})"
+        )
+        flight.close(FlightOutcome.FAILED)
+        await streamer.abort(rejection_text(rejected))
+        return
+    if job.stopped:
+        # Lo stop di chi ha avviato il job ferma l'inferenza condivisa: anche
+        # le chat agganciate ricevono il testo parziale.
+        flight.close(FlightOutcome.STOPPED)
+        # Con l'anteprima il testo in chat è quello della prima passata: non
+        # resta lì, lo sostituisce la parte definitiva prodotta finora.
+        await streamer.stop("".join(refined) if preview else None)
+    else:
+        flight.close(FlightOutcome.DONE)
+        # Solo le trascrizioni complete e non vuote finiscono in cache.
+        transcript = "".join(refined)
+        if transcript.strip():
+            cache.put(transcript_key, transcript)
+        await streamer.finish()
 
     # Log di solo metadati (nessun testo di trascrizione): utente, durata audio,
-    # caratteri prodotti, tempo di elaborazione, lingua richiesta.
+    # caratteri prodotti, tempo di elaborazione, lingua richiesta, modello e
+    # profilo di decodifica.
+    outcome = "stopped after" if job.stopped else "transcribed"
     logger.success(
-        f"{update.message.from_user.username}: transcribed {duration}s audio "
+        f"{update.message.from_user.username}: {outcome} {duration}s audio "
         f"({len(streamer.text)} chars) in {round(time.time() - start_time, 2)}s "
-        f"[lang={language or 'auto'}]"
+        f"[lang={language or 'auto'}, model={model_name}, profile={profile}"
+        f"{', with preview' if preview else ''}]"
     )
+
+
+async def _stream_preview(
+    transcriber, streamer: TranscriptionStreamer, lock: asyncio.Lock, samples, language
+) -> None:
+    """Prima passata: il modello di anteprima riempie subito il placeholder.
+
+    Gira nella corsia dell'anteprima e senza chat (flusso a sé), quindi non
+    ritarda la passata definitiva né i job delle altre chat. Un errore
+    dell'anteprima non interrompe la trascrizione definitiva.
+    """
+    try:
+        async with aclosing(
+            transcriber.stream_segments(
+                samples,
+                language=language,
+                priority=Priority.INTERACTIVE,
+                model_name=transcriber.preview_lane,
+            )
+        ) as segments:
+            async for text in segments:
+                async with lock:
+                    await streamer.add(text)
+    except Exception as e:
+        logger.warning(f"Preview transcription failed: {e}")
@@ -1,4 +1,11 @@
+import argparse
+import asyncio
+import signal
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import TypeVar
 
 from loguru import logger
 from telegram import BotCommand
@@ -15,13 +22,23 @@ from calliope.handlers.help import help_command
 from calliope.handlers.language import change_language
 from calliope.handlers.start import start
 from calliope.handlers.stats import stats
+from calliope.handlers.stop import stop_callback
 from calliope.handlers.timestamp import timestamp
 from calliope.handlers.transcribe import stt
 from calliope.logging_setup import setup_logging
-from calliope.settings import settings
+from calliope.runner import JobRunner
+from calliope.settings import Settings, settings
+from calliope.storage.jobs import JobQueue
 from calliope.storage.mongo import MongoStorage
+from calliope.transcription.cache import TranscriptCache
+from calliope.transcription.language import LanguagePinner
+from calliope.transcription.remote import RemoteTranscriber
+from calliope.transcription.singleflight import SingleFlight
+from calliope.transcription.tuning import TuneResult, tune_and_save
 from calliope.transcription.whisper import WhisperTranscriber
 
+T = TypeVar("T")
+
 # Comandi mostrati nel menu di Telegram (impostati all'avvio via set_my_commands).
 BOT_COMMANDS = [
     BotCommand("start", "Start the bot"),
@@ -32,9 +49,22 @@ BOT_COMMANDS = [
 
 
 async def _post_init(application: Application) -> None:
-    """Registra i comandi del bot e memorizza l'istante di avvio (uptime)."""
+    """Registra i comandi del bot, memorizza l'istante di avvio (uptime) e
+    avvia il conto alla rovescia dello scarico per inattività."""
     application.bot_data["start_time"] = datetime.now()
     await application.bot.set_my_commands(BOT_COMMANDS)
+    application.bot_data["transcriber"].schedule_idle_unload()
+    runner = application.bot_data.get("job_runner")
+    if runner is not None:
+        runner.start()
+
+
+async def _post_stop(application: Application) -> None:
+    """Ferma il runner dei lavori (attende quelli in corso) prima dello shutdown
+    del bot, che serve ancora a consegnarne i risultati."""
+    runner = application.bot_data.get("job_runner")
+    if runner is not None:
+        await runner.stop()
 
 
 async def _post_shutdown(application: Application) -> None:
@@ -53,38 +83,158 @@ async def _post_shutdown(application: Application) -> None:
         storage.close()
 
 
+def _timed(phase: str, build: Callable[[], T]) -> T:
+    """Esegue una fase dell'avvio e ne registra la durata nel log."""
+    started = time.perf_counter()
+    result = build()
+    logger.info(f"Startup: {phase} in {time.perf_counter() - started:.2f}s")
+    return result
+
+
+def _build_transcriber(settings: Settings) -> WhisperTranscriber | RemoteTranscriber:
+    """Il transcriber locale o il client del ``calliope-worker`` (``remote``)."""
+    if settings.inference_backend == "remote":
+        return RemoteTranscriber(settings)
+    return WhisperTranscriber(settings)
+
+
+def _build_job_runner(
+    application: Application, storage: MongoStorage
+) -> JobRunner | None:
+    """Coda persistente e runner, se abilitati e con MongoDB raggiungibile."""
+    if not settings.job_queue_enabled:
+        return None
+    if not storage.available:
+        logger.warning("Job queue enabled but MongoDB unavailable: transcribing inline")
+        return None
+    queue = JobQueue(storage.db, settings)
+    application.bot_data["job_queue"] = queue
+    return JobRunner(
+        application,
+        queue,
+        concurrency=settings.job_concurrency,
+        poll_interval_s=settings.job_poll_interval_s,
+    )
+
+
+async def _run_jobs_only(application: Application) -> None:
+    """Istanza senza polling (JOB_WORKER_ONLY): esegue lavori fino a SIGTERM/SIGINT."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    async with application:  # initialize/shutdown del bot
+        application.bot_data["start_time"] = datetime.now()
+        application.bot_data["transcriber"].schedule_idle_unload()
+        application.bot_data["job_runner"].start()
+        logger.info("Worker-only instance: not polling Telegram")
+        await stop.wait()
+        await _post_stop(application)
+    await _post_shutdown(application)
+
+
+def tune() -> None:
+    """``calliope tune``: misura le configurazioni candidate e salva la migliore.
+
+    Va eseguito sulla macchina di produzione (a bot fermo: le misure usano
+    tutti i core); i boot successivi riusano il risultato.
+    """
+    setup_logging(settings)
+    device = WhisperTranscriber._resolve_device(settings)
+    print(f"Tuning {settings.whisper_model} on {device}")
+    print(f"{'compute_type':<16}{'cpu_threads':>12}{'inter_threads':>15}{'rtf':>8}")
+
+    def _show(result: TuneResult) -> None:
+        print(
+            f"{result.compute_type:<16}{result.cpu_threads:>12}"
+            f"{result.inter_threads:>15}{result.rtf:>8.3f}"
+        )
+
+    best = tune_and_save(settings, device, on_result=_show)
+    print("Best:")
+    _show(best)
+    print(f"Saved to {settings.whisper_tune_file}")
+
+
 def main() -> None:
-    """Bootstrap esplicito: logging → storage → modello → application.
+    """Entry point di ``calliope``: avvia il bot o, con ``tune``, l'auto-tuning."""
+    parser = argparse.ArgumentParser(prog="calliope")
+    parser.add_argument(
+        "command",
+        nargs="?",
+        choices=["run", "tune"],
+        default="run",
+        help="run the bot (default) or tune compute type and threads",
+    )
+    if parser.parse_args().command == "tune":
+        tune()
+        return
+    run()
+
+
+def run() -> None:
+    """Bootstrap esplicito: logging → storage e modello → warm-up → application.
 
     Tutte le risorse costose sono create qui (nessun side effect a import-time)
-    e iniettate negli handler tramite ``application.bot_data``.
+    e iniettate negli handler tramite ``application.bot_data``. La connessione
+    a MongoDB (fino a 5 s di timeout) e il caricamento del modello sono
+    indipendenti e avvengono in parallelo; il warm-up segue il caricamento.
     """
     setup_logging(settings)
     logger.info("Starting Calliope")
+    startup = time.perf_counter()
 
-    storage = MongoStorage(settings)
-    transcriber = WhisperTranscriber(settings)
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="startup") as pool:
+        storage_future = pool.submit(
+            _timed, "storage ready", lambda: MongoStorage(settings)
+        )
+        transcriber_future = pool.submit(
+            _timed, "model loaded", lambda: _build_transcriber(settings)
+        )
+        storage = storage_future.result()
+        transcriber = transcriber_future.result()
+    if settings.whisper_warmup:
+        _timed("model warm-up", transcriber.warmup)
+    transcript_cache = TranscriptCache(settings.transcript_cache_size, storage)
 
-    application = (
+    builder = (
         Application.builder()
         .token(settings.telegram_token.get_secret_value())
-        .read_timeout(60)
-        .write_timeout(60)
+        .read_timeout(settings.telegram_timeout_s)
+        .write_timeout(settings.telegram_timeout_s)
         # Gestisce gli update in modo concorrente: i comandi (/start, /help, ...)
         # rispondono anche mentre è in corso una trascrizione (che gira comunque
         # su un thread executor dedicato, fuori dall'event loop).
         .concurrent_updates(True)
         .post_init(_post_init)
+        .post_stop(_post_stop)
         .post_shutdown(_post_shutdown)
-        .build()
     )
+    if settings.telegram_proxy:
+        # Lo stesso proxy serve sia le chiamate API sia il long polling.
+        builder = builder.proxy(settings.telegram_proxy).get_updates_proxy(
+            settings.telegram_proxy
+        )
+    application = builder.build()
 
     # Dependency injection: gli handler leggono queste chiavi da context.bot_data.
     application.bot_data["settings"] = settings
     application.bot_data["storage"] = storage
     application.bot_data["transcriber"] = transcriber
+    application.bot_data["transcript_cache"] = transcript_cache
+    application.bot_data["flights"] = SingleFlight()
+    application.bot_data["language_pinner"] = LanguagePinner(
+        storage,
+        min_detections=settings.language_pin_detections,
+        min_probability=settings.language_pin_min_probability,
+        recheck_every=settings.language_pin_recheck_every,
+    )
+    runner = _build_job_runner(application, storage)
+    application.bot_data["job_runner"] = runner
 
-    logger.info("Application is running")
+    logger.info(
+        f"Application is running (startup took {time.perf_counter() - startup:.2f}s)"
+    )
 
     # on different commands - answer in Telegram
     application.add_handler(CommandHandler("start", start))
@@ -95,6 +245,7 @@ def main() -> None:
     application.add_handler(
         CallbackQueryHandler(broadcast_callback, pattern="^broadcast:")
     )
+    application.add_handler(CallbackQueryHandler(stop_callback, pattern="^stop:"))
 
     application.add_handler(MessageHandler(filters.VOICE & ~filters.COMMAND, stt))
     application.add_handler(MessageHandler(filters.VIDEO_NOTE & ~filters.COMMAND, stt))
@@ -103,6 +254,10 @@ def main() -> None:
     # Handler globale degli errori (notifica l'owner, risposta generica all'utente)
     application.add_error_handler(error_handler)
 
+    if runner is not None and settings.job_worker_only:
+        asyncio.run(_run_jobs_only(application))
+        return
+
     # Run the bot until the user presses Ctrl-C
     application.run_polling()
 
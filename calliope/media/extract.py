@@ -8,20 +8,35 @@ La decodifica usa **ffmpeg diretto** (nessun moviepy, nessun librosa): elimina
 la dipendenza pesante, i leak di ``VideoFileClip`` e il doppio ricampionamento
 ogg→librosa→whisper. Si decodifica direttamente a 16 kHz mono (la frequenza a
 cui lavora faster-whisper), quindi il modello non deve ricampionare di nuovo.
+
+Voice e video_note non passano dal disco: i byte scaricati da Telegram sono
+scritti nello stdin di ffmpeg man mano che arrivano, mentre il PCM è letto da
+stdout, così la decodifica procede insieme al download. Il file temporaneo
+resta per i video e come ripiego per gli MP4 con il moov atom in coda (ffmpeg
+deve poter tornare indietro nel file, impossibile su una pipe).
 """
 
 import asyncio
 import os
 import tempfile
+from collections.abc import AsyncGenerator, AsyncIterator
+from contextlib import aclosing
 from dataclasses import dataclass
 from datetime import timedelta
 
+import httpx
 import numpy as np
 from loguru import logger
-from telegram import Bot, Message
+from telegram import Bot, File, Message
+from telegram.error import NetworkError
 
 # faster-whisper lavora a 16 kHz mono: decodifichiamo direttamente al target.
 SAMPLE_RATE = 16000
+# Byte letti al massimo in testa a un file per capire se è un MP4 con il moov
+# atom in coda (ftyp e le box iniziali occupano poche decine di byte).
+SNIFF_LIMIT = 64 * 1024
+# Timeout del download in streaming se il chiamante non ne indica uno.
+_DOWNLOAD_TIMEOUT_S = 60.0
 
 
 def _to_seconds(duration: int | timedelta | None) -> int:
@@ -75,20 +90,46 @@ def _extract_attachment(message: Message) -> tuple[str, int]:
     )
 
 
-async def _decode_to_pcm(source_path: str) -> np.ndarray:
-    """Decodifica un file media in PCM float32 mono a 16 kHz via ffmpeg.
+def attachment_unique_id(message: Message) -> str:
+    """``file_unique_id`` dell'allegato di ``message``.
 
-    L'input è un file su disco (robusto anche con MP4 il cui moov atom è in
-    coda); l'output PCM raw viene letto da stdout in memoria, senza file
-    intermedi. Solleva ``RuntimeError`` se ffmpeg fallisce.
+    A differenza di ``file_id`` è lo stesso per il medesimo file anche quando
+    viene inoltrato in chat diverse o da bot diversi: è la chiave della cache.
     """
-    process = await asyncio.create_subprocess_exec(
+    for attachment in (message.voice, message.video_note, message.video):
+        if attachment is not None:
+            return attachment.file_unique_id
+    raise UnsupportedMediaError(
+        "Message has no supported audio/video attachment (voice, video_note or video)."
+    )
+
+
+def attachment_file_id(message: Message) -> str:
+    """``file_id`` dell'allegato di ``message`` (per scaricarlo in seguito)."""
+    return _extract_attachment(message)[0]
+
+
+def declared_duration(message: Message) -> int:
+    """Durata in secondi dichiarata da Telegram per l'allegato di ``message``.
+
+    Non scarica nulla: serve alle stime (admission control) prima del download.
+    """
+    return _extract_attachment(message)[1]
+
+
+def _ffmpeg_args(source: str) -> list[str]:
+    """Comando ffmpeg che decodifica ``source`` (file o ``pipe:0``) in PCM
+    float32 mono a 16 kHz su stdout."""
+    # Con l'input su stdin ffmpeg non lo usa per i comandi interattivi;
+    # altrimenti ``-nostdin`` glielo impedisce esplicitamente.
+    interactive = [] if source == "pipe:0" else ["-nostdin"]
+    return [
         "ffmpeg",
-        "-nostdin",
+        *interactive,
         "-threads",
         "0",
         "-i",
-        source_path,
+        source,
         "-vn",  # scarta l'eventuale traccia video
         "-f",
         "f32le",  # PCM float32 little-endian su stdout
@@ -97,41 +138,218 @@ async def _decode_to_pcm(source_path: str) -> np.ndarray:
         "-ar",
         str(SAMPLE_RATE),
         "pipe:1",
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
-    stdout, stderr = await process.communicate()
-    if process.returncode != 0:
+    ]
+
+
+def _pcm(returncode: int | None, stdout: bytes, stderr: bytes) -> np.ndarray:
+    """Campioni dall'output di ffmpeg; ``RuntimeError`` se ffmpeg è fallito."""
+    if returncode != 0:
         detail = stderr.decode("utf-8", "replace").strip().splitlines()
         tail = detail[-1] if detail else "unknown error"
-        raise RuntimeError(f"ffmpeg failed (code {process.returncode}): {tail}")
+        raise RuntimeError(f"ffmpeg failed (code {returncode}): {tail}")
 
     # frombuffer restituisce un array read-only che condivide il buffer di
     # stdout: copiamo per ottenere un array scrivibile e proprietario dei dati.
     return np.frombuffer(stdout, dtype=np.float32).copy()
 
 
+async def _decode_to_pcm(source_path: str) -> np.ndarray:
+    """Decodifica un file media in PCM float32 mono a 16 kHz via ffmpeg.
+
+    L'input è un file su disco (robusto anche con MP4 il cui moov atom è in
+    coda); l'output PCM raw viene letto da stdout in memoria, senza file
+    intermedi. Solleva ``RuntimeError`` se ffmpeg fallisce.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *_ffmpeg_args(source_path),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate()
+    return _pcm(process.returncode, stdout, stderr)
+
+
+async def _decode_stream(chunks: AsyncIterator[bytes]) -> np.ndarray:
+    """Decodifica via ffmpeg i byte di ``chunks`` man mano che arrivano.
+
+    I chunk sono scritti nello stdin di ffmpeg mentre stdout e stderr vengono
+    letti in parallelo: nessuna delle pipe si riempie e la decodifica procede
+    insieme al download. Un errore del download annulla ffmpeg e propaga;
+    ``RuntimeError`` se ffmpeg fallisce.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *_ffmpeg_args("pipe:0"),
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    assert process.stdin and process.stdout and process.stderr
+
+    async def _feed() -> None:
+        assert process.stdin
+        try:
+            async for chunk in chunks:
+                process.stdin.write(chunk)
+                await process.stdin.drain()  # backpressure se ffmpeg è indietro
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # ffmpeg è uscito prima: l'errore arriva dal codice di uscita
+        finally:
+            process.stdin.close()
+
+    try:
+        _fed, stdout, stderr = await asyncio.gather(
+            _feed(), process.stdout.read(), process.stderr.read()
+        )
+    except BaseException:
+        if process.returncode is None:
+            process.kill()
+        await process.wait()
+        raise
+    return _pcm(await process.wait(), stdout, stderr)
+
+
+async def _decode_via_file(chunks: AsyncIterator[bytes]) -> np.ndarray:
+    """Scrive ``chunks`` in un file temporaneo e lo decodifica (input seekable).
+
+    Apertura, scritture e chiusura del file girano in un thread: su un disco
+    lento non bloccano l'event loop (e gli altri download in corso).
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        source_path = os.path.join(temp_dir, "input")
+        source = await asyncio.to_thread(open, source_path, "wb")
+        try:
+            async for chunk in chunks:
+                await asyncio.to_thread(source.write, chunk)
+        finally:
+            await asyncio.to_thread(source.close)
+        return await _decode_to_pcm(source_path)
+
+
+def needs_seekable_input(head: bytes) -> bool | None:
+    """True se ``head`` è l'inizio di un MP4 con i dati (``mdat``) prima del
+    ``moov`` atom: ffmpeg deve leggere la coda del file, non basta una pipe.
+
+    False per i formati leggibili in streaming (Ogg/Opus, MP4 "faststart");
+    None se servono più byte per deciderlo.
+    """
+    if len(head) < 8:
+        return None
+    if head[4:8] != b"ftyp":
+        return False  # non è un MP4/MOV
+    offset = 0
+    while offset + 8 <= len(head):
+        size = int.from_bytes(head[offset : offset + 4], "big")
+        kind = head[offset + 4 : offset + 8]
+        if kind == b"moov":
+            return False
+        if kind == b"mdat":
+            return True
+        if size == 1:  # dimensione a 64 bit dopo il tipo
+            if offset + 16 > len(head):
+                return None
+            size = int.from_bytes(head[offset + 8 : offset + 16], "big")
+        if size < 8:
+            return True  # box fino a fine file o corrotta: meglio il file
+        offset += size
+    return None
+
+
+async def _prepend(
+    head: bytes, chunks: AsyncIterator[bytes]
+) -> AsyncGenerator[bytes, None]:
+    if head:
+        yield head
+    async for chunk in chunks:
+        yield chunk
+
+
+async def _download_chunks(
+    telegram_file: File,
+    proxy: str | None = None,
+    timeout_s: float = _DOWNLOAD_TIMEOUT_S,
+) -> AsyncGenerator[bytes, None]:
+    """I byte del file Telegram man mano che arrivano dalla rete.
+
+    ``File.download_*`` di python-telegram-bot restituisce il file solo a
+    download concluso: qui la richiesta HTTP è fatta in streaming, con gli
+    stessi proxy e timeout configurati per il bot. L'URL contiene il token del
+    bot, quindi non va mai loggato.
+    """
+    try:
+        async with (
+            httpx.AsyncClient(timeout=timeout_s, proxy=proxy) as client,
+            client.stream("GET", str(telegram_file.file_path)) as response,
+        ):
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                yield chunk
+    except httpx.HTTPError as e:
+        # Stesso tipo di errore di un download fatto da python-telegram-bot.
+        raise NetworkError(f"File download failed: {type(e).__name__}") from e
+
+
+def _streamable(message: Message, telegram_file: File) -> bool:
+    """True se l'allegato va decodificato in streaming: voice e video_note
+    scaricati via HTTP (con un Bot API server locale il file è già su disco)."""
+    is_url = str(telegram_file.file_path or "").startswith(("https://", "http://"))
+    return is_url and (message.voice is not None or message.video_note is not None)
+
+
+async def _stream_audio(
+    telegram_file: File, proxy: str | None, timeout_s: float
+) -> np.ndarray:
+    """Scarica e decodifica in streaming, con il file temporaneo come ripiego
+    per gli MP4 con il moov atom in coda (riconosciuti dai primi byte)."""
+    download = _download_chunks(telegram_file, proxy=proxy, timeout_s=timeout_s)
+    async with aclosing(download) as chunks:
+        head = b""
+        seekable = None
+        async for chunk in chunks:
+            head += chunk
+            seekable = needs_seekable_input(head)
+            if seekable is not None or len(head) >= SNIFF_LIMIT:
+                break
+        # aclosing anche qui: su errore o ripiego il generatore va chiuso
+        # subito, non lasciato al garbage collector.
+        async with aclosing(_prepend(head, chunks)) as rest:
+            if seekable is False:
+                return await _decode_stream(rest)
+            logger.debug("MP4 with the moov atom at the end: decoding from a temp file")
+            return await _decode_via_file(rest)
+
+
 async def download_audio(
-    bot: Bot, message: Message, max_duration_s: int | None = None
+    bot: Bot,
+    message: Message,
+    max_duration_s: int | None = None,
+    *,
+    proxy: str | None = None,
+    timeout_s: float = _DOWNLOAD_TIMEOUT_S,
 ) -> AudioData:
     """Scarica l'allegato di ``message`` e ne estrae l'audio.
 
     Gestisce voice, video_note e video restituendo sempre audio mono float32 a
-    16 kHz. Se ``max_duration_s`` è impostato e la durata dichiarata lo supera,
+    16 kHz (voice e video_note decodificati mentre si scaricano, vedi
+    :func:`_stream_audio`). Se ``max_duration_s`` è impostato e la durata dichiarata lo supera,
     solleva ``MediaTooLongError`` **prima** di scaricare il file (nessun download
     sprecato). Solleva ``UnsupportedMediaError`` se il messaggio non ha un
     allegato gestito; propaga gli errori di Telegram (es. ``BadRequest`` per file
-    troppo grandi) e di ffmpeg al chiamante.
+    troppo grandi, ``NetworkError`` anche per un download in streaming
+    interrotto) e di ffmpeg al chiamante. ``proxy`` e ``timeout_s`` valgono
+    per il download in streaming (gli altri passano dal client del bot).
     """
     file_id, duration = _extract_attachment(message)
     if max_duration_s is not None and duration > max_duration_s:
         raise MediaTooLongError(duration, max_duration_s)
     telegram_file = await bot.get_file(file_id)
 
-    with tempfile.TemporaryDirectory() as temp_dir:
-        source_path = os.path.join(temp_dir, "input")
-        await telegram_file.download_to_drive(source_path)
-        samples = await _decode_to_pcm(source_path)
+    if _streamable(message, telegram_file):
+        samples = await _stream_audio(telegram_file, proxy, timeout_s)
+    else:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            source_path = os.path.join(temp_dir, "input")
+            await telegram_file.download_to_drive(source_path)
+            samples = await _decode_to_pcm(source_path)
 
     logger.info(
         f"Audio decoded: {samples.size / SAMPLE_RATE:.1f}s of samples "
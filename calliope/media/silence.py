@@ -1,38 +1,155 @@
-"""Pre-filtro energetico per rilevare l'assenza di parlato in un audio."""
+"""Pre-filtro energetico per rilevare l'assenza di parlato in un audio.
+
+Il criterio è l'**ampiezza media assoluta** per campione di ogni finestra da
+1 secondo: una finestra è "con parlato" se la media è ``>= threshold``. Essendo
+normalizzata per campione, la soglia non dipende dalla dimensione della
+finestra né dal sample rate (l'ultima finestra, se parziale, è mediata sui
+soli campioni presenti).
+
+Il calcolo è vettoriale (le finestre sono righe di una matrice ``(n, sr)``)
+ma l'audio viene scandito a blocchi di :data:`CHUNK_WINDOWS` finestre in un
+buffer riutilizzato: il costo è dominato dalla banda di memoria (non
+dall'interprete), e blocchi che stanno in cache evitano i temporanei grandi
+quanto l'intero file. :func:`detect_silence` si ferma al primo blocco con
+parlato e :class:`SpeechDetector` può lavorare su uno stream che arriva a pezzi.
+"""
 
 import numpy as np
 
 from calliope.settings import settings
 
+# Finestre analizzate per blocco: 8 s a 16 kHz sono ~500 KB di float32, che
+# restano in cache tra ``abs`` e somma (vedi scripts/bench_silence.py).
+CHUNK_WINDOWS = 8
+
+
+def window_levels(audio: np.ndarray, window: int) -> np.ndarray:
+    """Ampiezza media assoluta di ogni finestra di ``window`` campioni.
+
+    L'ultima finestra può essere parziale: la media è sui campioni presenti.
+    """
+    full = len(audio) // window
+    levels = np.abs(audio[: full * window]).reshape(full, window).mean(axis=1)
+    tail = audio[full * window :]
+    if len(tail):
+        levels = np.append(levels, np.abs(tail).mean())
+    return levels
+
+
+class SpeechDetector:
+    """Rilevatore di parlato incrementale, per audio che arriva a blocchi.
+
+    :meth:`feed` valuta solo le finestre complete e tiene da parte il resto per
+    il blocco successivo; :meth:`finish` valuta l'eventuale finestra parziale
+    finale. Appena una finestra supera la soglia :attr:`speech` diventa
+    ``True`` e i blocchi successivi non vengono più analizzati.
+    """
+
+    def __init__(self, sr: float, threshold: float | None = None) -> None:
+        self._window = int(sr)
+        self._threshold = settings.silence_threshold if threshold is None else threshold
+        self._pending = np.empty(0, dtype=np.float32)
+        self._buffer = np.empty(0, dtype=np.float32)  # allocato al primo blocco
+        self.speech = False
+
+    def feed(self, samples: np.ndarray) -> bool:
+        """Aggiunge un blocco di campioni; ``True`` se c'è parlato finora."""
+        if self.speech or self._window <= 0:
+            return self.speech
+        if len(self._pending):
+            samples = np.concatenate([self._pending, samples])
+        complete = len(samples) - len(samples) % self._window
+        self._pending = samples[complete:]
+        self._check(samples[:complete])
+        return self.speech
+
+    def finish(self) -> bool:
+        """Chiude lo stream valutando la finestra parziale; ``True`` = parlato."""
+        if not self.speech and len(self._pending):
+            self.speech = bool(np.abs(self._pending).mean() >= self._threshold)
+        self._pending = np.empty(0, dtype=np.float32)
+        return self.speech
+
+    def _check(self, samples: np.ndarray) -> None:
+        """Valuta finestre complete a blocchi, fermandosi al primo con parlato."""
+        block = CHUNK_WINDOWS * self._window
+        if len(self._buffer) < min(block, len(samples)):
+            self._buffer = np.empty(block, dtype=np.float32)
+        # soglia sulla somma della finestra: evita una divisione per finestra
+        limit = self._threshold * self._window
+        for start in range(0, len(samples), block):
+            chunk = samples[start : start + block]
+            magnitudes = self._buffer[: len(chunk)]
+            np.abs(chunk, out=magnitudes)
+            if (magnitudes.reshape(-1, self._window).sum(axis=1) >= limit).any():
+                self.speech = True
+                return
 
-def detect_silence(audio: np.ndarray, sr: float, threshold: int | None = None) -> bool:
+
+def detect_silence(
+    audio: np.ndarray, sr: float, threshold: float | None = None
+) -> bool:
     """Determina se l'audio è (essenzialmente) muto, cioè non contiene parlato.
 
-    Scandisce l'**intero** audio in finestre da 1 secondo e ne calcola l'energia
-    (somma delle ampiezze assolute). Se nessuna finestra supera la soglia,
-    l'audio è considerato muto. È un pre-filtro energetico economico: serve a
-    evitare l'inferenza su clip senza parlato.
+    Scandisce l'audio in finestre da 1 secondo, a blocchi di
+    :data:`CHUNK_WINDOWS` finestre, fermandosi al primo blocco con una finestra
+    sopra la soglia. È un pre-filtro energetico economico: serve a evitare
+    l'inferenza su clip senza parlato.
 
     Args:
         audio: campioni audio come array NumPy (mono).
         sr: frequenza di campionamento in Hz (dimensione della finestra da 1 s).
-        threshold: energia minima per considerare una finestra "con parlato".
-            Se ``None`` usa ``settings.silence_threshold``.
+        threshold: ampiezza media assoluta per campione oltre la quale una
+            finestra è "con parlato". Se ``None`` usa ``settings.silence_threshold``.
 
     Returns:
         ``True`` se l'audio è muto (nessuna finestra sopra la soglia),
         ``False`` se almeno una finestra contiene parlato.
     """
+    if int(sr) <= 0 or len(audio) == 0:
+        return True
+    detector = SpeechDetector(sr, threshold)
+    detector.feed(audio)
+    return not detector.finish()
+
+
+def detect_speech_regions(
+    audio: np.ndarray, sr: float, threshold: float | None = None, *, padding: int = 1
+) -> np.ndarray:
+    """Mappa delle regioni con parlato: intervalli di campioni ``[start, end)``.
+
+    Stesso criterio di :func:`detect_silence`, calcolato su tutte le finestre.
+    Ogni finestra attiva viene allargata di ``padding`` finestre per lato, così
+    l'inizio e la fine delle parole non vengono tagliati e le pause brevi non
+    spezzano una regione.
+
+    Args:
+        audio: campioni audio come array NumPy (mono).
+        sr: frequenza di campionamento in Hz (dimensione della finestra da 1 s).
+        threshold: ampiezza media assoluta per campione di una finestra attiva;
+            ``None`` usa ``settings.silence_threshold``.
+        padding: finestre aggiunte prima e dopo ogni finestra attiva.
+
+    Returns:
+        Array ``(n, 2)`` di interi con inizio (incluso) e fine (esclusa) di ogni
+        regione, in campioni e in ordine; vuoto se l'audio è muto.
+    """
     if threshold is None:
         threshold = settings.silence_threshold
 
     window = int(sr)
     if window <= 0 or len(audio) == 0:
-        return True
+        return np.empty((0, 2), dtype=np.int64)
+
+    active = window_levels(audio, window) >= threshold
 
-    for start in range(0, len(audio), window):
-        window_energy = np.abs(audio[start : start + window]).sum()
-        if window_energy >= threshold:
-            return False  # trovata una finestra con parlato
+    if padding > 0 and active.any():
+        # dilatazione della maschera: una finestra è attiva se lo è una vicina
+        kernel = np.ones(2 * padding + 1, dtype=np.int64)
+        active = np.convolve(active.astype(np.int64), kernel, mode="same") > 0
 
-    return True  # nessuna finestra sopra la soglia → audio muto
+    # fronti di salita/discesa della maschera → confini delle regioni
+    edges = np.diff(np.concatenate(([0], active.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1) * window
+    ends = np.minimum(np.flatnonzero(edges == -1) * window, len(audio))
+    return np.stack([starts, ends], axis=1).astype(np.int64)
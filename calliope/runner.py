@@ -0,0 +1,176 @@
+"""Esecuzione dei lavori della coda persistente (:mod:`calliope.storage.jobs`).
+
+Ogni istanza del bot con ``JOB_QUEUE_ENABLED`` avvia un :class:`JobRunner`:
+``job_concurrency`` loop che prendono in carico un lavoro alla volta, lo
+eseguono con lo stesso codice degli handler (ricostruendo l'``Update``
+Telegram salvato nel lavoro) e consegnano il risultato nella chat d'origine.
+Il lavoro viene rimosso dalla coda solo a consegna avvenuta; i messaggi già
+inviati da un tentativo fallito sono riusati da quello successivo
+(:class:`~calliope.transcription.streaming.Delivery`), senza duplicati in chat.
+
+Allo spegnimento il runner smette di prendere lavori e attende quelli in
+corso, come PTB fa con gli handler; un lavoro interrotto comunque (task
+annullato) torna subito in coda, uno di un'istanza morta quando il suo lease
+scade.
+"""
+
+import asyncio
+import os
+import socket
+from functools import partial
+
+from loguru import logger
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import Application, CallbackContext
+
+from calliope.handlers.timestamp import transcribe_video
+from calliope.handlers.transcribe import transcribe_voice
+from calliope.notifier import notify_error
+from calliope.storage.jobs import Job, JobQueue
+from calliope.transcription.streaming import Delivery
+
+# Handler che eseguono ogni tipo di lavoro (senza admission: già in coda).
+_HANDLERS = {"stt": transcribe_voice, "timestamp": transcribe_video}
+
+
+class JobRunner:
+    """Prende in carico ed esegue i lavori della coda, con heartbeat del lease."""
+
+    def __init__(
+        self,
+        application: Application,
+        queue: JobQueue,
+        *,
+        concurrency: int,
+        poll_interval_s: float,
+    ) -> None:
+        self._application = application
+        self._queue = queue
+        self._concurrency = concurrency
+        self._poll_interval_s = poll_interval_s
+        # Identifica l'istanza nei lease (più processi per host, più host).
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._stopping = asyncio.Event()
+        self._task: asyncio.Future | None = None
+
+    def start(self) -> None:
+        """Avvia i loop in background (da chiamare con l'event loop attivo)."""
+        self._stopping.clear()
+        self._task = asyncio.gather(*(self._loop() for _ in range(self._concurrency)))
+        logger.info(
+            f"Job runner {self.owner} started ({self._concurrency} concurrent jobs)"
+        )
+
+    async def stop(self) -> None:
+        """Smette di prendere lavori e attende la fine di quelli in corso."""
+        if self._task is None:
+            return
+        self._stopping.set()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        logger.info(f"Job runner {self.owner} stopped")
+
+    async def _loop(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                job = await asyncio.to_thread(self._queue.claim, self.owner)
+            except Exception as e:
+                logger.error(f"Could not claim a job: {e}")
+                job = None
+            if job is None:
+                # Coda vuota (o MongoDB non raggiungibile): si riprova più tardi,
+                # svegliandosi subito se arriva lo stop.
+                try:
+                    await asyncio.wait_for(
+                        self._stopping.wait(), timeout=self._poll_interval_s
+                    )
+                except asyncio.TimeoutError:  # non è il TimeoutError builtin su 3.10
+                    pass
+                continue
+            await self.run_job(job)
+
+    async def run_job(self, job: Job) -> None:
+        """Esegue ``job`` rinnovandone il lease e ne registra l'esito in coda.
+
+        Se il lease viene perso (un'altra istanza ha ripreso il lavoro) l'handler
+        è annullato e l'esito scartato: consegna e registrazione spettano ora
+        all'altra istanza.
+        """
+        logger.info(f"Job {job.id} ({job.kind}) claimed, attempt {job.attempts}")
+        update = Update.de_json(job.update, self._application.bot)
+        delivery = Delivery(job.replies, partial(self._record_replies, job))
+
+        async def _execute() -> None:
+            context = CallbackContext.from_update(update, self._application)
+            await _HANDLERS[job.kind](
+                update, context, job.language, admit=False, delivery=delivery
+            )
+
+        handler = asyncio.ensure_future(_execute())
+        heartbeat = asyncio.ensure_future(self._heartbeat(job))
+        try:
+            await asyncio.wait(
+                {handler, heartbeat}, return_when=asyncio.FIRST_COMPLETED
+            )
+        except asyncio.CancelledError:
+            await _cancel(handler)
+            await asyncio.to_thread(self._queue.release, job, self.owner)
+            raise
+        finally:
+            heartbeat.cancel()
+
+        if not handler.done():
+            await _cancel(handler)
+            logger.warning(f"Job {job.id}: lease lost, result dropped")
+            return
+        try:
+            handler.result()
+        except asyncio.CancelledError:
+            await asyncio.to_thread(self._queue.release, job, self.owner)
+        except Exception as e:
+            logger.opt(exception=e).error(f"Job {job.id} failed")
+            dead = await asyncio.to_thread(
+                self._queue.fail, job, self.owner, f"{type(e).__name__}: {e}"
+            )
+            if dead:
+                await self._report_failure(update, e)
+        else:
+            await asyncio.to_thread(self._queue.complete, job, self.owner)
+
+    async def _record_replies(self, job: Job, message_ids: list[int]) -> None:
+        await asyncio.to_thread(
+            self._queue.record_replies, job, self.owner, message_ids
+        )
+
+    async def _heartbeat(self, job: Job) -> None:
+        """Rinnova il lease a un terzo della sua durata finché il lavoro gira;
+        termina se il lease è passato a un'altra istanza."""
+        while True:
+            await asyncio.sleep(self._queue.lease_s / 3)
+            try:
+                owned = await asyncio.to_thread(self._queue.heartbeat, job, self.owner)
+            except Exception as e:
+                logger.warning(f"Job {job.id}: lease renewal failed: {e}")
+                continue
+            if not owned:
+                logger.warning(f"Job {job.id}: lease lost to another instance")
+                return
+
+    async def _report_failure(self, update: Update, error: Exception) -> None:
+        """Lavoro abbandonato: avvisa l'owner e risponde in modo generico."""
+        bot = self._application.bot
+        await notify_error(bot, update, error)
+        if update.effective_message is not None:
+            try:
+                await update.effective_message.reply_text(
+                    "Something went wrong, please try again."
+                )
+            except TelegramError:
+                pass
+
+
+async def _cancel(task: asyncio.Future) -> None:
+    """Annulla ``task`` e ne attende la fine, ignorandone l'esito."""
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
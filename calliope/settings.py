@@ -13,10 +13,51 @@ Docker basta l'iniezione via ``env_file:`` del compose.
 import os
 from typing import Annotated, Literal
 
-from pydantic import SecretStr, field_validator
+from pydantic import BaseModel, Field, SecretStr, field_validator
 from pydantic_settings import BaseSettings, NoDecode, SettingsConfigDict
 
 
+class RouteRule(BaseModel):
+    """Regola del router dei modelli: ``model`` serve i media che rispettano
+    tutte le condizioni impostate (quelle lasciate vuote non filtrano)."""
+
+    model: str
+    min_duration_s: int | None = None
+    max_duration_s: int | None = None
+    # Lingue richieste (da /lang o DEFAULT_LANGUAGE); vuota = qualunque, anche
+    # l'auto-detect.
+    languages: list[str] = []
+    replicas: int = Field(default=1, ge=1)
+
+
+class DecodingProfile(BaseModel):
+    """Parametri di decodifica passati a ``transcribe`` di faster-whisper.
+
+    I campi lasciati a None non vengono passati: vale il default della
+    libreria (beam 5, fallback di temperatura, ``condition_on_previous_text``).
+    """
+
+    beam_size: int | None = Field(default=None, ge=1)
+    best_of: int | None = Field(default=None, ge=1)
+    patience: float | None = Field(default=None, gt=0)
+    # Un numero = nessun fallback; una lista = temperature provate in ordine
+    # quando la decodifica non supera le soglie di compressione/log-prob.
+    temperature: float | list[float] | None = None
+    condition_on_previous_text: bool | None = None
+    # Solo token di testo, senza token di timestamp (più veloce).
+    without_timestamps: bool | None = None
+
+
+class DecodingRule(BaseModel):
+    """Regola dei profili di decodifica: ``profile`` per i media del percorso
+    ``path`` (``voice``/``video``, vuoto = entrambi) nella fascia di durata."""
+
+    profile: str
+    path: Literal["voice", "video"] | None = None
+    min_duration_s: int | None = None
+    max_duration_s: int | None = None
+
+
 class Settings(BaseSettings):
     """Configurazione dell'applicazione, validata all'avvio."""
 
@@ -29,12 +70,21 @@ class Settings(BaseSettings):
     # --- Telegram ---
     telegram_token: SecretStr
     admin_chat_id: int | None = None
+    # Proxy HTTP(S)/SOCKS per le chiamate alla Bot API e per i download dei file
+    # (es. "http://proxy:3128"). None = connessione diretta.
+    telegram_proxy: str | None = None
+    # Timeout di lettura/scrittura delle chiamate alla Bot API e dei download
+    # in streaming, in secondi.
+    telegram_timeout_s: float = Field(default=60.0, gt=0)
 
     # --- MongoDB ---
     mongo_uri: str = "mongodb://localhost:27017"
     mongo_db_name: str = "calliope"
     mongo_users_collection: str = "users_db"
     mongo_groups_collection: str = "groups_db"
+    mongo_transcripts_collection: str = "transcripts"
+    mongo_jobs_collection: str = "jobs"
+    mongo_dead_jobs_collection: str = "jobs_dead"
 
     # --- Modello / trascrizione ---
     whisper_model: str = "deepdml/faster-whisper-large-v3-turbo-ct2"
@@ -43,9 +93,152 @@ class Settings(BaseSettings):
     # None = auto: float16 su GPU, int8 su CPU (override es. "int8_float16").
     whisper_compute_type: str | None = None
     default_language: str | None = None  # None = auto-detect
+    # Pool di inferenza: numero di repliche del modello servite in parallelo da
+    # altrettanti thread worker (ogni richiesta va alla prima replica libera).
+    whisper_replicas: int = Field(default=1, ge=1)
+    # True = un solo WhisperModel caricato con ``num_workers=whisper_replicas``
+    # (pesi condivisi, meno memoria); False = N copie indipendenti del modello.
+    whisper_shared_model: bool = False
+    # Dove gira l'inferenza: "thread" = repliche nel processo del bot;
+    # "process" = un processo worker per replica (crash isolati, niente GIL
+    # condiviso con l'event loop). Con "process" whisper_shared_model è ignorato.
+    # "remote" = nessun modello nel bot: l'inferenza è delegata a un
+    # ``calliope-worker`` in ascolto su worker_socket (una GPU, più bot).
+    inference_backend: Literal["thread", "process", "remote"] = "thread"
+    worker_socket: str = "/tmp/calliope-worker.sock"
+    # Thread CTranslate2 per replica (``cpu_threads``). 0 = auto: su CPU i core
+    # disponibili divisi tra le repliche (nessun oversubscription), su GPU il
+    # default di CTranslate2.
+    whisper_cpu_threads: int = Field(default=0, ge=0)
+    # Auto-tuning (vedi ``calliope tune``): compute_type, cpu_threads e
+    # decodifiche parallele (repliche) più veloci per modello e hardware,
+    # misurati su una clip sintetica e salvati in whisper_tune_file. Un
+    # risultato salvato è sempre riusato; con whisper_autotune il tuning gira
+    # all'avvio se manca. I valori impostati esplicitamente (WHISPER_COMPUTE_TYPE,
+    # WHISPER_CPU_THREADS, WHISPER_REPLICAS) hanno la precedenza.
+    whisper_autotune: bool = False
+    whisper_tune_file: str = "~/.cache/calliope/tune.json"
+    whisper_tune_clip_s: float = Field(default=10.0, gt=0, le=30)
+    # Inferenza di prova all'avvio (prima del polling): il primo vocale dopo un
+    # deploy non paga il costo della prima chiamata al modello.
+    whisper_warmup: bool = True
+    # Scarica i modelli dopo model_idle_unload_s secondi senza trascrizioni
+    # (libera RAM/VRAM nelle ore di inattività); la prima richiesta successiva
+    # li ricarica e mostra all'utente quanto ha atteso. None = sempre caricati.
+    model_idle_unload_s: int | None = Field(default=None, gt=0)
+    # Router dei modelli: regole valutate in ordine, vince la prima che
+    # corrisponde; senza corrispondenze si usa ``whisper_model``. Ogni modello
+    # citato viene caricato all'avvio con le sue repliche. In ``.env`` come
+    # JSON, es. ``WHISPER_ROUTES=[{"model": "small", "max_duration_s": 15}]``.
+    whisper_routes: list[RouteRule] = []
+    # Anteprima a due passate: i vocali lunghi (>= preview_min_duration_s) sono
+    # trascritti subito da un modello piccolo, con corsia e repliche proprie
+    # (non occupa mai gli slot delle trascrizioni definitive); il testo viene
+    # poi sostituito da quello del modello scelto dal router. None = disattivata.
+    preview_model: str | None = None
+    preview_min_duration_s: int = Field(default=30, ge=0)
+    preview_replicas: int = Field(default=1, ge=1)
+    # Inferenza batched (BatchedInferencePipeline) per i media lunghi del
+    # percorso timestamp: l'audio è diviso in chunk VAD decodificati a batch.
+    # Si attiva sopra la soglia di durata (es. 300); None = sempre sequenziale.
+    batched_min_duration_s: int | None = None
+    batch_size: int = Field(default=8, ge=1)
+    # Video lunghi (timestamp) divisi in chunk da ~parallel_chunk_s secondi,
+    # tagliati nel silenzio e sovrapposti di parallel_chunk_overlap_s, decodificati
+    # in parallelo sulle repliche libere. None (default) = sempre sequenziale.
+    # Serve WHISPER_REPLICAS > 1 (o più repliche nella corsia del modello).
+    parallel_chunk_s: int | None = Field(default=None, gt=0)
+    parallel_chunk_overlap_s: float = Field(default=2.0, ge=0)
+    # Durata degli intervalli del file con timestamp (es. 30, 60, 300 secondi).
+    timestamp_interval_s: int = Field(default=60, gt=0)
+    # Granularità dei timestamp del percorso video: "word" = timestamp di ogni
+    # parola (esatti, ma con una passata di allineamento in più); "segment" =
+    # solo quelli dei segmenti, con le parole interpolate (più veloce, un
+    # segmento a cavallo di due intervalli è diviso in un punto stimato).
+    # I media lunghi almeno segment_timestamps_min_duration_s secondi usano
+    # comunque "segment"; None = nessuna soglia.
+    timestamp_granularity: Literal["word", "segment"] = "word"
+    segment_timestamps_min_duration_s: int | None = Field(default=None, ge=0)
+    # Profili di decodifica: nomi → parametri di faster-whisper. Predefiniti
+    # "fast" (greedy, nessun fallback, senza token di timestamp), "balanced"
+    # (i default di faster-whisper) e "accurate" (beam più ampio); in
+    # ``.env`` come JSON si possono ridefinire o aggiungerne, es.
+    # ``DECODING_PROFILES={"fast": {"beam_size": 2}}``. Il profilo di una
+    # richiesta è quello della prima regola di decoding_rules che corrisponde
+    # (percorso e durata), altrimenti quello di default del percorso.
+    decoding_profiles: dict[str, DecodingProfile] = {}
+    decoding_rules: list[DecodingRule] = []
+    voice_decoding_profile: str = "balanced"
+    video_decoding_profile: str = "balanced"
+    # Micro-batching tra richieste: i vocali brevi (<= microbatch_max_clip_s)
+    # arrivati entro la finestra vengono decodificati insieme in una chiamata
+    # batched. 0 = disattivato (ogni vocale è decodificato da solo). Il testo
+    # può differire da quello sequenziale: ogni clip è un chunk indipendente di
+    # BatchedInferencePipeline (niente condition_on_previous_text né fallback
+    # di temperatura, segmentazione diversa). Per questo è opt-in.
+    microbatch_window_ms: int = Field(default=0, ge=0)
+    microbatch_max_size: int = Field(default=8, ge=1)
+    # Una clip batched è un'unica finestra Whisper: al massimo 30 s.
+    microbatch_max_clip_s: int = Field(default=20, ge=1, le=30)
+    # Scheduler a priorità: i job partono in ordine di costo stimato (secondi di
+    # audio × peso della classe); il percorso video→file pesa ``batch_weight``
+    # volte quello interattivo. L'aging sottrae ``aging_rate`` secondi di costo
+    # per ogni secondo di attesa, così nessun job lungo resta in coda per sempre.
+    scheduler_aging_rate: float = Field(default=5.0, gt=0)
+    scheduler_batch_weight: float = Field(default=4.0, ge=1)
+    # Fair queuing per chat: massimo di richieste in coda/in corso per chat
+    # (0 = nessun limite, il default: un limite rifiuta le richieste in più) e
+    # pesi per chat (default 1; peso 2 = il doppio della quota). In ``.env``
+    # come JSON: ``SCHEDULER_CHAT_WEIGHTS={"-100123": 0.5}``.
+    scheduler_max_queued_per_chat: int = Field(default=0, ge=0)
+    scheduler_chat_weights: dict[int, float] = {}
+    # Admission control: attesa stimata massima (s) oltre la quale una richiesta
+    # è rifiutata prima del download. None = nessun limite.
+    admission_max_wait_s: int | None = None
+    # Real-time factor (s di calcolo per s di audio) usato per le stime finché
+    # non ci sono misure. None = 0.1 su GPU, 0.5 su CPU.
+    admission_initial_rtf: float | None = None
+    # Cache delle trascrizioni per ``file_unique_id`` + lingua + modello: un
+    # vocale inoltrato in più chat viene scaricato e trascritto una volta sola.
+    # Voci tenute in memoria (LRU, 0 = nessuna cache in memoria) e, solo se
+    # abilitato, anche su MongoDB con scadenza TTL in secondi. None = nessun
+    # testo di trascrizione scritto su DB (default, per privacy).
+    transcript_cache_size: int = Field(default=256, ge=0)
+    transcript_cache_ttl_s: int | None = Field(default=None, gt=0)
+
+    # Lingua imparata per chat (solo in auto-detect): dopo N rilevamenti
+    # consecutivi della stessa lingua con probabilità >= min_probability la
+    # lingua viene fissata e il rilevamento saltato; ogni recheck_every
+    # richieste si ricontrolla. 0 = disattivato.
+    language_pin_detections: int = Field(default=3, ge=0)
+    language_pin_min_probability: float = Field(default=0.9, ge=0, le=1)
+    language_pin_recheck_every: int = Field(default=20, ge=1)
+
+    # Coda di lavori persistente su MongoDB: voice/video vengono accodati e
+    # trascritti da una qualunque istanza (nessun lavoro perso a un riavvio).
+    # Ogni istanza esegue fino a job_concurrency lavori; il lease di un lavoro
+    # è rinnovato mentre è in corso e, se l'istanza muore, scade e il lavoro
+    # torna disponibile. Dopo job_max_attempts tentativi falliti (attesa
+    # crescente da job_retry_backoff_s) il lavoro va nei lavori morti.
+    # job_worker_only = istanza senza polling di Telegram: esegue solo lavori
+    # (il polling di un token deve restare a una sola istanza).
+    job_queue_enabled: bool = False
+    job_worker_only: bool = False
+    job_concurrency: int = Field(default=2, ge=1)
+    job_lease_s: float = Field(default=60.0, gt=0)
+    job_max_attempts: int = Field(default=3, ge=1)
+    job_retry_backoff_s: float = Field(default=30.0, ge=0)
+    job_poll_interval_s: float = Field(default=2.0, gt=0)
 
     # --- Limiti / runtime ---
-    silence_threshold: int = 70  # predisposta per lo step 2.7 (detect_silence)
+    # Ampiezza media assoluta per campione oltre la quale una finestra da 1 s
+    # contiene parlato (detect_silence). Valori > 1 sono la vecchia soglia in
+    # "somma per finestra a 16 kHz" (es. 70) e vengono convertiti.
+    silence_threshold: float = Field(default=70 / 16000, ge=0)
+    # Decodifica solo le regioni con parlato trovate dal pre-filtro energetico
+    # (``clip_timestamps`` di faster-whisper): i tratti muti non vengono decodificati.
+    # Opt-in: il pre-filtro può tagliare parlato molto sommesso.
+    skip_silent_regions: bool = False
     max_media_duration_s: int = 1800  # media più lunghi vengono rifiutati (3.3)
     # Allowlist di chat abilitate (vuota = bot pubblico). Utile a chi self-hosta
     # su GPU propria. In ``.env``: ``ALLOWED_CHAT_IDS=123,456`` (interi separati
@@ -56,7 +249,21 @@ class Settings(BaseSettings):
     # sink file ruota ogni giorno con retention 14 giorni e compressione zip.
     log_file: str | None = None
 
-    @field_validator("admin_chat_id", "default_language", "log_file", mode="before")
+    @field_validator(
+        "admin_chat_id",
+        "telegram_proxy",
+        "default_language",
+        "log_file",
+        "preview_model",
+        "model_idle_unload_s",
+        "batched_min_duration_s",
+        "parallel_chunk_s",
+        "segment_timestamps_min_duration_s",
+        "admission_max_wait_s",
+        "admission_initial_rtf",
+        "transcript_cache_ttl_s",
+        mode="before",
+    )
     @classmethod
     def _empty_str_to_none(cls, v: object) -> object:
         """Tratta una variabile opzionale lasciata vuota (es. ``ADMIN_CHAT_ID=``)
@@ -65,6 +272,14 @@ class Settings(BaseSettings):
             return None
         return v
 
+    @field_validator("silence_threshold")
+    @classmethod
+    def _normalize_silence_threshold(cls, v: float) -> float:
+        """Converte una soglia legacy (somma delle ampiezze su 1 s a 16 kHz) in
+        ampiezza media per campione: l'audio float è in [-1, 1], quindi una
+        media > 1 non avrebbe senso."""
+        return v / 16000 if v > 1 else v
+
     @field_validator("allowed_chat_ids", mode="before")
     @classmethod
     def _parse_id_list(cls, v: object) -> object:
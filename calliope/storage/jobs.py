@@ -0,0 +1,240 @@
+"""Coda di lavori persistente su MongoDB.
+
+Con ``JOB_QUEUE_ENABLED`` gli handler ``stt`` e ``timestamp`` non trascrivono:
+accodano un documento con i riferimenti al messaggio (chat, message id,
+``file_id``, lingua, priorità e l'update Telegram serializzato) e ritornano.
+I lavori sono eseguiti dal :class:`~calliope.runner.JobRunner` di una qualunque
+istanza del bot: un riavvio non perde la coda e più repliche se la dividono.
+
+- **Claim atomico**: ``find_one_and_update`` porta un lavoro da ``queued`` a
+  ``running`` con un *lease* (scadenza) intestato all'istanza. Un lavoro
+  ``running`` con lease scaduto (istanza morta) torna prendibile da chiunque.
+- **Heartbeat**: chi esegue un lavoro rinnova il lease finché è in corso.
+- **Retry e dead-letter**: un lavoro fallito torna in coda con un ritardo
+  crescente; superato ``max_attempts`` finisce nella collezione dei lavori
+  morti con l'ultimo errore, per l'analisi manuale.
+- **Consegna idempotente**: il documento registra gli id dei messaggi già
+  inviati in chat (placeholder, testo parziale, stato): un nuovo tentativo li
+  modifica invece di inviarne altri.
+
+Il ``_id`` è ``"<chat_id>:<message_id>"``: un update consegnato due volte da
+Telegram non genera due lavori.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Literal
+
+from loguru import logger
+from pymongo import ASCENDING, ReturnDocument
+
+from calliope.settings import Settings
+
+JobKind = Literal["stt", "timestamp"]
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+@dataclass
+class Job:
+    """Un lavoro preso in carico da questa istanza."""
+
+    id: str
+    kind: JobKind
+    chat_id: int
+    message_id: int
+    file_id: str
+    language: str | None
+    priority: int
+    update: dict[str, Any]  # ``Update.to_dict()`` del messaggio originale
+    attempts: int
+    replies: list[int]  # messaggi già consegnati dai tentativi precedenti
+
+    @classmethod
+    def from_document(cls, document: dict) -> "Job":
+        return cls(
+            id=document["_id"],
+            kind=document["kind"],
+            chat_id=document["chat_id"],
+            message_id=document["message_id"],
+            file_id=document["file_id"],
+            language=document.get("language"),
+            priority=document["priority"],
+            update=document["update"],
+            attempts=document["attempts"],
+            replies=document.get("replies") or [],
+        )
+
+
+class JobQueue:
+    """Coda di lavori condivisa tra le istanze, su due collezioni MongoDB."""
+
+    def __init__(self, db, settings: Settings) -> None:
+        self.collection = db[settings.mongo_jobs_collection]
+        self.dead_collection = db[settings.mongo_dead_jobs_collection]
+        self.lease_s = settings.job_lease_s
+        self.max_attempts = settings.job_max_attempts
+        self.retry_backoff_s = settings.job_retry_backoff_s
+        self._ensure_indexes()
+
+    def _ensure_indexes(self) -> None:
+        try:
+            # Ordine di claim: stato, priorità, anzianità.
+            self.collection.create_index(
+                [
+                    ("state", ASCENDING),
+                    ("priority", ASCENDING),
+                    ("created_at", ASCENDING),
+                ]
+            )
+            self.collection.create_index("lease_until")
+        except Exception as e:
+            logger.warning(f"Could not create job queue indexes: {e}")
+
+    def enqueue(
+        self,
+        kind: JobKind,
+        *,
+        chat_id: int,
+        message_id: int,
+        file_id: str,
+        language: str | None,
+        priority: int,
+        update: dict[str, Any],
+    ) -> bool:
+        """Accoda un lavoro. False se lo stesso messaggio era già in coda."""
+        now = _utcnow()
+        result = self.collection.update_one(
+            {"_id": f"{chat_id}:{message_id}"},
+            {
+                "$setOnInsert": {
+                    "kind": kind,
+                    "chat_id": chat_id,
+                    "message_id": message_id,
+                    "file_id": file_id,
+                    "language": language,
+                    "priority": priority,
+                    "update": update,
+                    "state": "queued",
+                    "attempts": 0,
+                    "created_at": now,
+                    "available_at": now,
+                    "owner": None,
+                    "lease_until": None,
+                    "last_error": None,
+                    "replies": [],
+                }
+            },
+            upsert=True,
+        )
+        return result.upserted_id is not None
+
+    def claim(self, owner: str) -> Job | None:
+        """Prende in carico il prossimo lavoro disponibile, o None.
+
+        Atomico: due istanze non possono ottenere lo stesso lavoro. Un lavoro
+        ripreso da un'istanza morta conta come un nuovo tentativo; oltre
+        ``max_attempts`` (es. un media che manda in crash il worker) va nei
+        lavori morti invece di essere eseguito ancora.
+        """
+        while True:
+            now = _utcnow()
+            document = self.collection.find_one_and_update(
+                {
+                    "$or": [
+                        {"state": "queued", "available_at": {"$lte": now}},
+                        {"state": "running", "lease_until": {"$lte": now}},
+                    ]
+                },
+                {
+                    "$set": {
+                        "state": "running",
+                        "owner": owner,
+                        "lease_until": now + timedelta(seconds=self.lease_s),
+                    },
+                    "$inc": {"attempts": 1},
+                },
+                sort=[("priority", ASCENDING), ("created_at", ASCENDING)],
+                return_document=ReturnDocument.AFTER,
+            )
+            if document is None:
+                return None
+            if document["attempts"] <= self.max_attempts:
+                return Job.from_document(document)
+            self._bury(document, document.get("last_error") or "lease expired")
+
+    def heartbeat(self, job: Job, owner: str) -> bool:
+        """Rinnova il lease. False se il lavoro non è più di ``owner``."""
+        result = self.collection.update_one(
+            {"_id": job.id, "owner": owner, "state": "running"},
+            {"$set": {"lease_until": _utcnow() + timedelta(seconds=self.lease_s)}},
+        )
+        return result.matched_count == 1
+
+    def record_replies(self, job: Job, owner: str, message_ids: list[int]) -> None:
+        """Registra i messaggi consegnati in chat, riusati dai nuovi tentativi."""
+        self.collection.update_one(
+            {"_id": job.id, "owner": owner}, {"$set": {"replies": message_ids}}
+        )
+
+    def complete(self, job: Job, owner: str) -> None:
+        """Rimuove un lavoro concluso (il risultato è già stato consegnato)."""
+        self.collection.delete_one({"_id": job.id, "owner": owner})
+
+    def fail(self, job: Job, owner: str, error: str) -> bool:
+        """Registra un fallimento: nuovo tentativo o dead-letter.
+
+        Il ritardo prima del nuovo tentativo raddoppia a ogni fallimento.
+        Ritorna True se il lavoro è finito nei lavori morti.
+        """
+        if job.attempts >= self.max_attempts:
+            document = self.collection.find_one({"_id": job.id, "owner": owner})
+            if document is not None:
+                self._bury(document, error)
+            return True
+        delay = self.retry_backoff_s * 2 ** (job.attempts - 1)
+        self.collection.update_one(
+            {"_id": job.id, "owner": owner},
+            {
+                "$set": {
+                    "state": "queued",
+                    "owner": None,
+                    "lease_until": None,
+                    "available_at": _utcnow() + timedelta(seconds=delay),
+                    "last_error": error,
+                }
+            },
+        )
+        return False
+
+    def release(self, job: Job, owner: str) -> None:
+        """Rimette in coda un lavoro non eseguito, senza contare il tentativo."""
+        self.collection.update_one(
+            {"_id": job.id, "owner": owner},
+            {
+                "$set": {"state": "queued", "owner": None, "lease_until": None},
+                "$inc": {"attempts": -1},
+            },
+        )
+
+    def _bury(self, document: dict, error: str) -> None:
+        """Sposta un lavoro nella collezione dei lavori morti."""
+        document.update(state="dead", last_error=error, failed_at=_utcnow())
+        self.dead_collection.replace_one(
+            {"_id": document["_id"]}, document, upsert=True
+        )
+        self.collection.delete_one({"_id": document["_id"]})
+        logger.error(
+            f"Job {document['_id']} dead-lettered after "
+            f"{document['attempts']} attempt(s): {error}"
+        )
+
+    def counts(self) -> dict[str, int]:
+        """Lavori in coda, in corso e morti (per /admin)."""
+        return {
+            "queued": self.collection.count_documents({"state": "queued"}),
+            "running": self.collection.count_documents({"state": "running"}),
+            "dead": self.dead_collection.count_documents({}),
+        }
@@ -21,6 +21,9 @@ class MongoStorage:
     def __init__(self, settings: Settings) -> None:
         self.available = False
         self.client: pymongo.MongoClient | None = None
+        # Cache persistente delle trascrizioni: opt-in (TTL configurato).
+        self.transcripts_collection = None
+        self._transcripts_ttl_s = settings.transcript_cache_ttl_s
         try:
             self.client = pymongo.MongoClient(
                 settings.mongo_uri, serverSelectionTimeoutMS=5000
@@ -29,6 +32,10 @@ class MongoStorage:
             self.db = self.client[settings.mongo_db_name]
             self.users_collection = self.db[settings.mongo_users_collection]
             self.groups_collection = self.db[settings.mongo_groups_collection]
+            if self._transcripts_ttl_s is not None:
+                self.transcripts_collection = self.db[
+                    settings.mongo_transcripts_collection
+                ]
             self._ensure_indexes()
             self.available = True
             logger.info(f"Connected to MongoDB at {settings.mongo_uri}")
@@ -45,6 +52,16 @@ class MongoStorage:
             self.groups_collection.create_index("group_id", unique=True)
         except Exception as e:
             logger.warning(f"Could not create unique indexes: {e}")
+        if self.transcripts_collection is None:
+            return
+        try:
+            self.transcripts_collection.create_index("key", unique=True)
+            # Indice TTL: MongoDB elimina da sé le trascrizioni scadute.
+            self.transcripts_collection.create_index(
+                "created_at", expireAfterSeconds=self._transcripts_ttl_s
+            )
+        except Exception as e:
+            logger.warning(f"Could not create transcript cache indexes: {e}")
 
     def close(self) -> None:
         """Chiude il client MongoDB (usato nel graceful shutdown, step 3.5)."""
@@ -191,7 +208,59 @@ class MongoStorage:
             logger.error(f"Error changing language: {e}")
             raise
 
+    def save_transcript(self, key: str, text: str) -> None:
+        """Salva una trascrizione nella cache persistente (se abilitata)."""
+        if not self.available or self.transcripts_collection is None:
+            return
+        try:
+            self.transcripts_collection.update_one(
+                {"key": key},
+                {"$set": {"text": text, "created_at": _utcnow()}},
+                upsert=True,
+            )
+        except Exception as e:
+            logger.error(f"Error saving transcript to cache: {e}")
+
+    def _chat_filter(self, chat_id: int):
+        """Collezione e filtro del documento di una chat (gruppi: id negativi)."""
+        if chat_id < 0:
+            return self.groups_collection, {"group_id": str(chat_id)}
+        return self.users_collection, {"user_id": str(chat_id)}
+
+    def save_language_pin(self, chat_id: int, language: str | None) -> None:
+        """Salva (o azzera) la lingua imparata della chat."""
+        if not self.available:
+            return
+        try:
+            collection, query = self._chat_filter(chat_id)
+            collection.update_one(query, {"$set": {"language_pin": language}})
+        except Exception as e:
+            logger.error(f"Error saving language pin: {e}")
+
     # --------------------------------------------------------------- read API
+    def get_language_pin(self, chat_id: int) -> str | None:
+        """Lingua imparata della chat, o None."""
+        if not self.available:
+            return None
+        try:
+            collection, query = self._chat_filter(chat_id)
+            document = collection.find_one(query, {"language_pin": 1})
+        except Exception as e:
+            logger.error(f"Error reading language pin: {e}")
+            return None
+        return document.get("language_pin") if document else None
+
+    def get_transcript(self, key: str) -> str | None:
+        """Trascrizione in cache per ``key``, o None (assente o tier disattivo)."""
+        if not self.available or self.transcripts_collection is None:
+            return None
+        try:
+            document = self.transcripts_collection.find_one({"key": key})
+        except Exception as e:
+            logger.error(f"Error reading transcript cache: {e}")
+            return None
+        return document.get("text") if document else None
+
     def get_language(self, update) -> str | None:
         """Lingua di trascrizione impostata, o None (auto-detect)."""
         if not self.available:
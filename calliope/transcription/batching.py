@@ -0,0 +1,201 @@
+"""Micro-batching dei vocali brevi tra richieste diverse.
+
+Nei gruppi affollati arrivano molti vocali da 5–20 s nello stesso secondo: invece
+di decodificarli uno alla volta, :class:`MicroBatcher` li raccoglie per una
+breve finestra (``window_s``) e li consegna insieme a una funzione di dispatch
+che li decodifica in **una** chiamata batched. I segmenti prodotti tornano a
+ciascuna richiesta sulla propria coda, quindi ogni chat vede solo il proprio
+testo, nell'ordine in cui il modello lo produce.
+
+Le clip sono raggruppate per modello, lingua richiesta e profilo di
+decodifica: una chiamata batched usa un solo modello, una sola lingua (con
+``None`` la lingua viene rilevata clip per clip da chi decodifica) e gli
+stessi parametri di decodifica.
+
+Ogni clip porta con sé chat, priorità e callback della richiesta: chi
+decodifica il batch lo accoda allo scheduler sotto le chat delle sue clip,
+riporta a ciascuna la lingua rilevata e salta le clip il cui consumer ha
+smesso di iterare. Una richiesta successiva della stessa chat attende che le
+clip ancora nella finestra siano in coda allo scheduler
+(:meth:`MicroBatcher.wait_queued`), così non le scavalca.
+
+Il testo batched non è identico a quello sequenziale: ogni clip è un chunk
+indipendente di ``BatchedInferencePipeline`` (niente
+``condition_on_previous_text`` né fallback di temperatura, segmentazione per
+chunk). Per questo il micro-batching è disattivato di default.
+"""
+
+import asyncio
+import threading
+from collections.abc import AsyncIterator, Awaitable, Callable
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from calliope.transcription.scheduler import Priority, QueueCallback
+
+# Sentinella: il thread decoder segnala la fine dei segmenti di una clip.
+STREAM_DONE = object()
+
+# Chiave di raggruppamento delle clip: (modello, lingua, profilo).
+_BatchKey = tuple[str | None, str | None, str | None]
+
+
+@dataclass(eq=False)
+class BatchClip:
+    """Una richiesta in attesa di essere decodificata in un batch."""
+
+    samples: np.ndarray
+    language: str | None
+    model_name: str | None
+    loop: asyncio.AbstractEventLoop
+    profile: str | None = None
+    chat_id: int | None = None
+    priority: Priority = Priority.INTERACTIVE
+    on_queue: QueueCallback | None = None
+    on_info: Callable[[str, float], None] | None = None
+    queue: asyncio.Queue = field(default_factory=asyncio.Queue)
+    # Impostato quando il consumer smette di iterare: la clip non va decodificata.
+    cancelled: threading.Event = field(default_factory=threading.Event)
+    # Impostato quando il batch è in coda allo scheduler (o non ci andrà più).
+    queued: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def emit(self, item: object) -> None:
+        """Inoltra un testo, un'eccezione o ``STREAM_DONE`` al consumer.
+
+        Thread-safe: è chiamata dal thread che esegue l'inferenza.
+        """
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+
+    def report_language(self, language: str, probability: float) -> None:
+        """Passa a ``on_info`` (nell'event loop) la lingua della clip.
+
+        Thread-safe come :meth:`emit`.
+        """
+        if self.on_info is not None:
+            self.loop.call_soon_threadsafe(self.on_info, language, probability)
+
+
+class MicroBatcher:
+    """Raccoglie clip brevi in una finestra temporale e le decodifica insieme.
+
+    Un batch parte quando scade la finestra aperta dalla prima clip oppure
+    appena raggiunge ``max_batch`` clip. ``dispatch`` riceve la lista di clip e
+    deve consegnare a ciascuna i propri segmenti (via :meth:`BatchClip.emit`)
+    chiudendo con ``STREAM_DONE``; imposta ``BatchClip.queued`` appena il
+    batch è in coda allo scheduler.
+    """
+
+    def __init__(
+        self,
+        dispatch: Callable[[list[BatchClip]], Awaitable[None]],
+        *,
+        window_s: float,
+        max_batch: int,
+    ) -> None:
+        self._dispatch = dispatch
+        self._window_s = window_s
+        self._max_batch = max_batch
+        self._pending: dict[_BatchKey, list[BatchClip]] = {}
+        self._timers: dict[_BatchKey, asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._unqueued: set[BatchClip] = set()  # clip non ancora nello scheduler
+
+    async def submit(
+        self,
+        samples: np.ndarray,
+        language: str | None = None,
+        model_name: str | None = None,
+        profile: str | None = None,
+        *,
+        chat_id: int | None = None,
+        priority: Priority = Priority.INTERACTIVE,
+        on_queue: QueueCallback | None = None,
+        on_info: Callable[[str, float], None] | None = None,
+    ) -> AsyncIterator[str]:
+        """Accoda una clip al prossimo batch e ne produce i testi dei segmenti.
+
+        Se il consumer smette di iterare la clip esce dal batch in attesa o,
+        se il batch è già partito, viene marcata come annullata.
+        """
+        loop = asyncio.get_running_loop()
+        clip = BatchClip(
+            samples=samples,
+            language=language,
+            model_name=model_name,
+            loop=loop,
+            profile=profile,
+            chat_id=chat_id,
+            priority=priority,
+            on_queue=on_queue,
+            on_info=on_info,
+        )
+        key = (model_name, language, profile)
+        self._unqueued.add(clip)
+        pending = self._pending.setdefault(key, [])
+        pending.append(clip)
+        if len(pending) >= self._max_batch:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = loop.call_later(self._window_s, self._flush, key)
+
+        done = False
+        try:
+            while True:
+                item = await clip.queue.get()
+                if item is STREAM_DONE:
+                    done = True
+                    break
+                if isinstance(item, Exception):
+                    done = True
+                    raise item
+                yield item
+        finally:
+            if not done:
+                self._withdraw(key, clip)
+
+    async def wait_queued(self, chat_id: int) -> None:
+        """Attende che le clip di ``chat_id`` già ricevute siano in coda allo
+        scheduler: la richiesta successiva della chat si accoda dopo di loro."""
+        for clip in [c for c in self._unqueued if c.chat_id == chat_id]:
+            await clip.queued.wait()
+
+    def _settle(self, clip: BatchClip) -> None:
+        """La clip non è più in attesa di entrare nello scheduler."""
+        clip.queued.set()
+        self._unqueued.discard(clip)
+
+    def _withdraw(self, key: _BatchKey, clip: BatchClip) -> None:
+        """Toglie ``clip`` dal batch in attesa, o la marca come annullata."""
+        clip.cancelled.set()
+        self._settle(clip)
+        pending = self._pending.get(key, [])
+        if clip in pending:
+            pending.remove(clip)
+            if not pending:
+                del self._pending[key]
+                timer = self._timers.pop(key, None)
+                if timer is not None:
+                    timer.cancel()
+
+    def _flush(self, key: _BatchKey) -> None:
+        """Chiude il batch in attesa per ``(modello, lingua, profilo)`` e lo avvia."""
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        clips = self._pending.pop(key, [])
+        if not clips:
+            return
+        task = asyncio.ensure_future(self._run(clips))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, clips: list[BatchClip]) -> None:
+        try:
+            await self._dispatch(clips)
+        except Exception as exc:  # es. executor già chiuso: sblocca i consumer
+            for clip in clips:
+                clip.queue.put_nowait(exc)
+        finally:
+            for clip in clips:
+                self._settle(clip)
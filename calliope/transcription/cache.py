@@ -0,0 +1,76 @@
+"""Cache delle trascrizioni per file Telegram.
+
+Lo stesso vocale inoltrato in più gruppi ha sempre lo stesso ``file_unique_id``:
+la chiave ``(file_unique_id, lingua, modello, profilo di decodifica)``
+identifica quindi una trascrizione già fatta, che può essere rimandata senza download né inferenza.
+
+Due livelli:
+- in memoria, LRU con capacità fissa (sempre attivo se ``capacity > 0``);
+- su MongoDB tramite :class:`~calliope.storage.mongo.MongoStorage`, solo se
+  abilitato (``TRANSCRIPT_CACHE_TTL_S``): i testi scadono con un indice TTL.
+"""
+
+from collections import OrderedDict
+from typing import Protocol
+
+
+class TranscriptStore(Protocol):
+    """Livello persistente della cache (in pratica ``MongoStorage``)."""
+
+    def get_transcript(self, key: str) -> str | None: ...
+
+    def save_transcript(self, key: str, text: str) -> None: ...
+
+
+def cache_key(
+    file_unique_id: str, language: str | None, model_name: str, profile: str
+) -> str:
+    """Chiave di cache: stesso file, lingua richiesta, modello e profilo."""
+    return f"{file_unique_id}:{language or 'auto'}:{model_name}:{profile}"
+
+
+class TranscriptCache:
+    """Cache LRU in memoria con un livello persistente opzionale.
+
+    Un hit sul livello persistente viene promosso in memoria, così le richieste
+    successive per lo stesso file non interrogano più il DB.
+    """
+
+    def __init__(self, capacity: int, store: TranscriptStore | None = None) -> None:
+        self._capacity = capacity
+        self._store = store
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> str | None:
+        """Testo in cache per ``key``, o None."""
+        text = self._entries.get(key)
+        if text is not None:
+            self._entries.move_to_end(key)
+        elif self._store is not None:
+            text = self._store.get_transcript(key)
+            if text is not None:
+                self._remember(key, text)
+        if text is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return text
+
+    def put(self, key: str, text: str) -> None:
+        """Memorizza una trascrizione completa in tutti i livelli attivi."""
+        self._remember(key, text)
+        if self._store is not None:
+            self._store.save_transcript(key, text)
+
+    def _remember(self, key: str, text: str) -> None:
+        if self._capacity <= 0:
+            return
+        self._entries[key] = text
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._capacity:
+            self._entries.popitem(last=False)
@@ -0,0 +1,146 @@
+"""Divisione dei media lunghi in chunk paralleli e ricucitura delle parole.
+
+Un video da 30 minuti decodificato in sequenza occupa una sola replica anche
+quando le altre sono libere. Qui l'audio viene diviso in chunk di circa
+``chunk_s`` secondi, tagliando nei punti più silenziosi vicino a ogni confine
+(mai a metà di una parola, se possibile), e ogni chunk è esteso di
+``overlap_s`` secondi per lato per dare contesto al modello.
+
+Ogni chunk "possiede" solo il tratto tra i suoi due tagli: dopo la
+trascrizione si tengono le parole il cui centro cade nel tratto posseduto
+(:func:`stitch_words`), così le parole ripetute nelle sovrapposizioni compaiono
+una sola volta. :class:`Stitcher` fa lo stesso in modo incrementale, man
+mano che i chunk finiscono.
+"""
+
+import math
+from typing import NamedTuple
+
+import numpy as np
+
+from calliope.media.silence import window_levels
+
+# Risoluzione della ricerca del punto di taglio (finestre da 100 ms).
+_CUT_RESOLUTION_S = 0.1
+# Due parole uguali ai lati di un taglio, più vicine di così, sono un duplicato.
+_DUPLICATE_GAP_S = 0.5
+
+
+class TimedWord(NamedTuple):
+    """Una parola con timestamp assoluti (in secondi dall'inizio dell'audio)."""
+
+    start: float
+    end: float
+    text: str
+
+
+class Chunk(NamedTuple):
+    """Un chunk da decodificare: estensione e tratto posseduto, in campioni."""
+
+    start: int  # inizio dell'audio passato al modello (con sovrapposizione)
+    end: int
+    own_start: int  # tratto di cui il chunk fornisce le parole
+    own_end: int
+
+
+def plan_chunks(
+    audio: np.ndarray, sr: int, *, chunk_s: float, overlap_s: float
+) -> list[Chunk]:
+    """Divide ``audio`` in chunk di circa ``chunk_s`` secondi tagliati nel silenzio.
+
+    Ogni taglio è cercato entro un quarto di chunk dal confine nominale, nella
+    finestra da 100 ms con l'ampiezza media più bassa. Un audio più corto di
+    due chunk resta un chunk unico.
+    """
+    total = len(audio)
+    chunk = int(chunk_s * sr)
+    if chunk <= 0 or total < 2 * chunk:
+        return [Chunk(0, total, 0, total)]
+
+    window = max(int(_CUT_RESOLUTION_S * sr), 1)
+    levels = window_levels(audio, window)
+    search = max(chunk // 4 // window, 1)
+    cuts = [0]
+    for nominal in range(chunk, total - chunk // 2, chunk):
+        center = nominal // window
+        low = max(center - search, (cuts[-1] + chunk // 2) // window)
+        high = min(center + search, len(levels) - 1)
+        if low >= high:
+            continue
+        quietest = low + int(np.argmin(levels[low:high]))
+        cuts.append(quietest * window + window // 2)
+    cuts.append(total)
+
+    overlap = int(overlap_s * sr)
+    return [
+        Chunk(
+            max(own_start - overlap, 0),
+            min(own_end + overlap, total),
+            own_start,
+            own_end,
+        )
+        for own_start, own_end in zip(cuts[:-1], cuts[1:], strict=True)
+    ]
+
+
+class Stitcher:
+    """Ricucitura incrementale: i chunk possono finire in qualunque ordine.
+
+    :meth:`add` riceve le parole di un chunk e restituisce quelle diventate
+    definitive, cioè dei chunk completati consecutivi a partire dal primo:
+    l'ordine del testo è sempre quello dell'audio.
+    """
+
+    def __init__(self, chunks: list[Chunk], sr: int) -> None:
+        self._chunks = chunks
+        self._sr = sr
+        self._done: dict[int, list[TimedWord]] = {}
+        self._next = 0  # primo chunk non ancora ricucito
+        self._last: TimedWord | None = None
+
+    def add(self, index: int, words: list[TimedWord]) -> list[TimedWord]:
+        self._done[index] = words
+        stitched: list[TimedWord] = []
+        while self._next in self._done:
+            stitched.extend(self._owned(self._next, self._done.pop(self._next)))
+            self._next += 1
+        return stitched
+
+    def _owned(self, index: int, words: list[TimedWord]) -> list[TimedWord]:
+        """Le parole del tratto posseduto dal chunk, senza il duplicato al taglio."""
+        chunk = self._chunks[index]
+        # Il primo e l'ultimo chunk tengono anche i timestamp fuori dall'audio
+        # (Whisper può chiudere l'ultima parola poco dopo la fine).
+        own_start = chunk.own_start / self._sr if index > 0 else -math.inf
+        own_end = (
+            chunk.own_end / self._sr if index < len(self._chunks) - 1 else math.inf
+        )
+        owned = [w for w in words if own_start <= (w.start + w.end) / 2 < own_end]
+        if owned and self._last is not None and _duplicate(self._last, owned[0]):
+            owned = owned[1:]  # solo a cavallo del taglio, non dentro il chunk
+        if owned:
+            self._last = owned[-1]
+        return owned
+
+
+def stitch_words(
+    chunk_words: list[list[TimedWord]], chunks: list[Chunk], sr: int
+) -> list[TimedWord]:
+    """Unisce le parole dei chunk (timestamp già assoluti) in un'unica sequenza.
+
+    Di ogni chunk si tengono le parole con il centro nel tratto posseduto; se
+    ai due lati di un taglio resta la stessa parola a meno di mezzo secondo
+    (timestamp leggermente diversi nei due chunk) la seconda viene scartata.
+    """
+    stitcher = Stitcher(chunks, sr)
+    stitched: list[TimedWord] = []
+    for index, words in enumerate(chunk_words):
+        stitched.extend(stitcher.add(index, words))
+    return stitched
+
+
+def _duplicate(previous: TimedWord, word: TimedWord) -> bool:
+    return (
+        previous.text.strip().lower() == word.text.strip().lower()
+        and word.start - previous.start < _DUPLICATE_GAP_S
+    )
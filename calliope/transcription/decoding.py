@@ -0,0 +1,78 @@
+"""Profili di decodifica: quanto lavora il decoder per ogni richiesta.
+
+Un vocale da 5 secondi in un gruppo vuole la risposta subito: decodifica greedy
+senza fallback di temperatura e senza token di timestamp basta quasi sempre.
+Un video di un'ora da consegnare come file può invece permettersi un beam più
+ampio. I profili (``DECODING_PROFILES``, più i predefiniti "fast", "balanced"
+e "accurate") danno un nome a questi compromessi; :class:`DecodingProfiles`
+sceglie quello di ogni richiesta dal percorso (vocale o video) e dalla durata,
+con le regole ``DECODING_RULES`` valutate in ordine come quelle del router dei
+modelli.
+"""
+
+from typing import Any, Literal
+
+from calliope.settings import DecodingProfile, DecodingRule, Settings
+
+# Percorso della richiesta: trascrizione in streaming o video→file con timestamp.
+DecodingPath = Literal["voice", "video"]
+
+BUILTIN_PROFILES: dict[str, DecodingProfile] = {
+    "fast": DecodingProfile(
+        beam_size=1,
+        best_of=1,
+        temperature=0.0,
+        condition_on_previous_text=False,
+        without_timestamps=True,
+    ),
+    "balanced": DecodingProfile(),
+    "accurate": DecodingProfile(beam_size=8, best_of=5, patience=1.5),
+}
+
+
+def _matches(rule: DecodingRule, path: DecodingPath, duration: float) -> bool:
+    if rule.path is not None and rule.path != path:
+        return False
+    if rule.min_duration_s is not None and duration < rule.min_duration_s:
+        return False
+    return rule.max_duration_s is None or duration <= rule.max_duration_s
+
+
+class DecodingProfiles:
+    """Profili disponibili e regole per scegliere quello di ogni richiesta."""
+
+    def __init__(
+        self,
+        profiles: dict[str, DecodingProfile],
+        rules: list[DecodingRule],
+        defaults: dict[DecodingPath, str],
+    ) -> None:
+        self.profiles = {**BUILTIN_PROFILES, **profiles}
+        self._rules = list(rules)
+        self._defaults = defaults
+        names = [rule.profile for rule in self._rules] + list(defaults.values())
+        unknown = sorted(set(names) - self.profiles.keys())
+        if unknown:
+            raise ValueError(f"Unknown decoding profile(s): {', '.join(unknown)}")
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "DecodingProfiles":
+        return cls(
+            settings.decoding_profiles,
+            settings.decoding_rules,
+            {
+                "voice": settings.voice_decoding_profile,
+                "video": settings.video_decoding_profile,
+            },
+        )
+
+    def select(self, path: DecodingPath, duration: float) -> str:
+        """Il profilo per un media di ``duration`` secondi del percorso ``path``."""
+        for rule in self._rules:
+            if _matches(rule, path, duration):
+                return rule.profile
+        return self._defaults[path]
+
+    def kwargs(self, name: str) -> dict[str, Any]:
+        """I kwargs di ``transcribe`` del profilo (solo i campi impostati)."""
+        return self.profiles[name].model_dump(exclude_none=True)
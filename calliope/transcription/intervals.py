@@ -0,0 +1,140 @@
+"""Raggruppamento in intervalli di tempo delle parole con timestamp.
+
+Il percorso video→file produce un testo diviso in intervalli di durata fissa
+(``TIMESTAMP_INTERVAL_S``: 30 s, 1 min, 5 min, ...), ognuno con la sua
+etichetta ``[HH:MM:SS - HH:MM:SS]``. :class:`IntervalBucketer` lavora in
+streaming: le parole arrivano in ordine di tempo dal decoder e ogni intervallo
+viene emesso appena il decoder lo ha superato, così l'handler può mostrare
+l'avanzamento senza attendere la fine del video. Il testo di un intervallo è
+unito in tempo lineare (:func:`join_words`).
+
+Con la granularità ``"segment"`` il decoder non calcola i timestamp delle
+parole: :func:`interpolate_words` li stima dai confini del segmento.
+"""
+
+import re
+from collections.abc import Iterable
+from typing import Literal, NamedTuple
+
+from calliope.transcription.chunking import TimedWord
+
+# "word": timestamp di ogni parola (allineamento cross-attention, esatto ma
+# costoso); "segment": solo i timestamp dei segmenti, parole interpolate.
+Granularity = Literal["word", "segment"]
+
+# Una parola con lo spazio che la precede: ``"".join`` ridà il testo originale.
+_TOKEN = re.compile(r"\s*\S+")
+
+
+class Interval(NamedTuple):
+    """Un intervallo concluso: estremi in secondi e testo."""
+
+    start: float
+    end: float
+    text: str
+
+    @property
+    def label(self) -> str:
+        return f"[{format_clock(self.start)} - {format_clock(self.end)}]"
+
+
+def format_clock(seconds: float) -> str:
+    """``HH:MM:SS`` (secondi troncati)."""
+    return (
+        f"{int(seconds // 3600):02d}:{int((seconds % 3600) // 60):02d}:"
+        f"{int(seconds % 60):02d}"
+    )
+
+
+def join_words(words: Iterable[str]) -> str:
+    """Ricostruisce la frase dalle parole di Whisper.
+
+    Una parola che inizia con una lettera o una cifra (o ``¿``/``¡``) è
+    preceduta da uno spazio; le altre (punteggiatura, parole che hanno già lo
+    spazio iniziale come quelle di faster-whisper) sono attaccate così come
+    sono. Un solo ``join`` finale: lineare nel numero di parole.
+    """
+    parts: list[str] = []
+    for word in words:
+        if parts and word and (word[0].isalnum() or word[0] in "¿¡"):
+            parts.append(" ")
+        parts.append(word)
+    return "".join(parts).strip()
+
+
+class IntervalBucketer:
+    """Raggruppa in intervalli di ``interval_s`` secondi parole in ordine di tempo.
+
+    :meth:`add` restituisce gli intervalli conclusi dalla parola (quelli che
+    la parola ha superato, anche vuoti); :meth:`finish` chiude i restanti fino
+    alla fine dell'ultima parola, l'ultimo dei quali può essere parziale. Una
+    parola che inizia in un intervallo già emesso (timestamp non monotoni)
+    finisce nell'intervallo corrente.
+    """
+
+    def __init__(self, interval_s: float = 60) -> None:
+        self._interval = interval_s
+        self._index = 0  # primo intervallo non ancora emesso
+        self._words: list[str] = []
+        self._end = 0.0  # fine dell'ultima parola: la durata trascritta
+
+    def add(self, word: TimedWord) -> list[Interval]:
+        index = max(int(word.start // self._interval), self._index)
+        done = [self._close(self._bound()) for _ in range(index - self._index)]
+        self._words.append(word.text)
+        self._end = max(self._end, word.end)
+        return done
+
+    def finish(self) -> list[Interval]:
+        last = int(self._end // self._interval)
+        return [
+            self._close(min(self._bound(), self._end))
+            for _ in range(last - self._index + 1)
+        ]
+
+    def _bound(self) -> float:
+        """Fine nominale dell'intervallo corrente."""
+        return (self._index + 1) * self._interval
+
+    def _close(self, end: float) -> Interval:
+        interval = Interval(self._index * self._interval, end, join_words(self._words))
+        self._words = []
+        self._index += 1
+        return interval
+
+
+def interpolate_words(start: float, end: float, text: str) -> list[TimedWord]:
+    """Parole di un segmento con timestamp interpolati (granularità "segment").
+
+    Senza ``word_timestamps`` Whisper dà solo inizio e fine del segmento: il
+    tempo è distribuito tra le parole in proporzione ai caratteri. Così un
+    segmento a cavallo di due intervalli viene diviso nel punto stimato,
+    invece di finire tutto nel primo.
+    """
+    tokens = _TOKEN.findall(text)
+    total = sum(len(token) for token in tokens)
+    if total == 0:
+        return []
+    words = []
+    position = 0
+    for token in tokens:
+        word_start = start + (end - start) * position / total
+        position += len(token)
+        words.append(
+            TimedWord(word_start, start + (end - start) * position / total, token)
+        )
+    return words
+
+
+def bucket_words(words: Iterable[TimedWord], interval_s: float = 60) -> list[Interval]:
+    """Tutti gli intervalli di ``words`` (versione non in streaming)."""
+    bucketer = IntervalBucketer(interval_s)
+    intervals = [interval for word in words for interval in bucketer.add(word)]
+    return intervals + bucketer.finish()
+
+
+def render_intervals(intervals: Iterable[Interval], return_dict: bool = False):
+    """Il testo finale: righe ``[inizio - fine]: testo`` o un dict etichetta→testo."""
+    if return_dict:
+        return {interval.label: interval.text for interval in intervals}
+    return "\n".join(f"{interval.label}: {interval.text}" for interval in intervals)
@@ -0,0 +1,116 @@
+"""Lingua "imparata" per chat: evita il language detection quando è prevedibile.
+
+Senza /lang ogni richiesta paga il rilevamento della lingua di faster-whisper
+sui primi 30 s. La maggior parte delle chat parla sempre la stessa lingua:
+:class:`LanguagePinner` registra lingua e probabilità rilevate per ogni chat e,
+dopo ``min_detections`` rilevamenti consecutivi concordi e sicuri, **fissa**
+quella lingua, che viene poi passata direttamente a ``transcribe``. La lingua
+imparata vale solo per la decodifica: router e cache vedono la richiesta come
+in auto (le regole per lingua del router sono pensate per /lang).
+
+Ogni ``recheck_every`` richieste servite con la lingua fissata, la richiesta
+successiva torna al rilevamento: se la lingua rilevata con sicurezza è un'altra
+la chat viene sbloccata e ricomincia a contare.
+
+Lo stato fissato è tenuto in memoria e salvato tramite ``MongoStorage`` (un
+/lang esplicito ha sempre la precedenza: il pinner entra in gioco solo in auto).
+"""
+
+from dataclasses import dataclass
+from typing import Protocol
+
+from loguru import logger
+
+
+class PinStore(Protocol):
+    """Persistenza della lingua fissata (in pratica ``MongoStorage``)."""
+
+    def get_language_pin(self, chat_id: int) -> str | None: ...
+
+    def save_language_pin(self, chat_id: int, language: str | None) -> None: ...
+
+
+@dataclass
+class _ChatState:
+    pinned: str | None = None
+    candidate: str | None = None
+    streak: int = 0  # rilevamenti sicuri consecutivi di ``candidate``
+    served: int = 0  # richieste servite con la lingua fissata dall'ultimo check
+
+
+class LanguagePinner:
+    """Stato della lingua imparata per ogni chat."""
+
+    def __init__(
+        self,
+        store: PinStore | None,
+        *,
+        min_detections: int,
+        min_probability: float,
+        recheck_every: int,
+    ) -> None:
+        self._store = store
+        self._min_detections = min_detections
+        self._min_probability = min_probability
+        self._recheck_every = recheck_every
+        self._chats: dict[int, _ChatState] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self._min_detections > 0
+
+    def _state(self, chat_id: int) -> _ChatState:
+        state = self._chats.get(chat_id)
+        if state is None:
+            pinned = self._store.get_language_pin(chat_id) if self._store else None
+            state = _ChatState(pinned=pinned, candidate=pinned)
+            self._chats[chat_id] = state
+        return state
+
+    def language_for(self, chat_id: int) -> str | None:
+        """La lingua da forzare per la prossima richiesta della chat, o None.
+
+        None significa "rileva": chat non ancora fissata oppure re-check dovuto.
+        Ogni lingua restituita conta come richiesta servita: va chiamata solo
+        per le richieste che arrivano all'inferenza (non per le risposte dalla
+        cache).
+        """
+        if not self.enabled:
+            return None
+        state = self._state(chat_id)
+        if state.pinned is None or state.served >= self._recheck_every:
+            return None
+        state.served += 1
+        return state.pinned
+
+    def observe(self, chat_id: int, language: str, probability: float) -> None:
+        """Registra un rilevamento di faster-whisper per la chat."""
+        if not self.enabled:
+            return
+        state = self._state(chat_id)
+        if probability < self._min_probability:
+            state.streak = 0  # rilevamento incerto: la sequenza si interrompe
+            return
+
+        if language == state.candidate:
+            state.streak += 1
+        else:
+            state.candidate, state.streak = language, 1
+
+        if state.pinned is not None:
+            if language == state.pinned:
+                state.served = 0  # re-check superato
+                return
+            logger.info(
+                f"Chat {chat_id}: detected {language}, unpinning {state.pinned}"
+            )
+            self._set_pin(chat_id, state, None)
+        if state.streak >= self._min_detections:
+            logger.info(f"Chat {chat_id}: pinning language {language}")
+            self._set_pin(chat_id, state, language)
+
+    def _set_pin(self, chat_id: int, state: _ChatState, language: str | None) -> None:
+        state.pinned = language
+        state.served = 0
+        if self._store is not None:
+            self._store.save_language_pin(chat_id, language)
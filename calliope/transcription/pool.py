@@ -0,0 +1,105 @@
+"""Pool di repliche del modello Whisper condivise dai thread worker.
+
+Ogni replica è un oggetto con l'interfaccia di ``WhisperModel`` (in pratica un
+``WhisperModel``). I thread dell'executor prendono in prestito la prima replica
+libera con :meth:`ReplicaPool.acquire` e la restituiscono a fine lavoro: così
+``stream_segments`` e ``transcribe_with_timestamps`` finiscono sempre sulla
+replica disponibile, senza che il chiamante debba sceglierla.
+
+Le repliche si possono sostituire a caldo (:meth:`ReplicaPool.swap`): i prestiti
+successivi ricevono le nuove, quelli in corso finiscono sulle vecchie, che
+:class:`RetiredReplicas` permette di liberare quando sono tutte rientrate.
+"""
+
+import queue
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any
+
+
+class ReplicaPool:
+    """Insieme di repliche intercambiabili, prestate una alla volta.
+
+    Le repliche possono anche essere lo **stesso** oggetto ripetuto N volte
+    (modello unico caricato con ``num_workers=N``): il pool in quel caso limita
+    soltanto il numero di chiamate concorrenti al modello condiviso.
+    """
+
+    def __init__(self, replicas: list[Any]) -> None:
+        if not replicas:
+            raise ValueError("ReplicaPool needs at least one replica")
+        self._size = len(replicas)
+        self._install(replicas)
+
+    def _install(self, replicas: list[Any]) -> None:
+        self._replicas = list(replicas)
+        self._idle: queue.SimpleQueue = queue.SimpleQueue()
+        for replica in self._replicas:
+            self._idle.put(replica)
+
+    @property
+    def size(self) -> int:
+        """Numero totale di repliche (libere + occupate), anche a pool scarico."""
+        return self._size
+
+    @property
+    def loaded(self) -> bool:
+        """False se le repliche sono state scaricate (``swap([])``)."""
+        return bool(self._replicas)
+
+    @property
+    def idle(self) -> int:
+        """Numero di repliche libere in questo istante (indicativo)."""
+        return self._idle.qsize()
+
+    @property
+    def replicas(self) -> list[Any]:
+        """Le repliche gestite dal pool (copia della lista)."""
+        return list(self._replicas)
+
+    @contextmanager
+    def acquire(self) -> Iterator[Any]:
+        """Presta una replica libera (bloccante) e la restituisce all'uscita.
+
+        Va chiamato dai thread worker, mai dall'event loop: se tutte le repliche
+        sono occupate il thread resta in attesa della prima che si libera.
+        """
+        idle = self._idle  # dopo uno swap la replica torna nella coda di origine
+        replica = idle.get()
+        try:
+            yield replica
+        finally:
+            idle.put(replica)
+
+    def swap(self, replicas: list[Any]) -> "RetiredReplicas":
+        """Sostituisce le repliche; una lista vuota scarica il pool.
+
+        Va chiamato dall'event loop tra un job e l'altro: i prestiti successivi
+        ricevono le nuove repliche, quelli in corso restano sulle vecchie.
+        Restituisce le repliche uscenti, da liberare con
+        :meth:`RetiredReplicas.wait_idle`. Le nuove repliche devono essere
+        quante quelle iniziali (la capacità nello scheduler non cambia).
+        """
+        if replicas and len(replicas) != self._size:
+            raise ValueError(f"Expected {self._size} replicas, got {len(replicas)}")
+        retired = RetiredReplicas(self._replicas, self._idle)
+        self._install(replicas)
+        return retired
+
+
+class RetiredReplicas:
+    """Repliche tolte da un pool, forse ancora in prestito a qualche job."""
+
+    def __init__(self, replicas: list[Any], idle: queue.SimpleQueue) -> None:
+        self._replicas = replicas
+        self._idle = idle
+
+    def wait_idle(self, poll_s: float = 0.05) -> list[Any]:
+        """Attende (bloccante) che tutte le repliche siano rientrate e le
+        restituisce: nessun job le usa più, si possono chiudere."""
+        while self._idle.qsize() < len(self._replicas):
+            time.sleep(poll_s)
+        replicas, self._replicas = self._replicas, []
+        self._idle = queue.SimpleQueue()
+        return replicas
@@ -0,0 +1,373 @@
+"""Backend di inferenza multi-processo: ogni replica in un processo figlio.
+
+Con ``INFERENCE_BACKEND=process`` ogni replica del :class:`ReplicaPool` è un
+:class:`ProcessReplica`: un proxy con l'interfaccia di ``WhisperModel``
+(``transcribe``, ``detect_language``) che inoltra le chiamate a un processo
+worker con il proprio modello. Il resto del transcriber non cambia: thread
+dell'executor, scheduler e generatori lazy funzionano come con le repliche
+in-process.
+
+- L'audio decodificato passa in ``multiprocessing.shared_memory``: il worker
+  legge i campioni direttamente dal segmento condiviso, senza pickling
+  dell'array.
+- I segmenti tornano uno alla volta su una pipe, appena prodotti. Se il
+  consumer smette di iterare il proxy chiede lo stop e il worker non decodifica
+  oltre il segmento corrente.
+- Se il worker muore (es. crash di CTranslate2) la richiesta in corso fallisce
+  con :class:`WorkerCrashedError` e il processo viene riavviato: il bot resta
+  in piedi e la replica torna disponibile. Se il riavvio fallisce mentre carica
+  il modello (es. OOM transitorio) viene ritentato con backoff; esauriti i
+  tentativi la richiesta fallisce e la successiva ricomincia da capo, così la
+  replica non resta rotta per sempre.
+
+Il protocollo sulla pipe è fatto di tuple ``(tipo, payload)``. Ogni richiesta
+``transcribe`` riceve ``info``, zero o più ``segment`` e infine ``end`` (o
+``error``); ``detect_language`` riceve ``result`` (o ``error``).
+"""
+
+import multiprocessing
+import signal
+import time
+from collections.abc import Callable, Iterator
+from multiprocessing import shared_memory
+from typing import Any, NamedTuple
+
+import numpy as np
+from loguru import logger
+
+# Costruisce il modello nel processo worker (es. ``partial(WhisperModel, ...)``):
+# deve essere picklable, il worker è avviato con ``spawn``.
+ModelLoader = Callable[[], Any]
+
+# Attesa massima per l'uscita ordinata di un worker prima del kill.
+_JOIN_TIMEOUT_S = 5.0
+
+# Tentativi di caricamento dopo un crash, con attesa che raddoppia a ogni
+# fallimento (1 s, 2 s, 4 s).
+_RESTART_ATTEMPTS = 3
+_RESTART_BACKOFF_S = 1.0
+
+
+class WorkerCrashedError(RuntimeError):
+    """Il processo worker è terminato durante una richiesta (viene riavviato)."""
+
+
+class WorkerInfo(NamedTuple):
+    """Il sottoinsieme di ``TranscriptionInfo`` rimandato dal worker."""
+
+    language: str
+    language_probability: float
+    duration: float
+
+
+# --- Lato worker -------------------------------------------------------------
+
+
+def _serve(conn, loader: ModelLoader) -> None:
+    """Loop del processo worker: carica il modello e serve le richieste."""
+    # Ctrl+C arriva a tutto il gruppo di processi: lo gestisce il padre.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        model = loader()
+    except Exception as exc:
+        _send_error(conn, exc)
+        return
+    conn.send(("ready", None))
+    while True:
+        try:
+            kind, request = conn.recv()
+        except EOFError:
+            return  # il padre è terminato
+        if kind == "shutdown":
+            return
+        if kind == "stop":
+            continue  # stop arrivato dopo la fine del flusso: niente da fermare
+        try:
+            _handle(conn, model, kind, request)
+        except Exception as exc:
+            _send_error(conn, exc)
+
+
+def _handle(conn, model, kind: str, request: dict) -> None:
+    """Collega il segmento condiviso della richiesta e la esegue."""
+    name = request.get("shm")
+    if name is None:  # es. percorso di file: passato così com'è
+        _dispatch(conn, model, kind, request["audio"], request)
+        return
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        # Vista senza copia sul segmento: va rilasciata prima di chiuderlo.
+        audio = np.ndarray(request["shape"], dtype=np.float32, buffer=shm.buf)
+        _dispatch(conn, model, kind, audio, request)
+        del audio
+    finally:
+        try:
+            shm.close()
+        except BufferError:
+            pass  # viste ancora referenziate (es. da un traceback): GC
+
+
+def _dispatch(conn, model, kind: str, audio, request: dict) -> None:
+    if kind == "detect_language":
+        conn.send(("result", model.detect_language(audio)))
+    else:
+        _stream(conn, model, audio, request)
+
+
+def _stream(conn, model, audio, request: dict) -> None:
+    """Trascrive e invia i segmenti uno alla volta, fermandosi su ``stop``."""
+    target = model
+    if request["batched"]:
+        from faster_whisper import BatchedInferencePipeline
+
+        target = BatchedInferencePipeline(model=model)
+    segments, info = target.transcribe(audio, **request["kwargs"])
+    conn.send(
+        (
+            "info",
+            WorkerInfo(info.language, info.language_probability, info.duration)
+            if info is not None
+            else None,
+        )
+    )
+    for segment in segments:
+        if conn.poll():  # il padre ha chiesto lo stop
+            conn.recv()
+            break
+        conn.send(("segment", segment))
+    conn.send(("end", None))
+
+
+def _send_error(conn, exc: Exception) -> None:
+    try:
+        conn.send(("error", exc))
+    except Exception:  # eccezione non picklable
+        conn.send(("error", RuntimeError(repr(exc))))
+
+
+# --- Lato bot ----------------------------------------------------------------
+
+
+class _Stream:
+    """Un flusso di segmenti in corso su una replica e il suo segmento condiviso."""
+
+    def __init__(self, replica: "ProcessReplica", shm) -> None:
+        self._replica = replica
+        self._shm = shm
+        self.open = True
+
+    def segments(self) -> Iterator[Any]:
+        try:
+            while self.open:
+                kind, payload = self._replica._recv(self)
+                if kind == "end":
+                    self._end()
+                    return
+                yield payload
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Ferma il worker se il flusso non è finito e libera la memoria condivisa."""
+        if not self.open:
+            return
+        try:
+            self._replica._conn.send(("stop", None))
+            while self.open:
+                kind, _payload = self._replica._recv(self)
+                if kind == "end":
+                    self._end()
+        except Exception:  # crash durante lo stop: il worker è già riavviato
+            self._end()
+
+    def _end(self) -> None:
+        if self.open:
+            self.open = False
+            _release(self._shm)
+        if self._replica._active is self:
+            self._replica._active = None
+
+
+def _release(shm) -> None:
+    if shm is not None:
+        shm.close()
+        shm.unlink()
+
+
+class _BatchedPipeline:
+    """Proxy di ``BatchedInferencePipeline`` eseguita nel processo worker."""
+
+    def __init__(self, replica: "ProcessReplica") -> None:
+        self._replica = replica
+
+    def transcribe(self, audio, **kwargs):
+        return self._replica._transcribe(audio, kwargs, batched=True)
+
+
+class ProcessReplica:
+    """Replica del modello in un processo worker, con l'interfaccia di ``WhisperModel``.
+
+    Come ogni replica del pool è usata da un thread alla volta. Un flusso di
+    segmenti non consumato fino in fondo viene chiuso alla richiesta
+    successiva (o quando il generatore viene chiuso).
+    """
+
+    def __init__(self, loader: ModelLoader, *, name: str = "whisper-worker") -> None:
+        self._loader = loader
+        self._name = name
+        self._active: _Stream | None = None
+        self._ready = False
+        # True dopo un crash, finché un worker riavviato non carica il modello:
+        # solo allora un caricamento fallito viene ritentato.
+        self._respawned = False
+        self._start()
+
+    @property
+    def pid(self) -> int | None:
+        return self._process.pid
+
+    def _start(self) -> None:
+        context = multiprocessing.get_context("spawn")
+        self._conn, child = context.Pipe()
+        self._process = context.Process(
+            target=_serve, args=(child, self._loader), name=self._name, daemon=True
+        )
+        self._process.start()
+        child.close()
+        self._ready = False
+
+    def wait_ready(self) -> None:
+        """Attende che il worker abbia caricato il modello (errore se fallisce).
+
+        Al primo avvio l'errore è sollevato subito (es. modello inesistente);
+        dopo un crash il riavvio è ritentato fino a ``_RESTART_ATTEMPTS``
+        volte con backoff esponenziale.
+        """
+        if self._ready:
+            return
+        delay = _RESTART_BACKOFF_S
+        for attempt in range(_RESTART_ATTEMPTS + 1):
+            try:
+                self._load()
+            except Exception as exc:
+                if not self._respawned:
+                    raise
+                if attempt == _RESTART_ATTEMPTS:
+                    logger.error(
+                        f"{self._name} failed to reload the model after "
+                        f"{_RESTART_ATTEMPTS} restarts: {exc!r}"
+                    )
+                    # la prossima richiesta riparte con un worker nuovo
+                    self._respawn()
+                    raise WorkerCrashedError(f"{self._name} failed to restart") from exc
+                logger.warning(
+                    f"{self._name} failed to reload the model ({exc!r}), "
+                    f"retrying in {delay:g}s"
+                )
+                time.sleep(delay)
+                delay *= 2
+                self._respawn()
+            else:
+                self._ready = True
+                self._respawned = False
+                return
+
+    def _load(self) -> None:
+        """Riceve l'esito del caricamento del modello nel worker."""
+        try:
+            kind, payload = self._conn.recv()
+        except (EOFError, OSError) as exc:
+            raise WorkerCrashedError(f"{self._name} died while loading") from exc
+        if kind == "error":
+            raise payload
+
+    def transcribe(self, audio, **kwargs):
+        """Come ``WhisperModel.transcribe``: ``(segmenti lazy, info)``."""
+        return self._transcribe(audio, kwargs, batched=False)
+
+    def batched(self) -> _BatchedPipeline:
+        """``BatchedInferencePipeline`` sul modello del worker."""
+        return _BatchedPipeline(self)
+
+    def detect_language(self, audio):
+        """Come ``WhisperModel.detect_language``: ``(lingua, prob, tutte)``."""
+        request, shm = self._prepare(audio)
+        try:
+            self._conn.send(("detect_language", request))
+            _kind, result = self._recv(None)
+            return result
+        finally:
+            _release(shm)
+
+    def close(self) -> None:
+        """Arresta il worker (uscita ordinata, poi kill)."""
+        if self._active is not None:
+            self._active.close()
+        try:
+            self._conn.send(("shutdown", None))
+        except OSError:
+            pass
+        self._process.join(_JOIN_TIMEOUT_S)
+        if self._process.is_alive():
+            self._process.kill()
+            self._process.join()
+        self._conn.close()
+
+    def _transcribe(self, audio, kwargs: dict, batched: bool):
+        request, shm = self._prepare(audio)
+        request.update(kwargs=kwargs, batched=batched)
+        stream = _Stream(self, shm)
+        try:
+            self._conn.send(("transcribe", request))
+            _kind, info = self._recv(stream)
+        except BaseException:
+            stream._end()
+            raise
+        self._active = stream
+        return stream.segments(), info
+
+    def _prepare(self, audio) -> tuple[dict, Any]:
+        """Chiude il flusso precedente e copia l'audio in memoria condivisa."""
+        if self._active is not None:
+            self._active.close()
+            self._active = None
+        self.wait_ready()
+        if not isinstance(audio, np.ndarray):
+            return {"audio": audio}, None
+        samples = np.ascontiguousarray(audio, dtype=np.float32)
+        shm = shared_memory.SharedMemory(create=True, size=max(samples.nbytes, 1))
+        view = np.ndarray(samples.shape, dtype=np.float32, buffer=shm.buf)
+        view[...] = samples
+        del view  # nessuna vista viva: il segmento si può chiudere
+        return {"shm": shm.name, "shape": samples.shape}, shm
+
+    def _recv(self, stream: _Stream | None) -> tuple[str, Any]:
+        """Riceve un messaggio; ``error`` chiude il flusso e viene sollevato."""
+        try:
+            kind, payload = self._conn.recv()
+        except (EOFError, OSError) as exc:
+            if stream is not None:
+                stream._end()
+            self._restart()
+            raise WorkerCrashedError(f"{self._name} crashed") from exc
+        if kind == "error":
+            if stream is not None:
+                stream._end()
+            raise payload
+        return kind, payload
+
+    def _restart(self) -> None:
+        self._process.join(_JOIN_TIMEOUT_S)
+        logger.warning(
+            f"{self._name} (pid {self._process.pid}) exited with code "
+            f"{self._process.exitcode}, restarting"
+        )
+        self._active = None
+        self._respawn()
+
+    def _respawn(self) -> None:
+        """Sostituisce il processo worker (già terminato) con uno nuovo."""
+        self._process.join(_JOIN_TIMEOUT_S)
+        self._conn.close()
+        self._start()
+        self._respawned = True
@@ -0,0 +1,362 @@
+"""Client del worker di inferenza remoto (``calliope-worker``).
+
+Più deployment del bot possono condividere una sola macchina GPU: il worker
+(:mod:`calliope.worker`) ospita il :class:`WhisperTranscriber` con i suoi
+modelli e il suo scheduler, e ogni bot usa un :class:`RemoteTranscriber` che
+espone la stessa interfaccia (``stream_segments``,
+``transcribe_with_timestamps``, ``route``, ``admit``, ...).
+
+Protocollo, su socket Unix, una richiesta per connessione:
+
+- richiesta: una riga JSON con ``op`` (``hello``, ``stats``, ``admit``,
+  ``stream``, ``intervals``) e i parametri; per ``stream`` e ``intervals``
+  seguono ``nbytes`` byte di PCM float32 a 16 kHz;
+- risposta: righe JSON (NDJSON) inviate man mano: ``{"queue": [pos, eta]}``,
+  ``{"info": [lingua, prob]}``, ``{"reload": secondi}`` (modelli ricaricati
+  dopo lo scarico per inattività), ``{"segment": testo}``,
+  ``{"interval": [inizio, fine, testo]}``, chiuse da ``{"done": true}``
+  oppure da ``{"error": {...}}``.
+
+Chiudere la connessione annulla la richiesta sul worker (come annullare il
+task con il transcriber locale). L'ammissione avviene prima del download come
+con il transcriber locale: il bot controlla il proprio limite per chat, poi
+``admit`` chiede al worker, che vede la coda di tutti i bot, il suo limite per
+chat e lo SLA sull'attesa (senza prenotare nulla). Il worker ripete il
+controllo quando riceve l'audio e può ancora rifiutare la richiesta.
+"""
+
+import asyncio
+import json
+import socket
+from collections.abc import AsyncGenerator, AsyncIterator, Callable
+from contextlib import aclosing
+
+import numpy as np
+from loguru import logger
+
+from calliope.settings import DecodingProfile, DecodingRule, RouteRule, Settings
+from calliope.transcription.decoding import DecodingPath, DecodingProfiles
+from calliope.transcription.intervals import (
+    Granularity,
+    Interval,
+    render_intervals,
+)
+from calliope.transcription.router import ModelRouter
+from calliope.transcription.scheduler import (
+    Admission,
+    AdmissionRejectedError,
+    ChatQueueFullError,
+    OverloadedError,
+    Priority,
+    QueueCallback,
+    TranscriptionScheduler,
+)
+
+# Timeout delle chiamate brevi (hello, stats, admit).
+_CALL_TIMEOUT_S = 5.0
+# Le righe NDJSON possono contenere un'intera trascrizione con timestamp.
+STREAM_LIMIT = 64 * 1024 * 1024
+
+
+class RemoteWorkerError(RuntimeError):
+    """Errore riportato dal worker (o worker non raggiungibile)."""
+
+
+def encode(message: dict) -> bytes:
+    """Una riga NDJSON."""
+    return json.dumps(message).encode() + b"\n"
+
+
+def raise_for_error(error: dict) -> None:
+    """Risolleva nel bot l'errore serializzato dal worker."""
+    kind = error.get("type")
+    if kind == "overloaded":
+        raise OverloadedError(error["eta_s"], error["limit_s"])
+    if kind == "chat_queue_full":
+        raise ChatQueueFullError(error["chat_id"], error["limit"])
+    raise RemoteWorkerError(error.get("message", "worker error"))
+
+
+class RemoteTranscriber:
+    """Stessa interfaccia di ``WhisperTranscriber``, inferenza sul worker."""
+
+    def __init__(self, settings: Settings) -> None:
+        self._settings = settings
+        self._path = settings.worker_socket
+        hello = self._call({"op": "hello"})
+        self.model_name: str = hello["model_name"]
+        self.device = f"remote ({hello['device']})"
+        self.preview_lane: str | None = hello["preview_lane"]
+        self._preview_min_duration_s: float = hello["preview_min_duration_s"]
+        self._router = ModelRouter(
+            [RouteRule(**rule) for rule in hello["routes"]], self.model_name
+        )
+        decoding = hello["decoding"]
+        self._profiles = DecodingProfiles(
+            {
+                name: DecodingProfile(**profile)
+                for name, profile in decoding["profiles"].items()
+            },
+            [DecodingRule(**rule) for rule in decoding["rules"]],
+            decoding["defaults"],
+        )
+        # Solo il limite per chat: code e SLA sono del worker.
+        self._admission = TranscriptionScheduler(
+            1,
+            aging_rate=settings.scheduler_aging_rate,
+            batch_weight=settings.scheduler_batch_weight,
+            max_queued_per_chat=settings.scheduler_max_queued_per_chat,
+        )
+
+    # --- Interfaccia sincrona (handler e /admin) ------------------------------
+
+    def route(self, duration: float, language: str | None) -> str:
+        """Il modello per un media di ``duration`` secondi (regole del worker)."""
+        return self._router.route(duration, language)
+
+    def decoding_profile(self, path: DecodingPath, duration: float) -> str:
+        """Il profilo di decodifica per un media (profili e regole del worker)."""
+        return self._profiles.select(path, duration)
+
+    def wants_preview(self, duration: float) -> bool:
+        """True se il worker ha un modello di anteprima e il media è lungo."""
+        return (
+            self.preview_lane is not None and duration >= self._preview_min_duration_s
+        )
+
+    async def admit(
+        self,
+        chat_id: int,
+        *,
+        duration: float = 0.0,
+        priority: Priority = Priority.INTERACTIVE,
+        model_name: str | None = None,
+    ) -> Admission:
+        """Prenota un posto per la chat, prima del download.
+
+        Dopo il limite per chat locale al bot, il worker verifica il proprio
+        limite per chat e lo SLA sulla coda condivisa (``ChatQueueFullError``
+        e ``OverloadedError`` come in locale). Se il worker non risponde la
+        richiesta è ammessa: l'errore arriverà con la trascrizione.
+        """
+        admission = self._admission.admit(chat_id, cost=duration, priority=priority)
+        try:
+            await self._acall(
+                {
+                    "op": "admit",
+                    "chat_id": chat_id,
+                    "duration": duration,
+                    "priority": int(priority),
+                    "model_name": model_name,
+                }
+            )
+        except AdmissionRejectedError:
+            admission.release()
+            raise
+        except (OSError, asyncio.TimeoutError, RemoteWorkerError) as e:
+            logger.warning(f"Worker admission check failed, admitting: {e!r}")
+        return admission
+
+    async def stats(self) -> dict:
+        """Stato della coda e dei modelli del worker, in un'unica chiamata (vedi
+        ``WhisperTranscriber.stats``); vuoto se il worker non risponde."""
+        try:
+            reply = await self._acall({"op": "stats"})
+        except (OSError, asyncio.TimeoutError, RemoteWorkerError):
+            return {"queue": (0, 0), "models": []}
+        return {
+            "queue": tuple(reply["queue"]),
+            "models": [tuple(m) for m in reply["models"]],
+        }
+
+    @property
+    def loaded(self) -> bool:
+        """Sempre True: caricamento e scarico dei modelli sono affare del worker
+        (una ricarica è comunque riportata a ``on_reload``)."""
+        return True
+
+    def schedule_idle_unload(self) -> None:
+        """Niente da fare: lo scarico per inattività avviene sul worker."""
+
+    async def swap_model(self, name: str) -> float:
+        """Non supportato: i modelli vanno cambiati sul worker, che li ospita."""
+        raise RemoteWorkerError(
+            "the models live on calliope-worker: change WHISPER_MODEL there"
+        )
+
+    def warmup(self) -> None:
+        """Niente da fare: il modello è già caldo sul worker."""
+
+    def shutdown(self) -> None:
+        """Niente da fare: le connessioni sono per richiesta."""
+
+    def _call(self, request: dict) -> dict:
+        """Chiamata sincrona breve: una richiesta, una riga di risposta.
+
+        Solo fuori dall'event loop (l'handshake all'avvio): gli handler usano
+        :meth:`_acall`.
+        """
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(_CALL_TIMEOUT_S)
+            sock.connect(self._path)
+            sock.sendall(encode(request))
+            with sock.makefile("rb") as stream:
+                line = stream.readline()
+        return self._reply(line)
+
+    async def _acall(self, request: dict) -> dict:
+        """Come :meth:`_call`, senza bloccare l'event loop: un worker lento
+        rallenta solo la richiesta che lo interroga."""
+
+        async def _roundtrip() -> bytes:
+            reader, writer = await asyncio.open_unix_connection(
+                self._path, limit=STREAM_LIMIT
+            )
+            try:
+                writer.write(encode(request))
+                await writer.drain()
+                return await reader.readline()
+            finally:
+                writer.close()
+
+        return self._reply(await asyncio.wait_for(_roundtrip(), _CALL_TIMEOUT_S))
+
+    @staticmethod
+    def _reply(line: bytes) -> dict:
+        """La riga di risposta di una chiamata breve; risolleva gli errori."""
+        if not line:
+            raise RemoteWorkerError("worker closed the connection")
+        reply = json.loads(line)
+        if "error" in reply:
+            raise_for_error(reply["error"])
+        return reply
+
+    # --- Inferenza -------------------------------------------------------------
+
+    async def stream_segments(
+        self,
+        file_audio,
+        language: str | None = None,
+        *,
+        duration: float | None = None,
+        priority: Priority = Priority.INTERACTIVE,
+        chat_id: int | None = None,
+        on_queue: QueueCallback | None = None,
+        model_name: str | None = None,
+        on_info: Callable[[str, float], None] | None = None,
+        profile: str | None = None,
+        on_reload: Callable[[float], None] | None = None,
+    ) -> AsyncIterator[str]:
+        """Come ``WhisperTranscriber.stream_segments``, decodificato sul worker."""
+        request = {
+            "op": "stream",
+            "language": language,
+            "duration": duration,
+            "priority": int(priority),
+            "chat_id": chat_id,
+            "model_name": model_name,
+            "profile": profile,
+        }
+        # aclosing: se il consumer smette di iterare la connessione si chiude
+        # subito e il worker smette di decodificare.
+        async with aclosing(self._request(request, file_audio)) as messages:
+            async for message in messages:
+                if "segment" in message:
+                    yield message["segment"]
+                elif "queue" in message and on_queue is not None:
+                    on_queue(*message["queue"])
+                elif "info" in message and on_info is not None:
+                    on_info(*message["info"])
+                elif "reload" in message and on_reload is not None:
+                    on_reload(message["reload"])
+
+    async def transcribe_with_timestamps(
+        self,
+        audio_data: np.ndarray,
+        return_dict: bool = False,
+        language: str | None = None,
+        *,
+        duration: float | None = None,
+        priority: Priority = Priority.BATCH,
+        chat_id: int | None = None,
+        model_name: str | None = None,
+        interval_s: float | None = None,
+        granularity: Granularity | None = None,
+        profile: str | None = None,
+    ):
+        """Come ``WhisperTranscriber.transcribe_with_timestamps``, sul worker."""
+        async with aclosing(
+            self.stream_intervals(
+                audio_data,
+                language,
+                interval_s=interval_s,
+                granularity=granularity,
+                duration=duration,
+                priority=priority,
+                chat_id=chat_id,
+                model_name=model_name,
+                profile=profile,
+            )
+        ) as stream:
+            intervals = [interval async for interval in stream]
+        return render_intervals(intervals, return_dict)
+
+    async def stream_intervals(
+        self,
+        audio_data: np.ndarray,
+        language: str | None = None,
+        *,
+        interval_s: float | None = None,
+        granularity: Granularity | None = None,
+        duration: float | None = None,
+        priority: Priority = Priority.BATCH,
+        chat_id: int | None = None,
+        model_name: str | None = None,
+        profile: str | None = None,
+        on_reload: Callable[[float], None] | None = None,
+    ) -> AsyncGenerator[Interval, None]:
+        """Come ``WhisperTranscriber.stream_intervals``, sul worker."""
+        request = {
+            "op": "intervals",
+            "interval_s": interval_s,
+            "granularity": granularity,
+            "language": language,
+            "duration": duration,
+            "priority": int(priority),
+            "chat_id": chat_id,
+            "model_name": model_name,
+            "profile": profile,
+        }
+        async with aclosing(self._request(request, audio_data)) as messages:
+            async for message in messages:
+                if "interval" in message:
+                    yield Interval(*message["interval"])
+                elif "reload" in message and on_reload is not None:
+                    on_reload(message["reload"])
+
+    async def _request(self, request: dict, audio) -> AsyncGenerator[dict, None]:
+        """Invia richiesta e PCM, poi produce le righe di risposta fino a ``done``."""
+        if not isinstance(audio, np.ndarray):
+            raise TypeError("RemoteTranscriber needs decoded audio samples")
+        samples = np.ascontiguousarray(audio, dtype=np.float32)
+        request["nbytes"] = samples.nbytes
+        reader, writer = await asyncio.open_unix_connection(
+            self._path, limit=STREAM_LIMIT
+        )
+        try:
+            writer.write(encode(request))
+            writer.write(memoryview(samples).cast("B"))  # PCM grezzo, senza copia
+            await writer.drain()
+            while True:
+                line = await reader.readline()
+                if not line:
+                    raise RemoteWorkerError("worker closed the connection")
+                message = json.loads(line)
+                if "error" in message:
+                    raise_for_error(message["error"])
+                if message.get("done"):
+                    return
+                yield message
+        finally:
+            # Chiudere la connessione prima della fine annulla il job sul worker.
+            writer.close()
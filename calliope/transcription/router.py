@@ -0,0 +1,54 @@
+"""Router dei modelli: sceglie quale modello trascrive ogni richiesta.
+
+Un vocale da 3 secondi non ha bisogno di large-v3-turbo: con ``WHISPER_ROUTES``
+si possono tenere caricati più modelli (es. uno piccolo per le clip brevi, uno
+distillato inglese per le chat fissate su ``en`` con /lang) e scegliere per
+ogni richiesta in base a durata e lingua. Le regole sono valutate in ordine e
+vince la prima che corrisponde; altrimenti si usa il modello di default.
+"""
+
+from collections import Counter
+
+from calliope.settings import RouteRule
+
+
+def _matches(rule: RouteRule, duration: float, language: str | None) -> bool:
+    if rule.min_duration_s is not None and duration < rule.min_duration_s:
+        return False
+    if rule.max_duration_s is not None and duration > rule.max_duration_s:
+        return False
+    return not rule.languages or language in rule.languages
+
+
+class ModelRouter:
+    """Regole di routing più i contatori delle richieste servite per modello."""
+
+    def __init__(self, rules: list[RouteRule], default: str) -> None:
+        self._rules = list(rules)
+        self.default = default
+        self.served: Counter[str] = Counter()
+
+    @property
+    def models(self) -> dict[str, int | None]:
+        """Modelli da caricare → repliche richieste (None = quelle di default).
+
+        Il modello di default è sempre il primo; un modello citato da più
+        regole riceve il numero di repliche più alto tra quelle indicate.
+        """
+        models: dict[str, int | None] = {self.default: None}
+        for rule in self._rules:
+            if rule.model == self.default:
+                continue
+            models[rule.model] = max(rule.replicas, models.get(rule.model) or 0)
+        return models
+
+    def route(self, duration: float, language: str | None) -> str:
+        """Il modello per un media di ``duration`` secondi in ``language``."""
+        for rule in self._rules:
+            if _matches(rule, duration, language):
+                return rule.model
+        return self.default
+
+    def record(self, model: str, count: int = 1) -> None:
+        """Conta ``count`` richieste servite da ``model``."""
+        self.served[model] += count
@@ -0,0 +1,437 @@
+"""Scheduler delle trascrizioni: decide quale richiesta ottiene la prossima replica.
+
+Sostituisce la coda FIFO implicita dell'executor. Ogni job dichiara un costo
+stimato (i secondi di audio, da ``AudioData.duration``), una classe di priorità
+e la chat di provenienza. Lo scheduler è un *weighted fair queuing* per chat:
+
+- a ogni job è assegnato un tag virtuale di fine ``start + costo × peso_classe /
+  peso_chat``, dove ``start`` non è mai prima della fine del job precedente
+  della stessa chat: una chat che inoltra 50 vocali di fila accumula tag sempre
+  più alti e le altre chat si inseriscono tra i suoi job;
+- quando una replica si libera parte il job con il punteggio più basso::
+
+      punteggio = tag − aging × secondi_di_attesa
+
+Così un vocale da 10 s non aspetta dietro un video da 30 minuti, il percorso
+interattivo (voice/video note) precede quello video→file, e l'aging garantisce
+che anche i job lunghi prima o poi passino davanti (nessuna starvation).
+
+Per chat, i job partono e terminano nell'ordine di arrivo: è candidato solo il
+primo job in coda di ciascuna chat, e solo se la chat non ha già un job in
+esecuzione. Un job può servire più chat (un batch del micro-batcher): parte
+solo quando è il primo in coda per tutte e nessuna ha un job in corso. Il
+numero di job per chat (in coda o in corso) è limitato da
+:meth:`TranscriptionScheduler.admit`.
+
+Lo scheduler misura anche il *real-time factor* (secondi di elaborazione per
+secondo di audio) dei job completati e lo usa per stimare l'attesa: ai job in
+coda comunica posizione ed ETA man mano che la coda avanza, e
+:meth:`TranscriptionScheduler.admit` rifiuta in anticipo le richieste la cui
+attesa stimata supera lo SLA configurato.
+
+Con più modelli caricati (router) gli slot sono divisi in **corsie**, una per
+modello, ciascuna con la capacità delle sue repliche: un job attende solo uno
+slot della propria corsia, e tempi di attesa e real-time factor sono stimati
+per corsia. L'equità tra chat resta globale.
+
+Lo scheduler vive nell'event loop (nessun lock): i job in attesa non occupano
+thread dell'executor, che esegue solo i job a cui è stato concesso uno slot.
+"""
+
+import asyncio
+import itertools
+from collections.abc import AsyncIterator, Callable, Collection, Hashable, Mapping
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from enum import IntEnum
+from time import monotonic
+
+
+class Priority(IntEnum):
+    """Classe di priorità di un job (valore più basso = più urgente)."""
+
+    INTERACTIVE = 0  # voice / video note: l'utente guarda il placeholder
+    BATCH = 1  # video → file .txt con timestamp
+
+
+# Peso dell'ultima misura nella media mobile esponenziale del real-time factor.
+_RTF_SMOOTHING = 0.2
+# Sotto questa durata la misura del real-time factor è dominata dall'overhead.
+_RTF_MIN_AUDIO_S = 1.0
+
+# Callback di avanzamento della coda: (posizione 1-based, attesa stimata in s).
+QueueCallback = Callable[[int, float], None]
+
+# Corsia usata quando lo scheduler è costruito con un numero intero di slot.
+DEFAULT_LANE: Hashable = None
+
+
+class AdmissionRejectedError(Exception):
+    """La richiesta è stata rifiutata prima di entrare in coda."""
+
+
+class ChatQueueFullError(AdmissionRejectedError):
+    """La chat ha già troppi job in coda o in corso."""
+
+    def __init__(self, chat_id: int, limit: int) -> None:
+        self.chat_id = chat_id
+        self.limit = limit
+        super().__init__(f"Chat {chat_id} has {limit} queued jobs already")
+
+
+class OverloadedError(AdmissionRejectedError):
+    """L'attesa stimata supera lo SLA: meglio rifiutare subito che far aspettare."""
+
+    def __init__(self, eta_s: float, limit_s: float) -> None:
+        self.eta_s = eta_s
+        self.limit_s = limit_s
+        super().__init__(f"Estimated wait {eta_s:.0f}s > {limit_s:.0f}s")
+
+
+@dataclass(eq=False)
+class _Job:
+    flows: tuple[Hashable, ...]
+    cost: float
+    priority: Priority
+    start: float
+    tag: float
+    enqueued_at: float
+    seq: int
+    granted: asyncio.Future = field(repr=False)
+    lane: Hashable = DEFAULT_LANE
+    on_queue: QueueCallback | None = field(default=None, repr=False)
+    started_at: float = 0.0
+    last_status: tuple[int, int] | None = None
+
+
+class Admission:
+    """Prenotazione di un posto nella coda di una chat (vedi ``admit``).
+
+    Va rilasciata a fine richiesta, tipicamente usandola come context manager.
+    """
+
+    def __init__(self, scheduler: "TranscriptionScheduler", chat_id: int) -> None:
+        self._scheduler = scheduler
+        self._chat_id = chat_id
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._scheduler._unadmit(self._chat_id)
+
+    def __enter__(self) -> "Admission":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+
+class TranscriptionScheduler:
+    """Assegna ``slots`` posti di esecuzione (uno per replica) ai job in attesa.
+
+    ``slots`` è un intero (una sola corsia) oppure una mappa ``corsia →
+    capacità`` (es. modello → repliche); in quel caso ``slot``, ``admit`` e
+    ``estimate_wait`` ricevono la corsia del job con ``lane=``.
+
+    Uso::
+
+        with scheduler.admit(chat_id):  # ChatQueueFullError se la chat è piena
+            audio = await download_audio(...)
+            async with scheduler.slot(
+                cost=audio.duration, priority=Priority.BATCH, chat_id=chat_id
+            ):
+                await loop.run_in_executor(executor, work)
+    """
+
+    def __init__(
+        self,
+        slots: int | Mapping[Hashable, int],
+        *,
+        aging_rate: float,
+        batch_weight: float,
+        max_queued_per_chat: int = 0,
+        chat_weights: Mapping[int, float] | None = None,
+        initial_rtf: float = 0.5,
+        max_wait_s: float | None = None,
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        self._capacity: dict[Hashable, int] = (
+            dict(slots) if isinstance(slots, Mapping) else {DEFAULT_LANE: slots}
+        )
+        self._aging_rate = aging_rate
+        self._weights = {Priority.INTERACTIVE: 1.0, Priority.BATCH: batch_weight}
+        self._max_queued_per_chat = max_queued_per_chat
+        self._chat_weights = dict(chat_weights or {})
+        self._clock = clock
+        self._max_wait_s = max_wait_s
+        self._initial_rtf = initial_rtf
+        self._rtf = {lane: initial_rtf for lane in self._capacity}
+        self._waiting: list[_Job] = []  # in ordine di arrivo
+        self._active: list[_Job] = []
+        self._busy_flows: set[Hashable] = set()
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._flow_finish: dict[Hashable, float] = {}
+        self._admitted: dict[int, int] = {}
+
+    @property
+    def waiting(self) -> int:
+        """Job in coda, non ancora partiti."""
+        return len(self._waiting)
+
+    @property
+    def running(self) -> int:
+        """Job che occupano uno slot in questo momento."""
+        return len(self._active)
+
+    @property
+    def rtf(self) -> float:
+        """Real-time factor medio misurato (secondi di calcolo per secondo di audio)
+        della prima corsia."""
+        return next(iter(self._rtf.values()))
+
+    def lane_rtf(self, lane: Hashable) -> float:
+        """Real-time factor misurato per ``lane``."""
+        return self._rtf[lane]
+
+    def rename_lane(self, old: Hashable, new: Hashable) -> None:
+        """Rinomina la corsia ``old`` in ``new`` (es. dopo il cambio di modello).
+
+        Capacità e posizione tra le corsie restano; i job in coda e in corso
+        passano alla nuova corsia. Il real-time factor riparte dal valore
+        iniziale: quello misurato era del modello precedente.
+        """
+        if old not in self._capacity:
+            raise ValueError(f"Unknown scheduler lane: {old!r}")
+        if new in self._capacity:
+            raise ValueError(f"Scheduler lane already exists: {new!r}")
+        self._capacity = {
+            new if lane == old else lane: slots
+            for lane, slots in self._capacity.items()
+        }
+        self._rtf = {
+            new if lane == old else lane: self._initial_rtf if lane == old else rtf
+            for lane, rtf in self._rtf.items()
+        }
+        for job in self._waiting + self._active:
+            if job.lane == old:
+                job.lane = new
+
+    def admit(
+        self,
+        chat_id: int,
+        *,
+        cost: float = 0.0,
+        priority: Priority = Priority.INTERACTIVE,
+        lane: Hashable = DEFAULT_LANE,
+    ) -> Admission:
+        """Prenota un posto per una richiesta di ``chat_id``.
+
+        Solleva ``ChatQueueFullError`` se la chat ha già
+        ``max_queued_per_chat`` richieste ammesse e non ancora concluse
+        (0 = nessun limite), ``OverloadedError`` se l'attesa stimata per un job
+        di costo ``cost`` supera ``max_wait_s``. Va chiamata prima del download,
+        così le richieste che non verrebbero servite non scaricano nulla.
+        """
+        count = self._admitted.get(chat_id, 0)
+        if self._max_queued_per_chat and count >= self._max_queued_per_chat:
+            raise ChatQueueFullError(chat_id, self._max_queued_per_chat)
+        if self._max_wait_s is not None:
+            eta = self.estimate_wait(
+                cost=cost, priority=priority, chat_id=chat_id, lane=lane
+            )
+            if eta > self._max_wait_s:
+                raise OverloadedError(eta, self._max_wait_s)
+        self._admitted[chat_id] = count + 1
+        return Admission(self, chat_id)
+
+    def estimate_wait(
+        self,
+        *,
+        cost: float,
+        priority: Priority = Priority.INTERACTIVE,
+        chat_id: int | None = None,
+        lane: Hashable = DEFAULT_LANE,
+    ) -> float:
+        """Secondi di attesa stimati prima che parta un nuovo job così fatto."""
+        queued = [j for j in self._waiting if j.lane == lane]
+        if not queued and self._free(lane):
+            return 0.0
+        flow: Hashable = chat_id if chat_id is not None else object()
+        chats = () if chat_id is None else (chat_id,)
+        tag = self._tag((flow,), cost, priority, chats)
+        now = self._clock()
+        ahead = [j for j in queued if flow in j.flows or self._score(j, now) <= tag]
+        return self._eta(sum(j.cost for j in ahead), now, lane)
+
+    def _free(self, lane: Hashable) -> int:
+        """Slot liberi nella corsia ``lane``."""
+        return self._capacity[lane] - sum(1 for j in self._active if j.lane == lane)
+
+    def _eta(self, audio_ahead: float, now: float, lane: Hashable) -> float:
+        """Attesa stimata nella corsia dato l'audio in coda davanti (s di audio)."""
+        rtf = self._rtf[lane]
+        remaining = sum(
+            max(0.0, j.cost * rtf - (now - j.started_at))
+            for j in self._active
+            if j.lane == lane
+        )
+        if self._free(lane) and not audio_ahead:
+            return 0.0
+        return (audio_ahead * rtf + remaining) / self._capacity[lane]
+
+    def _start(self, flows: tuple[Hashable, ...]) -> float:
+        """Inizio virtuale: non prima della fine dei job precedenti dei flussi."""
+        finish = max((self._flow_finish.get(f, 0.0) for f in flows), default=0.0)
+        return max(self._virtual_time, finish)
+
+    def _tag(
+        self,
+        flows: tuple[Hashable, ...],
+        cost: float,
+        priority: Priority,
+        chat_ids: Collection[int],
+    ) -> float:
+        # Un job di più chat usa il peso più basso tra le sue chat.
+        weight = min((self._chat_weights.get(c, 1.0) for c in chat_ids), default=1.0)
+        return self._start(flows) + max(cost, 0.0) * self._weights[priority] / weight
+
+    def _unadmit(self, chat_id: int) -> None:
+        count = self._admitted.get(chat_id, 0) - 1
+        if count > 0:
+            self._admitted[chat_id] = count
+        else:
+            self._admitted.pop(chat_id, None)
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        *,
+        cost: float,
+        priority: Priority,
+        chat_id: int | None = None,
+        on_queue: QueueCallback | None = None,
+        lane: Hashable = DEFAULT_LANE,
+        chat_ids: Collection[int] = (),
+    ) -> AsyncIterator[None]:
+        """Attende il proprio turno e occupa uno slot per la durata del blocco.
+
+        ``chat_id=None`` indica un job senza chat (es. uno slot di aiuto):
+        forma un flusso a sé, senza vincoli d'ordine con gli altri job.
+        ``chat_ids`` sostituisce ``chat_id`` per un job che serve più chat (un
+        batch del micro-batcher): parte dopo i job precedenti di ciascuna e
+        conta come job in corso per tutte.
+        ``on_queue`` riceve ``(posizione, eta_s)`` finché il job resta in coda,
+        a ogni cambiamento (mai dopo la concessione dello slot); la posizione è
+        quella nella corsia ``lane``.
+        """
+        if lane not in self._capacity:
+            raise ValueError(f"Unknown scheduler lane: {lane!r}")
+        seq = next(self._seq)
+        chats = tuple(dict.fromkeys(chat_ids)) or (
+            () if chat_id is None else (chat_id,)
+        )
+        flows: tuple[Hashable, ...] = chats or (("job", seq),)
+        start = self._start(flows)
+        tag = self._tag(flows, cost, priority, chats)
+        for flow in chats:
+            self._flow_finish[flow] = tag
+        job = _Job(
+            flows=flows,
+            cost=max(cost, 0.0),
+            priority=priority,
+            start=start,
+            tag=tag,
+            enqueued_at=self._clock(),
+            seq=seq,
+            granted=asyncio.get_running_loop().create_future(),
+            lane=lane,
+            on_queue=on_queue,
+        )
+        self._waiting.append(job)
+        self._dispatch()
+        try:
+            await job.granted
+        except asyncio.CancelledError:
+            if job.granted.done() and not job.granted.cancelled():
+                self._release(job)  # slot concesso ma il chiamante è stato cancellato
+            else:
+                self._waiting.remove(job)
+                self._notify()
+            raise
+        try:
+            yield
+        finally:
+            self._release(job)
+
+    def _score(self, job: _Job, now: float) -> float:
+        waited = now - job.enqueued_at
+        return job.tag - self._aging_rate * waited
+
+    def _eligible(self) -> list[_Job]:
+        """I job primi in coda per ognuna delle loro chat, nessuna delle quali
+        ha un job in esecuzione, se la loro corsia ha uno slot libero."""
+        heads: dict[Hashable, _Job] = {}
+        for job in self._waiting:
+            for flow in job.flows:
+                heads.setdefault(flow, job)
+        return [
+            job
+            for job in self._waiting
+            if all(heads[f] is job and f not in self._busy_flows for f in job.flows)
+            and self._free(job.lane)
+        ]
+
+    def _dispatch(self) -> None:
+        """Concede gli slot liberi ai job con il punteggio più basso."""
+        while True:
+            eligible = self._eligible()
+            if not eligible:
+                break
+            now = self._clock()
+            job = min(eligible, key=lambda j: (self._score(j, now), j.seq))
+            self._waiting.remove(job)
+            self._busy_flows.update(job.flows)
+            self._active.append(job)
+            job.started_at = now
+            self._virtual_time = max(self._virtual_time, job.start)
+            job.granted.set_result(None)
+        self._notify()
+
+    def _notify(self) -> None:
+        """Comunica posizione ed ETA ai job in coda che hanno una callback."""
+        if not any(j.on_queue for j in self._waiting):
+            return
+        now = self._clock()
+        ranked = sorted(self._waiting, key=lambda j: (self._score(j, now), j.seq))
+        for lane in self._capacity:
+            audio_ahead = 0.0
+            position = 0
+            for job in ranked:
+                if job.lane != lane:
+                    continue
+                position += 1
+                if job.on_queue is not None:
+                    eta = self._eta(audio_ahead, now, lane)
+                    status = (position, round(eta))
+                    if status != job.last_status:
+                        job.last_status = status
+                        job.on_queue(position, eta)
+                audio_ahead += job.cost
+
+    def _release(self, job: _Job) -> None:
+        self._active.remove(job)
+        self._busy_flows.difference_update(job.flows)
+        elapsed = self._clock() - job.started_at
+        if job.cost >= _RTF_MIN_AUDIO_S:
+            rtf = self._rtf[job.lane]
+            self._rtf[job.lane] = rtf + _RTF_SMOOTHING * (elapsed / job.cost - rtf)
+        waiting = {f for j in self._waiting for f in j.flows}
+        for flow in job.flows:
+            if flow not in waiting:
+                # Flusso esaurito: dimentica il suo tag (la mappa non cresce).
+                finish = self._flow_finish.get(flow)
+                if finish is not None and finish <= job.tag:
+                    self._flow_finish.pop(flow, None)
+        self._dispatch()
@@ -0,0 +1,91 @@
+"""Coalescenza delle richieste identiche in corso (single-flight).
+
+Se lo stesso file (stessa chiave di cache: ``file_unique_id`` + lingua +
+modello) arriva in più chat mentre la prima trascrizione è ancora in corso, le
+richieste successive non vengono accodate di nuovo: si **agganciano** al job
+già avviato (:class:`Flight`) e ne ricevono i segmenti, prima quelli già
+prodotti e poi quelli nuovi man mano che arrivano. Ogni chat ha il proprio
+``TranscriptionStreamer``, ma l'inferenza è una sola.
+"""
+
+import asyncio
+from collections.abc import AsyncIterator, Iterator
+from contextlib import contextmanager
+from enum import Enum
+
+
+class FlightOutcome(Enum):
+    """Come si è concluso il job condiviso."""
+
+    DONE = "done"  # trascrizione completa
+    SILENT = "silent"  # audio senza parlato: nessun testo
+    STOPPED = "stopped"  # fermata dal pulsante "Stop" di chi l'ha avviata
+    FAILED = "failed"  # download o inferenza falliti
+
+
+class Flight:
+    """Un job in corso: accumula i segmenti e li ridistribuisce a chi segue."""
+
+    def __init__(self) -> None:
+        self.chunks: list[str] = []
+        self.outcome: FlightOutcome | None = None  # None = ancora in corso
+        self.followers = 0
+        self._changed = asyncio.Event()
+
+    def publish(self, chunk: str) -> None:
+        """Aggiunge un segmento prodotto dal job e sveglia chi segue."""
+        self.chunks.append(chunk)
+        self._wake()
+
+    def close(self, outcome: FlightOutcome) -> None:
+        """Chiude il job (idempotente: vale il primo esito)."""
+        if self.outcome is None:
+            self.outcome = outcome
+            self._wake()
+
+    def _wake(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self) -> AsyncIterator[str]:
+        """Produce tutti i segmenti del job, dal primo, fino alla chiusura.
+
+        Al termine l'esito è in :attr:`outcome`.
+        """
+        self.followers += 1
+        index = 0
+        while True:
+            while index < len(self.chunks):
+                yield self.chunks[index]
+                index += 1
+            if self.outcome is not None:
+                return
+            await self._changed.wait()
+
+
+class SingleFlight:
+    """Registro dei job in corso per chiave di trascrizione."""
+
+    def __init__(self) -> None:
+        self._flights: dict[str, Flight] = {}
+
+    def get(self, key: str) -> Flight | None:
+        """Il job in corso per ``key``, o None."""
+        return self._flights.get(key)
+
+    @contextmanager
+    def lead(self, key: str) -> Iterator[Flight]:
+        """Registra un nuovo job per ``key`` per la durata del blocco.
+
+        Se il blocco termina senza un esito esplicito (es. eccezione o download
+        fallito) il job è chiuso come ``FAILED``: chi lo seguiva può ripiegare
+        su una trascrizione propria.
+        """
+        flight = Flight()
+        self._flights[key] = flight
+        try:
+            yield flight
+        finally:
+            flight.close(FlightOutcome.FAILED)
+            if self._flights.get(key) is flight:
+                del self._flights[key]
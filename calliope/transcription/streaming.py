@@ -13,15 +13,16 @@ from datetime import timedelta
 from time import monotonic
 
 from loguru import logger
-from telegram import Message
-from telegram.error import RetryAfter
+from telegram import InlineKeyboardMarkup, Message
+from telegram.error import BadRequest, RetryAfter, TelegramError
 
-from calliope.transcription.formatting import split_message
+from calliope.transcription.formatting import format_timedelta, split_message
 
 TELEGRAM_MAX_CHARS = 4096
 CONTINUATION = " [...]"
 # Sui messaggi non finali resta spazio per il marcatore di continuazione.
 _SPLIT_LIMIT = TELEGRAM_MAX_CHARS - len(CONTINUATION)
+STOPPED_MARKER = "⏹ Stopped"
 
 
 async def send_or_edit_with_retry(
@@ -50,6 +51,98 @@ async def send_or_edit_with_retry(
     raise RuntimeError(f"Flood control: giving up after {max_attempts} attempts")
 
 
+def queue_status_text(position: int, eta_s: float) -> str:
+    """Testo del placeholder per una richiesta in coda, es. ``"⏳ Queued: #3, ~1m 20s"``."""
+    eta = (
+        f"~{format_timedelta(timedelta(seconds=round(eta_s)))}"
+        if eta_s >= 1
+        else "starting soon"
+    )
+    return f"⏳ Queued: #{position}, {eta}"
+
+
+# Placeholder mentre il primo job dopo lo scarico per inattività ricarica i modelli.
+WAKING_UP_STATUS = "💤 Waking up the model…"
+
+
+def reload_note(seconds: float) -> str:
+    """Riga con il tempo di ricarica dei modelli, es. ``"💤 Model reloaded in 8.2s"``."""
+    return f"💤 Model reloaded in {seconds:.1f}s"
+
+
+class Delivery:
+    """Messaggi in chat di un lavoro della coda persistente, riusati nei retry.
+
+    Un lavoro che fallisce dopo aver inviato il placeholder o del testo
+    parziale viene ripetuto da capo: il nuovo tentativo modifica i messaggi
+    già consegnati invece di inviarne altri. ``message_ids`` sono quelli del
+    tentativo precedente; ``record`` salva quelli attuali (nel documento del
+    lavoro) a ogni cambiamento.
+    """
+
+    def __init__(
+        self, message_ids: list[int], record: Callable[[list[int]], Awaitable[None]]
+    ) -> None:
+        self.message_ids = list(message_ids)
+        self._record = record
+
+    def previous(self, origin: Message) -> list[Message]:
+        """I messaggi del tentativo precedente, nella chat di ``origin``."""
+        messages = []
+        for message_id in self.message_ids:
+            message = Message(message_id, origin.date, origin.chat)
+            message.set_bot(origin.get_bot())
+            messages.append(message)
+        return messages
+
+    async def reply(
+        self,
+        origin: Message,
+        text: str,
+        reply_markup: InlineKeyboardMarkup | None = None,
+    ) -> Message:
+        """Il primo messaggio del lavoro: quello del tentativo precedente
+        riportato a ``text`` (gli altri vengono cancellati), o una nuova
+        risposta a ``origin`` se non c'è o è stato cancellato dall'utente."""
+        previous = self.previous(origin)
+        for extra in previous[1:]:
+            try:
+                await extra.delete()
+            except TelegramError:
+                pass  # già cancellato: nulla da fare
+        if previous:
+            first = previous[0]
+            try:
+                await send_or_edit_with_retry(
+                    lambda: first.edit_text(text=text, reply_markup=reply_markup)
+                )
+            except BadRequest as e:
+                if "not modified" in str(e).lower():
+                    await self.record([first])
+                    return first
+                logger.info(f"Previous reply {first.message_id} is gone: {e}")
+            else:
+                await self.record([first])
+                return first
+        sent = await origin.reply_text(
+            text, disable_notification=True, reply_markup=reply_markup
+        )
+        await self.record([sent])
+        return sent
+
+    async def record(self, messages: list[Message]) -> None:
+        """Salva gli id di ``messages`` se sono cambiati. Best effort: un
+        errore di salvataggio non interrompe la consegna."""
+        message_ids = [message.message_id for message in messages]
+        if message_ids == self.message_ids:
+            return
+        self.message_ids = message_ids
+        try:
+            await self._record(message_ids)
+        except Exception as e:
+            logger.warning(f"Could not record delivered messages: {e}")
+
+
 class TranscriptionStreamer:
     """Riflette il testo della trascrizione su Telegram aggiornando a intervalli.
 
@@ -61,6 +154,12 @@ class TranscriptionStreamer:
         async for chunk in transcriber.stream_segments(...):
             await streamer.add(chunk)
         await streamer.finish()
+
+    Una tastiera inline passata a :meth:`start` (es. il pulsante "Stop") resta
+    sull'ultimo messaggio finché lo streaming è in corso e sparisce con il flush
+    finale. Con ``delivery`` (lavori della coda persistente) il placeholder
+    riusa i messaggi di un tentativo precedente e i messaggi inviati vengono
+    registrati.
     """
 
     def __init__(
@@ -69,33 +168,94 @@ class TranscriptionStreamer:
         *,
         min_interval_s: float = 3.0,
         min_chars: int = 400,
+        delivery: Delivery | None = None,
     ) -> None:
         self._reply_to = reply_to
+        self._delivery = delivery
         self._min_interval_s = min_interval_s
         self._min_chars = min_chars
         self._text = ""
         self._messages: list[Message] = []
         self._rendered: list[str] = []  # testo attualmente mostrato da ogni messaggio
+        self._keyboards: list[bool] = []  # se il messaggio mostra la tastiera
+        self._markup: InlineKeyboardMarkup | None = None
         self._finalized = 0  # numero di messaggi iniziali ormai definitivi
         self._last_flush = 0.0
         self._chars_since_flush = 0
+        self._status: str | None = None  # stato della coda da mostrare
+        self._status_task: asyncio.Task | None = None
+        self._notes: list[str] = []  # righe in coda al testo finale
 
     @property
     def text(self) -> str:
         """Il testo completo accumulato finora."""
         return self._text
 
-    async def start(self) -> None:
-        """Invia il placeholder iniziale (feedback immediato prima dell'inferenza)."""
-        placeholder = await self._reply_to.reply_text(
-            "[...]", disable_notification=True
-        )
+    async def start(self, reply_markup: InlineKeyboardMarkup | None = None) -> None:
+        """Invia il placeholder iniziale (feedback immediato prima dell'inferenza).
+
+        ``reply_markup`` è la tastiera da mostrare durante lo streaming.
+        """
+        self._markup = reply_markup
+        if self._delivery is not None:
+            placeholder = await self._delivery.reply(
+                self._reply_to, "[...]", reply_markup=reply_markup
+            )
+        else:
+            placeholder = await self._reply_to.reply_text(
+                "[...]", disable_notification=True, reply_markup=reply_markup
+            )
         self._messages.append(placeholder)
         self._rendered.append("[...]")
+        self._keyboards.append(reply_markup is not None)
+        self._last_flush = monotonic()
+
+    def show_queue_status(self, position: int, eta_s: float) -> None:
+        """Mostra nel placeholder posizione in coda e attesa stimata (è la
+        callback ``on_queue`` dello scheduler)."""
+        self.show_status(queue_status_text(position, eta_s))
+
+    def show_status(self, status: str) -> None:
+        """Mostra ``status`` nel placeholder finché non arriva il testo.
+
+        Sincrona: l'edit parte in un task che rispetta l'intervallo minimo tra
+        aggiornamenti e viene abbandonato appena arriva il primo testo della
+        trascrizione.
+        """
+        if self._text or not self._messages:
+            return
+        self._status = status
+        if self._status_task is None or self._status_task.done():
+            self._status_task = asyncio.ensure_future(self._flush_status())
+
+    async def _flush_status(self) -> None:
+        delay = self._min_interval_s - (monotonic() - self._last_flush)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self._text or self._status is None:
+            return
         self._last_flush = monotonic()
+        try:
+            await self._render(0, self._status, self._markup)
+        except TelegramError as e:
+            # Puramente informativo: la trascrizione prosegue comunque.
+            logger.warning(f"Could not update status: {e}")
+
+    async def _stop_status(self) -> None:
+        """Annulla un aggiornamento di stato pendente prima di mostrare il testo."""
+        self._status = None
+        task, self._status_task = self._status_task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
 
     async def add(self, chunk: str) -> None:
         """Accumula un nuovo pezzo di testo; aggiorna Telegram se è ora di farlo."""
+        if self._status_task is not None:
+            await self._stop_status()
         self._text += chunk
         self._chars_since_flush += len(chunk)
         now = monotonic()
@@ -105,13 +265,53 @@ class TranscriptionStreamer:
         ):
             await self._flush()
 
+    def add_note(self, note: str) -> None:
+        """Aggiunge una riga (es. il tempo di ricarica del modello) in fondo al
+        testo finale, dopo una riga vuota."""
+        self._notes.append(note)
+
     async def finish(self) -> None:
         """Flush finale: garantisce che il testo completo sia visibile in chat."""
+        await self._stop_status()
+        self._markup = None  # lo streaming è concluso: via la tastiera
         if not self._text.strip():
             # Non si può inviare un messaggio vuoto: mostra un fallback.
             self._text = "🔇"
+        if self._notes:
+            notes, self._notes = "\n".join(self._notes), []
+            self._text = f"{self._text.rstrip()}\n\n{notes}"
         await self._flush()
 
+    async def replace(self, text: str) -> None:
+        """Sostituisce tutto il testo mostrato (es. l'anteprima con la versione
+        definitiva): i messaggi esistenti vengono modificati e quelli in più
+        cancellati."""
+        await self._stop_status()
+        self._text = text
+        self._finalized = 0
+        await self._flush()
+
+    async def abort(self, text: str) -> None:
+        """Chiude lo streaming mostrando ``text`` al posto della trascrizione
+        (es. richiesta rifiutata prima di produrre testo)."""
+        self._text = text
+        self._finalized = 0
+        self._notes = []
+        await self.finish()
+
+    async def stop(self, partial: str | None = None) -> None:
+        """Chiude una trascrizione interrotta: testo parziale più un marcatore.
+
+        ``partial``, se indicato, prende il posto del testo mostrato (es.
+        l'anteprima, sostituita dalla parte definitiva già prodotta).
+        """
+        if partial is not None:
+            self._text = partial
+            self._finalized = 0
+        text = self._text.rstrip()
+        self._text = f"{text}\n\n{STOPPED_MARKER}" if text else STOPPED_MARKER
+        await self.finish()
+
     async def _flush(self) -> None:
         self._last_flush = monotonic()
         self._chars_since_flush = 0
@@ -120,26 +320,52 @@ class TranscriptionStreamer:
         for i, part in enumerate(parts):
             if i < self._finalized:
                 continue  # messaggio già definitivo: non lo tocchiamo più
-            target = part + CONTINUATION if i < len(parts) - 1 else part
-            await self._render(i, target)
+            last = i == len(parts) - 1
+            target = part if last else part + CONTINUATION
+            await self._render(i, target, self._markup if last else None)
+
+        # Testo sostituito con uno più corto: i messaggi in eccesso spariscono.
+        excess = self._messages[len(parts) :]
+        for message in excess:
+            await send_or_edit_with_retry(lambda m=message: m.delete())
+        del self._messages[len(parts) :]
+        del self._rendered[len(parts) :]
+        del self._keyboards[len(parts) :]
+        if excess and self._delivery is not None:
+            await self._delivery.record(self._messages)
 
         # Tutti i messaggi tranne l'ultimo non cambieranno più.
         self._finalized = max(self._finalized, len(parts) - 1)
 
-    async def _render(self, index: int, target: str) -> None:
+    async def _render(
+        self, index: int, target: str, markup: InlineKeyboardMarkup | None = None
+    ) -> None:
+        # Un edit del testo senza ``reply_markup`` rimuove la tastiera: va
+        # ripassata a ogni edit finché deve restare visibile.
+        keyboard = markup is not None
         if index < len(self._messages):
-            if self._rendered[index] == target:
-                return  # nessuna modifica: evita l'errore "message is not modified"
             message = self._messages[index]
-            await send_or_edit_with_retry(
-                lambda t=target, m=message: m.edit_text(text=t)
-            )
+            if self._rendered[index] != target:
+                await send_or_edit_with_retry(
+                    lambda t=target, m=message: m.edit_text(text=t, reply_markup=markup)
+                )
+            elif self._keyboards[index] != keyboard:
+                # Testo invariato: si aggiorna solo la tastiera.
+                await send_or_edit_with_retry(
+                    lambda m=message: m.edit_reply_markup(reply_markup=markup)
+                )
+            else:
+                return  # nessuna modifica: evita l'errore "message is not modified"
             self._rendered[index] = target
+            self._keyboards[index] = keyboard
         else:
             sent = await send_or_edit_with_retry(
                 lambda t=target: self._reply_to.chat.send_message(
-                    text=t, disable_notification=True
+                    text=t, disable_notification=True, reply_markup=markup
                 )
             )
             self._messages.append(sent)
             self._rendered.append(target)
+            self._keyboards.append(keyboard)
+            if self._delivery is not None:
+                await self._delivery.record(self._messages)
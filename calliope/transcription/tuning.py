@@ -0,0 +1,303 @@
+"""Auto-tuning di ``compute_type`` e thread di CTranslate2 per questa macchina.
+
+Il default (``float16`` su GPU, ``int8`` su CPU, tutti i core divisi tra le
+repliche) non è il più veloce ovunque: su alcune CPU ``int8_float32`` batte
+``int8``, su altre conviene dare meno thread a ogni decodifica e farne di più
+in parallelo. :func:`autotune` misura il throughput del modello su una clip
+sintetica:
+
+1. con tutti i core e una decodifica alla volta prova i ``compute_type``
+   supportati dal device (``int8``, ``int8_float32``, ``float32`` e, dove
+   supportate, le varianti ``float16``/``bfloat16``);
+2. con il ``compute_type`` migliore prova le coppie ``cpu_threads`` (thread per
+   decodifica) × ``inter_threads`` (decodifiche parallele) che usano tutti i
+   core. Su GPU i thread CPU non contano e questo passo è saltato.
+
+Il vincitore è salvato in un file JSON (``WHISPER_TUNE_FILE``) con chiave
+modello + device + impronta dell'hardware (:func:`hardware_id`): i boot
+successivi lo riusano senza misurare, finché modello o hardware non cambiano.
+"""
+
+import json
+import os
+import platform
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+import ctranslate2
+import numpy as np
+from faster_whisper import WhisperModel
+from loguru import logger
+
+from calliope.media.extract import SAMPLE_RATE
+from calliope.settings import Settings
+
+# In ordine di preferenza a parità (quasi) di velocità: i tipi quantizzati
+# occupano meno memoria.
+COMPUTE_TYPES = (
+    "int8",
+    "int8_float32",
+    "float32",
+    "int8_float16",
+    "float16",
+    "int8_bfloat16",
+    "bfloat16",
+)
+# Decodifiche parallele provate al massimo (oltre, i thread per decodifica
+# diventano troppo pochi per i modelli grandi).
+MAX_INTER_THREADS = 4
+# Opzioni fisse della decodifica di prova: greedy, nessun fallback né contesto,
+# token limitati, così il tempo dipende dalla configurazione e non dal testo
+# allucinato sulla clip sintetica.
+_BENCH_OPTIONS: dict[str, Any] = {
+    "language": "en",
+    "beam_size": 1,
+    "temperature": 0.0,
+    "condition_on_previous_text": False,
+    "without_timestamps": True,
+    "max_new_tokens": 64,
+}
+
+ModelLoader = Callable[..., Any]
+
+
+@dataclass
+class TuneResult:
+    """La configurazione più veloce trovata e il suo real-time factor."""
+
+    compute_type: str
+    cpu_threads: int
+    inter_threads: int
+    rtf: float  # secondi di calcolo per secondo di audio (throughput)
+
+
+def available_cores() -> int:
+    """Core utilizzabili dal processo (affinità inclusa, es. in un container)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _cpu_model() -> str:
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as cpuinfo:
+            for line in cpuinfo:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or "unknown cpu"
+
+
+def hardware_id(device: str, device_index: int = 0) -> str:
+    """Impronta dell'hardware: cambia se cambiano CPU, core, GPU o CTranslate2."""
+    parts = [
+        platform.machine(),
+        _cpu_model(),
+        f"{available_cores()} cores",
+        f"ctranslate2 {ctranslate2.__version__}",
+    ]
+    if device == "cuda":
+        types = sorted(ctranslate2.get_supported_compute_types("cuda", device_index))
+        parts.append(
+            f"cuda:{device_index}/{ctranslate2.get_cuda_device_count()} "
+            f"({','.join(types)})"
+        )
+    return " | ".join(parts)
+
+
+def tuning_key(model_name: str, device: str, hardware: str) -> str:
+    return f"{model_name} | {device} | {hardware}"
+
+
+def load_tuned(path: str, key: str) -> TuneResult | None:
+    """Il risultato salvato per ``key``, o None (file assente o illeggibile)."""
+    try:
+        entries = json.loads(Path(path).expanduser().read_text(encoding="utf-8"))
+        entry = entries[key]
+        return TuneResult(
+            compute_type=entry["compute_type"],
+            cpu_threads=entry["cpu_threads"],
+            inter_threads=entry["inter_threads"],
+            rtf=entry["rtf"],
+        )
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_tuned(path: str, key: str, result: TuneResult) -> None:
+    """Salva ``result`` sotto ``key`` conservando le altre voci del file."""
+    file = Path(path).expanduser()
+    try:
+        entries = json.loads(file.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        entries = {}
+    entries[key] = {
+        **asdict(result),
+        "tuned_at": datetime.now(timezone.utc).isoformat(),
+    }
+    file.parent.mkdir(parents=True, exist_ok=True)
+    tmp = file.with_suffix(file.suffix + ".tmp")
+    tmp.write_text(json.dumps(entries, indent=2), encoding="utf-8")
+    tmp.replace(file)  # atomico: un boot concorrente non legge mai metà file
+
+
+def compute_type_candidates(device: str, device_index: int = 0) -> list[str]:
+    """I ``compute_type`` da provare supportati dal device."""
+    supported = ctranslate2.get_supported_compute_types(device, device_index)
+    return [compute_type for compute_type in COMPUTE_TYPES if compute_type in supported]
+
+
+def thread_candidates(cores: int) -> list[tuple[int, int]]:
+    """Coppie ``(cpu_threads, inter_threads)`` da provare su ``cores`` core.
+
+    Ogni coppia usa tutti i core (``cpu_threads × inter_threads = cores``),
+    più una decodifica singola su metà dei core: con l'hyper-threading i core
+    logici sono il doppio di quelli fisici e spesso metà thread vanno più veloci.
+    """
+    candidates = []
+    inter = 1
+    while inter <= min(cores, MAX_INTER_THREADS):
+        candidates.append((cores // inter, inter))
+        inter *= 2
+    if cores >= 4:
+        candidates.append((cores // 2, 1))
+    return candidates
+
+
+def synthetic_clip(seconds: float, seed: int = 0) -> np.ndarray:
+    """Clip deterministica simile al parlato: armoniche modulate a ~4 Hz e rumore.
+
+    Il silenzio non servirebbe: il decoder si fermerebbe al primo token.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.3 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+    envelope = 0.5 * (1 + np.sin(2 * np.pi * 4 * t)) ** 2
+    audio = 0.1 * voice * envelope + 0.01 * rng.standard_normal(t.size)
+    return audio.astype(np.float32)
+
+
+def measure(model, clip: np.ndarray, inter_threads: int, repeat: int) -> float:
+    """Real-time factor con ``inter_threads`` decodifiche parallele della clip."""
+
+    def _decode(times: int) -> None:
+        for _ in range(times):
+            segments, _info = model.transcribe(clip, **_BENCH_OPTIONS)
+            for _segment in segments:  # il generatore è lazy: va consumato
+                pass
+
+    _decode(1)  # la prima chiamata paga le allocazioni: fuori dalla misura
+    workers = [
+        threading.Thread(target=_decode, args=(repeat,)) for _ in range(inter_threads)
+    ]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+    return elapsed / (clip.size / SAMPLE_RATE * repeat * inter_threads)
+
+
+def autotune(
+    model_name: str,
+    device: str,
+    device_index: int = 0,
+    *,
+    clip_s: float = 10.0,
+    repeat: int = 2,
+    loader: ModelLoader = WhisperModel,
+    on_result: Callable[[TuneResult], None] | None = None,
+) -> TuneResult:
+    """Misura le configurazioni candidate e restituisce la più veloce.
+
+    Bloccante e lento (un caricamento del modello per configurazione): va
+    eseguito all'avvio o con ``calliope tune``. ``on_result`` riceve ogni
+    misura (es. per stamparla).
+    """
+    clip = synthetic_clip(clip_s)
+    cores = available_cores()
+
+    def _try(compute_type: str, cpu_threads: int, inter_threads: int) -> TuneResult:
+        model = loader(
+            model_name,
+            device=device,
+            device_index=device_index,
+            compute_type=compute_type,
+            cpu_threads=cpu_threads,
+            num_workers=inter_threads,
+        )
+        rtf = measure(model, clip, inter_threads, repeat)
+        result = TuneResult(compute_type, cpu_threads, inter_threads, rtf)
+        logger.info(
+            f"Tuning {model_name}: compute_type={compute_type}, "
+            f"cpu_threads={cpu_threads}, inter_threads={inter_threads} → rtf {rtf:.3f}"
+        )
+        if on_result is not None:
+            on_result(result)
+        return result
+
+    baseline_threads = cores if device == "cpu" else 0
+    results = []
+    for compute_type in compute_type_candidates(device, device_index):
+        try:
+            results.append(_try(compute_type, baseline_threads, 1))
+        except (ValueError, RuntimeError) as e:  # tipo non supportato dal modello
+            logger.info(f"Tuning {model_name}: {compute_type} skipped ({e})")
+    if not results:
+        raise RuntimeError(f"No compute type could be benchmarked on {device}")
+    best = min(results, key=lambda r: r.rtf)
+    if device == "cpu":
+        for cpu_threads, inter_threads in thread_candidates(cores):
+            if (cpu_threads, inter_threads) == (baseline_threads, 1):
+                continue  # già misurata nel primo passo
+            result = _try(best.compute_type, cpu_threads, inter_threads)
+            if result.rtf < best.rtf:
+                best = result
+    return best
+
+
+def tune_and_save(
+    settings: Settings,
+    device: str,
+    *,
+    on_result: Callable[[TuneResult], None] | None = None,
+) -> TuneResult:
+    """Esegue :func:`autotune` per il modello di default e salva il vincitore."""
+    result = autotune(
+        settings.whisper_model,
+        device,
+        settings.device_index,
+        clip_s=settings.whisper_tune_clip_s,
+        on_result=on_result,
+    )
+    hardware = hardware_id(device, settings.device_index)
+    key = tuning_key(settings.whisper_model, device, hardware)
+    try:
+        save_tuned(settings.whisper_tune_file, key, result)
+    except OSError as e:
+        logger.warning(f"Could not save tuning to {settings.whisper_tune_file}: {e}")
+    return result
+
+
+def tuned_config(settings: Settings, device: str) -> TuneResult | None:
+    """La configurazione salvata per modello e hardware attuali.
+
+    Se manca e ``whisper_autotune`` è attivo il tuning viene eseguito ora
+    (bloccante: minuti per i modelli grandi). None = nessun tuning.
+    """
+    hardware = hardware_id(device, settings.device_index)
+    key = tuning_key(settings.whisper_model, device, hardware)
+    result = load_tuned(settings.whisper_tune_file, key)
+    if result is None and settings.whisper_autotune:
+        logger.info(f"No tuning for {settings.whisper_model} on this machine: tuning")
+        result = tune_and_save(settings, device)
+    return result
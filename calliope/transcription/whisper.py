@@ -1,16 +1,47 @@
 import asyncio
-from collections.abc import AsyncIterator
+import bisect
+import gc
+import os
+import threading
+import time
+from collections.abc import AsyncGenerator, AsyncIterator, Callable, Collection
 from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing, asynccontextmanager
+from functools import partial
 
 import ctranslate2
 import numpy as np
-from faster_whisper import WhisperModel
+from faster_whisper import BatchedInferencePipeline, WhisperModel
 from loguru import logger
 
+from calliope.media.extract import SAMPLE_RATE
+from calliope.media.silence import detect_speech_regions
 from calliope.settings import Settings
-
-# Sentinella: il thread produttore segnala la fine dello stream dei segmenti.
-_STREAM_DONE = object()
+from calliope.transcription.batching import STREAM_DONE, BatchClip, MicroBatcher
+from calliope.transcription.chunking import (
+    Chunk,
+    Stitcher,
+    TimedWord,
+    plan_chunks,
+)
+from calliope.transcription.decoding import DecodingPath, DecodingProfiles
+from calliope.transcription.intervals import (
+    Granularity,
+    Interval,
+    IntervalBucketer,
+    interpolate_words,
+    render_intervals,
+)
+from calliope.transcription.pool import ReplicaPool, RetiredReplicas
+from calliope.transcription.process import ProcessReplica
+from calliope.transcription.router import ModelRouter
+from calliope.transcription.scheduler import (
+    Admission,
+    Priority,
+    QueueCallback,
+    TranscriptionScheduler,
+)
+from calliope.transcription.tuning import TuneResult, tuned_config
 
 
 class WhisperTranscriber:
@@ -21,34 +52,428 @@ class WhisperTranscriber:
     costosa, nessun side effect a import-time).
 
     L'inferenza è CPU/GPU-bound e **bloccante**: viene eseguita in un
-    ``ThreadPoolExecutor`` dedicato con un solo worker, così l'event loop resta
-    libero (il bot risponde ad altri comandi/utenti durante una trascrizione) e
-    le richieste si accodano una alla volta (una GPU = una trascrizione per
-    volta). I metodi pubblici sono coroutine da attendere; il consumo del
-    generatore lazy di faster-whisper avviene **dentro** il thread.
+    ``ThreadPoolExecutor`` dedicato con un worker per replica del modello
+    (``settings.whisper_replicas``), così l'event loop resta libero (il bot
+    risponde ad altri comandi/utenti durante una trascrizione). Ogni job prende
+    in prestito la prima replica libera dal :class:`ReplicaPool`. L'ordine di
+    partenza non è FIFO: il :class:`TranscriptionScheduler` concede uno slot per
+    replica privilegiando i job brevi e interattivi. I metodi pubblici sono
+    coroutine da attendere; il consumo del generatore lazy di faster-whisper
+    avviene **dentro** il thread.
+
+    Con ``settings.whisper_routes`` vengono caricati più modelli, ognuno con il
+    proprio pool di repliche e la propria corsia nello scheduler: il
+    :class:`ModelRouter` sceglie il modello di ogni richiesta da durata e
+    lingua (vedi :meth:`route`). Il modello di anteprima (``preview_model``),
+    se configurato, ha una corsia a sé: :attr:`preview_lane`.
+
+    Il modello di default si può sostituire a caldo (:meth:`swap_model`) e,
+    con ``settings.model_idle_unload_s``, i modelli vengono scaricati dopo un
+    periodo senza lavoro e ricaricati alla richiesta successiva.
     """
 
     def __init__(self, settings: Settings) -> None:
+        self._settings = settings
         self.model_name = settings.whisper_model
         self.device = self._resolve_device(settings)
-        self.compute_type = self._resolve_compute_type(settings, self.device)
-        logger.info(
-            f"Loading model {self.model_name} "
-            f"(device={self.device}, compute_type={self.compute_type})..."
+        # Configurazione misurata da ``calliope tune`` per modello e hardware.
+        tuned = tuned_config(settings, self.device)
+        if tuned is not None:
+            logger.info(
+                f"Tuned configuration: compute_type={tuned.compute_type}, "
+                f"cpu_threads={tuned.cpu_threads}, inter_threads={tuned.inter_threads}"
+            )
+        self.compute_type = self._resolve_compute_type(settings, self.device, tuned)
+        self.replicas = self._resolve_replicas(settings, tuned)
+        self.shared_model = self._resolve_shared_model(settings, tuned)
+        self._router = ModelRouter(settings.whisper_routes, self.model_name)
+        self._profiles = DecodingProfiles.from_settings(settings)
+        # corsia → (modello, repliche): una per modello del router, più quella
+        # dell'anteprima (separata anche se il modello è lo stesso).
+        lanes = {
+            name: (name, replicas or self.replicas)
+            for name, replicas in self._router.models.items()
+        }
+        self.preview_lane: str | None = None
+        if settings.preview_model:
+            self.preview_lane = f"preview:{settings.preview_model}"
+            lanes[self.preview_lane] = (
+                settings.preview_model,
+                settings.preview_replicas,
+            )
+        workers = sum(replicas for _name, replicas in lanes.values())
+        self.cpu_threads = self._resolve_cpu_threads(
+            settings, self.device, workers, tuned
         )
-        self.model = WhisperModel(
-            self.model_name,
-            device=self.device,
-            device_index=settings.device_index,
-            compute_type=self.compute_type,
+        self._pools: dict[str, ReplicaPool] = {}
+        for lane, (name, replicas) in lanes.items():
+            logger.info(
+                f"Loading model {name} "
+                f"(device={self.device}, compute_type={self.compute_type}, "
+                f"replicas={replicas}, cpu_threads={self.cpu_threads or 'default'})..."
+            )
+            self._pools[lane] = ReplicaPool(
+                self._load_replicas(settings, name, replicas)
+            )
+        # Un worker per replica (di tutti i modelli): lo scheduler concede al
+        # più uno slot per replica, quindi l'executor non accoda mai nulla.
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="whisper"
         )
-        # max_workers=1: le trascrizioni si serializzano naturalmente (coda).
-        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="whisper")
+        self._scheduler = self._build_scheduler(settings)
+        self._batcher = self._build_batcher(settings)
+        self._init_lifecycle()
         logger.info("Model loaded.")
 
+    def _build_scheduler(self, settings: Settings) -> TranscriptionScheduler:
+        """Scheduler a priorità: una corsia per modello, uno slot per replica."""
+        return TranscriptionScheduler(
+            {name: pool.size for name, pool in self._pools.items()},
+            aging_rate=settings.scheduler_aging_rate,
+            batch_weight=settings.scheduler_batch_weight,
+            max_queued_per_chat=settings.scheduler_max_queued_per_chat,
+            chat_weights=settings.scheduler_chat_weights,
+            initial_rtf=settings.admission_initial_rtf
+            or (0.1 if self.device == "cuda" else 0.5),
+            max_wait_s=settings.admission_max_wait_s,
+        )
+
+    def _build_batcher(self, settings: Settings) -> MicroBatcher | None:
+        """Micro-batcher dei vocali brevi, se abilitato da settings."""
+        if not settings.microbatch_window_ms:
+            return None
+        return MicroBatcher(
+            self._dispatch_batch,
+            window_s=settings.microbatch_window_ms / 1000,
+            max_batch=settings.microbatch_max_size,
+        )
+
+    def _load_replicas(self, settings: Settings, name: str, replicas: int) -> list:
+        """Carica ``replicas`` copie di ``name`` (o un modello condiviso con N worker).
+
+        Con ``inference_backend="process"`` ogni replica è un processo worker
+        (:class:`ProcessReplica`) che carica il proprio modello.
+        """
+        if settings.inference_backend == "process":
+            loader = partial(
+                WhisperModel,
+                name,
+                device=self.device,
+                device_index=settings.device_index,
+                compute_type=self.compute_type,
+                cpu_threads=self.cpu_threads,
+            )
+            workers = [
+                ProcessReplica(loader, name=f"whisper-{name}-{i}")
+                for i in range(replicas)
+            ]
+            for worker in workers:  # i worker caricano il modello in parallelo
+                worker.wait_ready()
+            return workers
+        if self.shared_model:
+            # Un solo modello: CTranslate2 esegue in parallelo fino a
+            # ``num_workers`` chiamate concorrenti, con i pesi condivisi.
+            model = WhisperModel(
+                name,
+                device=self.device,
+                device_index=settings.device_index,
+                compute_type=self.compute_type,
+                cpu_threads=self.cpu_threads,
+                num_workers=replicas,
+            )
+            return [model] * replicas
+        return [
+            WhisperModel(
+                name,
+                device=self.device,
+                device_index=settings.device_index,
+                compute_type=self.compute_type,
+                cpu_threads=self.cpu_threads,
+            )
+            for _ in range(replicas)
+        ]
+
+    @property
+    def model(self) -> WhisperModel:
+        """La prima replica del modello di default (per ispezione)."""
+        return self._pools[self.model_name].replicas[0]
+
+    # --- Ciclo di vita: cambio a caldo e scarico per inattività --------------
+
+    def _init_lifecycle(self) -> None:
+        self._aliases: dict[str, str] = {}  # modello sostituito → quello nuovo
+        self._load_lock = asyncio.Lock()  # un caricamento (swap o reload) alla volta
+        self._reload_task: asyncio.Future | None = None
+        self._idle_timer: asyncio.TimerHandle | None = None
+        self._background: set[asyncio.Future] = set()
+
+    @property
+    def loaded(self) -> bool:
+        """False se i modelli sono stati scaricati per inattività."""
+        return all(pool.loaded for pool in self._pools.values())
+
+    def _lane(self, name: str) -> str:
+        """La corsia attuale del modello ``name``: un modello sostituito da
+        :meth:`swap_model` porta al nuovo (job instradati prima del cambio)."""
+        return self._aliases.get(name, name)
+
+    def _pool(self, name: str) -> ReplicaPool:
+        return self._pools[self._lane(name)]
+
+    def _lane_model(self, lane: str) -> str:
+        """Il modello da caricare per ``lane``."""
+        if lane == self.preview_lane and self._settings.preview_model:
+            return self._settings.preview_model
+        return lane
+
+    async def swap_model(self, name: str) -> float:
+        """Sostituisce a caldo il modello di default con ``name``.
+
+        Il nuovo modello è caricato in un thread (con le stesse repliche)
+        mentre il vecchio continua a servire; poi, nell'event loop e quindi tra
+        un job e l'altro, pool, router e corsia dello scheduler passano al
+        nuovo. I job che hanno già una replica finiscono con il vecchio
+        modello, liberato appena tutte le sue repliche rientrano. Restituisce
+        i secondi di caricamento; ``ValueError`` se ``name`` è già caricato.
+        """
+        async with self._load_lock:
+            old = self.model_name
+            if name in self._pools:
+                raise ValueError(f"Model {name} is already loaded")
+            pool = self._pools[old]
+            logger.info(f"Loading model {name} to replace {old} (replicas={pool.size})")
+            started = time.perf_counter()
+            replicas = await asyncio.to_thread(
+                self._load_replicas, self._settings, name, pool.size
+            )
+            elapsed = time.perf_counter() - started
+            retired = pool.swap(replicas)
+            self._pools = {
+                name if lane == old else lane: p for lane, p in self._pools.items()
+            }
+            self._aliases = {
+                alias: name if target == old else target
+                for alias, target in self._aliases.items()
+                if alias != name
+            }
+            self._aliases[old] = name
+            self._router.default = name
+            self.model_name = name
+            self._scheduler.rename_lane(old, name)
+            self._free_later([retired])
+        logger.info(f"Switched model from {old} to {name} (loaded in {elapsed:.1f}s)")
+        return elapsed
+
+    @asynccontextmanager
+    async def _slot(
+        self,
+        *,
+        cost: float,
+        priority: Priority,
+        lane: str,
+        chat_id: int | None = None,
+        on_queue: QueueCallback | None = None,
+        on_reload: Callable[[float], None] | None = None,
+        chat_ids: Collection[int] = (),
+    ) -> AsyncIterator[None]:
+        """Slot dello scheduler nella corsia di ``lane``, con i modelli caricati.
+
+        Lo scarico per inattività è sospeso finché il job è in coda o in corso;
+        se i modelli erano scarichi vengono ricaricati e ``on_reload`` riceve i
+        secondi di attesa. All'uscita, se non resta lavoro, lo scarico è
+        riprogrammato.
+        """
+        self._cancel_idle_unload()
+        try:
+            if chat_id is not None and self._batcher is not None:
+                # I vocali della chat ancora nella finestra del micro-batcher
+                # sono arrivati prima: entrano in coda davanti a questo job.
+                await self._batcher.wait_queued(chat_id)
+            async with self._scheduler.slot(
+                cost=cost,
+                priority=priority,
+                chat_id=chat_id,
+                on_queue=on_queue,
+                lane=self._lane(lane),
+                chat_ids=chat_ids,
+            ):
+                reload_s = await self._ensure_loaded()
+                if reload_s is not None and on_reload is not None:
+                    on_reload(reload_s)
+                yield
+        finally:
+            self.schedule_idle_unload()
+
+    async def _ensure_loaded(self) -> float | None:
+        """Ricarica i modelli scaricati: i secondi di attesa, o None se erano
+        già caricati. I job che arrivano durante il caricamento lo condividono;
+        annullarne uno non lo interrompe."""
+        if self.loaded:
+            return None
+        if self._reload_task is None or self._reload_task.done():
+            self._reload_task = asyncio.ensure_future(self._reload())
+        return await asyncio.shield(self._reload_task)
+
+    async def _reload(self) -> float | None:
+        async with self._load_lock:
+            unloaded = {
+                lane: pool for lane, pool in self._pools.items() if not pool.loaded
+            }
+            if not unloaded:
+                return None
+            logger.info(f"Reloading {len(unloaded)} idle model(s)")
+            started = time.perf_counter()
+            replicas = await asyncio.to_thread(
+                lambda: {
+                    lane: self._load_replicas(
+                        self._settings, self._lane_model(lane), pool.size
+                    )
+                    for lane, pool in unloaded.items()
+                }
+            )
+            for lane, pool in unloaded.items():
+                pool.swap(replicas[lane])
+            elapsed = time.perf_counter() - started
+        logger.info(f"Models reloaded in {elapsed:.1f}s")
+        return elapsed
+
+    def schedule_idle_unload(self) -> None:
+        """(Ri)programma lo scarico dei modelli dopo ``model_idle_unload_s``
+        secondi, se non ci sono job in coda o in corso.
+
+        Va chiamata nell'event loop: all'avvio e, internamente, dopo ogni job.
+        """
+        idle_s = self._settings.model_idle_unload_s
+        if idle_s is None or self._scheduler.waiting or self._scheduler.running:
+            return
+        self._cancel_idle_unload()
+        loop = asyncio.get_running_loop()
+        self._idle_timer = loop.call_later(idle_s, self._unload_idle)
+
+    def _cancel_idle_unload(self) -> None:
+        if self._idle_timer is not None:
+            self._idle_timer.cancel()
+            self._idle_timer = None
+
+    def _unload_idle(self) -> None:
+        """Scarica i modelli, se nel frattempo non è arrivato lavoro."""
+        self._idle_timer = None
+        if (
+            self._scheduler.waiting
+            or self._scheduler.running
+            or self._load_lock.locked()
+        ):
+            return
+        retired = [pool.swap([]) for pool in self._pools.values() if pool.loaded]
+        if retired:
+            logger.info(
+                f"No transcriptions for {self._settings.model_idle_unload_s}s: "
+                "unloading models"
+            )
+            self._free_later(retired)
+
+    def _free_later(self, retired: list[RetiredReplicas]) -> None:
+        """Libera in un thread le repliche uscenti, appena tutte rientrate."""
+        future = asyncio.ensure_future(asyncio.to_thread(self._free, retired))
+        self._background.add(future)
+        future.add_done_callback(self._background.discard)
+
+    @staticmethod
+    def _free(retired: list[RetiredReplicas]) -> None:
+        for batch in retired:
+            for replica in set(batch.wait_idle()):
+                if isinstance(replica, ProcessReplica):
+                    replica.close()
+        gc.collect()  # i pesi di CTranslate2 si liberano con l'ultimo riferimento
+
+    def route(self, duration: float, language: str | None) -> str:
+        """Il modello che trascriverà un media di ``duration`` s in ``language``."""
+        return self._router.route(duration, language)
+
+    def decoding_profile(self, path: DecodingPath, duration: float) -> str:
+        """Il profilo di decodifica per un media di ``duration`` s del percorso."""
+        return self._profiles.select(path, duration)
+
+    def wants_preview(self, duration: float) -> bool:
+        """True se per un media di ``duration`` secondi va mostrata l'anteprima."""
+        return (
+            self.preview_lane is not None
+            and duration >= self._settings.preview_min_duration_s
+        )
+
+    def model_stats(self) -> list[tuple[str, int, float]]:
+        """``(modello, richieste servite, real-time factor)`` per ogni modello."""
+        return [
+            (name, self._router.served[name], self._scheduler.lane_rtf(name))
+            for name in self._pools
+        ]
+
+    async def admit(
+        self,
+        chat_id: int,
+        *,
+        duration: float = 0.0,
+        priority: Priority = Priority.INTERACTIVE,
+        model_name: str | None = None,
+    ) -> Admission:
+        """Prenota un posto in coda per la chat (vedi ``TranscriptionScheduler.admit``).
+
+        Asincrona come quella di ``RemoteTranscriber``, che interroga il worker;
+        qui il controllo è locale e immediato.
+
+        Solleva ``ChatQueueFullError`` se la chat ha già troppe richieste
+        pendenti, ``OverloadedError`` se l'attesa stimata per un media di
+        ``duration`` secondi sul modello ``model_name`` (default: quello di
+        default) supera lo SLA; l'``Admission`` va rilasciata a fine richiesta.
+        """
+        return self._scheduler.admit(
+            chat_id,
+            cost=duration,
+            priority=priority,
+            lane=self._lane(model_name or self.model_name),
+        )
+
+    @property
+    def rtf(self) -> float:
+        """Real-time factor misurato dallo scheduler su questo device."""
+        return self._scheduler.rtf
+
+    @property
+    def queue_stats(self) -> tuple[int, int]:
+        """``(in coda, in esecuzione)`` in questo istante."""
+        return self._scheduler.waiting, self._scheduler.running
+
+    async def stats(self) -> dict:
+        """Coda e modelli nello stesso istante, per ``/admin status``:
+        ``{"queue": (in coda, in esecuzione), "models": model_stats()}``."""
+        return {"queue": self.queue_stats, "models": self.model_stats()}
+
+    def warmup(self) -> None:
+        """Inferenza di prova su una clip sintetica, una per replica distinta.
+
+        La prima chiamata a un modello CTranslate2 paga l'allocazione dei buffer
+        e l'inizializzazione dei kernel: farla all'avvio evita che la paghi il
+        primo vocale dopo ogni deploy. Bloccante: va chiamata prima del polling.
+        """
+        clip = np.zeros(SAMPLE_RATE, dtype=np.float32)  # 1 s di silenzio
+        seen: set[int] = set()
+        replicas = [r for pool in self._pools.values() for r in pool.replicas]
+        for model in replicas:
+            if id(model) in seen:
+                continue  # modello condiviso: basta una volta
+            seen.add(id(model))
+            segments, _info = model.transcribe(clip, language="en")
+            for _segment in segments:  # il generatore è lazy: va consumato
+                pass
+
     def shutdown(self) -> None:
-        """Arresta l'executor attendendo la trascrizione in corso (step 3.5)."""
+        """Arresta l'executor attendendo le trascrizioni in corso (step 3.5)."""
+        self._cancel_idle_unload()
         self._executor.shutdown(wait=True)
+        for pool in self._pools.values():
+            for replica in set(pool.replicas):
+                if isinstance(replica, ProcessReplica):
+                    replica.close()
 
     @staticmethod
     def _resolve_device(settings: Settings) -> str:
@@ -61,14 +486,79 @@ class WhisperTranscriber:
         return "cpu"
 
     @staticmethod
-    def _resolve_compute_type(settings: Settings, device: str) -> str:
-        """compute_type esplicito: float16 su GPU, int8 su CPU (override da settings)."""
+    def _resolve_compute_type(
+        settings: Settings, device: str, tuned: TuneResult | None = None
+    ) -> str:
+        """compute_type: quello di settings, poi quello del tuning, altrimenti
+        float16 su GPU e int8 su CPU."""
         if settings.whisper_compute_type:
             return settings.whisper_compute_type
+        if tuned is not None:
+            return tuned.compute_type
         return "float16" if device == "cuda" else "int8"
 
+    @staticmethod
+    def _resolve_replicas(settings: Settings, tuned: TuneResult | None = None) -> int:
+        """Repliche del modello: ``WHISPER_REPLICAS`` se impostato, altrimenti le
+        decodifiche parallele (``inter_threads``) più veloci misurate dal tuning."""
+        if tuned is not None and "whisper_replicas" not in settings.model_fields_set:
+            return tuned.inter_threads
+        return settings.whisper_replicas
+
+    @staticmethod
+    def _resolve_shared_model(
+        settings: Settings, tuned: TuneResult | None = None
+    ) -> bool:
+        """True se le repliche sono un solo modello con N worker CTranslate2.
+
+        Oltre a ``WHISPER_SHARED_MODEL``, vale quando le repliche vengono dal
+        tuning: ``calliope tune`` misura un unico modello con
+        ``num_workers=inter_threads``, non N modelli indipendenti.
+        """
+        if settings.whisper_shared_model:
+            return True
+        return tuned is not None and "whisper_replicas" not in settings.model_fields_set
+
+    @staticmethod
+    def _resolve_cpu_threads(
+        settings: Settings,
+        device: str,
+        replicas: int,
+        tuned: TuneResult | None = None,
+    ) -> int:
+        """Budget di thread CTranslate2 per replica (0 = default di CT2).
+
+        Su CPU, in automatico, i core disponibili vengono divisi tra le repliche
+        così che N decodifiche parallele non si contendano gli stessi core. Il
+        valore del tuning vale solo se le repliche sono quelle misurate (con
+        più corsie o repliche i core andrebbero in oversubscription).
+        """
+        if settings.whisper_cpu_threads:
+            return settings.whisper_cpu_threads
+        if device != "cpu":
+            return 0
+        if tuned is not None and tuned.inter_threads == replicas:
+            return tuned.cpu_threads
+        cores = (
+            len(os.sched_getaffinity(0))
+            if hasattr(os, "sched_getaffinity")
+            else (os.cpu_count() or 1)
+        )
+        return max(1, cores // replicas)
+
     async def stream_segments(
-        self, file_audio, language: str | None = None
+        self,
+        file_audio,
+        language: str | None = None,
+        *,
+        duration: float | None = None,
+        priority: Priority = Priority.INTERACTIVE,
+        chat_id: int | None = None,
+        on_queue: QueueCallback | None = None,
+        model_name: str | None = None,
+        on_info: Callable[[str, float], None] | None = None,
+        profile: str | None = None,
+        on_reload: Callable[[float], None] | None = None,
     ) -> AsyncIterator[str]:
         """Trascrive l'audio producendo i testi dei segmenti man mano.
 
@@ -77,143 +567,634 @@ class WhisperTranscriber:
         una coda thread-safe. Il consumer può così aggiornare Telegram in tempo
         reale senza che l'event loop venga mai bloccato.
 
+        Se il consumer smette di iterare (generatore chiuso o task annullato)
+        il produttore si ferma al segmento successivo, senza decodificare il
+        resto dell'audio, e la replica torna subito disponibile.
+
         Args:
             file_audio: array/percorso audio accettato da faster-whisper.
             language: codice lingua ISO (es. ``"it"``); ``None`` = auto-detect.
+            duration: durata dichiarata in secondi (costo per lo scheduler);
+                ``None`` = calcolata dai campioni.
+            priority: classe di priorità del job.
+            chat_id: chat di provenienza (fair queuing e ordine per chat).
+            on_queue: callback ``(posizione, eta_s)`` chiamata finché il job è
+                in coda (es. per aggiornare il placeholder).
+            model_name: modello (corsia) da usare, es. :attr:`preview_lane`
+                per l'anteprima; ``None`` = scelto dal router.
+            on_info: callback ``(lingua, probabilità)`` chiamata nell'event loop
+                con la lingua rilevata dal modello (es. per impararla).
+            profile: profilo di decodifica (vedi
+                :mod:`~calliope.transcription.decoding`); ``None`` = scelto
+                dalle regole per il percorso ``voice``.
+            on_reload: callback chiamata nell'event loop con i secondi di
+                attesa se il job ha dovuto ricaricare i modelli scaricati per
+                inattività.
 
         Yields:
             Il testo di ciascun segmento, nell'ordine di produzione.
         """
+        cost = self._audio_seconds(file_audio, duration)
+        model_name = self._lane(model_name or self.route(cost, language))
+        if model_name != self.preview_lane:
+            # l'anteprima accompagna una richiesta già contata nella sua corsia
+            self._router.record(model_name)
+        profile = profile or self.decoding_profile("voice", cost)
+        if self._batcher is not None and self._batchable(file_audio):
+            # Vocale breve: attende qualche ms altre clip da decodificare insieme.
+            # Il batch è di più chat: i modelli si ricaricano prima, per chi attende.
+            reload_s = await self._ensure_loaded()
+            if reload_s is not None and on_reload is not None:
+                on_reload(reload_s)
+            async for text in self._batcher.submit(
+                file_audio,
+                language=language,
+                model_name=model_name,
+                profile=profile,
+                chat_id=chat_id,
+                priority=priority,
+                on_queue=on_queue,
+                on_info=on_info,
+            ):
+                yield text
+            return
+
         loop = asyncio.get_running_loop()
         queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
 
         def _produce() -> None:
             try:
-                segments, _info = self.model.transcribe(file_audio, language=language)
-                for segment in segments:
-                    loop.call_soon_threadsafe(queue.put_nowait, segment.text)
+                with self._pool(model_name).acquire() as model:
+                    if stop.is_set():
+                        return  # annullato mentre attendeva la replica
+                    segments, info = model.transcribe(
+                        file_audio,
+                        language=language,
+                        **self._profiles.kwargs(profile),
+                        **self._speech_clips(file_audio),
+                    )
+                    if on_info is not None and info is not None:
+                        loop.call_soon_threadsafe(
+                            on_info, info.language, info.language_probability
+                        )
+                    for segment in segments:
+                        if stop.is_set():
+                            break  # il generatore lazy non decodifica oltre
+                        loop.call_soon_threadsafe(queue.put_nowait, segment.text)
             except Exception as exc:  # inoltra l'errore al consumer
                 loop.call_soon_threadsafe(queue.put_nowait, exc)
             else:
-                loop.call_soon_threadsafe(queue.put_nowait, _STREAM_DONE)
+                loop.call_soon_threadsafe(queue.put_nowait, STREAM_DONE)
+
+        async with self._slot(
+            cost=cost,
+            priority=priority,
+            chat_id=chat_id,
+            on_queue=on_queue,
+            lane=model_name,
+            on_reload=on_reload,
+        ):
+            future = loop.run_in_executor(self._executor, _produce)
+            try:
+                while True:
+                    item = await queue.get()
+                    if item is STREAM_DONE:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    yield item
+            finally:
+                # Ferma il produttore e ne attende l'uscita: lo slot si libera
+                # solo quando la replica è davvero tornata nel pool.
+                stop.set()
+                await future
+
+    @staticmethod
+    def _audio_seconds(file_audio, duration: float | None = None) -> float:
+        """Costo stimato di un job: la durata dichiarata o quella dei campioni."""
+        if duration:
+            return float(duration)
+        if isinstance(file_audio, np.ndarray):
+            return file_audio.size / SAMPLE_RATE
+        return 0.0
+
+    def _speech_clips(self, file_audio) -> dict:
+        """``clip_timestamps`` con le sole regioni di parlato di ``file_audio``.
+
+        Restituisce i kwargs da passare a ``WhisperModel.transcribe``: vuoti se
+        la funzione è disattivata, se l'input non è un array o se le regioni
+        coprono già tutto l'audio (nessun tratto da saltare). faster-whisper
+        posiziona il seek all'inizio di ogni clip, quindi i timestamp dei
+        segmenti e delle parole restano assoluti rispetto all'audio originale.
+        """
+        if not self._settings.skip_silent_regions or not isinstance(
+            file_audio, np.ndarray
+        ):
+            return {}
+        regions = detect_speech_regions(
+            file_audio, SAMPLE_RATE, self._settings.silence_threshold
+        )
+        if len(regions) == 0:
+            return {}  # il pre-filtro del handler decide già sull'audio muto
+        if len(regions) == 1 and regions[0, 1] - regions[0, 0] == file_audio.size:
+            return {}
+        skipped = file_audio.size - int((regions[:, 1] - regions[:, 0]).sum())
+        logger.debug(
+            f"Skipping {skipped / SAMPLE_RATE:.0f}s of silence "
+            f"({len(regions)} speech regions)"
+        )
+        return {"clip_timestamps": (regions.ravel() / SAMPLE_RATE).tolist()}
+
+    def _batchable(self, file_audio) -> bool:
+        """True se la clip può passare dal micro-batcher (array abbastanza corto)."""
+        return (
+            isinstance(file_audio, np.ndarray)
+            and file_audio.size / SAMPLE_RATE <= self._settings.microbatch_max_clip_s
+        )
+
+    async def _dispatch_batch(self, clips: list[BatchClip]) -> None:
+        """Decodifica nel thread executor un batch raccolto dal micro-batcher.
+
+        Il batch attende lo slot come un job delle chat delle sue clip (ordine
+        e limiti per chat valgono anche per i vocali batched), con la priorità
+        più alta tra le clip; la posizione in coda arriva a ogni clip.
+        """
+        loop = asyncio.get_running_loop()
+        clips = [clip for clip in clips if not clip.cancelled.is_set()]
+        if not clips:
+            return
+        cost = sum(clip.samples.size for clip in clips) / SAMPLE_RATE
+        # il batcher raggruppa per modello
+        lane = clips[0].model_name or self.model_name
+
+        def _on_queue(position: int, eta: float) -> None:
+            for clip in clips:
+                if clip.on_queue is not None:
+                    clip.on_queue(position, eta)
 
-        future = loop.run_in_executor(self._executor, _produce)
+        # Entrando in ``_slot`` il batch è accodato prima che i waiter di
+        # ``wait_queued`` (svegliati al prossimo giro del loop) chiedano il loro.
+        for clip in clips:
+            clip.queued.set()
+        async with self._slot(
+            cost=cost,
+            priority=min(clip.priority for clip in clips),
+            lane=lane,
+            chat_ids=[clip.chat_id for clip in clips if clip.chat_id is not None],
+            on_queue=_on_queue,
+        ):
+            await loop.run_in_executor(self._executor, self._decode_batch, clips)
+
+    def _decode_batch(self, clips: list[BatchClip]) -> None:
+        """Decodifica più clip brevi con una replica e smista i segmenti.
+
+        Con una sola clip si usa il ``transcribe`` sequenziale (output identico
+        al percorso non batched). Altrimenti le clip senza lingua vengono prima
+        assegnate alla lingua rilevata su ciascuna, poi ogni gruppo con la
+        stessa lingua è decodificato in una sola chiamata batched. La lingua di
+        ogni clip è riportata al suo ``on_info``; le clip annullate mentre il
+        batch attendeva lo slot non vengono decodificate.
+        """
         try:
-            while True:
-                item = await queue.get()
-                if item is _STREAM_DONE:
-                    break
-                if isinstance(item, Exception):
-                    raise item
-                yield item
-        finally:
-            await future  # assicura il completamento del thread produttore
+            with self._pool(clips[0].model_name or self.model_name).acquire() as model:
+                clips = [clip for clip in clips if not clip.cancelled.is_set()]
+                if len(clips) == 1:
+                    clip = clips[0]
+                    segments, info = model.transcribe(
+                        clip.samples,
+                        language=clip.language,
+                        **self._clip_profile(clip),
+                        **self._speech_clips(clip.samples),
+                    )
+                    if info is not None:
+                        clip.report_language(info.language, info.language_probability)
+                    for segment in segments:
+                        if clip.cancelled.is_set():
+                            break  # il generatore lazy non decodifica oltre
+                        clip.emit(segment.text)
+                    clip.emit(STREAM_DONE)
+                    return
+
+                groups: dict[str, list[BatchClip]] = {}
+                for clip in clips:
+                    language, probability = clip.language, 1.0
+                    if language is None:
+                        language, probability, _all = model.detect_language(
+                            clip.samples
+                        )
+                    # come faster-whisper: probabilità 1 per la lingua imposta
+                    clip.report_language(language, probability)
+                    groups.setdefault(language, []).append(clip)
+                for language, group in groups.items():
+                    self._decode_group(model, group, language)
+        except Exception as exc:  # inoltra l'errore a tutti i consumer
+            for clip in clips:
+                clip.emit(exc)
+
+    def _decode_group(self, model, clips: list[BatchClip], language: str) -> None:
+        """Una chiamata batched per clip della stessa lingua.
+
+        Le clip vengono concatenate e delimitate con ``clip_timestamps``: ogni
+        clip è un chunk indipendente del batch (nessun contesto condiviso) e i
+        segmenti tornano con timestamp assoluti, da cui si ricava la clip di
+        appartenenza.
+        """
+        offsets = []
+        clip_timestamps = []
+        position = 0
+        for clip in clips:
+            offsets.append(position / SAMPLE_RATE)
+            clip_timestamps.append(
+                {
+                    "start": position / SAMPLE_RATE,
+                    "end": (position + clip.samples.size) / SAMPLE_RATE,
+                }
+            )
+            position += clip.samples.size
+        audio = np.concatenate([clip.samples for clip in clips]).astype(np.float32)
+
+        pipeline = self._batched_pipeline(model)
+        segments, _info = pipeline.transcribe(
+            audio,
+            language=language,
+            clip_timestamps=clip_timestamps,
+            batch_size=len(clips),
+            **self._clip_profile(clips[0]),  # il batcher raggruppa per profilo
+        )
+        for segment in segments:
+            if all(clip.cancelled.is_set() for clip in clips):
+                break  # nessuno legge più: il generatore non decodifica oltre
+            # Tolleranza per l'arrotondamento dei timestamp a 3 decimali.
+            index = bisect.bisect_right(offsets, segment.start + 1e-3) - 1
+            clips[max(index, 0)].emit(segment.text)
+        for clip in clips:
+            clip.emit(STREAM_DONE)
+
+    def _clip_profile(self, clip: BatchClip) -> dict:
+        """Kwargs del profilo di una clip del micro-batcher."""
+        if clip.profile is None:
+            return {}
+        return self._profiles.kwargs(clip.profile)
 
     async def transcribe_with_timestamps(
         self,
         audio_data: np.ndarray,
         return_dict: bool = False,
         language: str | None = None,
+        *,
+        duration: float | None = None,
+        priority: Priority = Priority.BATCH,
+        chat_id: int | None = None,
+        model_name: str | None = None,
+        interval_s: float | None = None,
+        granularity: Granularity | None = None,
+        profile: str | None = None,
     ):
-        """Variante con timestamp, eseguita nel thread executor (vedi
-        :meth:`_transcribe_with_timestamps`)."""
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(
-            self._executor,
-            self._transcribe_with_timestamps,
+        """Testo con timestamp diviso in intervalli (vedi :meth:`stream_intervals`).
+
+        Ritorna le righe ``[HH:MM:SS - HH:MM:SS]: testo`` oppure, con
+        ``return_dict``, un dizionario etichetta→testo.
+        """
+        async with aclosing(
+            self.stream_intervals(
+                audio_data,
+                language,
+                interval_s=interval_s,
+                granularity=granularity,
+                duration=duration,
+                priority=priority,
+                chat_id=chat_id,
+                model_name=model_name,
+                profile=profile,
+            )
+        ) as stream:
+            intervals = [interval async for interval in stream]
+        return render_intervals(intervals, return_dict)
+
+    async def stream_intervals(
+        self,
+        audio_data: np.ndarray,
+        language: str | None = None,
+        *,
+        interval_s: float | None = None,
+        granularity: Granularity | None = None,
+        duration: float | None = None,
+        priority: Priority = Priority.BATCH,
+        chat_id: int | None = None,
+        model_name: str | None = None,
+        profile: str | None = None,
+        on_reload: Callable[[float], None] | None = None,
+    ) -> AsyncGenerator[Interval, None]:
+        """Trascrive con timestamp producendo gli intervalli man mano.
+
+        Le parole arrivano dal thread executor appena decodificate e un
+        intervallo viene prodotto appena il decoder lo supera (vedi
+        :class:`~calliope.transcription.intervals.IntervalBucketer`): il
+        consumer può mostrare l'avanzamento durante l'elaborazione.
+
+        Un media lungo con più repliche disponibili viene diviso in chunk
+        (:func:`~calliope.transcription.chunking.plan_chunks`) decodificati in
+        parallelo: vedi :meth:`_transcribe_chunks`. In quel caso le parole di
+        un chunk arrivano quando il chunk e tutti i precedenti sono finiti.
+
+        Se il consumer smette di iterare (o il task viene annullato)
+        l'inferenza si interrompe al segmento successivo e lo slot è
+        rilasciato solo dopo l'uscita del thread. ``model_name=None`` lascia
+        scegliere il modello al router; ``interval_s=None`` usa
+        ``settings.timestamp_interval_s``.
+
+        ``granularity`` sceglie come si collocano le parole negli intervalli:
+        ``"word"`` usa i timestamp di ogni parola (``word_timestamps``, esatti
+        ma con una passata di allineamento in più), ``"segment"`` solo quelli
+        dei segmenti, interpolando le parole
+        (:func:`~calliope.transcription.intervals.interpolate_words`).
+        ``None`` = dalla configurazione (vedi :meth:`_granularity`).
+        ``profile=None`` sceglie il profilo di decodifica per il percorso
+        ``video``. ``on_reload`` riceve i secondi di attesa se il job ha dovuto
+        ricaricare i modelli scaricati per inattività.
+        """
+        cost = self._audio_seconds(audio_data, duration)
+        model_name = self._lane(model_name or self.route(cost, language))
+        self._router.record(model_name)
+        granularity = granularity or self._granularity(cost)
+        decoding = self._profiles.kwargs(
+            profile or self.decoding_profile("video", cost)
+        )
+        chunks = self._plan_parallel(audio_data, model_name)
+        bucketer = IntervalBucketer(interval_s or self._settings.timestamp_interval_s)
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+
+        async def _produce() -> None:
+            try:
+                # Con più chunk lo slot del job ne decodifica uno alla volta come
+                # gli slot di aiuto: costa un chunk, non l'intero media (il
+                # real-time factor e le ETA dell'admission restano corretti).
+                async with self._slot(
+                    cost=cost if len(chunks) == 1 else self._chunk_cost(chunks),
+                    priority=priority,
+                    chat_id=chat_id,
+                    lane=model_name,
+                    on_reload=on_reload,
+                ):
+                    try:
+                        await self._transcribe_chunks(
+                            audio_data,
+                            chunks,
+                            language,
+                            stop,
+                            model_name,
+                            priority,
+                            queue.put_nowait,
+                            granularity,
+                            decoding,
+                        )
+                    finally:
+                        stop.set()  # ferma i chunk ancora in corso
+            finally:
+                queue.put_nowait(STREAM_DONE)
+
+        producer = asyncio.ensure_future(_produce())
+        try:
+            while (words := await queue.get()) is not STREAM_DONE:
+                for word in words:
+                    for interval in bucketer.add(word):
+                        yield interval
+            await producer  # propaga gli errori dell'inferenza
+        finally:
+            if not producer.done():
+                producer.cancel()  # il consumer ha smesso di iterare
+            await asyncio.gather(producer, return_exceptions=True)
+        for interval in bucketer.finish():
+            yield interval
+
+    def _granularity(self, duration: float) -> Granularity:
+        """Granularità dei timestamp da configurazione: ``"segment"`` per i media
+        oltre ``segment_timestamps_min_duration_s``, altrimenti quella di default."""
+        threshold = self._settings.segment_timestamps_min_duration_s
+        if threshold is not None and duration >= threshold:
+            return "segment"
+        return self._settings.timestamp_granularity
+
+    @staticmethod
+    def _chunk_cost(chunks: list[Chunk]) -> float:
+        """Costo per lo scheduler di uno slot che decodifica un chunk: la durata
+        media dei chunk, in secondi."""
+        return sum(c.end - c.start for c in chunks) / len(chunks) / SAMPLE_RATE
+
+    def _plan_parallel(self, audio_data: np.ndarray, model_name: str) -> list[Chunk]:
+        """Chunk per la decodifica parallela, o un chunk unico se non conviene."""
+        chunk_s = self._settings.parallel_chunk_s
+        if chunk_s is None or self._pool(model_name).size < 2:
+            return [Chunk(0, audio_data.size, 0, audio_data.size)]
+        return plan_chunks(
             audio_data,
-            return_dict,
-            language,
+            SAMPLE_RATE,
+            chunk_s=chunk_s,
+            overlap_s=self._settings.parallel_chunk_overlap_s,
         )
 
-    def _transcribe_with_timestamps(
+    async def _transcribe_chunks(
         self,
         audio_data: np.ndarray,
-        return_dict: bool = False,
-        language: str | None = None,
+        chunks: list[Chunk],
+        language: str | None,
+        stop: threading.Event,
+        model_name: str,
+        priority: Priority,
+        emit: Callable[[list[TimedWord]], None],
+        granularity: Granularity = "word",
+        decoding: dict | None = None,
+    ) -> None:
+        """Decodifica i chunk con lo slot del job più slot aggiuntivi della corsia.
+
+        Le parole definitive sono passate a ``emit`` (nell'event loop): con un
+        chunk solo segmento per segmento, con più chunk ricucite
+        (:class:`~calliope.transcription.chunking.Stitcher`) appena un chunk e
+        tutti i precedenti sono finiti.
+
+        Lo slot già concesso al job lavora i chunk in ordine; per gli altri si
+        chiedono allo scheduler slot "di aiuto" senza chat (concorrono con gli
+        altri job come un batch), che prelevano i chunk rimasti dalla stessa
+        coda. Gli aiuti ancora in attesa quando i chunk finiscono vengono
+        annullati, così nessuna replica resta prenotata a vuoto.
+        """
+        loop = asyncio.get_running_loop()
+        pending = list(range(len(chunks)))
+        stitcher = Stitcher(chunks, SAMPLE_RATE)
+        streaming = len(chunks) == 1
+
+        def _on_words(words: list[TimedWord]) -> None:
+            loop.call_soon_threadsafe(emit, words)
+
+        async def _work() -> None:
+            while pending and not stop.is_set():
+                index = pending.pop(0)
+                chunk = chunks[index]
+                future = loop.run_in_executor(
+                    self._executor,
+                    partial(
+                        self._timed_words,
+                        audio_data[chunk.start : chunk.end],
+                        language,
+                        stop,
+                        model_name,
+                        offset_s=chunk.start / SAMPLE_RATE,
+                        on_words=_on_words if streaming else None,
+                        granularity=granularity,
+                        decoding=decoding,
+                    ),
+                )
+                try:
+                    words = await asyncio.shield(future)
+                except asyncio.CancelledError:
+                    # lo slot si libera solo quando la replica è tornata nel pool
+                    stop.set()
+                    await asyncio.wait([future])
+                    raise
+                if not streaming:
+                    emit(stitcher.add(index, words))
+
+        started: set[asyncio.Task] = set()
+
+        async def _help() -> None:
+            cost = self._chunk_cost(chunks)
+            async with self._slot(cost=cost, priority=priority, lane=model_name):
+                task = asyncio.current_task()
+                if task is not None:
+                    started.add(task)
+                await _work()
+
+        helpers_count = min(len(chunks), self._pool(model_name).size) - 1
+        helpers = [asyncio.create_task(_help()) for _ in range(helpers_count)]
+        if helpers:
+            logger.info(
+                f"Parallel transcription: {len(chunks)} chunks, "
+                f"up to {helpers_count + 1} replicas"
+            )
+        try:
+            await _work()
+        except BaseException:
+            stop.set()
+            for helper in helpers:
+                helper.cancel()
+            await asyncio.gather(*helpers, return_exceptions=True)
+            raise
+        # Gli aiuti ancora in attesa di uno slot non servono più; quelli in
+        # corso finiscono il loro chunk.
+        for helper in helpers:
+            if helper not in started:
+                helper.cancel()
+        for outcome in await asyncio.gather(*helpers, return_exceptions=True):
+            if isinstance(outcome, Exception):
+                raise outcome
+
+    @staticmethod
+    def _batched_pipeline(model):
+        """``BatchedInferencePipeline`` sulla replica (nel suo processo, se remota)."""
+        if isinstance(model, ProcessReplica):
+            return model.batched()
+        return BatchedInferencePipeline(model=model)
+
+    def _use_batched(self, audio_data: np.ndarray) -> bool:
+        """True se l'audio è abbastanza lungo per l'inferenza batched."""
+        threshold = self._settings.batched_min_duration_s
+        return threshold is not None and audio_data.size / SAMPLE_RATE >= threshold
+
+    def _word_segments(
+        self,
+        model,
+        audio_data: np.ndarray,
+        language: str | None,
+        word_timestamps: bool = True,
+        decoding: dict | None = None,
     ):
+        """Segmenti con timestamp (anche a livello di parola, se
+        ``word_timestamps``) per ``audio_data``, decodificati con i kwargs del
+        profilo ``decoding``.
+
+        Sotto la soglia usa il ``transcribe`` sequenziale del modello, limitato
+        alle regioni di parlato (:meth:`_speech_clips`); sopra usa
+        ``BatchedInferencePipeline``: l'audio viene diviso in chunk dal VAD (che
+        scarta già il silenzio) e i chunk sono decodificati ``batch_size`` alla
+        volta. I timestamp restano
+        assoluti rispetto all'inizio dell'audio, quindi il bucketing a minuti a
+        valle non cambia. Senza ``word_timestamps`` servono i timestamp dei
+        segmenti: ``without_timestamps`` del profilo è ignorato.
         """
-        Trascrive il contenuto di 'audio_data' (già caricato in memoria) e restituisce il testo
-        suddiviso in intervalli di 1 minuto con i rispettivi timestamp.
+        decoding = dict(decoding or {})
+        if not word_timestamps:
+            decoding["without_timestamps"] = False
+        if self._use_batched(audio_data):
+            logger.info(
+                f"Batched inference for {audio_data.size / SAMPLE_RATE:.0f}s of audio "
+                f"(batch_size={self._settings.batch_size})"
+            )
+            pipeline = self._batched_pipeline(model)
+            segments, _info = pipeline.transcribe(
+                audio_data,
+                word_timestamps=word_timestamps,
+                language=language,
+                batch_size=self._settings.batch_size,
+                **decoding,
+            )
+            return segments
+        segments, _info = model.transcribe(
+            audio=audio_data,
+            word_timestamps=word_timestamps,
+            language=language,
+            **decoding,
+            **self._speech_clips(audio_data),
+        )
+        return segments
 
-        Parametri:
-        - audio_data: array NumPy con i campioni dell'audio (float o int).
-        - sample_rate: frequenza di campionamento dell'audio (es. 22050, 44100, 16000, ecc.).
-        - return_dict: se True, restituisce un dizionario {intervalo: testo}; altrimenti una stringa.
+    def _timed_words(
+        self,
+        audio_data: np.ndarray,
+        language: str | None = None,
+        stop: threading.Event | None = None,
+        model_name: str | None = None,
+        offset_s: float = 0.0,
+        on_words: Callable[[list[TimedWord]], None] | None = None,
+        granularity: Granularity = "word",
+        decoding: dict | None = None,
+    ) -> list[TimedWord]:
+        """Parole con timestamp di ``audio_data``, spostate di ``offset_s`` secondi.
 
-        Ritorna:
-        - Una stringa formattata con segmenti [HH:MM:SS - HH:MM:SS]: trascrizione
-        oppure un dizionario { (start, end): "trascrizione" } a seconda di return_dict.
+        Gira nel thread executor: prende in prestito una replica del modello e
+        consuma il generatore lazy finché la replica è in prestito.
+        ``on_words`` riceve le parole di ogni segmento appena decodificato.
+        Con ``granularity="segment"`` i timestamp delle parole sono interpolati
+        da quelli del segmento (nessun allineamento per parola). ``decoding``
+        sono i kwargs del profilo di decodifica.
         """
         # Assicuriamoci che l'audio sia in float32 (richiesto spesso da modelli come Whisper)
         if audio_data.dtype != np.float32:
             audio_data = audio_data.astype(np.float32)
 
-        # Esegui la trascrizione con timestamp a livello di parola
-        segments, info = self.model.transcribe(
-            audio=audio_data, word_timestamps=True, language=language
-        )
-
-        # Dizionario che accumula le parole per ciascun minuto
-        minute_segments: dict[int, list[str]] = {}
-        total_duration = 0.0
-
-        for segment in segments:
-            for word in segment.words:
-                start_time = word.start
-                end_time = word.end
-                text = word.word
-
-                # Minuto in cui cade la parola
-                minute_index = int(start_time // 60)
-
-                # Aggiorna la durata totale se necessario
-                if end_time > total_duration:
-                    total_duration = end_time
-
-                # Aggiungi la parola al dizionario
-                if minute_index not in minute_segments:
-                    minute_segments[minute_index] = []
-                minute_segments[minute_index].append(text)
-
-        # Costruiamo un dict finale con chiave [HH:MM:SS - HH:MM:SS] e valore testo
-        result_dict = {}
-        # Numero totale di minuti trascritti (includendo l'eventuale ultimo parziale)
-        num_minutes = int(total_duration // 60) + 1
-
-        for i in range(num_minutes):
-            start_interval = i * 60
-            # L'ultimo minuto potrebbe non essere pieno
-            end_interval = min((i + 1) * 60, total_duration)
-
-            # Formattazione dei timestamp
-            start_ts = f"{int(start_interval // 3600):02d}:{int((start_interval % 3600) // 60):02d}:{int(start_interval % 60):02d}"
-            end_ts = f"{int(end_interval // 3600):02d}:{int((end_interval % 3600) // 60):02d}:{int(end_interval % 60):02d}"
-
-            # Preleva le parole accumulate in questo minuto
-            words = minute_segments.get(i, [])
-
-            # Ricostruisce la frase (semplice concatenazione con spazi)
-            if not words:
-                text_segment = ""
-            else:
-                text_segment = words[0]
-                for w in words[1:]:
-                    # Se la parola inizia con un segno di punteggiatura comune, la attacchiamo direttamente
-                    if w and (w[0].isalnum() or w[0] == "¿" or w[0] == "¡"):
-                        text_segment += " " + w
-                    else:
-                        text_segment += w
-
-            interval_label = f"[{start_ts} - {end_ts}]"
-            result_dict[interval_label] = text_segment.strip()
-
-        # Ritorno dei risultati nel formato desiderato
-        if return_dict:
-            return result_dict
-        else:
-            output_lines = [
-                f"{interval_label}: {text}"
-                for interval_label, text in result_dict.items()
-            ]
-            return "\n".join(output_lines)
+        words: list[TimedWord] = []
+        pool = self._pool(model_name or self.model_name)
+        with pool.acquire() as model:
+            if stop is not None and stop.is_set():
+                return words  # annullato mentre attendeva la replica
+            by_word = granularity == "word"
+            segments = self._word_segments(
+                model, audio_data, language, by_word, decoding
+            )
+            for segment in segments:
+                if stop is not None and stop.is_set():
+                    break
+                if by_word:
+                    segment_words = [
+                        TimedWord(word.start + offset_s, word.end + offset_s, word.word)
+                        for word in segment.words
+                    ]
+                else:
+                    segment_words = interpolate_words(
+                        segment.start + offset_s, segment.end + offset_s, segment.text
+                    )
+                words.extend(segment_words)
+                if on_words is not None:
+                    on_words(segment_words)
+        return words
@@ -0,0 +1,230 @@
+"""``calliope-worker``: server di inferenza condiviso da più istanze del bot.
+
+Carica il :class:`WhisperTranscriber` (modelli, repliche, scheduler) una sola
+volta e lo espone su un socket Unix (``WORKER_SOCKET``) con il protocollo
+NDJSON descritto in :mod:`calliope.transcription.remote`. I bot configurati con
+``INFERENCE_BACKEND=remote`` e lo stesso socket usano questo processo al posto
+di un modello proprio: una macchina GPU serve così più front-end, con
+scheduling ed equità tra chat globali.
+"""
+
+import asyncio
+import contextlib
+import json
+import os
+from contextlib import aclosing
+
+import numpy as np
+from loguru import logger
+
+from calliope.logging_setup import setup_logging
+from calliope.media.extract import SAMPLE_RATE
+from calliope.settings import settings
+from calliope.transcription.remote import STREAM_LIMIT, encode
+from calliope.transcription.scheduler import (
+    ChatQueueFullError,
+    OverloadedError,
+    Priority,
+)
+from calliope.transcription.whisper import WhisperTranscriber
+
+
+def _hello(transcriber) -> dict:
+    """Configurazione che il client replica localmente (router, anteprima,
+    profili di decodifica)."""
+    return {
+        "model_name": transcriber.model_name,
+        "device": transcriber.device,
+        "preview_lane": transcriber.preview_lane,
+        "preview_min_duration_s": settings.preview_min_duration_s,
+        "routes": [rule.model_dump() for rule in settings.whisper_routes],
+        "decoding": {
+            "profiles": {
+                name: profile.model_dump()
+                for name, profile in settings.decoding_profiles.items()
+            },
+            "rules": [rule.model_dump() for rule in settings.decoding_rules],
+            "defaults": {
+                "voice": settings.voice_decoding_profile,
+                "video": settings.video_decoding_profile,
+            },
+        },
+    }
+
+
+async def _stats(transcriber) -> dict:
+    stats = await transcriber.stats()
+    return {
+        "queue": list(stats["queue"]),
+        "models": [list(m) for m in stats["models"]],
+    }
+
+
+async def _admit(transcriber, request: dict) -> dict:
+    """Controllo di ammissione chiesto dal bot prima del download.
+
+    Stessi controlli di :func:`_run`, ma il posto è rilasciato subito: il
+    worker lo prenota solo quando riceve l'audio. Un rifiuto arriva al bot
+    come errore (vedi ``_error``).
+    """
+    with await transcriber.admit(
+        request["chat_id"],
+        duration=request.get("duration") or 0.0,
+        priority=Priority(request["priority"]),
+        model_name=request.get("model_name"),
+    ):
+        return {"admitted": True}
+
+
+def _error(exc: Exception) -> dict:
+    """Serializza un errore per il client (vedi ``raise_for_error``)."""
+    if isinstance(exc, OverloadedError):
+        return {"type": "overloaded", "eta_s": exc.eta_s, "limit_s": exc.limit_s}
+    if isinstance(exc, ChatQueueFullError):
+        return {"type": "chat_queue_full", "chat_id": exc.chat_id, "limit": exc.limit}
+    return {"type": "internal", "message": f"{type(exc).__name__}: {exc}"}
+
+
+async def _cancel_on_disconnect(
+    reader: asyncio.StreamReader, task: asyncio.Task
+) -> None:
+    """Annulla la richiesta se il client chiude la connessione."""
+    await reader.read()  # EOF: il client non invia altro dopo la richiesta
+    task.cancel()
+
+
+async def _run(transcriber, request: dict, samples: np.ndarray, writer) -> None:
+    """Esegue una richiesta di inferenza inviando le risposte man mano."""
+    chat_id = request.get("chat_id")
+    priority = Priority(request["priority"])
+    duration = request.get("duration")
+    model_name = request.get("model_name")
+    admission = contextlib.nullcontext()
+    if chat_id is not None:  # stesso controllo di ammissione di un bot locale
+        admission = await transcriber.admit(
+            chat_id,
+            duration=duration or samples.size / SAMPLE_RATE,
+            priority=priority,
+            model_name=model_name,
+        )
+    with admission:
+        if request["op"] == "stream":
+            segments = transcriber.stream_segments(
+                samples,
+                request.get("language"),
+                duration=duration,
+                priority=priority,
+                chat_id=chat_id,
+                on_queue=lambda pos, eta: writer.write(encode({"queue": [pos, eta]})),
+                model_name=model_name,
+                on_info=lambda lang, prob: writer.write(encode({"info": [lang, prob]})),
+                profile=request.get("profile"),
+                on_reload=lambda seconds: writer.write(encode({"reload": seconds})),
+            )
+            async with aclosing(segments):
+                async for text in segments:
+                    writer.write(encode({"segment": text}))
+                    await writer.drain()
+        else:
+            intervals = transcriber.stream_intervals(
+                samples,
+                request.get("language"),
+                interval_s=request.get("interval_s"),
+                granularity=request.get("granularity"),
+                duration=duration,
+                priority=priority,
+                chat_id=chat_id,
+                model_name=model_name,
+                profile=request.get("profile"),
+                on_reload=lambda seconds: writer.write(encode({"reload": seconds})),
+            )
+            async with aclosing(intervals):
+                async for interval in intervals:
+                    writer.write(encode({"interval": list(interval)}))
+                    await writer.drain()
+
+
+def handler(transcriber):
+    """Callback per ``asyncio.start_unix_server``: una richiesta per connessione."""
+
+    async def _handle(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            request = json.loads(await reader.readline())
+            op = request.get("op")
+            if op == "hello":
+                writer.write(encode(_hello(transcriber)))
+            elif op == "stats":
+                writer.write(encode(await _stats(transcriber)))
+            elif op == "admit":
+                writer.write(encode(await _admit(transcriber, request)))
+            elif op in ("stream", "intervals"):
+                payload = await reader.readexactly(request["nbytes"])
+                samples = np.frombuffer(payload, dtype=np.float32)
+                task = asyncio.current_task()
+                assert task is not None
+                watcher = asyncio.create_task(_cancel_on_disconnect(reader, task))
+                try:
+                    await _run(transcriber, request, samples, writer)
+                finally:
+                    watcher.cancel()
+                writer.write(encode({"done": True}))
+            else:
+                writer.write(encode({"error": _error(ValueError(f"bad op {op!r}"))}))
+            await writer.drain()
+        except asyncio.CancelledError:
+            logger.info("Client disconnected, request cancelled")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            logger.info("Client disconnected")
+        except Exception as exc:
+            if not isinstance(exc, (OverloadedError, ChatQueueFullError)):
+                logger.exception("Worker request failed")
+            with contextlib.suppress(ConnectionError):
+                writer.write(encode({"error": _error(exc)}))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    return _handle
+
+
+async def serve(transcriber, path: str) -> asyncio.AbstractServer:
+    """Avvia il server sul socket ``path`` (un file stantio viene rimosso)."""
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
+    return await asyncio.start_unix_server(
+        handler(transcriber), path=path, limit=STREAM_LIMIT
+    )
+
+
+def main() -> None:
+    setup_logging(settings)
+    if settings.inference_backend == "remote":
+        raise SystemExit(
+            "calliope-worker hosts the models itself: set INFERENCE_BACKEND "
+            "to thread or process"
+        )
+    transcriber = WhisperTranscriber(settings)
+    if settings.whisper_warmup:
+        transcriber.warmup()
+
+    async def _serve_forever() -> None:
+        server = await serve(transcriber, settings.worker_socket)
+        logger.info(f"Worker listening on {settings.worker_socket}")
+        transcriber.schedule_idle_unload()
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(_serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        transcriber.shutdown()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(settings.worker_socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Benchmark della granularità dei timestamp: "word" vs "segment".
+
+Con ``word`` faster-whisper allinea ogni parola (``word_timestamps=True``, una
+passata cross-attention in più); con ``segment`` si usano solo i confini dei
+segmenti e le parole sono interpolate
+(:func:`calliope.transcription.intervals.interpolate_words`). Lo script misura:
+
+- **accuratezza**: quota di parole che finiscono nello stesso intervallo
+  (30 s, 1 min, 5 min) con le due granularità;
+- **velocità del bucketing**: tempo per raggruppare le parole;
+- con ``--audio``, anche il **tempo di inferenza** di un modello reale con e
+  senza ``word_timestamps`` e l'accuratezza sul suo output.
+
+Senza ``--audio`` il trascritto è sintetico: ~2.5 parole/s, pause casuali,
+segmenti chiusi sulle pause o dopo ~10 s, come quelli di Whisper.
+
+Uso:
+    uv run python scripts/bench_bucketing.py [--minutes 30]
+    uv run python scripts/bench_bucketing.py --audio video.mp4 --model small
+"""
+
+import argparse
+import time
+import timeit
+from functools import partial
+
+import numpy as np
+
+from calliope.transcription.chunking import TimedWord
+from calliope.transcription.intervals import bucket_words, interpolate_words
+
+INTERVALS = (30, 60, 300)
+
+
+def synthetic_transcript(minutes: int, seed: int = 0):
+    """Parole con timestamp "veri" e segmenti costruiti sopra di esse."""
+    rng = np.random.default_rng(seed)
+    words: list[TimedWord] = []
+    segments: list[tuple[float, float, str]] = []
+    current: list[TimedWord] = []
+    position = 0.0
+    while position < minutes * 60:
+        length = int(rng.integers(2, 10))
+        duration = length * float(rng.uniform(0.05, 0.09))
+        word = TimedWord(position, position + duration, " " + "x" * length)
+        words.append(word)
+        current.append(word)
+        pause = float(rng.exponential(0.15)) + (
+            float(rng.uniform(0.5, 3)) if rng.random() < 0.05 else 0
+        )
+        position += duration + pause
+        if pause > 0.5 or current[-1].end - current[0].start > 10:
+            segments.append(_segment(current))
+            current = []
+    if current:
+        segments.append(_segment(current))
+    return words, segments
+
+
+def _segment(words: list[TimedWord]) -> tuple[float, float, str]:
+    return words[0].start, words[-1].end, "".join(w.text for w in words)
+
+
+def segment_words(segments) -> list[TimedWord]:
+    return [
+        w for start, end, text in segments for w in interpolate_words(start, end, text)
+    ]
+
+
+def _bucket_segments(segments, interval: int):
+    return bucket_words(segment_words(segments), interval)
+
+
+def agreement(exact: list[TimedWord], estimated: list[TimedWord], interval: int):
+    """Quota di parole nello stesso intervallo (sequenze di parole allineate)."""
+    if len(exact) != len(estimated):
+        return None
+    same = sum(
+        int(a.start // interval) == int(b.start // interval)
+        for a, b in zip(exact, estimated, strict=True)
+    )
+    return same / len(exact) if exact else 1.0
+
+
+def report(exact: list[TimedWord], segments, repeat: int) -> None:
+    estimated = segment_words(segments)
+    print(f"{len(exact)} words, {len(segments)} segments")
+    print(f"{'interval':<10}{'agreement':>11}{'word (ms)':>12}{'segment (ms)':>14}")
+    for interval in INTERVALS:
+        share = agreement(exact, estimated, interval)
+        by_word = min(
+            timeit.repeat(
+                partial(bucket_words, exact, interval), number=1, repeat=repeat
+            )
+        )
+        by_segment = min(
+            timeit.repeat(
+                partial(_bucket_segments, segments, interval), number=1, repeat=repeat
+            )
+        )
+        shown = "n/a" if share is None else f"{share:.2%}"
+        print(
+            f"{interval:<10}{shown:>11}{by_word * 1e3:>12.2f}{by_segment * 1e3:>14.2f}"
+        )
+
+
+def real_model(path: str, model_name: str, device: str) -> None:
+    """Inferenza reale con e senza word_timestamps, poi il confronto."""
+    from faster_whisper import WhisperModel, decode_audio
+
+    audio = decode_audio(path)
+    model = WhisperModel(model_name, device=device)
+    runs = {}
+    for word_timestamps in (True, False):
+        started = time.perf_counter()
+        segments, _info = model.transcribe(audio, word_timestamps=word_timestamps)
+        runs[word_timestamps] = list(segments)
+        elapsed = time.perf_counter() - started
+        label = "word" if word_timestamps else "segment"
+        print(f"inference ({label}): {elapsed:.1f}s for {audio.size / 16000:.0f}s")
+    exact = [
+        TimedWord(w.start, w.end, w.word) for s in runs[True] for w in s.words or []
+    ]
+    report(exact, [(s.start, s.end, s.text) for s in runs[False]], repeat=3)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--minutes", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--audio", help="media da trascrivere con un modello reale")
+    parser.add_argument("--model", default="small")
+    parser.add_argument("--device", default="auto")
+    args = parser.parse_args()
+
+    if args.audio:
+        real_model(args.audio, args.model, args.device)
+        return
+    words, segments = synthetic_transcript(args.minutes)
+    report(words, segments, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
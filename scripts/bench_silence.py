@@ -0,0 +1,74 @@
+"""Benchmark del pre-filtro di silenzio: loop per finestra vs versione vettoriale.
+
+Confronta la vecchia implementazione (loop Python su finestre da 1 s, un
+``np.abs(...).sum()`` per finestra) con :func:`calliope.media.silence.detect_silence`
+su audio sintetico da 1 s, 60 s e 30 min, in due casi:
+
+- ``silent``: audio muto, va scandito tutto (caso peggiore);
+- ``speech@end``: parlato solo nell'ultimo secondo (nessuna uscita anticipata
+  per il loop fino alla fine, una sola per blocco per la versione vettoriale).
+
+Uso:
+    uv run python scripts/bench_silence.py [--repeat 5]
+"""
+
+import argparse
+import timeit
+
+import numpy as np
+
+from calliope.media.silence import detect_silence
+
+SR = 16000
+THRESHOLD = 70 / SR
+DURATIONS = {"1s": 1, "60s": 60, "30min": 30 * 60}
+
+
+def legacy_detect_silence(audio: np.ndarray, sr: float, threshold: float) -> bool:
+    """L'implementazione precedente, con la soglia riportata per campione."""
+    window = int(sr)
+    if window <= 0 or len(audio) == 0:
+        return True
+    for start in range(0, len(audio), window):
+        chunk = audio[start : start + window]
+        if np.abs(chunk).sum() >= threshold * len(chunk):
+            return False
+    return True
+
+
+def _inputs(seconds: int) -> dict[str, np.ndarray]:
+    rng = np.random.default_rng(0)
+    silent = (rng.standard_normal(seconds * SR) * 1e-4).astype(np.float32)
+    speech = silent.copy()
+    speech[-SR:] += 0.1
+    return {"silent": silent, "speech@end": speech}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'input':<18}{'loop (ms)':>12}{'vector (ms)':>14}{'speedup':>10}")
+    for label, seconds in DURATIONS.items():
+        for case, audio in _inputs(seconds).items():
+            expected = legacy_detect_silence(audio, SR, THRESHOLD)
+            assert detect_silence(audio, SR, THRESHOLD) == expected
+
+            def _best(fn, audio=audio):
+                return min(
+                    timeit.repeat(
+                        lambda: fn(audio, SR, THRESHOLD), number=1, repeat=args.repeat
+                    )
+                )
+
+            loop = _best(legacy_detect_silence)
+            vector = _best(detect_silence)
+            print(
+                f"{label + ' ' + case:<18}{loop * 1e3:>12.2f}{vector * 1e3:>14.2f}"
+                f"{loop / vector:>9.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Test del micro-batcher dei vocali brevi (dispatch finto, nessun modello)."""
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from calliope.transcription.batching import STREAM_DONE, MicroBatcher
+
+
+class _RecordingDispatch:
+    """Registra i batch ricevuti e risponde a ogni clip con la sua lunghezza."""
+
+    def __init__(self):
+        self.batches: list[list] = []
+
+    async def __call__(self, clips):
+        self.batches.append(clips)
+        for clip in clips:
+            clip.emit(f"len={clip.samples.size}")
+            clip.emit(STREAM_DONE)
+
+
+async def _collect(batcher, size, language=None):
+    return [t async for t in batcher.submit(np.zeros(size), language=language)]
+
+
+async def test_clips_in_window_share_one_batch():
+    dispatch = _RecordingDispatch()
+    batcher = MicroBatcher(dispatch, window_s=0.05, max_batch=8)
+
+    out = await asyncio.gather(*(_collect(batcher, n) for n in (1, 2, 3)))
+
+    assert len(dispatch.batches) == 1
+    assert len(dispatch.batches[0]) == 3
+    # ogni richiesta riceve solo i propri segmenti
+    assert out == [["len=1"], ["len=2"], ["len=3"]]
+
+
+async def test_full_batch_flushes_without_waiting_window():
+    dispatch = _RecordingDispatch()
+    batcher = MicroBatcher(dispatch, window_s=60.0, max_batch=2)
+
+    out = await asyncio.wait_for(
+        asyncio.gather(_collect(batcher, 1), _collect(batcher, 2)), timeout=1
+    )
+
+    assert out == [["len=1"], ["len=2"]]
+    assert len(dispatch.batches) == 1
+
+
+async def test_languages_are_batched_separately():
+    dispatch = _RecordingDispatch()
+    batcher = MicroBatcher(dispatch, window_s=0.01, max_batch=8)
+
+    await asyncio.gather(
+        _collect(batcher, 1, "it"),
+        _collect(batcher, 2, "en"),
+        _collect(batcher, 3, "it"),
+    )
+
+    by_language = sorted((batch[0].language, len(batch)) for batch in dispatch.batches)
+    assert by_language == [("en", 1), ("it", 2)]
+
+
+async def test_decoding_profiles_are_batched_separately():
+    dispatch = _RecordingDispatch()
+    batcher = MicroBatcher(dispatch, window_s=0.01, max_batch=8)
+
+    async def _submit(profile):
+        return [t async for t in batcher.submit(np.zeros(1), profile=profile)]
+
+    await asyncio.gather(_submit("fast"), _submit("balanced"), _submit("fast"))
+
+    by_profile = sorted((batch[0].profile, len(batch)) for batch in dispatch.batches)
+    assert by_profile == [("balanced", 1), ("fast", 2)]
+
+
+async def test_dispatch_error_reaches_every_clip():
+    async def _boom(clips):
+        raise RuntimeError("executor closed")
+
+    batcher = MicroBatcher(_boom, window_s=0.01, max_batch=8)
+    results = await asyncio.gather(
+        _collect(batcher, 1), _collect(batcher, 2), return_exceptions=True
+    )
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+async def test_abandoned_clip_leaves_the_pending_batch():
+    dispatch = _RecordingDispatch()
+    batcher = MicroBatcher(dispatch, window_s=0.05, max_batch=8)
+    abandoned = batcher.submit(np.zeros(1))
+    waiting = asyncio.ensure_future(abandoned.__anext__())
+    await asyncio.sleep(0)
+    waiting.cancel()
+    await asyncio.gather(waiting, return_exceptions=True)
+    await abandoned.aclose()
+
+    assert await _collect(batcher, 2) == ["len=2"]
+    assert [len(batch) for batch in dispatch.batches] == [1]
+
+
+async def test_error_emitted_by_decoder_is_raised():
+    async def _fail(clips):
+        for clip in clips:
+            clip.emit(ValueError("boom"))
+
+    batcher = MicroBatcher(_fail, window_s=0.01, max_batch=8)
+    with pytest.raises(ValueError):
+        await _collect(batcher, 1)
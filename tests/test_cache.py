@@ -0,0 +1,54 @@
+"""Test della cache delle trascrizioni (LRU in memoria + livello Mongo)."""
+
+from calliope.transcription.cache import TranscriptCache, cache_key
+
+
+def test_key_includes_language_model_and_profile():
+    assert cache_key("AgAD", None, "turbo", "fast") == "AgAD:auto:turbo:fast"
+    key = cache_key("AgAD", "it", "turbo", "fast")
+    assert key != cache_key("AgAD", "en", "turbo", "fast")
+    assert key != cache_key("AgAD", "it", "large", "fast")
+    assert key != cache_key("AgAD", "it", "turbo", "accurate")
+
+
+def test_lru_evicts_least_recently_used():
+    cache = TranscriptCache(2)
+    cache.put("a", "uno")
+    cache.put("b", "due")
+    assert cache.get("a") == "uno"  # "a" diventa la più recente
+    cache.put("c", "tre")
+    assert cache.get("b") is None
+    assert cache.get("a") == "uno"
+    assert cache.get("c") == "tre"
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_zero_capacity_disables_memory_tier():
+    cache = TranscriptCache(0)
+    cache.put("a", "uno")
+    assert len(cache) == 0
+    assert cache.get("a") is None
+
+
+class TestMongoTier:
+    def test_disabled_by_default(self, storage):
+        assert storage.transcripts_collection is None
+        storage.save_transcript("a", "uno")  # no-op
+        assert storage.get_transcript("a") is None
+
+    def test_persists_and_promotes(self, monkeypatch, make_settings):
+        import mongomock
+
+        monkeypatch.setattr(
+            "calliope.storage.mongo.pymongo.MongoClient", mongomock.MongoClient
+        )
+        from calliope.storage.mongo import MongoStorage
+
+        store = MongoStorage(make_settings(transcript_cache_ttl_s=3600))
+        indexes = store.transcripts_collection.index_information()
+        assert any(info.get("expireAfterSeconds") == 3600 for info in indexes.values())
+
+        TranscriptCache(16, store).put("a", "uno")
+        fresh = TranscriptCache(16, store)  # es. dopo un riavvio del bot
+        assert fresh.get("a") == "uno"
+        assert len(fresh) == 1  # promossa in memoria
@@ -0,0 +1,71 @@
+"""Test della divisione in chunk e della ricucitura delle parole."""
+
+import numpy as np
+
+from calliope.transcription.chunking import (
+    Chunk,
+    Stitcher,
+    TimedWord,
+    plan_chunks,
+    stitch_words,
+)
+
+SR = 1000  # sample rate basso: i test restano veloci
+
+
+def test_short_audio_is_a_single_chunk():
+    audio = np.ones(SR * 50, dtype=np.float32)
+    assert plan_chunks(audio, SR, chunk_s=30, overlap_s=1) == [
+        Chunk(0, SR * 50, 0, SR * 50)
+    ]
+
+
+def test_cuts_fall_in_the_silence_near_each_boundary():
+    audio = np.ones(SR * 100, dtype=np.float32)
+    audio[28 * SR : 29 * SR] = 0.0  # pausa vicino ai 30 s
+    audio[62 * SR : 63 * SR] = 0.0  # pausa vicino ai 60 s
+    chunks = plan_chunks(audio, SR, chunk_s=30, overlap_s=2)
+
+    cuts = [c.own_start for c in chunks[1:]]
+    assert len(cuts) == 2
+    assert 28 * SR <= cuts[0] < 29 * SR
+    assert 62 * SR <= cuts[1] < 63 * SR
+    # tratti posseduti contigui e che coprono tutto l'audio
+    assert chunks[0].own_start == 0 and chunks[-1].own_end == len(audio)
+    for left, right in zip(chunks[:-1], chunks[1:], strict=True):
+        assert left.own_end == right.own_start
+        assert left.end == left.own_end + 2 * SR  # sovrapposizione
+        assert right.start == right.own_start - 2 * SR
+
+
+def test_stitch_drops_words_duplicated_in_the_overlap():
+    chunks = [Chunk(0, 12, 0, 10), Chunk(8, 20, 10, 20)]
+    first = [TimedWord(1, 2, " a"), TimedWord(8.5, 9, " b"), TimedWord(10.5, 11, " c")]
+    second = [
+        TimedWord(8.5, 9, " b"),
+        TimedWord(10.5, 11, " c"),
+        TimedWord(15, 16, " d"),
+    ]
+    stitched = stitch_words([first, second], chunks, sr=1)
+    assert [w.text for w in stitched] == [" a", " b", " c", " d"]
+
+
+def test_stitch_drops_boundary_duplicate_with_shifted_timestamps():
+    chunks = [Chunk(0, 12, 0, 10), Chunk(8, 20, 10, 20)]
+    first = [TimedWord(9.6, 9.9, " ciao")]
+    second = [TimedWord(9.9, 10.3, " Ciao"), TimedWord(12, 13, " mondo")]
+    stitched = stitch_words([first, second], chunks, sr=1)
+    assert [w.text for w in stitched] == [" ciao", " mondo"]
+
+
+def test_stitcher_releases_words_in_audio_order():
+    chunks = [Chunk(0, 12, 0, 10), Chunk(8, 22, 10, 20), Chunk(18, 30, 20, 30)]
+    words = [
+        [TimedWord(1, 2, " a")],
+        [TimedWord(12, 13, " b")],
+        [TimedWord(25, 26, " c")],
+    ]
+    stitcher = Stitcher(chunks, sr=1)
+    assert stitcher.add(2, words[2]) == []  # i precedenti non sono finiti
+    assert stitcher.add(0, words[0]) == words[0]
+    assert stitcher.add(1, words[1]) == words[1] + words[2]
@@ -0,0 +1,50 @@
+"""Test dei profili di decodifica (scelta per percorso e durata)."""
+
+import pytest
+
+from calliope.settings import DecodingProfile, DecodingRule
+from calliope.transcription.decoding import DecodingProfiles
+
+RULES = [
+    DecodingRule(profile="fast", path="voice", max_duration_s=20),
+    DecodingRule(profile="accurate", min_duration_s=3600),
+]
+DEFAULTS = {"voice": "balanced", "video": "balanced"}
+
+
+def test_first_matching_rule_wins():
+    profiles = DecodingProfiles({}, RULES, DEFAULTS)
+    assert profiles.select("voice", 5) == "fast"
+    assert profiles.select("video", 5) == "balanced"  # regola solo per i vocali
+    assert profiles.select("voice", 60) == "balanced"
+    assert profiles.select("video", 4000) == "accurate"
+
+
+def test_builtin_kwargs():
+    profiles = DecodingProfiles({}, [], DEFAULTS)
+    assert profiles.kwargs("balanced") == {}  # default di faster-whisper
+    assert profiles.kwargs("fast") == {
+        "beam_size": 1,
+        "best_of": 1,
+        "temperature": 0.0,
+        "condition_on_previous_text": False,
+        "without_timestamps": True,
+    }
+
+
+def test_configured_profiles_extend_and_override_builtins():
+    profiles = DecodingProfiles(
+        {"fast": DecodingProfile(beam_size=2), "wide": DecodingProfile(beam_size=10)},
+        [],
+        {"voice": "fast", "video": "wide"},
+    )
+    assert profiles.kwargs("fast") == {"beam_size": 2}
+    assert profiles.select("video", 60) == "wide"
+    assert "accurate" in profiles.profiles
+
+
+def test_unknown_profile_is_rejected():
+    with pytest.raises(ValueError, match="greedy"):
+        DecodingProfiles({}, [DecodingRule(profile="greedy")], DEFAULTS)
+    with pytest.raises(ValueError, match="turbo"):
+        DecodingProfiles({}, [], {"voice": "turbo", "video": "balanced"})
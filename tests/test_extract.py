@@ -1,16 +1,28 @@
-"""Test dell'estrazione media (parti pure: attachment, durata, limiti)."""
+"""Test dell'estrazione media (attachment, durata, limiti, download in streaming).
 
+ffmpeg è sostituito da un processo Python che copia stdin su stdout: si
+verifica il plumbing delle pipe, non la decodifica.
+"""
+
+import sys
 from datetime import timedelta
+from pathlib import Path
 from types import SimpleNamespace
+from typing import Any
 
+import httpx
+import numpy as np
 import pytest
+from telegram.error import NetworkError
 
+from calliope.media import extract
 from calliope.media.extract import (
     MediaTooLongError,
     UnsupportedMediaError,
     _extract_attachment,
     _to_seconds,
     download_audio,
+    needs_seekable_input,
 )
 
 
@@ -64,3 +76,190 @@ async def test_download_rejects_over_limit_before_download():
     assert exc.value.duration == 100
     assert exc.value.limit == 60
     assert bot.get_file_called is False
+
+
+def _box(kind: bytes, payload: bytes = b"") -> bytes:
+    return (8 + len(payload)).to_bytes(4, "big") + kind + payload
+
+
+class TestNeedsSeekableInput:
+    def test_ogg_streams(self):
+        assert needs_seekable_input(b"OggS\x00\x02" + b"\x00" * 20) is False
+
+    def test_faststart_mp4_streams(self):
+        head = _box(b"ftyp", b"isom" * 4) + _box(b"moov")
+        assert needs_seekable_input(head) is False
+
+    def test_moov_at_end_needs_a_file(self):
+        head = _box(b"ftyp", b"isom" * 4) + _box(b"free") + _box(b"mdat", b"x" * 8)
+        assert needs_seekable_input(head) is True
+
+    def test_undecided_until_next_box_arrives(self):
+        assert needs_seekable_input(b"\x00\x00") is None
+        assert needs_seekable_input(_box(b"ftyp", b"isom" * 4)) is None
+
+    def test_large_box_size(self):
+        wide = (1).to_bytes(4, "big") + b"wide" + (16).to_bytes(8, "big")
+        assert needs_seekable_input(_box(b"ftyp") + wide + _box(b"mdat")) is True
+
+
+def _echo_ffmpeg(source):
+    """Al posto di ffmpeg: copia l'input (stdin o file) su stdout."""
+    if source == "pipe:0":
+        code = "import sys; sys.stdout.buffer.write(sys.stdin.buffer.read())"
+        return [sys.executable, "-c", code]
+    code = f"import sys; sys.stdout.buffer.write(open({source!r}, 'rb').read())"
+    return [sys.executable, "-c", code]
+
+
+async def _chunks(data: bytes, size: int = 64 * 1024):
+    for start in range(0, len(data), size):
+        yield data[start : start + size]
+
+
+class TestStreamingDecode:
+    async def test_pipes_chunks_through_the_decoder(self, monkeypatch):
+        monkeypatch.setattr(extract, "_ffmpeg_args", _echo_ffmpeg)
+        samples = np.linspace(-1, 1, 1_000_000, dtype=np.float32)  # > buffer pipe
+        decoded = await extract._decode_stream(_chunks(samples.tobytes()))
+        np.testing.assert_array_equal(decoded, samples)
+
+    async def test_decoder_failure_is_reported(self, monkeypatch):
+        code = "import sys; sys.stderr.write('Invalid data\\n'); sys.exit(1)"
+        monkeypatch.setattr(
+            extract, "_ffmpeg_args", lambda source: [sys.executable, "-c", code]
+        )
+        with pytest.raises(RuntimeError, match="Invalid data"):
+            await extract._decode_stream(_chunks(b"\x00" * 1_000_000))
+
+    async def test_download_error_stops_the_decoder(self, monkeypatch):
+        monkeypatch.setattr(extract, "_ffmpeg_args", _echo_ffmpeg)
+
+        async def _broken():
+            yield b"\x00" * 1024
+            raise NetworkError("connection reset")
+
+        with pytest.raises(NetworkError):
+            await extract._decode_stream(_broken())
+
+
+class _DownloadBot:
+    def __init__(self, path):
+        self.file = SimpleNamespace(file_path=path, downloaded=False)
+
+        async def _to_drive(target):
+            self.file.downloaded = True
+            Path(target).write_bytes(np.ones(4, dtype=np.float32).tobytes())
+
+        self.file.download_to_drive = _to_drive
+
+    async def get_file(self, file_id):
+        return self.file
+
+
+class TestDownloadRouting:
+    URL = "https://api.telegram.org/file/botTOKEN/voice/file_1.oga"
+
+    @pytest.fixture
+    def network(self, monkeypatch):
+        """Download finto: i byte di ``payload`` a blocchi da 7."""
+        payload: dict[str, Any] = {}
+
+        async def _download(telegram_file, **kw):
+            payload["download_kw"] = kw
+            async for chunk in _chunks(payload["data"], size=7):
+                yield chunk
+
+        monkeypatch.setattr(extract, "_ffmpeg_args", _echo_ffmpeg)
+        monkeypatch.setattr(extract, "_download_chunks", _download)
+        return payload
+
+    async def test_voice_is_decoded_while_downloading(self, network, monkeypatch):
+        files = []
+        monkeypatch.setattr(extract, "_decode_via_file", files.append)
+        samples = np.arange(8, dtype=np.float32)
+        network["data"] = samples.tobytes()
+        bot = _DownloadBot(self.URL)
+        msg = _msg(voice=SimpleNamespace(file_id="v", duration=1))
+        audio = await download_audio(bot, msg)
+        np.testing.assert_array_equal(audio.samples, samples)
+        assert not bot.file.downloaded and files == []
+
+    async def test_download_uses_the_bot_proxy_and_timeout(self, network):
+        network["data"] = np.zeros(2, dtype=np.float32).tobytes()
+        msg = _msg(voice=SimpleNamespace(file_id="v", duration=1))
+        await download_audio(
+            _DownloadBot(self.URL), msg, proxy="http://proxy:3128", timeout_s=5.0
+        )
+        assert network["download_kw"] == {
+            "proxy": "http://proxy:3128",
+            "timeout_s": 5.0,
+        }
+
+    async def test_mp4_with_moov_at_end_falls_back_to_a_file(self, network):
+        head = _box(b"ftyp", b"isom" * 4) + _box(b"mdat")
+        network["data"] = head + np.zeros(2, dtype=np.float32).tobytes()
+        msg = _msg(video_note=SimpleNamespace(file_id="vn", duration=1))
+        audio = await download_audio(_DownloadBot(self.URL), msg)
+        # il finto ffmpeg ha letto dal file tutti i byte, testa compresa
+        assert audio.samples.tobytes() == network["data"]
+
+    async def test_video_keeps_the_temp_file(self, network):
+        bot = _DownloadBot(self.URL)
+        msg = _msg(video=SimpleNamespace(file_id="vid", duration=1))
+        audio = await download_audio(bot, msg)
+        assert bot.file.downloaded and audio.samples.size == 4
+
+    async def test_local_bot_api_file_is_not_streamed(self, network):
+        bot = _DownloadBot("/var/lib/telegram-bot-api/voice/file_1.oga")
+        msg = _msg(voice=SimpleNamespace(file_id="v", duration=1))
+        await download_audio(bot, msg)
+        assert bot.file.downloaded
+
+    async def test_prepended_stream_is_closed_when_the_decoder_fails(
+        self, network, monkeypatch
+    ):
+        code = "import sys; sys.stderr.write('Invalid data\\n'); sys.exit(1)"
+        monkeypatch.setattr(
+            extract, "_ffmpeg_args", lambda source: [sys.executable, "-c", code]
+        )
+        closed = []
+        prepend = extract._prepend
+
+        async def _tracked(head, chunks):
+            try:
+                async for chunk in prepend(head, chunks):
+                    yield chunk
+            finally:
+                closed.append(True)
+
+        monkeypatch.setattr(extract, "_prepend", _tracked)
+        network["data"] = b"OggS" + b"\x00" * 1_000_000
+        msg = _msg(voice=SimpleNamespace(file_id="v", duration=1))
+        with pytest.raises(RuntimeError, match="Invalid data"):
+            await download_audio(_DownloadBot(self.URL), msg)
+        assert closed == [True]  # chiuso subito, non dal garbage collector
+
+
+class _BrokenBody(httpx.AsyncByteStream):
+    """Corpo della risposta interrotto dopo il primo blocco."""
+
+    async def __aiter__(self):
+        yield b"OggS" + b"\x00" * 64
+        raise httpx.ReadError("connection reset")
+
+
+async def test_interrupted_download_is_a_network_error(monkeypatch):
+    client = httpx.AsyncClient
+    transport = httpx.MockTransport(
+        lambda request: httpx.Response(200, stream=_BrokenBody())
+    )
+    monkeypatch.setattr(
+        extract.httpx,
+        "AsyncClient",
+        lambda **kw: client(transport=transport, timeout=kw["timeout"]),
+    )
+    monkeypatch.setattr(extract, "_ffmpeg_args", _echo_ffmpeg)
+    msg = _msg(voice=SimpleNamespace(file_id="v", duration=1))
+    with pytest.raises(NetworkError, match="ReadError"):
+        await download_audio(_DownloadBot(TestDownloadRouting.URL), msg)
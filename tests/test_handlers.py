@@ -1,10 +1,23 @@
 """Test degli handler con Update/Context finti (no rete, no Telegram reale)."""
 
+import asyncio
+from contextlib import nullcontext
 from types import SimpleNamespace
 
+import numpy as np
+import pytest
+from telegram.error import NetworkError
+
+import calliope.handlers.transcribe as transcribe_mod
 from calliope.handlers.admin import admin
 from calliope.handlers.language import change_language
 from calliope.handlers.start import start
+from calliope.handlers.stop import stop_callback, track_job
+from calliope.handlers.transcribe import stt
+from calliope.transcription.cache import TranscriptCache, cache_key
+from calliope.transcription.language import LanguagePinner
+from calliope.transcription.scheduler import ChatQueueFullError, OverloadedError
+from calliope.transcription.singleflight import FlightOutcome, SingleFlight
 
 
 class RecordingMessage:
@@ -13,6 +26,7 @@ class RecordingMessage:
         self.chat = chat
         self.text = text
         self.replies: list[str] = []
+        self.edits: list[str] = []
         self.reactions: list[str] = []
 
     async def reply_text(self, text, **kw):
@@ -23,6 +37,10 @@ class RecordingMessage:
         self.replies.append(text)
         return self
 
+    async def edit_text(self, text, **kw):
+        self.edits.append(text)
+        return self
+
     async def set_reaction(self, emoji):
         self.reactions.append(emoji)
 
@@ -34,6 +52,9 @@ class FakeBot:
     async def send_message(self, chat_id, text, **kw):
         self.sent.append((chat_id, text))
 
+    async def send_chat_action(self, chat_id, action, **kw):
+        pass
+
 
 def make_handler_update(*, user_id=1, username="alice", chat_type="private", text=None):
     user = SimpleNamespace(
@@ -54,8 +75,14 @@ def make_handler_update(*, user_id=1, username="alice", chat_type="private", tex
     )
 
 
-def make_ctx(storage=None, args=None, transcriber=None):
-    bot_data = {}
+def make_ctx(storage=None, args=None, transcriber=None, cache=None):
+    bot_data = {
+        "transcript_cache": cache or TranscriptCache(16),
+        "flights": SingleFlight(),
+        "language_pinner": LanguagePinner(
+            None, min_detections=3, min_probability=0.9, recheck_every=20
+        ),
+    }
     if storage is not None:
         bot_data["storage"] = storage
     if transcriber is not None:
@@ -120,3 +147,362 @@ class TestAdminAuthorization:
         await admin(upd, ctx)
         assert len(upd.message.replies) == 1
         assert "Admin commands" in upd.message.replies[0]
+
+    async def test_model_swap_reports_outcome(self, storage, monkeypatch):
+        import calliope.notifier as notifier
+
+        class _Swappable:
+            model_name = "turbo"
+
+            async def swap_model(self, name):
+                if name == "missing":
+                    raise ValueError("no such model")
+                self.model_name = name
+                return 12.34
+
+        monkeypatch.setattr(notifier.settings, "admin_chat_id", 111)
+        transcriber = _Swappable()
+        upd = make_handler_update(user_id=111)
+        await admin(upd, make_ctx(args=["model", "small"], transcriber=transcriber))
+        assert upd.message.replies == [
+            "⏳ Loading small…",
+            "✅ Switched from turbo to small (loaded in 12.3s).",
+        ]
+        upd = make_handler_update(user_id=111)
+        await admin(upd, make_ctx(args=["model", "missing"], transcriber=transcriber))
+        assert "no such model" in upd.message.replies[-1]
+        assert transcriber.model_name == "small"  # il modello precedente resta
+
+    async def test_status_reads_stats_once(self, storage, monkeypatch):
+        import calliope.notifier as notifier
+
+        class _Stats:
+            device = "cpu"
+            loaded = True
+            calls = 0
+
+            async def stats(self):
+                self.calls += 1
+                return {"queue": (2, 1), "models": [("turbo", 5, 0.25)]}
+
+        monkeypatch.setattr(notifier.settings, "admin_chat_id", 111)
+        transcriber = _Stats()
+        upd = make_handler_update(user_id=111)
+        await admin(upd, make_ctx(args=["status"], transcriber=transcriber))
+        assert transcriber.calls == 1
+        assert "Queue: 2 waiting, 1 running" in upd.message.replies[0]
+        assert "turbo: 5 served, RTF 0.25" in upd.message.replies[0]
+
+
+class _RejectingTranscriber:
+    model_name = "fake-model"
+
+    def __init__(self, error):
+        self.error = error
+        self.admitted = []
+
+    def route(self, duration, language):
+        return self.model_name
+
+    def decoding_profile(self, path, duration):
+        return "balanced"
+
+    async def admit(self, chat_id, **kw):
+        self.admitted.append(kw)
+        raise self.error
+
+
+class _WorkerRejectingTranscriber(_RejectingTranscriber):
+    """Ammette la richiesta, ma la rifiuta allo streaming (come il worker
+    remoto quando la coda si riempie durante il download)."""
+
+    loaded = True
+
+    async def admit(self, chat_id, **kw):
+        self.admitted.append(kw)
+        return nullcontext()
+
+    def wants_preview(self, duration):
+        return False
+
+    async def stream_segments(self, samples, **kw):
+        raise self.error
+        yield  # generatore asincrono, come il transcriber vero
+
+
+class _PreviewTranscriber(_WorkerRejectingTranscriber):
+    """Anteprima immediata, passata definitiva che si ferma a metà."""
+
+    preview_lane = "preview:tiny"
+
+    def __init__(self):
+        super().__init__(None)
+        self.refining = asyncio.Event()
+
+    def wants_preview(self, duration):
+        return True
+
+    async def stream_segments(self, samples, model_name=None, **kw):
+        if model_name == self.preview_lane:
+            yield "anteprima completa"
+            return
+        yield "definitivo "
+        self.refining.set()
+        await asyncio.Event().wait()  # finché non arriva lo stop
+
+
+def make_voice_update(user_id=3, duration=12):
+    upd = make_handler_update(user_id=user_id)
+    upd.message.chat_id = upd.effective_chat.id
+    upd.message.voice = SimpleNamespace(
+        file_id="v", file_unique_id="uv", duration=duration
+    )
+    upd.message.video_note = None
+    upd.message.video = None
+    return upd
+
+
+class TestSttAdmission:
+    async def test_rejects_when_chat_queue_is_full(self, storage):
+        upd = make_voice_update()
+        ctx = make_ctx(
+            storage=storage,
+            transcriber=_RejectingTranscriber(ChatQueueFullError(3, 10)),
+        )
+        await stt(upd, ctx)
+        assert len(upd.message.replies) == 1
+        assert "already waiting" in upd.message.replies[0]
+
+    async def test_rejects_when_overloaded_before_download(self, storage):
+        upd = make_voice_update(duration=40)
+        transcriber = _RejectingTranscriber(OverloadedError(900, 300))
+        ctx = make_ctx(storage=storage, transcriber=transcriber)
+        await stt(upd, ctx)  # FakeBot non ha get_file: un download fallirebbe
+        assert transcriber.admitted[0]["duration"] == 40
+        assert "busy" in upd.message.replies[0]
+        assert "15m" in upd.message.replies[0]
+
+    async def test_rejection_while_streaming_is_reported(self, storage, monkeypatch):
+        async def _download(bot, message, **kw):
+            samples = np.zeros(16000, dtype=np.float32)
+            return SimpleNamespace(samples=samples, sample_rate=16000, duration=12)
+
+        monkeypatch.setattr(transcribe_mod, "download_audio", _download)
+        monkeypatch.setattr(transcribe_mod, "detect_silence", lambda *a: False)
+        upd = make_voice_update()
+        upd.message.message_id = 9
+        transcriber = _WorkerRejectingTranscriber(OverloadedError(900, 300))
+        ctx = make_ctx(storage=storage, transcriber=transcriber)
+        await stt(upd, ctx)
+        # il placeholder diventa il messaggio di rifiuto
+        assert upd.message.replies == ["[...]"]
+        assert "busy" in upd.message.edits[-1]
+        assert (
+            ctx.bot_data["flights"].get(cache_key("uv", None, "fake-model", "balanced"))
+            is None
+        )
+
+    async def test_interrupted_download_is_reported(self, storage, monkeypatch):
+        async def _download(bot, message, **kw):
+            raise NetworkError("File download failed: ReadError")
+
+        monkeypatch.setattr(transcribe_mod, "download_audio", _download)
+        upd = make_voice_update()
+        transcriber = _WorkerRejectingTranscriber(OverloadedError(900, 300))
+        ctx = make_ctx(storage=storage, transcriber=transcriber)
+        await stt(upd, ctx)
+        assert upd.message.replies == [
+            "Couldn't download this message (is it too large?)."
+        ]
+
+    async def test_stop_during_refine_drops_the_preview(self, storage, monkeypatch):
+        async def _download(bot, message, **kw):
+            samples = np.zeros(16000, dtype=np.float32)
+            return SimpleNamespace(samples=samples, sample_rate=16000, duration=60)
+
+        monkeypatch.setattr(transcribe_mod, "download_audio", _download)
+        monkeypatch.setattr(transcribe_mod, "detect_silence", lambda *a: False)
+        upd = make_voice_update(duration=60)
+        upd.message.message_id = 9
+        transcriber = _PreviewTranscriber()
+        ctx = make_ctx(storage=storage, transcriber=transcriber)
+        handler = asyncio.ensure_future(stt(upd, ctx))
+        await asyncio.wait_for(transcriber.refining.wait(), timeout=2)
+        ctx.bot_data["running_jobs"][f"{upd.message.chat_id}:9"].stop()
+        await handler
+        # al posto dell'anteprima: la parte definitiva più il marcatore
+        assert upd.message.edits[-1] == "definitivo\n\n⏹ Stopped"
+
+    async def test_cached_transcript_skips_queue_and_download(self, storage):
+        upd = make_voice_update(duration=40)
+        # sovraccarico: senza la cache la richiesta sarebbe rifiutata
+        transcriber = _RejectingTranscriber(OverloadedError(900, 300))
+        cache = TranscriptCache(16)
+        cache.put(cache_key("uv", None, "fake-model", "balanced"), "ciao dalla cache")
+        ctx = make_ctx(storage=storage, transcriber=transcriber, cache=cache)
+        await stt(upd, ctx)
+        assert transcriber.admitted == []
+        assert upd.message.edits[-1] == "ciao dalla cache"
+        assert storage.get_user_stats(upd)["times_used"] == 1
+
+    async def test_learned_language_is_kept_out_of_routing_and_cache(self, storage):
+        upd = make_voice_update(duration=40)
+        routed = []
+
+        class _Routing(_RejectingTranscriber):
+            def route(self, duration, language):
+                routed.append(language)
+                return self.model_name
+
+        cache = TranscriptCache(16)
+        cache.put(cache_key("uv", None, "fake-model", "balanced"), "dalla cache")
+        ctx = make_ctx(
+            storage=storage,
+            transcriber=_Routing(OverloadedError(900, 300)),
+            cache=cache,
+        )
+        pinner = ctx.bot_data["language_pinner"]
+        for _ in range(3):
+            pinner.observe(upd.message.chat_id, "it", 0.99)
+        assert pinner._state(upd.message.chat_id).pinned == "it"
+        await stt(upd, ctx)
+        assert routed == [None]  # il router non vede la lingua imparata
+        assert upd.message.edits[-1] == "dalla cache"
+        # risposta dalla cache: nessuna richiesta servita con la lingua fissata
+        assert pinner._state(upd.message.chat_id).served == 0
+
+    async def test_learned_language_is_used_for_decoding(self, storage, monkeypatch):
+        async def _download(bot, message, **kw):
+            samples = np.zeros(16000, dtype=np.float32)
+            return SimpleNamespace(samples=samples, sample_rate=16000, duration=12)
+
+        monkeypatch.setattr(transcribe_mod, "download_audio", _download)
+        monkeypatch.setattr(transcribe_mod, "detect_silence", lambda *a: False)
+        decoded = []
+
+        class _Decoding(_WorkerRejectingTranscriber):
+            async def stream_segments(self, samples, language=None, **kw):
+                decoded.append(language)
+                yield "ciao"
+
+        upd = make_voice_update()
+        upd.message.message_id = 9
+        ctx = make_ctx(storage=storage, transcriber=_Decoding(None))
+        pinner = ctx.bot_data["language_pinner"]
+        for _ in range(3):
+            pinner.observe(upd.message.chat_id, "it", 0.99)
+        await stt(upd, ctx)
+        assert decoded == ["it"]
+        assert pinner._state(upd.message.chat_id).served == 1
+
+    async def test_identical_request_joins_running_flight(self, storage):
+        upd = make_voice_update(duration=40)
+        transcriber = _RejectingTranscriber(OverloadedError(900, 300))
+        ctx = make_ctx(storage=storage, transcriber=transcriber)
+        flights = ctx.bot_data["flights"]
+        with flights.lead(cache_key("uv", None, "fake-model", "balanced")) as flight:
+            flight.publish("già ")
+            follower = asyncio.create_task(stt(upd, ctx))
+            await asyncio.sleep(0)
+            flight.publish("prodotto")
+            flight.close(FlightOutcome.DONE)
+            await follower
+
+        assert transcriber.admitted == []  # nessuna seconda inferenza accodata
+        assert upd.message.edits[-1] == "già prodotto"
+        assert storage.get_user_stats(upd)["times_used"] == 1
+
+
+class _RecordingJobQueue:
+    def __init__(self):
+        self.jobs = []
+
+    def enqueue(self, kind, **job):
+        self.jobs.append((kind, job))
+        return True
+
+
+class TestJobQueueMode:
+    async def test_stt_only_enqueues(self, storage):
+        upd = make_voice_update(duration=40)
+        upd.message.message_id = 77
+        upd.to_dict = lambda: {"update_id": 1}
+        # sovraccarico: se l'handler trascrivesse risponderebbe "busy"
+        transcriber = _RejectingTranscriber(OverloadedError(900, 300))
+        ctx = make_ctx(storage=storage, transcriber=transcriber)
+        queue = ctx.bot_data["job_queue"] = _RecordingJobQueue()
+        await stt(upd, ctx)
+
+        [(kind, job)] = queue.jobs
+        assert kind == "stt"
+        assert job["file_id"] == "v" and job["message_id"] == 77
+        assert job["priority"] == 0 and job["update"] == {"update_id": 1}
+        assert transcriber.admitted == [] and upd.message.replies == []
+        assert upd.message.reactions == ["✍"]
+
+    async def test_stt_transcribes_inline_when_enqueue_fails(self, storage):
+        class _BrokenQueue:
+            def enqueue(self, kind, **job):
+                raise ConnectionError("mongo down")
+
+        upd = make_voice_update()
+        upd.message.message_id = 77
+        upd.to_dict = lambda: {}
+        transcriber = _RejectingTranscriber(ChatQueueFullError(3, 10))
+        ctx = make_ctx(storage=storage, transcriber=transcriber)
+        ctx.bot_data["job_queue"] = _BrokenQueue()
+        await stt(upd, ctx)
+        assert "already waiting" in upd.message.replies[0]
+
+
+def make_stop_query(key, user_id):
+    answers: list[str] = []
+
+    async def _answer(text=None, **kw):
+        answers.append(text)
+
+    query = SimpleNamespace(
+        data=f"stop:{key}", from_user=SimpleNamespace(id=user_id), answer=_answer
+    )
+    return SimpleNamespace(callback_query=query), answers
+
+
+class TestStopButton:
+    async def _running_job(self, ctx, key, user_id):
+        task = asyncio.ensure_future(asyncio.sleep(60))
+        return task, track_job(ctx.bot_data, key, user_id, task)
+
+    async def test_sender_can_stop(self):
+        ctx = make_ctx()
+        task, tracking = await self._running_job(ctx, "7:1", user_id=7)
+        with tracking as job:
+            upd, answers = make_stop_query("7:1", user_id=7)
+            await stop_callback(upd, ctx)
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        assert job.stopped
+        assert answers == ["Stopping…"]
+        assert ctx.bot_data["running_jobs"] == {}  # deregistrato a fine blocco
+
+    async def test_other_users_cannot_stop(self, monkeypatch):
+        import calliope.notifier as notifier
+
+        monkeypatch.setattr(notifier.settings, "admin_chat_id", 999)
+        ctx = make_ctx()
+        task, tracking = await self._running_job(ctx, "-100:5", user_id=7)
+        with tracking as job:
+            upd, answers = make_stop_query("-100:5", user_id=8)
+            await stop_callback(upd, ctx)
+            assert not job.stopped
+            assert "Only the sender" in answers[0]
+
+            upd, answers = make_stop_query("-100:5", user_id=999)  # l'owner sì
+            await stop_callback(upd, ctx)
+            assert job.stopped
+        task.cancel()
+
+    async def test_finished_job(self):
+        ctx = make_ctx()
+        upd, answers = make_stop_query("1:1", user_id=1)
+        await stop_callback(upd, ctx)
+        assert "already finished" in answers[0]
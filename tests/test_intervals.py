@@ -0,0 +1,115 @@
+"""Test del raggruppamento in intervalli (streaming e output del percorso video)."""
+
+import numpy as np
+import pytest
+
+from calliope.transcription.chunking import TimedWord
+from calliope.transcription.intervals import (
+    IntervalBucketer,
+    bucket_words,
+    interpolate_words,
+    join_words,
+    render_intervals,
+)
+
+
+def legacy_bucket_by_minute(words, interval_s=60):
+    """Il bucketing precedente (concatenazione ripetuta), come riferimento."""
+    buckets: dict[int, list[str]] = {}
+    total = 0.0
+    for start, end, text in words:
+        total = max(total, end)
+        buckets.setdefault(int(start // interval_s), []).append(text)
+    lines = []
+    for i in range(int(total // interval_s) + 1):
+        start, end = i * interval_s, min((i + 1) * interval_s, total)
+        clock = [
+            f"{int(t // 3600):02d}:{int((t % 3600) // 60):02d}:{int(t % 60):02d}"
+            for t in (start, end)
+        ]
+        text = ""
+        for n, w in enumerate(buckets.get(i, [])):
+            if n and w and (w[0].isalnum() or w[0] in "¿¡"):
+                text += " " + w
+            else:
+                text += w
+        lines.append(f"[{clock[0]} - {clock[1]}]: {text.strip()}")
+    return "\n".join(lines)
+
+
+def random_words(seconds, seed=0):
+    rng = np.random.default_rng(seed)
+    vocabulary = [" ciao", "mondo", ",", " ¿qué", "tal", "?", " 42", "."]
+    words, position = [], 0.0
+    while position < seconds:
+        length = float(rng.uniform(0.1, 0.8))
+        words.append(TimedWord(position, position + length, rng.choice(vocabulary)))
+        position += length + float(rng.exponential(0.5 if rng.random() < 0.9 else 40))
+    return words
+
+
+@pytest.mark.parametrize("interval_s", [30, 60, 300])
+def test_matches_legacy_bucketing(interval_s):
+    words = random_words(30 * 60, seed=interval_s)
+    expected = legacy_bucket_by_minute(words, interval_s)
+    assert render_intervals(bucket_words(words, interval_s)) == expected
+
+
+def test_empty_transcript_has_one_empty_interval():
+    assert render_intervals(bucket_words([])) == "[00:00:00 - 00:00:00]: "
+    assert render_intervals(bucket_words([]), return_dict=True) == {
+        "[00:00:00 - 00:00:00]": ""
+    }
+
+
+def test_join_words_spacing():
+    assert join_words([" Ciao", ",", " come", " stai", "?"]) == "Ciao, come stai?"
+    assert join_words(["hola", "¿qué", "tal", "?"]) == "hola ¿qué tal?"
+    assert join_words([]) == ""
+
+
+class TestStreaming:
+    def test_interval_emitted_when_decoder_moves_past_it(self):
+        bucketer = IntervalBucketer(60)
+        assert bucketer.add(TimedWord(1, 2, " a")) == []
+        assert bucketer.add(TimedWord(59, 61, " b")) == []  # inizia nel primo
+        [first] = bucketer.add(TimedWord(62, 63, " c"))
+        assert (first.start, first.end, first.text) == (0, 60, "a b")
+        [last] = bucketer.finish()
+        assert (last.start, last.end, last.text) == (60, 63, "c")
+
+    def test_gaps_emit_empty_intervals(self):
+        bucketer = IntervalBucketer(30)
+        bucketer.add(TimedWord(1, 2, " a"))
+        done = bucketer.add(TimedWord(95, 96, " b"))
+        assert [(i.start, i.text) for i in done] == [(0, "a"), (30, ""), (60, "")]
+        assert [i.label for i in bucketer.finish()] == ["[00:01:30 - 00:01:36]"]
+
+    def test_out_of_order_word_joins_current_interval(self):
+        bucketer = IntervalBucketer(60)
+        bucketer.add(TimedWord(1, 2, " a"))
+        bucketer.add(TimedWord(61, 62, " b"))
+        bucketer.add(TimedWord(59.9, 60.5, " c"))  # timestamp all'indietro
+        assert [i.text for i in bucketer.finish()] == ["b c"]
+
+
+class TestInterpolation:
+    def test_words_cover_the_segment_in_order(self):
+        words = interpolate_words(10.0, 14.0, " Ciao, come stai?")
+        assert "".join(w.text for w in words) == " Ciao, come stai?"
+        assert words[0].start == 10.0 and words[-1].end == 14.0
+        assert all(a.end == b.start for a, b in zip(words, words[1:], strict=False))
+
+    def test_time_proportional_to_characters(self):
+        a, bbb = interpolate_words(0.0, 8.0, " a bbbbb")
+        assert (a.start, a.end) == (0.0, 2.0)
+        assert (bbb.start, bbb.end) == (2.0, 8.0)
+
+    def test_segment_across_a_boundary_is_split(self):
+        # 20 caratteri in 20 s: " tre" inizia a 58 s, " quattro" a 62 s
+        words = interpolate_words(50.0, 70.0, " uno due tre quattro")
+        intervals = bucket_words(words, 60)
+        assert [i.text for i in intervals] == ["uno due tre", "quattro"]
+
+    def test_empty_segment(self):
+        assert interpolate_words(1.0, 2.0, "  ") == []
@@ -0,0 +1,241 @@
+"""Test della coda di lavori persistente (mongomock) e del runner."""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import mongomock
+import pytest
+from telegram.ext import Application
+
+from calliope import runner as runner_module
+from calliope.runner import JobRunner
+from calliope.storage.jobs import JobQueue
+
+UPDATE = {
+    "update_id": 1,
+    "message": {
+        "message_id": 10,
+        "date": 0,
+        "chat": {"id": 42, "type": "private"},
+        "from": {"id": 42, "is_bot": False, "first_name": "Alice"},
+        "voice": {"file_id": "f", "file_unique_id": "u", "duration": 3},
+    },
+}
+
+
+@pytest.fixture
+def make_queue(make_settings):
+    def _factory(**overrides) -> JobQueue:
+        db = mongomock.MongoClient().db
+        return JobQueue(db, make_settings(**overrides))
+
+    return _factory
+
+
+def enqueue(queue: JobQueue, message_id: int, priority: int = 0) -> bool:
+    return queue.enqueue(
+        "stt",
+        chat_id=42,
+        message_id=message_id,
+        file_id=f"file-{message_id}",
+        language="it",
+        priority=priority,
+        update=UPDATE,
+    )
+
+
+class TestJobQueue:
+    def test_enqueue_is_idempotent_per_message(self, make_queue):
+        queue = make_queue()
+        assert enqueue(queue, 1) is True
+        assert enqueue(queue, 1) is False  # update consegnato due volte
+        assert queue.counts() == {"queued": 1, "running": 0, "dead": 0}
+
+    def test_claim_by_priority_then_age(self, make_queue):
+        queue = make_queue()
+        enqueue(queue, 1, priority=1)
+        enqueue(queue, 2, priority=0)
+        enqueue(queue, 3, priority=0)
+        claimed = [queue.claim("a").message_id for _ in range(3)]
+        assert claimed == [2, 3, 1]
+
+    def test_job_is_claimed_once(self, make_queue):
+        queue = make_queue()
+        enqueue(queue, 1)
+        job = queue.claim("a")
+        assert job is not None and job.attempts == 1 and job.language == "it"
+        assert queue.claim("b") is None
+        assert queue.counts()["running"] == 1
+
+    def test_expired_lease_is_reclaimed(self, make_queue):
+        queue = make_queue(job_lease_s=0.05)
+        enqueue(queue, 1)
+        job = queue.claim("dead-instance")
+        time.sleep(0.1)
+        retaken = queue.claim("b")
+        assert retaken is not None and retaken.id == job.id
+        assert retaken.attempts == 2
+        # il vecchio proprietario non può più rinnovare né completare
+        assert queue.heartbeat(job, "dead-instance") is False
+        queue.complete(job, "dead-instance")
+        assert queue.counts()["running"] == 1
+
+    def test_heartbeat_keeps_the_lease(self, make_queue):
+        queue = make_queue(job_lease_s=0.2)
+        enqueue(queue, 1)
+        job = queue.claim("a")
+        time.sleep(0.1)
+        assert queue.heartbeat(job, "a") is True
+        time.sleep(0.15)  # oltre il lease originale, non oltre quello rinnovato
+        assert queue.claim("b") is None
+
+    def test_failure_retries_then_dead_letters(self, make_queue):
+        queue = make_queue(job_max_attempts=2, job_retry_backoff_s=0)
+        enqueue(queue, 1)
+        job = queue.claim("a")
+        assert queue.fail(job, "a", "boom") is False  # torna in coda
+        job = queue.claim("a")
+        assert job.attempts == 2
+        assert queue.fail(job, "a", "boom again") is True
+        assert queue.claim("a") is None
+        dead = queue.dead_collection.find_one({"_id": job.id})
+        assert dead["last_error"] == "boom again"
+        assert queue.counts() == {"queued": 0, "running": 0, "dead": 1}
+
+    def test_retry_waits_for_backoff(self, make_queue):
+        queue = make_queue(job_retry_backoff_s=60)
+        enqueue(queue, 1)
+        queue.fail(queue.claim("a"), "a", "boom")
+        assert queue.claim("a") is None
+
+    def test_crashing_job_dead_letters_at_claim(self, make_queue):
+        # Un lavoro che fa morire l'istanza non viene ripreso all'infinito.
+        queue = make_queue(job_lease_s=0.01, job_max_attempts=1)
+        enqueue(queue, 1)
+        queue.claim("a")
+        time.sleep(0.05)
+        assert queue.claim("b") is None
+        assert queue.counts()["dead"] == 1
+
+    def test_delivered_replies_survive_a_retry(self, make_queue):
+        queue = make_queue(job_retry_backoff_s=0)
+        enqueue(queue, 1)
+        job = queue.claim("a")
+        assert job.replies == []
+        queue.record_replies(job, "a", [501, 502])
+        queue.fail(job, "a", "boom")
+        assert queue.claim("a").replies == [501, 502]
+
+    def test_release_does_not_count_an_attempt(self, make_queue):
+        queue = make_queue()
+        enqueue(queue, 1)
+        queue.release(queue.claim("a"), "a")
+        assert queue.claim("b").attempts == 1
+
+
+class TestJobRunner:
+    @pytest.fixture
+    def application(self):
+        return Application.builder().token("123:abc").build()
+
+    async def test_completed_job_leaves_the_queue(
+        self, make_queue, application, monkeypatch
+    ):
+        calls = []
+
+        async def handler(update, context, language, *, admit, delivery):
+            calls.append((update.effective_message.message_id, language, admit))
+
+        monkeypatch.setitem(runner_module._HANDLERS, "stt", handler)
+        queue = make_queue()
+        enqueue(queue, 1)
+        runner = JobRunner(application, queue, concurrency=1, poll_interval_s=0.01)
+        await runner.run_job(queue.claim(runner.owner))
+        assert calls == [(10, "it", False)]
+        assert queue.counts() == {"queued": 0, "running": 0, "dead": 0}
+
+    async def test_failed_job_is_retried_then_reported(
+        self, make_queue, application, monkeypatch
+    ):
+        async def handler(update, context, language, *, admit, delivery):
+            raise RuntimeError("boom")
+
+        reported = []
+
+        async def report(update, error):
+            reported.append(str(error))
+
+        monkeypatch.setitem(runner_module._HANDLERS, "stt", handler)
+        queue = make_queue(job_max_attempts=2, job_retry_backoff_s=0)
+        enqueue(queue, 1)
+        runner = JobRunner(application, queue, concurrency=1, poll_interval_s=0.01)
+        monkeypatch.setattr(runner, "_report_failure", report)
+
+        await runner.run_job(queue.claim(runner.owner))
+        assert reported == [] and queue.counts()["queued"] == 1
+        await runner.run_job(queue.claim(runner.owner))
+        assert reported == ["boom"] and queue.counts()["dead"] == 1
+
+    async def test_retry_reuses_the_delivered_messages(
+        self, make_queue, application, monkeypatch
+    ):
+        seen = []
+
+        async def handler(update, context, language, *, admit, delivery):
+            seen.append(delivery.message_ids)
+            await delivery.record([SimpleNamespace(message_id=700)])
+            raise RuntimeError("boom")
+
+        monkeypatch.setitem(runner_module._HANDLERS, "stt", handler)
+        queue = make_queue(job_max_attempts=3, job_retry_backoff_s=0)
+        enqueue(queue, 1)
+        runner = JobRunner(application, queue, concurrency=1, poll_interval_s=0.01)
+        await runner.run_job(queue.claim(runner.owner))
+        await runner.run_job(queue.claim(runner.owner))
+        # il secondo tentativo conosce il messaggio inviato dal primo
+        assert seen == [[], [700]]
+
+    async def test_loop_drains_queue_and_stops(
+        self, make_queue, application, monkeypatch
+    ):
+        done = []
+
+        async def handler(update, context, language, *, admit, delivery):
+            done.append(update.effective_message.message_id)
+
+        monkeypatch.setitem(runner_module._HANDLERS, "stt", handler)
+        queue = make_queue()
+        for message_id in (1, 2, 3):
+            enqueue(queue, message_id)
+        runner = JobRunner(application, queue, concurrency=2, poll_interval_s=0.01)
+        runner.start()
+        for _ in range(100):
+            if queue.counts()["queued"] == queue.counts()["running"] == 0:
+                break
+            await asyncio.sleep(0.01)
+        await runner.stop()
+        assert len(done) == 3
+
+    async def test_lost_lease_cancels_the_job(
+        self, make_queue, application, monkeypatch
+    ):
+        cancelled = asyncio.Event()
+
+        async def handler(update, context, language, *, admit, delivery):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        monkeypatch.setitem(runner_module._HANDLERS, "stt", handler)
+        queue = make_queue(job_lease_s=0.03)
+        enqueue(queue, 1)
+        runner = JobRunner(application, queue, concurrency=1, poll_interval_s=0.01)
+        job = queue.claim(runner.owner)
+        monkeypatch.setattr(queue, "heartbeat", lambda job, owner: False)
+        await asyncio.wait_for(runner.run_job(job), timeout=2)
+        assert cancelled.is_set()
+        # né completato né fallito: il lavoro resta all'istanza che l'ha ripreso
+        assert queue.counts()["running"] == 1
@@ -0,0 +1,72 @@
+"""Test della lingua imparata per chat (LanguagePinner)."""
+
+from calliope.transcription.language import LanguagePinner
+
+
+def _pinner(store=None, **kw):
+    kw.setdefault("min_detections", 3)
+    kw.setdefault("min_probability", 0.9)
+    kw.setdefault("recheck_every", 5)
+    return LanguagePinner(store, **kw)
+
+
+def test_pins_after_consistent_confident_detections():
+    pinner = _pinner()
+    for _ in range(2):
+        pinner.observe(1, "it", 0.98)
+        assert pinner.language_for(1) is None
+    pinner.observe(1, "it", 0.95)
+    assert pinner.language_for(1) == "it"
+    assert pinner.language_for(2) is None  # le altre chat non sono toccate
+
+
+def test_uncertain_or_inconsistent_detections_reset_the_streak():
+    pinner = _pinner()
+    pinner.observe(1, "it", 0.99)
+    pinner.observe(1, "it", 0.99)
+    pinner.observe(1, "it", 0.5)  # incerto
+    pinner.observe(1, "it", 0.99)
+    assert pinner.language_for(1) is None
+    pinner.observe(1, "es", 0.99)  # lingua diversa
+    pinner.observe(1, "it", 0.99)
+    assert pinner.language_for(1) is None
+
+
+def test_periodic_recheck_can_unpin():
+    pinner = _pinner(min_detections=1, recheck_every=2)
+    pinner.observe(1, "it", 0.99)
+    assert pinner.language_for(1) == "it"
+    assert pinner.language_for(1) == "it"
+    assert pinner.language_for(1) is None  # re-check: si torna al rilevamento
+    pinner.observe(1, "en", 0.99)
+    assert pinner.language_for(1) == "en"  # sbloccata e subito rifissata (N=1)
+
+
+def test_recheck_confirms_pin():
+    pinner = _pinner(min_detections=1, recheck_every=1)
+    pinner.observe(1, "it", 0.99)
+    assert pinner.language_for(1) == "it"
+    assert pinner.language_for(1) is None
+    pinner.observe(1, "it", 0.99)
+    assert pinner.language_for(1) == "it"
+
+
+def test_disabled_with_zero_detections():
+    pinner = _pinner(min_detections=0)
+    pinner.observe(1, "it", 0.99)
+    assert pinner.language_for(1) is None
+
+
+def test_pin_persisted_in_storage(storage, make_update):
+    private = make_update(user_id=42)
+    group = make_update(user_id=42, chat_type="group", chat_id=-100)
+    storage.update(private, 5)
+    storage.update(group, 5)
+
+    pinner = _pinner(storage, min_detections=1)
+    pinner.observe(42, "it", 0.99)
+    pinner.observe(-100, "en", 0.99)
+
+    restarted = _pinner(storage)  # es. dopo un riavvio del bot
+    assert restarted.language_for(42) == "it"
+    assert restarted.language_for(-100) == "en"
@@ -0,0 +1,170 @@
+"""Test del backend multi-processo (ProcessReplica) con un modello fittizio.
+
+I worker sono processi veri (spawn): il modello fittizio deve essere
+importabile dal figlio, quindi è definito a livello di modulo.
+"""
+
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from calliope.transcription.process import ProcessReplica, WorkerCrashedError
+
+
+class _EchoModel:
+    """Un segmento per secondo di audio, con il valore del primo campione."""
+
+    def transcribe(self, audio, language=None, **kw):
+        if language == "crash":
+            os._exit(3)  # simula un crash nativo (es. CTranslate2)
+        if language == "boom":
+            raise ValueError("boom")
+
+        def _gen():
+            for second in range(len(audio) // 16000):
+                value = float(audio[second * 16000])
+                yield SimpleNamespace(text=f"{value:g}", start=second, end=second + 1)
+
+        info = SimpleNamespace(
+            language=language or "it", language_probability=0.9, duration=1.0
+        )
+        return _gen(), info
+
+    def detect_language(self, audio):
+        return "en", 0.8, [("en", 0.8)]
+
+
+def _load_echo():
+    return _EchoModel()
+
+
+def _load_flaky(path):
+    """Fallisce finché il contatore in ``path`` è positivo (es. OOM transitorio)."""
+    failures = int(path.read_text())
+    if failures > 0:
+        path.write_text(str(failures - 1))
+        raise MemoryError("out of memory")
+    return _EchoModel()
+
+
+@pytest.fixture
+def replica():
+    r = ProcessReplica(_load_echo, name="test-worker")
+    r.wait_ready()
+    yield r
+    r.close()
+
+
+def _audio(values):
+    return np.repeat(np.array(values, dtype=np.float32), 16000)
+
+
+def test_segments_stream_from_shared_memory(replica):
+    segments, info = replica.transcribe(_audio([1, 2, 3]), language="en")
+    assert info.language == "en"
+    assert [s.text for s in segments] == ["1", "2", "3"]
+    assert replica.detect_language(_audio([0]))[0] == "en"
+
+
+def test_abandoned_stream_does_not_leak_into_next_request(replica):
+    segments, _info = replica.transcribe(_audio(range(50)))
+    assert next(segments).text == "0"
+    # il consumer si ferma: la richiesta successiva riceve solo i suoi segmenti
+    segments, _info = replica.transcribe(_audio([7, 8]))
+    assert [s.text for s in segments] == ["7", "8"]
+
+
+def test_worker_errors_are_raised_in_the_caller(replica):
+    with pytest.raises(ValueError, match="boom"):
+        replica.transcribe(_audio([1]), language="boom")
+    segments, _info = replica.transcribe(_audio([4]))
+    assert [s.text for s in segments] == ["4"]
+
+
+def test_crashed_worker_is_restarted(replica):
+    pid = replica.pid
+    with pytest.raises(WorkerCrashedError):
+        replica.transcribe(_audio([1]), language="crash")
+    segments, _info = replica.transcribe(_audio([5]))
+    assert [s.text for s in segments] == ["5"]
+    assert replica.pid != pid
+
+
+async def test_transcriber_api_unchanged_with_process_replicas(replica):
+    from concurrent.futures import ThreadPoolExecutor
+
+    from calliope.settings import Settings
+    from calliope.transcription.decoding import DecodingProfiles
+    from calliope.transcription.pool import ReplicaPool
+    from calliope.transcription.router import ModelRouter
+    from calliope.transcription.whisper import WhisperTranscriber
+
+    t = WhisperTranscriber.__new__(WhisperTranscriber)
+    t._settings = Settings(_env_file=None, telegram_token="test-token")
+    t.device = "cpu"
+    t.model_name = t._settings.whisper_model
+    t._router = ModelRouter([], t.model_name)
+    t._profiles = DecodingProfiles.from_settings(t._settings)
+    t.preview_lane = None
+    t._pools = {t.model_name: ReplicaPool([replica])}
+    t._executor = ThreadPoolExecutor(max_workers=1)
+    t._scheduler = t._build_scheduler(t._settings)
+    t._batcher = None
+    t._init_lifecycle()
+
+    out = [text async for text in t.stream_segments(_audio([1, 2]), "en")]
+    assert out == ["1", "2"]
+
+    # consumer che si ferma a metà: la replica resta utilizzabile
+    async for _text in t.stream_segments(_audio(range(30))):
+        break
+    out = [text async for text in t.stream_segments(_audio([3]))]
+    t._executor.shutdown()
+    assert out == ["3"]
+
+
+def test_failed_restart_is_retried_with_backoff(tmp_path, monkeypatch):
+    from functools import partial
+
+    from calliope.transcription import process
+
+    monkeypatch.setattr(process, "_RESTART_BACKOFF_S", 0.01)
+    counter = tmp_path / "failures"
+    counter.write_text("0")
+    r = ProcessReplica(partial(_load_flaky, counter), name="test-flaky")
+    try:
+        r.wait_ready()
+        counter.write_text("2")  # i primi due riavvii non caricano il modello
+        with pytest.raises(WorkerCrashedError):
+            r.transcribe(_audio([1]), language="crash")
+        segments, _info = r.transcribe(_audio([6]))
+        assert [s.text for s in segments] == ["6"]
+    finally:
+        r.close()
+
+
+def test_replica_recovers_after_exhausting_restarts(tmp_path, monkeypatch):
+    from functools import partial
+
+    from calliope.transcription import process
+
+    monkeypatch.setattr(process, "_RESTART_BACKOFF_S", 0.01)
+    monkeypatch.setattr(process, "_RESTART_ATTEMPTS", 1)
+    counter = tmp_path / "failures"
+    counter.write_text("0")
+    r = ProcessReplica(partial(_load_flaky, counter), name="test-flaky")
+    try:
+        r.wait_ready()
+        counter.write_text("2")
+        with pytest.raises(WorkerCrashedError):
+            r.transcribe(_audio([1]), language="crash")
+        # riavvio + un tentativo falliscono: la richiesta fallisce...
+        with pytest.raises(WorkerCrashedError, match="failed to restart"):
+            r.transcribe(_audio([2]))
+        # ...ma la replica non resta rotta: la successiva riparte da capo
+        segments, _info = r.transcribe(_audio([3]))
+        assert [s.text for s in segments] == ["3"]
+    finally:
+        r.close()
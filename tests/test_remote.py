@@ -0,0 +1,163 @@
+"""Test del worker remoto in loopback: server e client nello stesso processo."""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from calliope.settings import Settings
+from calliope.transcription.decoding import DecodingProfiles
+from calliope.transcription.pool import ReplicaPool
+from calliope.transcription.remote import RemoteTranscriber, raise_for_error
+from calliope.transcription.router import ModelRouter
+from calliope.transcription.scheduler import (
+    ChatQueueFullError,
+    OverloadedError,
+    Priority,
+)
+from calliope.transcription.whisper import WhisperTranscriber
+from calliope.worker import _error, serve
+
+
+class _Word:
+    def __init__(self, start, end, word):
+        self.start, self.end, self.word = start, end, word
+
+
+class _Model:
+    """Segmenti fissi con parole; ``endless`` produce segmenti all'infinito."""
+
+    def __init__(self, endless=False):
+        self.endless = endless
+        self.stopped = threading.Event()
+
+    def transcribe(self, audio=None, language=None, **kw):
+        def _gen():
+            i = 0
+            try:
+                while self.endless or i < 3:
+                    yield SimpleNamespace(
+                        text=f"s{i} ", words=[_Word(i * 40.0, i * 40.0 + 1, f" w{i}")]
+                    )
+                    i += 1
+            finally:
+                self.stopped.set()
+
+        return _gen(), SimpleNamespace(language="it", language_probability=0.95)
+
+
+def _local(model, **overrides):
+    t = WhisperTranscriber.__new__(WhisperTranscriber)
+    t._settings = Settings(_env_file=None, telegram_token="test-token", **overrides)
+    t.device = "cpu"
+    t.model_name = t._settings.whisper_model
+    t._router = ModelRouter(t._settings.whisper_routes, t.model_name)
+    t._profiles = DecodingProfiles.from_settings(t._settings)
+    t.preview_lane = None
+    t._pools = {t.model_name: ReplicaPool([model])}
+    t._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="whisper")
+    t._scheduler = t._build_scheduler(t._settings)
+    t._batcher = None
+    t._init_lifecycle()
+    return t
+
+
+@pytest.fixture
+async def loopback(tmp_path):
+    """Avvia un worker su un socket temporaneo; restituisce (locale, remoto)."""
+    servers = []
+
+    async def _start(model, **overrides):
+        path = str(tmp_path / "worker.sock")
+        local = _local(model, **overrides)
+        server = await serve(local, path)
+        servers.append((server, local))
+        settings = Settings(
+            _env_file=None,
+            telegram_token="test-token",
+            inference_backend="remote",
+            worker_socket=path,
+        )
+        # il client fa un handshake sincrono: fuori dall'event loop del server
+        remote = await asyncio.to_thread(RemoteTranscriber, settings)
+        return local, remote
+
+    yield _start
+    for server, local in servers:
+        server.close()
+        await server.wait_closed()
+        local.shutdown()
+
+
+async def test_stream_matches_local(loopback):
+    local, remote = await loopback(_Model())
+    assert remote.model_name == local.model_name
+    assert remote.route(10, None) == local.model_name
+
+    audio = np.zeros(16000, dtype=np.float32)
+    infos = []
+    out = [
+        text
+        async for text in remote.stream_segments(
+            audio, "it", chat_id=5, on_info=lambda lang, p: infos.append((lang, p))
+        )
+    ]
+    assert out == ["s0 ", "s1 ", "s2 "]
+    assert infos == [("it", 0.95)]
+    stats = (await remote.stats())["models"]
+    assert stats[0][:2] == (local.model_name, 1)
+
+
+async def test_timestamps_match_local(loopback):
+    local, remote = await loopback(_Model())
+    audio = np.zeros(16000, dtype=np.float32)
+    expected = await local.transcribe_with_timestamps(audio)
+    assert await remote.transcribe_with_timestamps(audio, chat_id=5) == expected
+    assert await remote.transcribe_with_timestamps(audio, return_dict=True) == (
+        await local.transcribe_with_timestamps(audio, return_dict=True)
+    )
+
+
+async def test_closing_the_stream_stops_the_worker(loopback):
+    model = _Model(endless=True)
+    _local_t, remote = await loopback(model)
+    async for _text in remote.stream_segments(np.zeros(16000, dtype=np.float32)):
+        break
+    # la connessione chiusa annulla il job: il generatore del modello si ferma
+    assert await asyncio.to_thread(model.stopped.wait, 5)
+
+
+async def test_worker_sla_checked_before_download(loopback):
+    local, remote = await loopback(_Model(), admission_max_wait_s=1)
+    release = asyncio.Event()
+
+    async def _busy():
+        async with local._scheduler.slot(
+            cost=100, priority=Priority.INTERACTIVE, lane=local.model_name
+        ):
+            await release.wait()
+
+    busy = asyncio.create_task(_busy())
+    await asyncio.sleep(0)
+    # la coda è sul worker: il bot la scopre con ``admit``, senza audio
+    with pytest.raises(OverloadedError):
+        await remote.admit(5, duration=10)
+    assert remote._admission._admitted == {}  # posto locale rilasciato
+    release.set()
+    await busy
+
+    with await remote.admit(5, duration=10):
+        assert remote._admission._admitted == {5: 1}
+    assert local._scheduler._admitted == {}  # il worker non tiene il posto
+
+
+@pytest.mark.parametrize(
+    "exc", [OverloadedError(120.0, 60.0), ChatQueueFullError(7, 3)]
+)
+def test_admission_errors_cross_the_wire(exc):
+    with pytest.raises(type(exc)) as raised:
+        raise_for_error(_error(exc))
+    assert vars(raised.value) == vars(exc)
@@ -0,0 +1,33 @@
+"""Test del router dei modelli (regole per durata e lingua)."""
+
+from calliope.settings import RouteRule
+from calliope.transcription.router import ModelRouter
+
+RULES = [
+    RouteRule(model="small", max_duration_s=10, replicas=2),
+    RouteRule(model="distil-en", languages=["en"]),
+    RouteRule(model="small", min_duration_s=3600),
+]
+
+
+def test_first_matching_rule_wins():
+    router = ModelRouter(RULES, "turbo")
+    assert router.route(3, "en") == "small"  # breve: vince la prima regola
+    assert router.route(60, "en") == "distil-en"
+    assert router.route(60, "it") == "turbo"
+    assert router.route(60, None) == "turbo"  # auto-detect: niente regola per lingua
+    assert router.route(4000, "it") == "small"
+
+
+def test_models_to_load():
+    router = ModelRouter(RULES, "turbo")
+    assert router.models == {"turbo": None, "small": 2, "distil-en": 1}
+    assert ModelRouter([], "turbo").models == {"turbo": None}
+
+
+def test_served_counts():
+    router = ModelRouter(RULES, "turbo")
+    router.record("small")
+    router.record("small", 3)
+    assert router.served["small"] == 4
+    assert router.served["turbo"] == 0
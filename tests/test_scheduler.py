@@ -0,0 +1,408 @@
+"""Test dello scheduler a priorità delle trascrizioni (orologio finto)."""
+
+import asyncio
+
+import pytest
+
+from calliope.transcription.scheduler import (
+    ChatQueueFullError,
+    OverloadedError,
+    Priority,
+    TranscriptionScheduler,
+)
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _make(slots=1, aging_rate=1.0, batch_weight=4.0, clock=None):
+    return TranscriptionScheduler(
+        slots, aging_rate=aging_rate, batch_weight=batch_weight, clock=clock or _Clock()
+    )
+
+
+async def _job(scheduler, order, name, *, cost, priority=Priority.INTERACTIVE):
+    async with scheduler.slot(cost=cost, priority=priority):
+        order.append(name)
+        await asyncio.sleep(0)
+
+
+async def _run_behind_blocker(scheduler, jobs):
+    """Occupa l'unico slot, accoda ``jobs`` e poi lo libera: ritorna l'ordine."""
+    order: list[str] = []
+    release = asyncio.Event()
+
+    async def _blocker():
+        async with scheduler.slot(cost=0, priority=Priority.INTERACTIVE):
+            await release.wait()
+
+    blocker = asyncio.create_task(_blocker())
+    await asyncio.sleep(0)
+    tasks = [asyncio.create_task(job(order)) for job in jobs]
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(blocker, *tasks)
+    return order
+
+
+async def test_short_voice_note_overtakes_long_video():
+    scheduler = _make()
+    order = await _run_behind_blocker(
+        scheduler,
+        [
+            lambda o: _job(scheduler, o, "video", cost=1800, priority=Priority.BATCH),
+            lambda o: _job(scheduler, o, "voice", cost=10),
+        ],
+    )
+    assert order == ["voice", "video"]
+
+
+async def test_interactive_beats_batch_at_equal_cost():
+    scheduler = _make()
+    order = await _run_behind_blocker(
+        scheduler,
+        [
+            lambda o: _job(scheduler, o, "video", cost=60, priority=Priority.BATCH),
+            lambda o: _job(scheduler, o, "video_note", cost=60),
+        ],
+    )
+    assert order == ["video_note", "video"]
+
+
+async def test_aging_prevents_starvation():
+    clock = _Clock()
+    scheduler = _make(aging_rate=1.0, batch_weight=1.0, clock=clock)
+    order: list[str] = []
+    release = asyncio.Event()
+
+    async def _blocker():
+        async with scheduler.slot(cost=0, priority=Priority.INTERACTIVE):
+            await release.wait()
+
+    blocker = asyncio.create_task(_blocker())
+    await asyncio.sleep(0)
+    video = asyncio.create_task(_job(scheduler, order, "video", cost=100))
+    await asyncio.sleep(0)
+    clock.now = 200.0  # il video aspetta da 200 s: punteggio 100 - 200 < 0
+    voice = asyncio.create_task(_job(scheduler, order, "voice", cost=10))
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(blocker, video, voice)
+    assert order == ["video", "voice"]
+
+
+async def test_slots_bound_concurrency():
+    scheduler = _make(slots=2)
+    peak = 0
+
+    async def _work():
+        nonlocal peak
+        async with scheduler.slot(cost=1, priority=Priority.INTERACTIVE):
+            peak = max(peak, scheduler.running)
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*(_work() for _ in range(5)))
+    assert peak == 2
+    assert scheduler.running == 0
+    assert scheduler.waiting == 0
+
+
+async def test_cancelled_waiter_leaves_queue():
+    scheduler = _make()
+    release = asyncio.Event()
+
+    async def _blocker():
+        async with scheduler.slot(cost=0, priority=Priority.INTERACTIVE):
+            await release.wait()
+
+    blocker = asyncio.create_task(_blocker())
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(_job(scheduler, [], "w", cost=1))
+    await asyncio.sleep(0)
+    assert scheduler.waiting == 1
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert scheduler.waiting == 0
+    release.set()
+    await blocker
+    assert scheduler.running == 0
+
+
+class TestFairQueuing:
+    async def test_flooding_chat_does_not_monopolise(self):
+        scheduler = _make(slots=1)
+        order: list[str] = []
+        release = asyncio.Event()
+
+        async def _blocker():
+            async with scheduler.slot(cost=0, priority=Priority.INTERACTIVE):
+                await release.wait()
+
+        async def _chat_job(chat_id, name):
+            async with scheduler.slot(
+                cost=10, priority=Priority.INTERACTIVE, chat_id=chat_id
+            ):
+                order.append(name)
+                await asyncio.sleep(0)
+
+        blocker = asyncio.create_task(_blocker())
+        await asyncio.sleep(0)
+        tasks = [asyncio.create_task(_chat_job(1, f"a{i}")) for i in range(5)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(_chat_job(2, "b0")))
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(blocker, *tasks)
+
+        # b0 arriva dopo 5 vocali di A ma passa subito dopo il primo
+        assert order == ["a0", "b0", "a1", "a2", "a3", "a4"]
+
+    async def test_chat_order_preserved_across_slots(self):
+        scheduler = _make(slots=3)
+        order: list[int] = []
+        peak = {}
+
+        async def _chat_job(i, cost):
+            async with scheduler.slot(
+                cost=cost, priority=Priority.INTERACTIVE, chat_id=7
+            ):
+                peak[i] = scheduler.running
+                await asyncio.sleep(0.001 * cost)
+                order.append(i)
+
+        # costi decrescenti: senza vincolo per chat i brevi finirebbero prima
+        await asyncio.gather(*(_chat_job(i, 5 - i) for i in range(5)))
+        assert order == [0, 1, 2, 3, 4]
+        assert max(peak.values()) == 1  # un solo job per chat alla volta
+
+    async def test_weight_gives_bigger_share(self):
+        scheduler = TranscriptionScheduler(
+            1, aging_rate=1.0, batch_weight=4.0, chat_weights={2: 3.0}, clock=_Clock()
+        )
+        order: list[str] = []
+        release = asyncio.Event()
+
+        async def _blocker():
+            async with scheduler.slot(cost=0, priority=Priority.INTERACTIVE):
+                await release.wait()
+
+        async def _chat_job(chat_id, name):
+            async with scheduler.slot(
+                cost=10, priority=Priority.INTERACTIVE, chat_id=chat_id
+            ):
+                order.append(name)
+                await asyncio.sleep(0)
+
+        blocker = asyncio.create_task(_blocker())
+        await asyncio.sleep(0)
+        tasks = [asyncio.create_task(_chat_job(1, f"a{i}")) for i in range(2)]
+        tasks += [asyncio.create_task(_chat_job(2, f"b{i}")) for i in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(blocker, *tasks)
+
+        # peso 3: i tre job di B (tag 3.3, 6.7, 10) stanno prima del secondo di A (20)
+        assert order == ["b0", "b1", "a0", "b2", "a1"]
+
+    async def test_multi_chat_job_waits_for_each_chat(self):
+        scheduler = _make(slots=2)
+        order: list[str] = []
+        release = asyncio.Event()
+
+        async def _running(chat_id):
+            async with scheduler.slot(
+                cost=1, priority=Priority.INTERACTIVE, chat_id=chat_id
+            ):
+                await release.wait()
+                order.append(f"job{chat_id}")
+
+        async def _batch():
+            async with scheduler.slot(
+                cost=1, priority=Priority.INTERACTIVE, chat_ids=[1, 2]
+            ):
+                order.append("batch")
+                assert scheduler.running == 1
+
+        async def _after(chat_id):
+            async with scheduler.slot(
+                cost=1, priority=Priority.INTERACTIVE, chat_id=chat_id
+            ):
+                order.append(f"after{chat_id}")
+
+        running = asyncio.create_task(_running(1))
+        await asyncio.sleep(0)
+        batch = asyncio.create_task(_batch())
+        await asyncio.sleep(0)
+        after = asyncio.create_task(_after(2))
+        await asyncio.sleep(0)
+        # uno slot è libero, ma il batch aspetta il job della chat 1 e la chat
+        # 2 il batch, arrivato prima
+        assert order == [] and scheduler.waiting == 2
+        release.set()
+        await asyncio.gather(running, batch, after)
+        assert order == ["job1", "batch", "after2"]
+
+
+class TestAdmission:
+    def test_cap_per_chat(self):
+        scheduler = TranscriptionScheduler(
+            1, aging_rate=1.0, batch_weight=4.0, max_queued_per_chat=2
+        )
+        first = scheduler.admit(1)
+        scheduler.admit(1)
+        with pytest.raises(ChatQueueFullError) as exc:
+            scheduler.admit(1)
+        assert exc.value.limit == 2
+        scheduler.admit(2)  # le altre chat non sono toccate
+        first.release()
+        first.release()  # idempotente
+        with scheduler.admit(1):
+            pass
+
+    def test_zero_means_unlimited(self):
+        scheduler = TranscriptionScheduler(1, aging_rate=1.0, batch_weight=4.0)
+        for _ in range(100):
+            scheduler.admit(1)
+
+
+class TestWaitEstimates:
+    async def test_idle_scheduler_has_no_wait(self):
+        scheduler = _make(slots=1)
+        assert scheduler.estimate_wait(cost=60) == 0.0
+
+    async def test_rtf_measured_from_completed_jobs(self):
+        clock = _Clock()
+        scheduler = TranscriptionScheduler(
+            1, aging_rate=1.0, batch_weight=4.0, initial_rtf=1.0, clock=clock
+        )
+        async with scheduler.slot(cost=100, priority=Priority.INTERACTIVE):
+            clock.now += 10  # 100 s di audio elaborati in 10 s → rtf 0.1
+        # media mobile: 1.0 + 0.2 × (0.1 − 1.0)
+        assert scheduler.rtf == pytest.approx(0.82)
+
+    async def test_queue_position_and_eta_reported(self):
+        clock = _Clock()
+        scheduler = TranscriptionScheduler(
+            1, aging_rate=0.0, batch_weight=1.0, initial_rtf=0.5, clock=clock
+        )
+        updates: dict[str, list] = {"a": [], "b": []}
+        release = asyncio.Event()
+
+        async def _blocker():
+            async with scheduler.slot(cost=20, priority=Priority.INTERACTIVE):
+                await release.wait()
+
+        async def _queued(name, cost):
+            async with scheduler.slot(
+                cost=cost,
+                priority=Priority.INTERACTIVE,
+                on_queue=lambda pos, eta: updates[name].append((pos, eta)),
+            ):
+                await asyncio.sleep(0)
+
+        blocker = asyncio.create_task(_blocker())
+        await asyncio.sleep(0)
+        a = asyncio.create_task(_queued("a", 30))
+        await asyncio.sleep(0)
+        b = asyncio.create_task(_queued("b", 10))
+        await asyncio.sleep(0)
+
+        # b (più breve) passa davanti ad a: a scende in seconda posizione
+        assert updates["b"][-1] == (1, 10.0)  # resto del blocker: 20 × 0.5
+        assert updates["a"][-1] == (2, 15.0)  # + 10 s di audio di b × 0.5
+        # una nuova richiesta da 60 s aspetterebbe blocker + b + a
+        assert scheduler.estimate_wait(cost=60) == pytest.approx(10 + 5 + 15)
+
+        release.set()
+        await asyncio.gather(blocker, a, b)
+        assert updates["a"][-1][0] == 1  # avanzata quando b è partito
+
+    async def test_admit_rejects_above_sla(self):
+        scheduler = TranscriptionScheduler(
+            1, aging_rate=1.0, batch_weight=4.0, initial_rtf=1.0, max_wait_s=30
+        )
+        release = asyncio.Event()
+
+        async def _blocker():
+            async with scheduler.slot(cost=120, priority=Priority.INTERACTIVE):
+                await release.wait()
+
+        blocker = asyncio.create_task(_blocker())
+        await asyncio.sleep(0)
+        with pytest.raises(OverloadedError) as exc:
+            scheduler.admit(5, cost=10)
+        assert exc.value.eta_s > 30
+        release.set()
+        await blocker
+        scheduler.admit(5, cost=10)  # coda vuota: ammessa
+
+
+class TestLanes:
+    async def test_busy_lane_does_not_block_other_model(self):
+        scheduler = TranscriptionScheduler(
+            {"turbo": 1, "small": 1}, aging_rate=1.0, batch_weight=4.0
+        )
+        release = asyncio.Event()
+        order: list[str] = []
+
+        async def _blocker():
+            async with scheduler.slot(
+                cost=600, priority=Priority.INTERACTIVE, lane="turbo"
+            ):
+                await release.wait()
+
+        async def _short():
+            async with scheduler.slot(
+                cost=3, priority=Priority.INTERACTIVE, lane="small"
+            ):
+                order.append("small")
+
+        blocker = asyncio.create_task(_blocker())
+        await asyncio.sleep(0)
+        await asyncio.wait_for(_short(), timeout=1)  # parte subito nella sua corsia
+        assert order == ["small"]
+        assert scheduler.estimate_wait(cost=10, lane="small") == 0.0
+        assert scheduler.estimate_wait(cost=10, lane="turbo") > 0
+        release.set()
+        await blocker
+
+    async def test_unknown_lane_is_rejected(self):
+        scheduler = TranscriptionScheduler(
+            {"turbo": 1}, aging_rate=1.0, batch_weight=4.0
+        )
+        with pytest.raises(ValueError):
+            async with scheduler.slot(cost=1, priority=Priority.INTERACTIVE):
+                pass
+
+    async def test_renamed_lane_keeps_its_jobs(self):
+        scheduler = TranscriptionScheduler(
+            {"turbo": 1, "small": 1}, aging_rate=1.0, batch_weight=4.0
+        )
+        release = asyncio.Event()
+        order: list[str] = []
+
+        async def _job(name, lane):
+            async with scheduler.slot(cost=5, priority=Priority.INTERACTIVE, lane=lane):
+                order.append(name)
+                await release.wait()
+
+        running = asyncio.create_task(_job("running", "turbo"))
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(_job("queued", "turbo"))
+        await asyncio.sleep(0)
+        scheduler.rename_lane("turbo", "large")
+        assert scheduler.estimate_wait(cost=1, lane="large") > 0  # coda ereditata
+        assert scheduler.lane_rtf("large") == scheduler.lane_rtf("small")
+        release.set()
+        await asyncio.gather(running, queued)
+        assert order == ["running", "queued"]
+        with pytest.raises(ValueError):
+            scheduler.rename_lane("turbo", "tiny")
+        with pytest.raises(ValueError):
+            scheduler.rename_lane("large", "small")
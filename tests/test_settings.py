@@ -14,6 +14,8 @@ def test_defaults(make_settings):
     assert s.max_media_duration_s == 1800
     assert s.allowed_chat_ids == []
     assert s.log_file is None
+    assert s.parallel_chunk_s is None  # chunk paralleli opt-in
+    assert s.skip_silent_regions is False
 
 
 def test_missing_token_raises(monkeypatch):
@@ -30,8 +32,11 @@ def test_token_is_secret(make_settings):
 
 
 def test_empty_optional_becomes_none(make_settings):
-    s = make_settings(admin_chat_id="", default_language="", log_file="")
+    s = make_settings(
+        admin_chat_id="", telegram_proxy="", default_language="", log_file=""
+    )
     assert s.admin_chat_id is None
+    assert s.telegram_proxy is None
     assert s.default_language is None
     assert s.log_file is None
 
@@ -50,3 +55,47 @@ class TestAllowedChatIds:
         s = make_settings(allowed_chat_ids="123")
         assert s.chat_allowed(123) is True
         assert s.chat_allowed(999) is False
+
+
+def test_replica_pool_defaults(make_settings):
+    s = make_settings()
+    assert s.whisper_replicas == 1
+    assert s.whisper_shared_model is False
+    assert s.whisper_cpu_threads == 0
+
+
+def test_replicas_must_be_positive(make_settings):
+    with pytest.raises(ValidationError):
+        make_settings(whisper_replicas=0)
+
+
+def test_chat_weights_from_json(monkeypatch, make_settings):
+    monkeypatch.setenv("SCHEDULER_CHAT_WEIGHTS", '{"-100123": 0.5, "42": 2}')
+    s = make_settings()
+    assert s.scheduler_chat_weights == {-100123: 0.5, 42: 2.0}
+    assert s.scheduler_max_queued_per_chat == 0  # nessun limite di default
+
+
+def test_routes_parsed_from_json(monkeypatch, make_settings):
+    monkeypatch.setenv(
+        "WHISPER_ROUTES",
+        '[{"model": "small", "max_duration_s": 15}, {"model": "en", "languages": ["en"]}]',
+    )
+    s = make_settings()
+    assert [r.model for r in s.whisper_routes] == ["small", "en"]
+    assert s.whisper_routes[0].max_duration_s == 15
+    assert s.whisper_routes[1].languages == ["en"]
+
+
+def test_decoding_profiles_from_json(monkeypatch, make_settings):
+    monkeypatch.setenv(
+        "DECODING_PROFILES", '{"greedy": {"beam_size": 1, "temperature": [0.0, 0.4]}}'
+    )
+    monkeypatch.setenv(
+        "DECODING_RULES",
+        '[{"profile": "greedy", "path": "voice", "max_duration_s": 30}]',
+    )
+    s = make_settings()
+    assert s.decoding_profiles["greedy"].temperature == [0.0, 0.4]
+    assert s.decoding_rules[0].path == "voice"
+    assert s.voice_decoding_profile == s.video_decoding_profile == "balanced"
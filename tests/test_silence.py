@@ -1,33 +1,57 @@
 """Test del pre-filtro di silenzio con audio sintetico."""
 
 import numpy as np
+import pytest
 
-from calliope.media.silence import detect_silence
+from calliope.media.silence import (
+    SpeechDetector,
+    detect_silence,
+    detect_speech_regions,
+    window_levels,
+)
+from calliope.settings import Settings
 
 SR = 16000
+LEVEL = 70 / SR  # soglia di default: ampiezza media per campione
+
+
+def _reference_is_silent(audio, sr, threshold):
+    """Implementazione di riferimento: loop Python per finestra (media)."""
+    window = int(sr)
+    for start in range(0, len(audio), window):
+        chunk = audio[start : start + window]
+        if np.abs(chunk).mean() >= threshold:
+            return False
+    return True
 
 
 def test_all_silent_is_true():
     audio = np.zeros(SR * 3, dtype=np.float32)
-    assert detect_silence(audio, SR, threshold=70) is True
+    assert detect_silence(audio, SR, threshold=LEVEL) is True
 
 
 def test_all_speech_is_false():
-    # ampiezza piena su tutto l'audio → energia per finestra >> soglia
+    # ampiezza piena su tutto l'audio → media per finestra >> soglia
     audio = np.ones(SR * 3, dtype=np.float32)
-    assert detect_silence(audio, SR, threshold=70) is False
+    assert detect_silence(audio, SR, threshold=LEVEL) is False
 
 
 def test_speech_only_in_tail_is_not_silent():
     audio = np.zeros(SR * 3, dtype=np.float32)
     audio[-SR:] = 1.0  # parlato solo nell'ultimo secondo
-    assert detect_silence(audio, SR, threshold=70) is False
+    assert detect_silence(audio, SR, threshold=LEVEL) is False
 
 
 def test_speech_only_at_head_is_not_silent():
     audio = np.zeros(SR * 3, dtype=np.float32)
     audio[:SR] = 1.0  # parlato solo nel primo secondo
-    assert detect_silence(audio, SR, threshold=70) is False
+    assert detect_silence(audio, SR, threshold=LEVEL) is False
+
+
+def test_speech_after_many_chunks_is_found():
+    audio = np.zeros(SR * 199 + 500, dtype=np.float32)  # oltre più blocchi
+    audio[-10:] = 1.0  # solo nell'ultima finestra, parziale
+    assert detect_silence(audio, SR, threshold=0.001) is False
 
 
 def test_empty_audio_is_silent():
@@ -35,18 +59,112 @@ def test_empty_audio_is_silent():
 
 
 def test_threshold_boundary():
-    # una finestra con energia esattamente pari alla soglia NON è silenzio (>=)
+    # una finestra con media esattamente pari alla soglia NON è silenzio (>=)
     audio = np.zeros(SR, dtype=np.float32)
-    audio[:70] = 1.0  # somma delle ampiezze assolute = 70
-    assert detect_silence(audio, SR, threshold=70) is False
-    assert detect_silence(audio, SR, threshold=71) is True
+    audio[:80] = 1.0  # media = 80 / 16000 = 0.005 (esatta in float)
+    assert detect_silence(audio, SR, threshold=0.005) is False
+    assert detect_silence(audio, SR, threshold=0.0051) is True
+
+
+def test_threshold_independent_of_window_size():
+    # stessa ampiezza media → stesso esito a sample rate diversi
+    for sr in (8000, 16000, 48000):
+        audio = np.full(sr * 2, 0.01, dtype=np.float32)
+        assert detect_silence(audio, sr, threshold=0.005) is False
+        assert detect_silence(audio, sr, threshold=0.02) is True
+
+
+def test_partial_last_window_is_averaged_on_its_samples():
+    audio = np.zeros(SR + 100, dtype=np.float32)
+    audio[SR:] = 0.01  # ultima finestra da 100 campioni a 0.01
+    assert detect_silence(audio, SR, threshold=0.005) is False
 
 
 def test_threshold_from_settings(monkeypatch):
     # threshold=None usa settings.silence_threshold
     import calliope.media.silence as silence_mod
 
-    monkeypatch.setattr(silence_mod.settings, "silence_threshold", 10)
+    monkeypatch.setattr(silence_mod.settings, "silence_threshold", 0.001)
     audio = np.zeros(SR, dtype=np.float32)
-    audio[:20] = 1.0  # energia 20 > 10
+    audio[:20] = 1.0  # media 0.00125 > 0.001
     assert detect_silence(audio, SR) is False
+
+
+@pytest.mark.parametrize("legacy, level", [(70, 70 / 16000), (0.01, 0.01)])
+def test_legacy_threshold_converted(legacy, level):
+    s = Settings(_env_file=None, telegram_token="x", silence_threshold=legacy)
+    assert s.silence_threshold == pytest.approx(level)
+
+
+def test_matches_reference_loop():
+    rng = np.random.default_rng(1)
+    for _ in range(30):
+        n = int(rng.integers(1, SR * 5))
+        audio = (rng.random(n, dtype=np.float32) * 0.01).astype(np.float32)
+        threshold = float(rng.uniform(0.004, 0.006))
+        assert detect_silence(audio, SR, threshold) == _reference_is_silent(
+            audio, SR, threshold
+        )
+
+
+def test_window_levels():
+    audio = np.array([1, -1, 0.5, -0.5, 2], dtype=np.float32)
+    assert window_levels(audio, 2).tolist() == [1.0, 0.5, 2.0]
+
+
+class TestSpeechDetector:
+    def test_stream_in_unaligned_blocks(self):
+        audio = np.zeros(SR * 5, dtype=np.float32)
+        audio[3 * SR : 3 * SR + SR // 2] = 0.5
+        detector = SpeechDetector(SR, threshold=LEVEL)
+        results = [detector.feed(block) for block in np.array_split(audio, 7)]
+        assert results[-1] is True
+        assert results[0] is False
+        assert detector.finish() is True
+
+    def test_silent_stream(self):
+        detector = SpeechDetector(SR, threshold=LEVEL)
+        for block in np.array_split(np.zeros(SR * 3, dtype=np.float32), 4):
+            assert detector.feed(block) is False
+        assert detector.finish() is False
+
+    def test_tail_evaluated_on_finish(self):
+        detector = SpeechDetector(SR, threshold=LEVEL)
+        assert detector.feed(np.ones(SR // 2, dtype=np.float32)) is False
+        assert detector.finish() is True
+
+
+class TestSpeechRegions:
+    def test_silent_audio_has_no_regions(self):
+        regions = detect_speech_regions(np.zeros(SR * 5, dtype=np.float32), SR, LEVEL)
+        assert regions.shape == (0, 2)
+
+    def test_region_padded_by_one_window(self):
+        audio = np.zeros(SR * 10, dtype=np.float32)
+        audio[4 * SR : 5 * SR] = 1.0  # parlato nel quinto secondo
+        regions = detect_speech_regions(audio, SR, threshold=LEVEL)
+        assert regions.tolist() == [[3 * SR, 6 * SR]]
+
+    def test_separate_bursts_and_short_pauses(self):
+        audio = np.zeros(SR * 20, dtype=np.float32)
+        audio[2 * SR : 3 * SR] = 1.0
+        audio[5 * SR : 6 * SR] = 1.0  # pausa di 2 s: assorbita dal margine
+        audio[15 * SR : 16 * SR] = 1.0
+        regions = detect_speech_regions(audio, SR, threshold=LEVEL)
+        assert regions.tolist() == [[1 * SR, 7 * SR], [14 * SR, 17 * SR]]
+
+    def test_partial_last_window_clamped_to_audio_length(self):
+        audio = np.ones(SR * 2 + 100, dtype=np.float32)
+        regions = detect_speech_regions(audio, SR, threshold=LEVEL)
+        assert regions.tolist() == [[0, len(audio)]]
+
+    def test_agrees_with_detect_silence(self):
+        rng = np.random.default_rng(0)
+        for _ in range(20):
+            audio = np.zeros(SR * 4, dtype=np.float32)
+            if rng.random() < 0.5:
+                start = int(rng.integers(0, len(audio) - 100))
+                audio[start : start + 100] = 1.0
+            silent = detect_silence(audio, SR, threshold=LEVEL)
+            regions = detect_speech_regions(audio, SR, threshold=LEVEL)
+            assert silent == (len(regions) == 0)
@@ -0,0 +1,47 @@
+"""Test della coalescenza delle richieste identiche (single-flight)."""
+
+import asyncio
+
+import pytest
+
+from calliope.transcription.singleflight import FlightOutcome, SingleFlight
+
+
+async def _collect(flight):
+    return [chunk async for chunk in flight.follow()]
+
+
+async def test_late_follower_gets_past_and_live_chunks():
+    flights = SingleFlight()
+    with flights.lead("k") as flight:
+        flight.publish("uno ")
+        early = asyncio.create_task(_collect(flights.get("k")))
+        await asyncio.sleep(0)
+        flight.publish("due ")
+        late = asyncio.create_task(_collect(flights.get("k")))
+        await asyncio.sleep(0)
+        flight.publish("tre")
+        flight.close(FlightOutcome.DONE)
+
+    assert await early == ["uno ", "due ", "tre"]
+    assert await late == ["uno ", "due ", "tre"]
+    assert flight.followers == 2
+    assert flights.get("k") is None  # deregistrato a fine job
+
+
+async def test_error_in_leader_marks_flight_failed():
+    flights = SingleFlight()
+    with pytest.raises(RuntimeError):
+        with flights.lead("k") as flight:
+            follower = asyncio.create_task(_collect(flight))
+            await asyncio.sleep(0)
+            raise RuntimeError("download failed")
+    assert await follower == []
+    assert flight.outcome is FlightOutcome.FAILED
+
+
+async def test_first_outcome_wins():
+    flights = SingleFlight()
+    with flights.lead("k") as flight:
+        flight.close(FlightOutcome.SILENT)
+    assert flight.outcome is FlightOutcome.SILENT
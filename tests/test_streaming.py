@@ -1,5 +1,7 @@
 """Test dello streaming a intervalli e del retry sul flood control (C5)."""
 
+import asyncio
+
 import pytest
 from telegram.error import RetryAfter
 
@@ -7,7 +9,11 @@ from calliope.transcription.formatting import split_message
 from calliope.transcription.streaming import (
     _SPLIT_LIMIT,
     CONTINUATION,
+    WAKING_UP_STATUS,
+    Delivery,
     TranscriptionStreamer,
+    queue_status_text,
+    reload_note,
     send_or_edit_with_retry,
 )
 
@@ -17,28 +23,41 @@ class FakeChat:
         self.messages: list[FakeMessage] = []
         self.api_calls = 0
 
-    def _new(self, text):
-        m = FakeMessage(self, text)
+    def _new(self, text, reply_markup=None):
+        m = FakeMessage(self, text, reply_markup)
+        m.message_id = len(self.messages)
         self.messages.append(m)
         return m
 
-    async def send_message(self, text, disable_notification=False):
+    async def send_message(self, text, disable_notification=False, reply_markup=None):
         self.api_calls += 1
-        return self._new(text)
+        return self._new(text, reply_markup)
 
 
 class FakeMessage:
-    def __init__(self, chat, text=None):
+    def __init__(self, chat, text=None, reply_markup=None):
         self.chat = chat
         self.text = text
+        self.reply_markup = reply_markup
 
-    async def reply_text(self, text, disable_notification=False):
+    async def reply_text(self, text, disable_notification=False, reply_markup=None):
         self.chat.api_calls += 1
-        return self.chat._new(text)
+        return self.chat._new(text, reply_markup)
 
-    async def edit_text(self, text):
+    async def edit_text(self, text, reply_markup=None):
         self.chat.api_calls += 1
         self.text = text
+        self.reply_markup = reply_markup
+        return self
+
+    async def delete(self):
+        self.chat.api_calls += 1
+        self.chat.messages.remove(self)
+        return True
+
+    async def edit_reply_markup(self, reply_markup=None):
+        self.chat.api_calls += 1
+        self.reply_markup = reply_markup
         return self
 
 
@@ -118,3 +137,135 @@ class TestFloodControlRetry:
 
         with pytest.raises(RuntimeError):
             await send_or_edit_with_retry(always_flood, max_attempts=3)
+
+
+class TestQueueStatus:
+    async def test_placeholder_shows_position_until_first_text(self):
+        chat = FakeChat()
+        origin = FakeMessage(chat)
+        streamer = TranscriptionStreamer(origin, min_interval_s=0.0)
+        await streamer.start()
+
+        streamer.show_queue_status(3, 80)
+        await asyncio.sleep(0.01)
+        assert chat.messages[0].text == "⏳ Queued: #3, ~1m 20s"
+
+        await streamer.add("ciao")
+        streamer.show_queue_status(1, 0)  # ignorato: la trascrizione è partita
+        await asyncio.sleep(0.01)
+        await streamer.finish()
+        assert chat.messages[0].text == "ciao"
+
+    async def test_status_throttled_and_dropped_when_text_arrives(self):
+        chat = FakeChat()
+        origin = FakeMessage(chat)
+        streamer = TranscriptionStreamer(origin, min_interval_s=60.0, min_chars=1)
+        await streamer.start()
+        streamer.show_queue_status(2, 30)  # l'edit attende l'intervallo minimo
+        await streamer.add("testo")
+        await asyncio.sleep(0.01)
+        assert chat.messages[0].text == "testo"
+
+    def test_status_text_soon(self):
+        assert queue_status_text(1, 0.2) == "⏳ Queued: #1, starting soon"
+
+    async def test_reload_note_follows_final_text(self):
+        chat = FakeChat()
+        origin = FakeMessage(chat)
+        streamer = TranscriptionStreamer(origin, min_interval_s=0.0, min_chars=1)
+        await streamer.start()
+        streamer.show_status(WAKING_UP_STATUS)
+        await asyncio.sleep(0.01)
+        assert chat.messages[0].text == WAKING_UP_STATUS
+        streamer.add_note(reload_note(8.24))
+        await streamer.add("ciao ")
+        await streamer.finish()
+        assert chat.messages[0].text == "ciao\n\n💤 Model reloaded in 8.2s"
+
+
+class TestStopKeyboard:
+    async def test_keyboard_follows_last_message_and_is_removed(self):
+        chat = FakeChat()
+        origin = FakeMessage(chat)
+        streamer = TranscriptionStreamer(origin, min_interval_s=0.0, min_chars=1)
+        keyboard = object()  # qualunque markup: lo streamer lo inoltra soltanto
+        await streamer.start(reply_markup=keyboard)
+        assert chat.messages[0].reply_markup is keyboard
+
+        await streamer.add("x" * 5000)  # secondo messaggio
+        assert chat.messages[0].reply_markup is None
+        assert chat.messages[1].reply_markup is keyboard
+
+        await streamer.finish()  # testo invariato: si toglie solo la tastiera
+        assert chat.messages[1].reply_markup is None
+
+    async def test_stop_keeps_partial_text_with_marker(self):
+        chat = FakeChat()
+        origin = FakeMessage(chat)
+        streamer = TranscriptionStreamer(origin, min_interval_s=0.0, min_chars=1)
+        await streamer.start(reply_markup=object())
+        await streamer.add("ciao mondo ")
+        await streamer.stop()
+        assert chat.messages[0].text == "ciao mondo\n\n⏹ Stopped"
+        assert chat.messages[0].reply_markup is None
+
+    async def test_stop_can_replace_the_shown_text(self):
+        chat = FakeChat()
+        origin = FakeMessage(chat)
+        streamer = TranscriptionStreamer(origin, min_interval_s=0.0, min_chars=1)
+        await streamer.start(reply_markup=object())
+        await streamer.add("anteprima " + "x" * 5000)  # due messaggi
+        await streamer.stop("definitivo ")
+        assert [m.text for m in chat.messages] == ["definitivo\n\n⏹ Stopped"]
+
+    async def test_delivery_reuses_messages_of_a_failed_attempt(self):
+        chat = FakeChat()
+        origin = FakeMessage(chat)
+        old = [chat._new("testo parziale"), chat._new("seconda parte")]
+        for message_id, message in enumerate(old, start=100):
+            message.message_id = message_id
+        recorded = []
+
+        async def _record(message_ids):
+            recorded.append(message_ids)
+
+        class _Delivery(Delivery):
+            def previous(self, origin):
+                return [m for m in old if m.message_id in self.message_ids]
+
+        delivery = _Delivery([100, 101], _record)
+        streamer = TranscriptionStreamer(
+            origin, min_interval_s=0.0, min_chars=1, delivery=delivery
+        )
+        await streamer.start()
+        # nessun nuovo messaggio: il primo torna placeholder, il secondo sparisce
+        assert [m.text for m in chat.messages] == ["[...]"]
+        assert recorded == [[100]]
+        await streamer.add("x" * 5000)
+        await streamer.finish()
+        assert recorded[-1] == [100, chat.messages[1].message_id]
+
+    async def test_abort_replaces_placeholder_and_drops_keyboard(self):
+        chat = FakeChat()
+        origin = FakeMessage(chat)
+        streamer = TranscriptionStreamer(origin, min_interval_s=0.0, min_chars=1)
+        await streamer.start(reply_markup=object())
+        streamer.add_note("nota")
+        await streamer.abort("🚦 busy")
+        assert chat.messages[0].text == "🚦 busy"
+        assert chat.messages[0].reply_markup is None
+
+
+class TestReplace:
+    async def test_refined_text_replaces_longer_preview(self):
+        chat = FakeChat()
+        origin = FakeMessage(chat)
+        streamer = TranscriptionStreamer(origin, min_interval_s=0.0, min_chars=1)
+        await streamer.start()
+        await streamer.add("anteprima " * 500)  # ~5000 caratteri: due messaggi
+        assert len(chat.messages) == 2
+
+        await streamer.replace("testo definitivo")
+        await streamer.finish()
+        assert [m.text for m in chat.messages] == ["testo definitivo"]
+        assert streamer.text == "testo definitivo"
@@ -0,0 +1,99 @@
+"""Test dell'auto-tuning (modello finto: i tempi dipendono dalla configurazione)."""
+
+import time
+
+import pytest
+
+from calliope.transcription import tuning
+from calliope.transcription.tuning import (
+    TuneResult,
+    autotune,
+    load_tuned,
+    save_tuned,
+    thread_candidates,
+    tuned_config,
+    tuning_key,
+)
+
+# Secondi per decodifica: int8_float32 è il tipo più veloce, e due decodifiche
+# parallele da 2 thread battono sia una da 4 sia quattro da 1.
+_COST = {"int8": 0.02, "int8_float32": 0.01, "float32": 0.03}
+_THREADS_FACTOR = {4: 1.5, 2: 1.0, 1: 4.0}
+
+
+class _TimedModel:
+    def __init__(self, name, *, compute_type, cpu_threads, num_workers, **kw):
+        self.cost = _COST[compute_type] * _THREADS_FACTOR[cpu_threads]
+        self.num_workers = num_workers
+
+    def transcribe(self, clip, **options):
+        assert options["beam_size"] == 1 and options["max_new_tokens"]
+        time.sleep(self.cost)
+        return iter([]), None
+
+
+@pytest.fixture
+def cpu(monkeypatch):
+    monkeypatch.setattr(tuning, "available_cores", lambda: 4)
+    monkeypatch.setattr(
+        tuning.ctranslate2,
+        "get_supported_compute_types",
+        lambda device, index=0: {"int8", "int8_float32", "float32", "int16"},
+    )
+
+
+def test_thread_candidates_use_every_core():
+    assert thread_candidates(1) == [(1, 1)]
+    assert thread_candidates(8) == [(8, 1), (4, 2), (2, 4), (4, 1)]
+
+
+def test_compute_types_filtered_by_device(cpu):
+    assert tuning.compute_type_candidates("cpu") == ["int8", "int8_float32", "float32"]
+
+
+def test_autotune_picks_fastest_configuration(cpu):
+    seen = []
+    best = autotune(
+        "tiny", "cpu", clip_s=1, repeat=1, loader=_TimedModel, on_result=seen.append
+    )
+    assert {r.compute_type for r in seen} == {"int8", "int8_float32", "float32"}
+    assert (best.compute_type, best.cpu_threads, best.inter_threads) == (
+        "int8_float32",
+        2,
+        2,
+    )
+
+
+def test_saved_result_is_keyed_by_model_and_hardware(tmp_path):
+    path = str(tmp_path / "tune.json")
+    result = TuneResult("int8_float32", 2, 2, 0.1)
+    save_tuned(path, tuning_key("small", "cpu", "box-a"), result)
+    save_tuned(path, tuning_key("turbo", "cpu", "box-a"), TuneResult("int8", 4, 1, 0.3))
+    assert load_tuned(path, tuning_key("small", "cpu", "box-a")) == result
+    assert load_tuned(path, tuning_key("small", "cpu", "box-b")) is None
+    assert load_tuned(str(tmp_path / "missing.json"), "any") is None
+
+
+def test_tuned_config_reuses_cache_and_tunes_only_on_request(
+    tmp_path, make_settings, monkeypatch
+):
+    calls = []
+
+    def _fake_tune(settings, device, **kw):
+        calls.append(device)
+        result = TuneResult("int8", 4, 1, 0.2)
+        hardware = tuning.hardware_id(device)
+        save_tuned(
+            settings.whisper_tune_file,
+            tuning_key(settings.whisper_model, device, hardware),
+            result,
+        )
+        return result
+
+    monkeypatch.setattr(tuning, "tune_and_save", _fake_tune)
+    path = str(tmp_path / "tune.json")
+    assert tuned_config(make_settings(whisper_tune_file=path), "cpu") is None
+    settings = make_settings(whisper_tune_file=path, whisper_autotune=True)
+    assert tuned_config(settings, "cpu").compute_type == "int8"
+    assert tuned_config(settings, "cpu").compute_type == "int8"  # dal file
+    assert calls == ["cpu"]
@@ -3,11 +3,21 @@
 Usa un modello fittizio: nessun modello Whisper reale viene caricato.
 """
 
+import asyncio
 import threading
+import time
 from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
 
+import numpy as np
 import pytest
 
+from calliope.settings import Settings
+from calliope.transcription.decoding import DecodingProfiles
+from calliope.transcription.pool import ReplicaPool
+from calliope.transcription.router import ModelRouter
+from calliope.transcription.scheduler import Priority
+from calliope.transcription.tuning import TuneResult
 from calliope.transcription.whisper import WhisperTranscriber
 
 
@@ -37,10 +47,21 @@ class _BoomModel:
         raise ValueError("boom")
 
 
-def _make(model):
+def _make(*models, **overrides):
     t = WhisperTranscriber.__new__(WhisperTranscriber)
-    t.model = model
-    t._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="whisper")
+    t._settings = Settings(_env_file=None, telegram_token="test-token", **overrides)
+    t.device = "cpu"
+    t.model_name = t._settings.whisper_model
+    t._router = ModelRouter(t._settings.whisper_routes, t.model_name)
+    t._profiles = DecodingProfiles.from_settings(t._settings)
+    t.preview_lane = None
+    t._pools = {t.model_name: ReplicaPool(list(models))}
+    t._executor = ThreadPoolExecutor(
+        max_workers=len(models), thread_name_prefix="whisper"
+    )
+    t._scheduler = t._build_scheduler(t._settings)
+    t._batcher = t._build_batcher(t._settings)
+    t._init_lifecycle()
     return t
 
 
@@ -56,9 +77,839 @@ async def test_stream_segments_order_and_language_forwarded():
     assert t.model.thread.startswith("whisper")
 
 
+async def test_detected_language_reported_to_on_info():
+    class _DetectingModel(_FakeModel):
+        def transcribe(self, audio, language=None, **kw):
+            segments, _ = super().transcribe(audio, language=language, **kw)
+            info = SimpleNamespace(language="it", language_probability=0.97)
+            return segments, info
+
+    t = _make(_DetectingModel())
+    seen = []
+    out = [
+        text
+        async for text in t.stream_segments(
+            [0.0], on_info=lambda lang, prob: seen.append((lang, prob))
+        )
+    ]
+    t.shutdown()
+
+    assert out == ["uno ", "due ", "tre"]
+    assert seen == [("it", 0.97)]
+
+
+class TestSpeechRegions:
+    class _ClipModel(_FakeModel):
+        def transcribe(self, audio, language=None, **kw):
+            self.clip_timestamps = kw.get("clip_timestamps")
+            return super().transcribe(audio, language=language, **kw)
+
+    @staticmethod
+    def _audio():
+        audio = np.zeros(60 * 16000, dtype=np.float32)
+        audio[10 * 16000 : 12 * 16000] = 0.5  # 2 s di parlato su 60 s
+        return audio
+
+    async def test_only_speech_regions_are_decoded(self):
+        t = _make(self._ClipModel(), skip_silent_regions=True)
+        _ = [text async for text in t.stream_segments(self._audio())]
+        t.shutdown()
+        # regione [10 s, 12 s) allargata di 1 s per lato, in secondi assoluti
+        assert t.model.clip_timestamps == [9.0, 13.0]
+
+    async def test_disabled_by_default(self):
+        t = _make(self._ClipModel())
+        _ = [text async for text in t.stream_segments(self._audio())]
+        t.shutdown()
+        assert t.model.clip_timestamps is None
+
+    async def test_full_speech_is_not_clipped(self):
+        t = _make(self._ClipModel(), skip_silent_regions=True)
+        audio = np.full(5 * 16000, 0.5, dtype=np.float32)
+        _ = [text async for text in t.stream_segments(audio)]
+        t.shutdown()
+        assert t.model.clip_timestamps is None
+
+
 async def test_stream_segments_propagates_error():
     t = _make(_BoomModel())
     with pytest.raises(ValueError):
         async for _ in t.stream_segments([0.0]):
             pass
     t.shutdown()
+
+
+class _EndlessModel:
+    """Modello con un numero enorme di segmenti lenti: conta quelli decodificati."""
+
+    def __init__(self):
+        self.produced = 0
+
+    def transcribe(self, audio, language=None, **kw):
+        def _gen():
+            for i in range(10_000):
+                time.sleep(0.001)
+                self.produced += 1
+                yield _Seg(f"s{i} ")
+
+        return _gen(), None
+
+
+class TestCancellation:
+    async def test_closing_stream_stops_decoding_and_frees_replica(self):
+        model = _EndlessModel()
+        t = _make(model)
+        gen = t.stream_segments([0.0])
+        assert await gen.__anext__() == "s0 "
+        await gen.aclose()
+
+        assert model.produced < 100  # il produttore si è fermato subito
+        assert t._pools[t.model_name].idle == 1
+        assert t.queue_stats == (0, 0)
+        t.shutdown()
+
+    async def test_cancelled_consumer_frees_replica(self):
+        model = _EndlessModel()
+        t = _make(model)
+        first = asyncio.Event()
+
+        async def _consume():
+            async for _ in t.stream_segments([0.0]):
+                first.set()
+
+        task = asyncio.create_task(_consume())
+        await first.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert model.produced < 100
+        assert t._pools[t.model_name].idle == 1
+        t.shutdown()
+
+
+class _GateModel:
+    """Modello che blocca finché tutte le repliche attese non sono occupate."""
+
+    def __init__(self, barrier):
+        self.barrier = barrier
+        self.calls = 0
+
+    def transcribe(self, audio, language=None, **kw):
+        self.calls += 1
+        self.barrier.wait(timeout=5)  # deadlock se le repliche fossero serializzate
+        return iter([_Seg("ok")]), None
+
+
+async def test_replicas_transcribe_in_parallel():
+    barrier = threading.Barrier(2)
+    a, b = _GateModel(barrier), _GateModel(barrier)
+    t = _make(a, b)
+
+    async def _run():
+        return [text async for text in t.stream_segments([0.0])]
+
+    out = await asyncio.gather(_run(), _run())
+    t.shutdown()
+
+    assert out == [["ok"], ["ok"]]
+    # ciascuna richiesta è andata su una replica diversa (quella libera)
+    assert (a.calls, b.calls) == (1, 1)
+
+
+class TestCpuThreads:
+    def test_explicit_value_wins(self, make_settings):
+        s = make_settings(whisper_cpu_threads=3)
+        assert WhisperTranscriber._resolve_cpu_threads(s, "cpu", 4) == 3
+
+    def test_cpu_cores_split_between_replicas(self, make_settings, monkeypatch):
+        import calliope.transcription.whisper as whisper_mod
+
+        monkeypatch.setattr(
+            whisper_mod.os,
+            "sched_getaffinity",
+            lambda _pid: set(range(8)),
+            raising=False,
+        )
+        s = make_settings(whisper_replicas=3)
+        assert WhisperTranscriber._resolve_cpu_threads(s, "cpu", 3) == 2
+
+    def test_gpu_uses_ctranslate2_default(self, make_settings):
+        s = make_settings()
+        assert WhisperTranscriber._resolve_cpu_threads(s, "cuda", 2) == 0
+
+
+class TestTunedConfiguration:
+    TUNED = TuneResult("int8_float32", 2, 2, 0.1)
+
+    def test_tuning_fills_unset_values(self, make_settings):
+        s = make_settings()
+        assert WhisperTranscriber._resolve_compute_type(s, "cpu", self.TUNED) == (
+            "int8_float32"
+        )
+        assert WhisperTranscriber._resolve_replicas(s, self.TUNED) == 2
+        assert WhisperTranscriber._resolve_cpu_threads(s, "cpu", 2, self.TUNED) == 2
+        # come nel tuning: un modello con ``num_workers=inter_threads``
+        assert WhisperTranscriber._resolve_shared_model(s, self.TUNED) is True
+
+    def test_explicit_settings_win(self, make_settings):
+        s = make_settings(
+            whisper_compute_type="int8", whisper_replicas=1, whisper_cpu_threads=3
+        )
+        assert WhisperTranscriber._resolve_compute_type(s, "cpu", self.TUNED) == "int8"
+        assert WhisperTranscriber._resolve_replicas(s, self.TUNED) == 1
+        assert WhisperTranscriber._resolve_cpu_threads(s, "cpu", 1, self.TUNED) == 3
+        assert WhisperTranscriber._resolve_shared_model(s, self.TUNED) is False
+
+    def test_tuned_threads_ignored_for_other_replica_counts(
+        self, make_settings, monkeypatch
+    ):
+        import calliope.transcription.whisper as whisper_mod
+
+        monkeypatch.setattr(
+            whisper_mod.os,
+            "sched_getaffinity",
+            lambda _pid: set(range(12)),
+            raising=False,
+        )
+        s = make_settings()
+        # una corsia in più (es. anteprima): core divisi tra 3 repliche, non 2
+        assert WhisperTranscriber._resolve_cpu_threads(s, "cpu", 3, self.TUNED) == 4
+
+
+class _Word:
+    def __init__(self, start, end, word):
+        self.start, self.end, self.word = start, end, word
+
+
+class _WordModel:
+    """Restituisce parole a 0 s, 30 s e 70 s (due minuti di trascrizione)."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def transcribe(self, audio=None, language=None, **kw):
+        self.calls += 1
+        words = [_Word(0.0, 0.5, " ciao"), _Word(30.0, 30.5, " mondo")]
+        words2 = [_Word(70.0, 70.5, " fine"), _Word(70.5, 70.7, ".")]
+        return iter([SimpleNamespace(words=words), SimpleNamespace(words=words2)]), None
+
+
+class TestTimestamps:
+    async def test_minute_buckets(self):
+        t = _make(_WordModel())
+        out = await t.transcribe_with_timestamps(np.zeros(16000, dtype=np.float32))
+        t.shutdown()
+        assert out == (
+            "[00:00:00 - 00:01:00]: ciao mondo\n[00:01:00 - 00:01:10]: fine."
+        )
+
+    async def test_batched_pipeline_above_threshold(self, monkeypatch):
+        import calliope.transcription.whisper as whisper_mod
+
+        calls = []
+
+        class _FakePipeline:
+            def __init__(self, model):
+                self.model = model
+
+            def transcribe(self, audio, **kw):
+                calls.append(kw)
+                return self.model.transcribe(audio, **kw)
+
+        monkeypatch.setattr(whisper_mod, "BatchedInferencePipeline", _FakePipeline)
+        model = _WordModel()
+        t = _make(model, batched_min_duration_s=2, batch_size=4)
+
+        short = await t.transcribe_with_timestamps(np.zeros(16000, dtype=np.float32))
+        assert calls == []  # sotto soglia: transcribe sequenziale
+
+        long = await t.transcribe_with_timestamps(np.zeros(3 * 16000, dtype=np.float32))
+        t.shutdown()
+        assert calls[0]["batch_size"] == 4
+        assert calls[0]["word_timestamps"] is True
+        assert long == short  # stesso output a minuti
+
+    async def test_configurable_interval(self):
+        t = _make(_WordModel(), timestamp_interval_s=300)
+        five_minutes = await t.transcribe_with_timestamps(
+            np.zeros(16000, dtype=np.float32)
+        )
+        half_minutes = await t.transcribe_with_timestamps(
+            np.zeros(16000, dtype=np.float32), interval_s=30
+        )
+        t.shutdown()
+        assert five_minutes == "[00:00:00 - 00:01:10]: ciao mondo fine."
+        assert half_minutes == (
+            "[00:00:00 - 00:00:30]: ciao\n"
+            "[00:00:30 - 00:01:00]: mondo\n"
+            "[00:01:00 - 00:01:10]: fine."
+        )
+
+    async def test_intervals_stream_while_decoding(self):
+        gate = threading.Event()
+
+        class _GatedModel:
+            def transcribe(self, audio=None, language=None, **kw):
+                def _gen():
+                    yield SimpleNamespace(words=[_Word(1.0, 1.5, " prima")])
+                    yield SimpleNamespace(words=[_Word(61.0, 61.5, " seconda")])
+                    gate.wait(5)  # il decoder è ancora al secondo minuto
+                    yield SimpleNamespace(words=[_Word(125.0, 125.5, " terza")])
+
+                return _gen(), None
+
+        t = _make(_GatedModel())
+        stream = t.stream_intervals(np.zeros(16000, dtype=np.float32))
+        first = await asyncio.wait_for(anext(stream), 2)
+        assert (first.start, first.end, first.text) == (0, 60, "prima")
+        gate.set()
+        rest = [interval.text async for interval in stream]
+        t.shutdown()
+        assert rest == ["seconda", "terza"]
+
+    async def test_closing_interval_stream_frees_replica(self):
+        gate = threading.Event()
+
+        class _SlowModel:
+            def transcribe(self, audio=None, language=None, **kw):
+                def _gen():
+                    for minute in range(100):
+                        yield SimpleNamespace(words=[_Word(minute * 60.0, 1.0, " x")])
+                        gate.wait(0.01)
+
+                return _gen(), None
+
+        t = _make(_SlowModel())
+        stream = t.stream_intervals(np.zeros(16000, dtype=np.float32))
+        await anext(stream)
+        await stream.aclose()
+        assert t.queue_stats == (0, 0)
+        # la replica è tornata nel pool: un nuovo job parte subito
+        second = t.stream_intervals(np.zeros(16000, dtype=np.float32))
+        await asyncio.wait_for(anext(second), 2)
+        await second.aclose()
+        t.shutdown()
+
+
+class _SegmentModel:
+    """Segmenti con testo e confini; parole solo con ``word_timestamps``."""
+
+    def __init__(self):
+        self.word_timestamps = []
+
+    def transcribe(self, audio=None, language=None, word_timestamps=False, **kw):
+        self.word_timestamps.append(word_timestamps)
+        segments = [
+            SimpleNamespace(
+                start=50.0,
+                end=70.0,
+                text=" uno due tre quattro",
+                words=[
+                    _Word(50.0, 55.0, " uno"),
+                    _Word(55.0, 59.0, " due"),
+                    _Word(59.0, 61.0, " tre"),
+                    _Word(61.0, 70.0, " quattro"),
+                ]
+                if word_timestamps
+                else None,
+            )
+        ]
+        return iter(segments), None
+
+
+class TestGranularity:
+    async def test_word_granularity_is_exact(self):
+        model = _SegmentModel()
+        t = _make(model)
+        out = await t.transcribe_with_timestamps(np.zeros(16000), return_dict=True)
+        t.shutdown()
+        assert model.word_timestamps == [True]
+        assert list(out.values()) == ["uno due tre", "quattro"]
+
+    async def test_segment_granularity_skips_word_alignment(self):
+        model = _SegmentModel()
+        t = _make(model, timestamp_granularity="segment")
+        out = await t.transcribe_with_timestamps(np.zeros(16000), return_dict=True)
+        t.shutdown()
+        assert model.word_timestamps == [False]
+        # il segmento è diviso nel punto interpolato del confine
+        assert list(out.values()) == ["uno due tre", "quattro"]
+
+    async def test_duration_threshold_and_per_request_override(self):
+        model = _SegmentModel()
+        t = _make(model, segment_timestamps_min_duration_s=600)
+        await t.transcribe_with_timestamps(np.zeros(16000), duration=300)
+        await t.transcribe_with_timestamps(np.zeros(16000), duration=900)
+        await t.transcribe_with_timestamps(
+            np.zeros(16000), duration=900, granularity="word"
+        )
+        t.shutdown()
+        assert model.word_timestamps == [True, False, True]
+
+
+class _KwargsModel:
+    """Registra i kwargs di decodifica di ogni chiamata."""
+
+    def __init__(self):
+        self.calls = []
+
+    def transcribe(self, audio=None, language=None, **kw):
+        self.calls.append(kw)
+        segment = SimpleNamespace(
+            start=0.0, end=1.0, text=" ciao", words=[_Word(0.0, 1.0, " ciao")]
+        )
+        return iter([segment]), None
+
+
+class TestDecodingProfiles:
+    async def test_voice_profile_by_duration_band(self):
+        model = _KwargsModel()
+        t = _make(
+            model,
+            decoding_rules=[{"profile": "fast", "path": "voice", "max_duration_s": 20}],
+        )
+        assert [x async for x in t.stream_segments([0.0], duration=5)]
+        assert [x async for x in t.stream_segments([0.0], duration=60)]
+        assert [x async for x in t.stream_segments([0.0], profile="accurate")]
+        t.shutdown()
+        assert model.calls[0]["beam_size"] == 1
+        assert model.calls[0]["without_timestamps"] is True
+        assert "beam_size" not in model.calls[1]  # balanced: default della libreria
+        assert model.calls[2]["beam_size"] == 8
+
+    async def test_video_profile_keeps_segment_timestamps(self):
+        model = _KwargsModel()
+        t = _make(model, video_decoding_profile="fast")
+        await t.transcribe_with_timestamps(np.zeros(16000))
+        await t.transcribe_with_timestamps(np.zeros(16000), granularity="segment")
+        t.shutdown()
+        assert model.calls[0]["beam_size"] == 1
+        assert model.calls[0]["without_timestamps"] is True
+        # l'interpolazione per segmento ha bisogno dei confini dei segmenti
+        assert model.calls[1]["without_timestamps"] is False
+
+
+class _BurstModel:
+    """Una "parola" per ogni raffica di campioni non nulli (testo dall'ampiezza).
+
+    Come Whisper, i timestamp sono relativi all'audio ricevuto.
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def transcribe(self, audio=None, language=None, **kw):
+        self.calls += 1
+        active = np.concatenate(([0], (audio != 0).astype(np.int8), [0]))
+        edges = np.diff(active)
+        starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        words = [
+            _Word(s / 16000, e / 16000, f" w{round(float(audio[s]) * 1000)}")
+            for s, e in zip(starts, ends, strict=True)
+        ]
+        segments = [
+            SimpleNamespace(words=words[i : i + 5]) for i in range(0, len(words), 5)
+        ]
+        return iter(segments), None
+
+
+def _bursty_audio(seconds):
+    """Raffiche da 0.3 s a intervalli irregolari, con ampiezze diverse."""
+    rng = np.random.default_rng(7)
+    audio = np.zeros(seconds * 16000, dtype=np.float32)
+    position = 0.5
+    while position < seconds - 1:
+        start = int(position * 16000)
+        audio[start : start + 4800] = rng.integers(1, 999) / 1000
+        position += float(rng.uniform(0.6, 2.5))
+    return audio
+
+
+class TestParallelChunks:
+    async def test_stitched_output_matches_sequential(self):
+        audio = _bursty_audio(20 * 60)
+
+        sequential = _make(_BurstModel(), parallel_chunk_s=None)
+        expected = await sequential.transcribe_with_timestamps(audio)
+        sequential.shutdown()
+
+        replicas = [_BurstModel() for _ in range(3)]
+        parallel = _make(*replicas, parallel_chunk_s=60, parallel_chunk_overlap_s=2)
+        out = await parallel.transcribe_with_timestamps(audio)
+        parallel.shutdown()
+
+        assert out == expected
+        assert sum(m.calls for m in replicas) >= 19  # ~20 chunk da 60 s
+        assert sum(1 for m in replicas if m.calls) > 1  # più repliche usate
+
+    async def test_each_slot_is_charged_one_chunk(self):
+        t = _make(_BurstModel(), _BurstModel(), parallel_chunk_s=60)
+        costs = []
+        slot = t._slot
+
+        def _recording_slot(**kw):
+            costs.append(kw["cost"])
+            return slot(**kw)
+
+        t._slot = _recording_slot
+        await t.transcribe_with_timestamps(_bursty_audio(5 * 60))
+        t.shutdown()
+        # lo slot del job e quello di aiuto: ~60 s ciascuno, non i 300 s del video
+        assert len(costs) == 2
+        assert all(50 < cost < 70 for cost in costs)
+
+    async def test_single_replica_stays_sequential(self):
+        model = _BurstModel()
+        t = _make(model, parallel_chunk_s=60)
+        await t.transcribe_with_timestamps(_bursty_audio(5 * 60))
+        t.shutdown()
+        assert model.calls == 1
+
+
+class TestMicroBatching:
+    async def test_batch_segments_routed_to_their_clip(self, monkeypatch):
+        import calliope.transcription.whisper as whisper_mod
+
+        seen = {}
+
+        class _FakePipeline:
+            def __init__(self, model):
+                pass
+
+            def transcribe(self, audio, language=None, clip_timestamps=None, **kw):
+                seen["language"] = language
+                seen["clips"] = clip_timestamps
+                # un segmento all'inizio di ciascuna clip, nell'ordine del batch
+                segs = [
+                    SimpleNamespace(start=c["start"] + 0.1, text=f"clip{i}")
+                    for i, c in enumerate(clip_timestamps)
+                ]
+                return iter(segs), None
+
+        class _DetectModel:
+            def detect_language(self, audio):
+                return "it", 0.99, []
+
+        monkeypatch.setattr(whisper_mod, "BatchedInferencePipeline", _FakePipeline)
+        t = _make(_DetectModel(), microbatch_window_ms=20, microbatch_max_size=8)
+
+        infos = []
+
+        async def _run(seconds):
+            audio = np.zeros(seconds * 16000, dtype=np.float32)
+            return [
+                x
+                async for x in t.stream_segments(
+                    audio,
+                    chat_id=seconds,
+                    on_info=lambda lang, p: infos.append((seconds, lang, p)),
+                )
+            ]
+
+        out = await asyncio.gather(_run(2), _run(3))
+        t.shutdown()
+
+        assert out == [["clip0"], ["clip1"]]
+        assert seen["language"] == "it"  # lingua rilevata per clip
+        assert sorted(infos) == [(2, "it", 0.99), (3, "it", 0.99)]
+        assert seen["clips"] == [
+            {"start": 0.0, "end": 2.0},
+            {"start": 2.0, "end": 5.0},
+        ]
+
+    async def test_batch_waits_behind_its_chats(self):
+        models = (_FakeModel(), _FakeModel())
+        t = _make(*models, microbatch_window_ms=5)
+        release = asyncio.Event()
+        statuses = []
+
+        async def _busy_chat():
+            async with t._scheduler.slot(
+                cost=30, priority=Priority.INTERACTIVE, chat_id=7, lane=t.model_name
+            ):
+                await release.wait()
+
+        blocker = asyncio.create_task(_busy_chat())
+        await asyncio.sleep(0)
+        audio = np.zeros(16000, dtype=np.float32)
+        run = asyncio.create_task(
+            _collect_all(
+                t.stream_segments(
+                    audio, chat_id=7, on_queue=lambda p, e: statuses.append(p)
+                )
+            )
+        )
+        await asyncio.sleep(0.05)
+        # una replica è libera, ma la chat 7 ha già un job in corso
+        assert [m.calls for m in models] == [[], []] and statuses == [1]
+        release.set()
+        assert await run == ["uno ", "due ", "tre"]
+        await blocker
+        t.shutdown()
+
+    async def test_later_request_of_the_chat_waits_for_its_batched_clip(self):
+        decoded = []
+
+        class _SizedModel(_FakeModel):
+            def transcribe(self, audio, language=None, **kw):
+                decoded.append(audio.size)
+                return super().transcribe(audio, language, **kw)
+
+        t = _make(
+            _SizedModel(),
+            _SizedModel(),
+            microbatch_window_ms=50,
+            microbatch_max_clip_s=1,
+        )
+        short = np.zeros(16000, dtype=np.float32)  # nel micro-batcher
+        long = np.zeros(2 * 16000, dtype=np.float32)  # lo salta
+        await asyncio.gather(
+            _collect_all(t.stream_segments(short, chat_id=7)),
+            _collect_all(t.stream_segments(long, chat_id=7)),
+        )
+        t.shutdown()
+        # due repliche libere, ma il vocale lungo arriva dopo quello batched
+        assert decoded == [16000, 32000]
+
+    async def test_batched_text_matches_sequential(self, monkeypatch):
+        import calliope.transcription.whisper as whisper_mod
+
+        class _EchoModel:
+            """Un segmento per clip, con il valore dei suoi campioni."""
+
+            def transcribe(self, audio, language=None, **kw):
+                return iter([SimpleNamespace(start=0.0, text=f"v{audio[0]:.0f}")]), None
+
+            def detect_language(self, audio):
+                return "it", 0.99, []
+
+        class _ChunkedPipeline:
+            """Come BatchedInferencePipeline: ogni clip è un chunk a sé."""
+
+            def __init__(self, model):
+                self.model = model
+
+            def transcribe(self, audio, clip_timestamps=None, **kw):
+                segs = []
+                for clip in clip_timestamps:
+                    start = int(clip["start"] * 16000)
+                    end = int(clip["end"] * 16000)
+                    chunk, _info = self.model.transcribe(audio[start:end])
+                    segs += [
+                        SimpleNamespace(start=clip["start"] + s.start, text=s.text)
+                        for s in chunk
+                    ]
+                return iter(segs), None
+
+        monkeypatch.setattr(whisper_mod, "BatchedInferencePipeline", _ChunkedPipeline)
+        clips = [np.full(n * 8000, n, dtype=np.float32) for n in (1, 2, 3)]
+
+        sequential = _make(_EchoModel())
+        expected = [await _collect_all(sequential.stream_segments(c)) for c in clips]
+        sequential.shutdown()
+
+        batched = _make(_EchoModel(), microbatch_window_ms=20, microbatch_max_size=8)
+        out = await asyncio.gather(
+            *(_collect_all(batched.stream_segments(c)) for c in clips)
+        )
+        batched.shutdown()
+        assert out == expected == [["v1"], ["v2"], ["v3"]]
+
+    async def test_long_clips_bypass_the_batcher(self):
+        t = _make(_FakeModel(), microbatch_window_ms=20, microbatch_max_clip_s=1)
+        audio = np.zeros(2 * 16000, dtype=np.float32)
+        out = [x async for x in t.stream_segments(audio)]
+        t.shutdown()
+        assert out == ["uno ", "due ", "tre"]
+
+    async def test_single_clip_uses_sequential_transcribe(self):
+        model = _FakeModel()
+        t = _make(model, microbatch_window_ms=5)
+        out = [x async for x in t.stream_segments(np.zeros(16000, dtype=np.float32))]
+        t.shutdown()
+        assert out == ["uno ", "due ", "tre"]
+        assert len(model.calls) == 1
+
+
+async def test_queue_status_forwarded_while_waiting():
+    t = _make(_FakeModel())
+    release = asyncio.Event()
+    statuses = []
+
+    async def _blocker():
+        async with t._scheduler.slot(
+            cost=30, priority=Priority.INTERACTIVE, lane=t.model_name
+        ):
+            await release.wait()
+
+    blocker = asyncio.create_task(_blocker())
+    await asyncio.sleep(0)
+
+    async def _consume():
+        gen = t.stream_segments(
+            [0.0], duration=5, on_queue=lambda pos, eta: statuses.append(pos)
+        )
+        return [x async for x in gen]
+
+    consumer = asyncio.create_task(_consume())
+    await asyncio.sleep(0.01)
+    assert statuses == [1]
+    release.set()
+    assert await consumer == ["uno ", "due ", "tre"]
+    await blocker
+    t.shutdown()
+
+
+def test_warmup_runs_once_per_distinct_replica():
+    shared = _FakeModel()
+    t = _make(shared, shared)  # modello condiviso con due worker
+    t.warmup()
+    assert len(shared.calls) == 1
+
+    a, b = _FakeModel(), _FakeModel()
+    t = _make(a, b)
+    t.warmup()
+    assert (len(a.calls), len(b.calls)) == (1, 1)
+
+
+async def test_router_sends_short_clips_to_their_model():
+    big, small = _FakeModel(), _FakeModel()
+    t = _make(big, whisper_routes=[{"model": "small", "max_duration_s": 10}])
+    t._pools["small"] = ReplicaPool([small])
+    t._scheduler = t._build_scheduler(t._settings)
+
+    assert [x async for x in t.stream_segments([0.0], duration=5)]
+    assert [x async for x in t.stream_segments([0.0], duration=60)]
+    t.shutdown()
+
+    assert (len(small.calls), len(big.calls)) == (1, 1)
+    served = {name: count for name, count, _rtf in t.model_stats()}
+    assert served == {t.model_name: 1, "small": 1}
+
+
+def test_preview_only_for_long_media():
+    t = _make(_FakeModel(), preview_model="tiny", preview_min_duration_s=30)
+    t.preview_lane = "preview:tiny"
+    assert not t.wants_preview(10)
+    assert t.wants_preview(45)
+    t.preview_lane = None  # anteprima non configurata
+    assert not t.wants_preview(45)
+
+
+async def test_preview_lane_runs_while_main_model_is_busy():
+    t = _make(_FakeModel())
+    tiny = _FakeModel()
+    t.preview_lane = "preview:tiny"
+    t._pools[t.preview_lane] = ReplicaPool([tiny])
+    t._scheduler = t._build_scheduler(t._settings)
+    t._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="whisper")
+    release = asyncio.Event()
+
+    async def _busy_main_model():
+        async with t._scheduler.slot(
+            cost=600, priority=Priority.INTERACTIVE, lane=t.model_name
+        ):
+            await release.wait()
+
+    blocker = asyncio.create_task(_busy_main_model())
+    await asyncio.sleep(0)
+    preview = t.stream_segments([0.0], duration=60, model_name=t.preview_lane)
+    out = await asyncio.wait_for(_collect_all(preview), timeout=2)
+    assert out == ["uno ", "due ", "tre"]
+    assert len(tiny.calls) == 1
+    # l'anteprima non conta come richiesta servita
+    assert t.preview_lane not in t._router.served
+    release.set()
+    await blocker
+    t.shutdown()
+
+
+async def _collect_all(gen):
+    return [x async for x in gen]
+
+
+class _HeldModel:
+    """Modello che resta in decodifica finché il test non lo rilascia."""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def transcribe(self, audio, language=None, **kw):
+        self.started.set()
+        self.release.wait(timeout=5)
+        return iter([_Seg("old")]), None
+
+
+class TestModelLifecycle:
+    def test_swapped_pool_frees_old_replicas_once_returned(self):
+        old, new = object(), object()
+        pool = ReplicaPool([old])
+        with pool.acquire() as borrowed:
+            retired = pool.swap([new])
+            with pool.acquire() as fresh:
+                assert (borrowed, fresh) == (old, new)
+        assert retired.wait_idle() == [old]
+        with pytest.raises(ValueError):
+            pool.swap([new, new])  # la capacità non cambia
+
+    async def test_swap_happens_between_jobs(self):
+        old, new = _HeldModel(), _FakeModel()
+        t = _make(old)
+        old_name = t.model_name
+        t._load_replicas = lambda settings, name, replicas: [new] * replicas
+        running = asyncio.ensure_future(_collect_all(t.stream_segments([0.0])))
+        await asyncio.to_thread(old.started.wait, 5)
+
+        assert await t.swap_model("small") >= 0
+        assert t.model_name == "small" and t.route(5, None) == "small"
+        with pytest.raises(ValueError):
+            await t.swap_model("small")
+        with await t.admit(1, model_name=old_name):  # instradato prima del cambio
+            pass
+        old.release.set()
+        assert await running == ["old"]  # il job in corso finisce sul vecchio
+        later = t.stream_segments([0.0], model_name=old_name)
+        assert await _collect_all(later) == ["uno ", "due ", "tre"]
+        await asyncio.gather(*t._background)  # vecchia replica liberata
+        assert [name for name, _served, _rtf in t.model_stats()] == ["small"]
+        t.shutdown()
+
+    async def test_idle_unload_and_lazy_reload(self):
+        model = _FakeModel()
+        t = _make(model)
+        t._settings = t._settings.model_copy(update={"model_idle_unload_s": 0.05})
+        loads = []
+
+        def _load(settings, name, replicas):
+            loads.append(name)
+            return [model] * replicas
+
+        t._load_replicas = _load
+        t.schedule_idle_unload()
+        await asyncio.sleep(0.2)
+        await asyncio.gather(*t._background)
+        assert not t.loaded
+
+        reloads: list[float] = []
+        out = await _collect_all(t.stream_segments([0.0], on_reload=reloads.append))
+        assert out == ["uno ", "due ", "tre"]
+        assert len(reloads) == 1 and loads == [t.model_name] and t.loaded
+        # Caricati: il job successivo non aspetta nessuna ricarica.
+        await _collect_all(t.stream_segments([0.0], on_reload=reloads.append))
+        assert len(reloads) == 1
+        await asyncio.sleep(0.2)  # di nuovo inattivo dopo l'ultimo job
+        assert not t.loaded
+        t.shutdown()
+
+    async def test_running_job_keeps_model_loaded(self):
+        model = _HeldModel()
+        t = _make(model)
+        t._settings = t._settings.model_copy(update={"model_idle_unload_s": 0.05})
+        t.schedule_idle_unload()
+        running = asyncio.ensure_future(_collect_all(t.stream_segments([0.0])))
+        await asyncio.sleep(0.2)
+        assert t.loaded
+        model.release.set()
+        assert await running == ["old"]
+        t.shutdown()